@@ -0,0 +1,54 @@
+"""
+Copyright (c) 2013 Shotgun Software, Inc
+----------------------------------------------------
+
+Benchmark the headless batch publish as the number of worker processes grows.
+Every shot is published by harness/batch_stub.py, so the numbers show the
+batch runner's scaling rather than Maya start-up:
+
+    python2.7 batch_benchmark.py --shots 16 --jobs 1,2,4,8 --geo 100 --latency 0.02
+"""
+from __future__ import print_function
+
+import argparse
+import os
+import sys
+import time
+
+BENCH_PATH = os.path.dirname(os.path.abspath(__file__))
+sys.path.append(os.path.join(os.path.dirname(BENCH_PATH), 'hooks'))
+
+from matchmove_lib import batch_publish
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Benchmark the batch publish over worker counts')
+    parser.add_argument('--shots', type=int, default=8)
+    parser.add_argument('--jobs', default='1,2,4', help='comma separated worker counts')
+    parser.add_argument('--geo', type=int, default=50)
+    parser.add_argument('--latency', type=float, default=0.02, help='seconds per Shotgun request')
+    parser.add_argument('--python', default=sys.executable, help='interpreter to run the workers with')
+    options = parser.parse_args(sys.argv[1:] if argv is None else argv)
+
+    env = dict(os.environ, MM_BENCH_GEO=str(options.geo), MM_BENCH_CONES=str(options.geo * 5),
+               MM_BENCH_LATENCY=str(options.latency))
+    command = [options.python, os.path.join(BENCH_PATH, 'harness', 'batch_stub.py')]
+    shots = ['seq010_%04d' % (10 * (i + 1)) for i in range(options.shots)]
+
+    print('%6s %10s %10s %8s' % ('jobs', 'wall s', 'shots/s', 'failed'))
+    status = 0
+    for jobs in [int(j) for j in options.jobs.split(',')]:
+        publisher = batch_publish.BatchPublisher(command, jobs, env=env)
+        start = time.time()
+        results = publisher.run(shots, 'batch benchmark')
+        wall = time.time() - start
+        failed = len([r for r in results if not r.ok])
+        print('%6d %10.2f %10.2f %8d' % (jobs, wall, len(shots) / wall, failed))
+        if failed:
+            print(batch_publish.format_report(results))
+            status = 1
+    return status
+
+
+if __name__ == '__main__':
+    sys.exit(main())
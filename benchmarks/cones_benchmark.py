@@ -0,0 +1,149 @@
+"""
+Copyright (c) 2013 Shotgun Software, Inc
+----------------------------------------------------
+
+Compare publishing marker cones as meshes in an OBJ with publishing them as
+records with matchmove_lib.cone_cloud, and check that the cones rebuilt from
+the records land where the meshes were.
+
+--cones cones are placed with random transforms.  The OBJ is loaded by
+parsing every vertex and face, which is the least any loader has to do, and
+the records by rebuilding every cone as the Maya loader does, or by reading
+only the positions for a point cloud:
+
+    python2.7 cones_benchmark.py --cones 20000
+
+Exits with status 1 if a rebuilt cone is off by more than TOLERANCE.
+"""
+from __future__ import print_function
+
+import argparse
+import os
+import random
+import shutil
+import sys
+import tempfile
+import time
+
+from harness import install_fakes
+
+install_fakes()
+
+from harness import scene
+from matchmove_lib import cone_cloud
+from matchmove_lib import obj_writer
+
+TOLERANCE = 1e-6
+
+
+def _cones(count):
+    """
+    The names, CHANNELS values and world space meshes of count random cones
+    """
+    cone = scene.cone_mesh(0.0)
+    local = cone.points
+    rng = random.Random(count)
+    names = []
+    channels = [[] for channel in cone_cloud.CHANNELS]
+    meshes = []
+    for index in range(count):
+        translate = [rng.uniform(-500.0, 500.0) for axis in range(3)]
+        rotate = [rng.uniform(-180.0, 180.0), rng.uniform(-90.0, 90.0), rng.uniform(-180.0, 180.0)]
+        scale = [rng.uniform(0.5, 2.0)] * 3
+        m = cone_cloud.compose_matrix(translate, rotate, scale)
+        points = []
+        for x, y, z in local:
+            points.extend((x * m[0] + y * m[4] + z * m[8] + m[12],
+                           x * m[1] + y * m[5] + z * m[9] + m[13],
+                           x * m[2] + y * m[6] + z * m[10] + m[14]))
+
+        names.append('cone%05d' % index)
+        for values, value in zip(channels, translate + rotate + scale):
+            values.append(value)
+        meshes.append(obj_writer.Mesh(names[-1], points, cone.face_counts, cone.face_connects))
+
+    prototype = obj_writer.Mesh('cone', [v for point in local for v in point], cone.face_counts, cone.face_connects)
+    return names, channels, prototype, meshes
+
+
+def _best_of(repeat, fn, *args):
+    best = None
+    result = None
+    for i in range(repeat):
+        start = time.time()
+        result = fn(*args)
+        elapsed = time.time() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best, result
+
+
+def _load_obj(path):
+    points = []
+    faces = []
+    with open(path) as fh:
+        for line in fh:
+            if line.startswith('v '):
+                points.append([float(v) for v in line.split()[1:]])
+            elif line.startswith('f '):
+                faces.append([int(v.split('/')[0]) for v in line.split()[1:]])
+    return points
+
+
+def _rebuild(path):
+    with cone_cloud.ConeCloud(path) as cloud:
+        return cloud.mesh('cones').points
+
+
+def _positions(path):
+    with cone_cloud.ConeCloud(path) as cloud:
+        return cloud.positions()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Benchmark publishing cones as records')
+    parser.add_argument('--cones', type=int, default=5000)
+    parser.add_argument('--repeat', type=int, default=3)
+    options = parser.parse_args(sys.argv[1:] if argv is None else argv)
+
+    folder = tempfile.mkdtemp(prefix='mm_cones_bench_')
+    status = 0
+    try:
+        names, channels, prototype, meshes = _cones(options.cones)
+        mesh_path = os.path.join(folder, 'cones_mesh.obj')
+        points_path = os.path.join(folder, 'cones_points.obj')
+        cloud_path = cone_cloud.cloud_path(points_path)
+
+        write_mesh, size = _best_of(options.repeat, obj_writer.write_obj, mesh_path, meshes)
+        write_cloud, size = _best_of(options.repeat, cone_cloud.write_cloud, cloud_path, names, channels, prototype)
+        write_points, size = _best_of(options.repeat, obj_writer.write_obj, points_path,
+                                      [cone_cloud.points_mesh('cones', channels)])
+
+        load_mesh, loaded = _best_of(options.repeat, _load_obj, mesh_path)
+        rebuild, rebuilt = _best_of(options.repeat, _rebuild, cloud_path)
+        positions, found = _best_of(options.repeat, _positions, cloud_path)
+        load_points, loaded_points = _best_of(options.repeat, _load_obj, points_path)
+
+        print('%-16s %10s %10s %10s' % ('file', 'MB', 'write ms', 'load ms'))
+        for label, path, write, load in (('mesh obj', mesh_path, write_mesh, load_mesh),
+                                         ('cone records', cloud_path, write_cloud, rebuild),
+                                         ('  positions', cloud_path, None, positions),
+                                         ('points obj', points_path, write_points, load_points)):
+            print('%-16s %10.3f %10s %10.2f' % (label, os.path.getsize(path) / 1e6,
+                                              '%.2f' % (write * 1000.0) if write is not None else '-',
+                                              load * 1000.0))
+
+        expected = [v for mesh in meshes for v in mesh.points]
+        error = max(abs(a - b) for a, b in zip(expected, rebuilt)) if len(expected) == len(rebuilt) else None
+        if error is None or error > TOLERANCE:
+            print('rebuilt cones are off by %s' % ('a different vertex count' if error is None else error))
+            status = 1
+        if len(found) != len(names) * 3:
+            print('read %d positions for %d cones' % (len(found) // 3, len(names)))
+            status = 1
+    finally:
+        shutil.rmtree(folder, ignore_errors=True)
+    return status
+
+
+if __name__ == '__main__':
+    sys.exit(main())
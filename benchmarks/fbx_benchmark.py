@@ -0,0 +1,88 @@
+"""
+Copyright (c) 2013 Shotgun Software, Inc
+----------------------------------------------------
+
+Benchmark matchmove_lib.fbx_header on large published camera files, and
+check that it finds the right names in each format.
+
+For every format a file with the given cameras baked over --frames frames is
+written, then read_header() is timed against reading the whole file line by
+line, which is the least any full parse has to do:
+
+    python2.7 fbx_benchmark.py --frames 20000 --cameras SHOT,LEFT,RIGHT
+
+Exits with status 1 if a header comes back with the wrong names.
+"""
+from __future__ import print_function
+
+import argparse
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+from harness import install_fakes
+
+install_fakes()
+
+from harness import fbx_files
+from matchmove_lib import fbx_header
+
+FORMATS = [
+    ('ascii 6.1', lambda path, cameras, frames: fbx_files.write_ascii(path, cameras, frames)),
+    ('binary 7.4', lambda path, cameras, frames: fbx_files.write_binary(path, cameras, frames, version=7400)),
+    ('binary 7.5', lambda path, cameras, frames: fbx_files.write_binary(path, cameras, frames, version=7500)),
+]
+
+
+def _best_of(repeat, fn, *args):
+    best = None
+    for i in range(repeat):
+        start = time.time()
+        fn(*args)
+        elapsed = time.time() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+
+def _read_lines(path):
+    with open(path, 'rb') as fh:
+        for line in fh:
+            pass
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Benchmark reading camera names from FBX files')
+    parser.add_argument('--frames', type=int, default=10000)
+    parser.add_argument('--cameras', default='SHOT', help='comma separated camera names')
+    parser.add_argument('--repeat', type=int, default=5)
+    options = parser.parse_args(sys.argv[1:] if argv is None else argv)
+
+    cameras = options.cameras.split(',')
+    folder = tempfile.mkdtemp(prefix='mm_fbx_bench_')
+    status = 0
+    try:
+        print('%-12s %10s %12s %12s  %s' % ('format', 'size MB', 'header ms', 'lines ms', 'found'))
+        for name, write in FORMATS:
+            path = os.path.join(folder, name.replace(' ', '_') + '.fbx')
+            write(path, cameras, options.frames)
+
+            header = fbx_header.read_header(path)
+            found = '%s / %s' % (header.camera, header.take)
+            if header.camera != cameras[-1] or header.take != 'Take 001':
+                found += '  WRONG, expected %s / Take 001' % cameras[-1]
+                status = 1
+
+            print('%-12s %10.1f %12.2f %12.2f  %s' % (
+                name, os.path.getsize(path) / 1e6,
+                _best_of(options.repeat, fbx_header.read_header, path) * 1000.0,
+                _best_of(options.repeat, _read_lines, path) * 1000.0,
+                found))
+    finally:
+        shutil.rmtree(folder, ignore_errors=True)
+    return status
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,28 @@
+"""
+Copyright (c) 2013 Shotgun Software, Inc
+----------------------------------------------------
+
+Benchmark harness that runs the matchmove hooks outside of Maya and Nuke.
+
+The fakes folder holds stand-ins for maya, pymel, tank and nuke that work on
+a generated FakeScene, and MockShotgun answers the Shotgun API from memory
+with a configurable latency per request.  scenario.run() drives the scan,
+pre-publish, publish and both loader hooks end to end and returns the wall
+time, call counts and peak memory of every stage.
+"""
+import os
+import sys
+
+FAKES_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'fakes')
+HOOKS_PATH = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..', 'hooks'))
+
+
+def install_fakes():
+    """
+    Put the fake maya, pymel, tank and nuke modules and the hooks folder on
+    sys.path
+    """
+    if FAKES_PATH not in sys.path:
+        sys.path.insert(0, FAKES_PATH)
+    if HOOKS_PATH not in sys.path:
+        sys.path.append(HOOKS_PATH)
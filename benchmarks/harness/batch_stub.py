@@ -0,0 +1,64 @@
+"""
+Copyright (c) 2013 Shotgun Software, Inc
+----------------------------------------------------
+
+A batch publish worker that runs without Maya: matchmove_lib.batch_worker
+with a bootstrap that generates a project for the shot code it is given
+instead of opening a work file.  Use it as the --worker of batch_publish,
+with a plain python as the --interpreter:
+
+    cd hooks
+    python2.7 -m matchmove_lib.batch_publish --interpreter python2.7 \\
+        --worker ../benchmarks/harness/batch_stub.py --comment test shot_a shot_b
+
+The scene size and Shotgun latency come from the MM_BENCH_* variables below.
+"""
+import atexit
+import os
+import shutil
+import sys
+import tempfile
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from harness import install_fakes
+
+install_fakes()
+
+from harness import scenario
+from matchmove_lib import batch_worker
+
+
+def _env(name, default, cast=int):
+    return cast(os.environ.get(name, default))
+
+
+def bootstrap(target, options):
+    """
+    Build a project for the shot target and return its publish app and work
+    file
+    """
+    root = tempfile.mkdtemp(prefix='mm_batch_stub_')
+    atexit.register(shutil.rmtree, root, True)
+    os.environ['HOME'] = root
+
+    config = {'cameras': _env('MM_BENCH_CAMERAS', 1),
+              'cones': _env('MM_BENCH_CONES', 50),
+              'geo': _env('MM_BENCH_GEO', 10),
+              'mesh_size': _env('MM_BENCH_MESH_SIZE', 10),
+              'frames': _env('MM_BENCH_FRAMES', 100)}
+
+    site = scenario.Site(root, shot_code=target, latency=_env('MM_BENCH_LATENCY', 0.0, float))
+    site.write_lens_files(_env('MM_BENCH_LENS_VERSIONS', 3))
+    work_path = site.work_path(1)
+    scenario._write(work_path, '//Maya ASCII 2014 scene\n')
+    site.build_scene(work_path, config)
+
+    hooks = scenario.load_publish_hooks()
+    hooks['hook_secondary_publish'].thumbnail_cache_path = os.path.join(root, 'thumbnail_cache.json')
+    app = scenario.PublishApp(site.tk, scenario.FakeEngine('tk-maya', site.sg), site.context, site.templates, hooks)
+    return app, work_path
+
+
+if __name__ == '__main__':
+    sys.exit(batch_worker.main(bootstrap=bootstrap))
@@ -0,0 +1,60 @@
+"""
+Stand-in for the Maya Python API 1.0 messages used by matchmove_lib.scene_state.
+Callbacks are stored on the current scene, which fires them on every change.
+"""
+import itertools
+
+import maya
+
+_ids = itertools.count(1)
+
+
+def _register(callback):
+    callback_id = next(_ids)
+    maya.scene.callbacks[callback_id] = lambda: callback(None)
+    return callback_id
+
+
+class MObject(object):
+    pass
+
+
+class MMessage(object):
+    @staticmethod
+    def removeCallback(callback_id):
+        maya.scene.callbacks.pop(callback_id, None)
+
+
+class MDGMessage(MMessage):
+    @staticmethod
+    def addNodeAddedCallback(callback, *args):
+        return _register(callback)
+
+    @staticmethod
+    def addNodeRemovedCallback(callback, *args):
+        return _register(callback)
+
+    @staticmethod
+    def addConnectionCallback(callback, *args):
+        return _register(callback)
+
+
+class MNodeMessage(MMessage):
+    @staticmethod
+    def addNameChangedCallback(node, callback, *args):
+        return _register(callback)
+
+
+class MDagMessage(MMessage):
+    @staticmethod
+    def addAllDagChangesCallback(callback, *args):
+        return _register(callback)
+
+
+class MSceneMessage(MMessage):
+    kAfterOpen = 2
+    kAfterNew = 3
+
+    @staticmethod
+    def addCallback(message, callback, *args):
+        return _register(callback)
@@ -0,0 +1,34 @@
+"""
+Stand-in for the maya package, backed by a harness.scene.FakeScene.
+
+Every fake command counts its calls in call_counts, keyed on the module and
+command name, so a benchmark can report how often each one was used.
+"""
+import functools
+
+scene = None
+call_counts = {}
+
+
+def use_scene(new_scene):
+    global scene
+    scene = new_scene
+
+
+def reset_counts():
+    call_counts.clear()
+
+
+def counted(module_name):
+    """
+    Decorator counting the calls of a fake command
+    """
+    def decorator(fn):
+        key = '%s.%s' % (module_name, fn.__name__)
+
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            call_counts[key] = call_counts.get(key, 0) + 1
+            return fn(*args, **kwargs)
+        return wrapper
+    return decorator
@@ -0,0 +1,103 @@
+"""
+Stand-in for the parts of the Maya Python API 2.0 used to read mesh data.
+"""
+import maya
+from maya import counted
+
+
+class MSpace(object):
+    kObject = 2
+    kWorld = 4
+
+
+class MPoint(object):
+    __slots__ = ('x', 'y', 'z', 'w')
+
+    def __init__(self, x=0.0, y=0.0, z=0.0, w=1.0):
+        self.x = x
+        self.y = y
+        self.z = z
+        self.w = w
+
+
+class MDagPath(object):
+    def __init__(self, node):
+        self.node = node
+
+    def fullPathName(self):
+        return self.node.path
+
+
+class MSelectionList(object):
+    def __init__(self):
+        self._nodes = []
+
+    def add(self, name):
+        node = maya.scene.node(name)
+        if node is None:
+            raise RuntimeError("(kInvalidParameter): Object does not exist")
+        self._nodes.append(node)
+        return self
+
+    def length(self):
+        return len(self._nodes)
+
+    def getDagPath(self, index):
+        return MDagPath(self._nodes[index])
+
+
+class MObject(object):
+    def __init__(self, node=None):
+        self.node = node
+
+
+class MFnDependencyNode(object):
+    def __init__(self, obj):
+        self._node = obj.node
+
+    def name(self):
+        return self._node.name
+
+    @counted('api')
+    def setName(self, name):
+        return maya.scene.rename(self._node, name).name
+
+
+class MFnMesh(object):
+    def __init__(self, dag_path=None):
+        self._node = dag_path.node if dag_path else None
+        self._mesh = self._node.mesh if self._node else None
+
+    @counted('api')
+    def getPoints(self, space=MSpace.kObject):
+        ox, oy, oz = maya.scene.world_translate(self._node) if space == MSpace.kWorld else (0.0, 0.0, 0.0)
+        return [MPoint(x + ox, y + oy, z + oz) for (x, y, z) in self._mesh.points]
+
+    @counted('api')
+    def create(self, vertices, polygonCounts, polygonConnects, parent=None):
+        """
+        Adds a polySurface transform and shape, returning the transform
+        """
+        from harness.scene import Mesh
+
+        name = 'polySurface%d' % len(maya.scene.nodes)
+        transform = maya.scene.add('|%s' % name, 'transform')
+        self._node = maya.scene.add('|%s|%sShape' % (name, name), 'mesh')
+        self._mesh = self._node.mesh = Mesh([(p.x, p.y, p.z) for p in vertices],
+                                            list(polygonCounts), list(polygonConnects))
+        return MObject(transform)
+
+    @counted('api')
+    def getVertices(self):
+        return list(self._mesh.face_counts), list(self._mesh.face_connects)
+
+    def numUVs(self):
+        return len(self._mesh.us)
+
+    @counted('api')
+    def getUVs(self):
+        return list(self._mesh.us), list(self._mesh.vs)
+
+    @counted('api')
+    def getAssignedUVs(self):
+        return list(self._mesh.face_counts), list(self._mesh.uv_ids)
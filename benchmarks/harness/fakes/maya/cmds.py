@@ -0,0 +1,336 @@
+"""
+Stand-in for maya.cmds covering the commands used by the matchmove hooks.
+"""
+import os
+
+import maya
+from maya import counted
+
+
+def _flag(kwargs, *names):
+    for name in names:
+        if name in kwargs:
+            return kwargs[name]
+    return None
+
+
+def _node(name):
+    node = maya.scene.node(name)
+    if node is None:
+        raise ValueError("No object matches name: %s" % name)
+    return node
+
+
+def _names(nodes, long_names):
+    return [n.path if long_names else n.name for n in nodes]
+
+
+def _flatten(args):
+    items = []
+    for arg in args:
+        if isinstance(arg, (list, tuple)):
+            items.extend(arg)
+        else:
+            items.append(arg)
+    return items
+
+
+@counted('cmds')
+def file(*args, **kwargs):
+    scene = maya.scene
+    if _flag(kwargs, 'query', 'q'):
+        if _flag(kwargs, 'sceneName', 'sn'):
+            return scene.scene_path
+        if _flag(kwargs, 'referenceNode', 'rfn'):
+            return [r.node for r in scene.references.values() if r.path == args[0]][-1]
+        return None
+
+    if _flag(kwargs, 'reference', 'r'):
+        reference = scene.add_reference(args[0], _flag(kwargs, 'namespace', 'ns'))
+        if not _flag(kwargs, 'deferReference', 'dr'):
+            scene.load_reference(reference)
+        return reference.path
+    if _flag(kwargs, 'loadReference', 'lr'):
+        reference = scene.references[_flag(kwargs, 'loadReference', 'lr')]
+        if args:
+            scene.repath_reference(reference, args[0])
+        if _flag(kwargs, 'loadReferenceDepth', 'lrd') != 'none' and not reference.loaded:
+            scene.load_reference(reference)
+        return None
+    if _flag(kwargs, 'rename', 'rn'):
+        scene.scene_path = _flag(kwargs, 'rename', 'rn')
+        return scene.scene_path
+    if _flag(kwargs, 'save', 's'):
+        scene.save(scene.scene_path)
+        return scene.scene_path
+    if _flag(kwargs, 'open', 'o'):
+        from harness.scene import open_scene
+        maya.use_scene(open_scene(args[0]))
+        return args[0]
+
+    if args and _flag(kwargs, 'exportSelected', 'es'):
+        # objExport: one group per selected mesh transform
+        lines = []
+        for path in scene.selection:
+            node = scene.nodes[path]
+            if node.type == 'mesh' and node.mesh:
+                lines.append('g %s' % node.parent.name)
+                lines.extend('v %f %f %f' % p for p in node.mesh.points)
+        with open(args[0], 'w') as fh:
+            fh.write('\n'.join(lines) + '\n')
+        return args[0]
+    return None
+
+
+@counted('cmds')
+def listCameras(perspective=False, orthographic=False, **kwargs):
+    return [maya.scene.partial_name(n.parent) for n in sorted(maya.scene.nodes.values(), key=lambda n: n.path)
+            if n.type == 'camera']
+
+
+@counted('cmds')
+def listConnections(plugs, source=True, destination=True, connections=False, skipConversionNodes=False, **kwargs):
+    from harness.scene import SHORT_ATTRS
+
+    if not isinstance(plugs, (list, tuple)):
+        plugs = [plugs]
+    found = []
+    for plug in plugs:
+        name, attr = plug.rsplit('.', 1)
+        node = maya.scene.node(name)
+        if node is None:
+            raise ValueError("No object matches name: %s" % plug)
+        attr = SHORT_ATTRS.get(attr, attr)
+        if source and attr in node.connections:
+            if connections:
+                full_names = _flag(kwargs, 'fullNodeName', 'fnn')
+                found.append('%s.%s' % (node.path if full_names else maya.scene.partial_name(node), attr))
+            found.append(node.connections[attr])
+    return found or None
+
+
+@counted('cmds')
+def ls(*args, **kwargs):
+    scene = maya.scene
+    long_names = _flag(kwargs, 'long', 'l')
+    node_type = 'transform' if _flag(kwargs, 'transforms', 'tr') else _flag(kwargs, 'type', 'typ')
+
+    if _flag(kwargs, 'selection', 'sl'):
+        paths = list(scene.selection)
+    elif not args:
+        paths = sorted(scene.nodes)
+    else:
+        paths = []
+        for arg in _flatten(args):
+            if '.' in arg:
+                # nodes with an attribute, only ever listed with objectsOnly
+                pattern, attr = arg.rsplit('.', 1)
+                paths.extend(p for p in scene.match(pattern) if attr in scene.nodes[p].attrs)
+            elif '*' in arg or '?' in arg:
+                paths.extend(scene.match(arg))
+            elif '|' not in arg:
+                # a short name lists every node it matches, like Maya
+                paths.extend(n.path for n in scene.short_names.get(arg, []))
+            elif scene.node(arg) is not None:
+                paths.append(scene.node(arg).path)
+
+    # each node is listed once, however many arguments name it
+    seen = set()
+    nodes = [scene.nodes[p] for p in paths if not (p in seen or seen.add(p))]
+    if kwargs.get('assemblies'):
+        nodes = [n for n in nodes if n.parent is None]
+    if node_type:
+        nodes = [n for n in nodes if n.type == node_type]
+    if _flag(kwargs, 'visible', 'v'):
+        nodes = [n for n in nodes if scene.is_visible(n)]
+    return _names(nodes, long_names)
+
+
+@counted('cmds')
+def select(*args, **kwargs):
+    scene = maya.scene
+    if _flag(kwargs, 'clear', 'cl'):
+        scene.selection = []
+        return
+
+    nodes = []
+    for name in _flatten(args):
+        node = _node(name)
+        nodes.append(node)
+        if _flag(kwargs, 'hierarchy', 'hi'):
+            nodes.extend(scene.descendants(node))
+    if _flag(kwargs, 'visible', 'vis'):
+        nodes = [n for n in nodes if scene.is_visible(n)]
+
+    paths = [n.path for n in nodes]
+    if _flag(kwargs, 'add', 'af'):
+        scene.selection.extend(paths)
+    else:
+        scene.selection = paths
+
+
+@counted('cmds')
+def loadPlugin(name, quiet=False, **kwargs):
+    maya.scene.plugins.add(name)
+    return [name]
+
+
+@counted('cmds')
+def pluginInfo(name=None, query=False, loaded=False, listPlugins=False, **kwargs):
+    if listPlugins:
+        return sorted(maya.scene.plugins)
+    return name in maya.scene.plugins
+
+
+@counted('cmds')
+def listRelatives(*args, **kwargs):
+    scene = maya.scene
+    long_names = _flag(kwargs, 'fullPath', 'f')
+    node_type = _flag(kwargs, 'type', 'typ')
+
+    found = []
+    for name in _flatten(args):
+        node = _node(name)
+        if _flag(kwargs, 'parent', 'p'):
+            related = [node.parent] if node.parent else []
+        elif _flag(kwargs, 'allDescendents', 'ad'):
+            related = list(scene.descendants(node))
+        elif _flag(kwargs, 'shapes', 's'):
+            related = [c for c in node.children if c.type != 'transform']
+        else:
+            related = list(node.children)
+        if node_type:
+            related = [n for n in related if n.type == node_type]
+        found.extend(related)
+    return _names(found, long_names) or None
+
+
+@counted('cmds')
+def xform(target, query=False, **kwargs):
+    if '.vtx[' in target:
+        node = _node(target.split('.', 1)[0])
+        values = []
+        for point in node.mesh.points:
+            values.extend(point)
+        return values
+    if _flag(kwargs, 'matrix', 'm'):
+        translate = maya.scene.world_translate(_node(target))
+        return [1.0, 0.0, 0.0, 0.0, 0.0, 1.0, 0.0, 0.0, 0.0, 0.0, 1.0, 0.0] + translate + [1.0]
+    return [0.0, 0.0, 0.0]
+
+
+@counted('cmds')
+def playbackOptions(query=False, **kwargs):
+    if _flag(kwargs, 'minTime', 'min'):
+        return float(maya.scene.start_frame)
+    if _flag(kwargs, 'maxTime', 'max'):
+        return float(maya.scene.end_frame)
+    return None
+
+
+@counted('cmds')
+def getAttr(plug, time=None, **kwargs):
+    name, attr = plug.rsplit('.', 1)
+    node = _node(name)
+    if attr in node.attrs:
+        return node.attrs[attr]
+    if attr == 'worldMatrix':
+        translate = maya.scene.world_translate(node)
+        return [1.0, 0.0, 0.0, 0.0, 0.0, 1.0, 0.0, 0.0, 0.0, 0.0, 1.0, 0.0] + translate + [1.0]
+    frame = time if time is not None else maya.scene.start_frame
+    owner = node.parent if node.type == 'camera' else node
+    return maya.scene.channel_value(owner, attr, frame)
+
+
+@counted('cmds')
+def keyframe(plug, query=False, time=None, timeChange=False, valueChange=False, **kwargs):
+    """
+    The fake scene keys its connected channels on every frame
+    """
+    from harness.scene import SHORT_ATTRS
+
+    name, attr = plug.rsplit('.', 1)
+    node = _node(name)
+    if SHORT_ATTRS.get(attr, attr) not in node.connections:
+        return None
+    start, end = time if time else (maya.scene.start_frame, maya.scene.end_frame)
+    owner = node.parent if node.type == 'camera' else node
+    keys = []
+    for frame in range(int(start), int(end) + 1):
+        keys.extend((float(frame), maya.scene.channel_value(owner, attr, frame)))
+    return keys
+
+
+@counted('cmds')
+def setAttr(plug, *values, **kwargs):
+    name, attr = plug.rsplit('.', 1)
+    _node(name).attrs[attr] = values[0] if len(values) == 1 else values
+
+
+@counted('cmds')
+def shadingNode(node_type, asTexture=False, **kwargs):
+    name = '%s%d' % (node_type, len(maya.scene.nodes))
+    maya.scene.add('|%s' % name, node_type)
+    return name
+
+
+@counted('cmds')
+def filterCurve(*curves, **kwargs):
+    return len(curves)
+
+
+@counted('cmds')
+def objExists(name):
+    return maya.scene.node(name) is not None
+
+
+@counted('cmds')
+def addAttr(name, longName=None, dataType=None, **kwargs):
+    _node(name).attrs[longName] = None
+
+
+@counted('cmds')
+def attributeQuery(attr, node=None, exists=False, **kwargs):
+    return attr in _node(node).attrs
+
+
+@counted('cmds')
+def parent(*args, **kwargs):
+    names = _flatten(args)
+    new_parent = _node(names[-1])
+    return [maya.scene.reparent(_node(name), new_parent).path for name in names[:-1]]
+
+
+@counted('cmds')
+def rename(name, new_name, **kwargs):
+    return maya.scene.rename(_node(name), new_name).name
+
+
+@counted('cmds')
+def delete(*args, **kwargs):
+    for name in _flatten(args):
+        maya.scene.remove(_node(name))
+
+
+@counted('cmds')
+def sets(*args, **kwargs):
+    for name in _flatten(args):
+        _node(name).attrs['shadingGroup'] = _flag(kwargs, 'forceElement', 'fe')
+
+
+@counted('cmds')
+def group(*args, **kwargs):
+    return maya.scene.add('|%s' % _flag(kwargs, 'name', 'n'), 'transform').name
+
+
+@counted('cmds')
+def referenceQuery(node, isLoaded=False, nodes=False, dagPath=False, **kwargs):
+    reference = maya.scene.references[node]
+    if isLoaded:
+        return reference.loaded
+    if nodes:
+        found = []
+        for top in reference.nodes:
+            found.extend([top] + list(maya.scene.descendants(top)))
+        return _names(found, dagPath)
+    return None
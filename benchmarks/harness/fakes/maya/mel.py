@@ -0,0 +1,75 @@
+"""
+Stand-in for maya.mel.  eval() understands the FBX and OBJ commands used by
+the matchmove hooks and ignores everything else.
+"""
+import re
+
+import maya
+from maya import counted
+
+_FILE_ARG = re.compile(r'-f\s+"([^"]*)"')
+_LAST_QUOTED = re.compile(r'"([^"]*)"\s*;?\s*$')
+_GROUP_NAME = re.compile(r'-gn\s+"([^"]*)"')
+
+FBX_HEADER = """; FBX 6.1.0 project file
+; ----------------------------------------------------
+
+FBXHeaderExtension:  {
+    FBXHeaderVersion: 1003
+    FBXVersion: 6100
+    Creator: "FBX SDK/FBX Plugins version 2013.1"
+}
+
+Objects:  {
+%(models)s}
+
+Takes:  {
+    Current: "Take 001"
+    Take: "Take 001" {
+        FileName: "Take_001.tak"
+        LocalTime: %(start)d,%(end)d
+    }
+}
+"""
+
+FBX_MODEL = """    Model: "Model::%s", "Camera" {
+        Version: 232
+    }
+"""
+
+
+@counted('mel')
+def eval(command):
+    scene = maya.scene
+    command = command.strip()
+
+    if command.startswith('FBXExport '):
+        path = _FILE_ARG.search(command).group(1)
+        cameras = [scene.nodes[p].parent.name for p in scene.selection if scene.nodes[p].type == 'camera']
+        with open(path, 'w') as fh:
+            fh.write(FBX_HEADER % {'models': ''.join(FBX_MODEL % name for name in cameras),
+                                   'start': scene.start_frame,
+                                   'end': scene.end_frame})
+        return None
+
+    if command.startswith('FBXImport '):
+        path = _FILE_ARG.search(command).group(1)
+        with open(path) as fh:
+            for line in fh:
+                if line.strip().startswith('Model: "Model::'):
+                    name = line.split('::', 1)[1].split('"', 1)[0]
+                    # merged into a node of the same name if there is one
+                    if scene.node('|%s' % name) is None:
+                        scene.add('|%s' % name, 'transform')
+        return None
+
+    if command.startswith('file -import'):
+        # imports the OBJ as a single group named after -gn
+        match = _GROUP_NAME.search(command)
+        name = match.group(1) if match else 'import%d' % len(scene.nodes)
+        path = _LAST_QUOTED.search(command).group(1)
+        group = scene.add('|%s' % name, 'transform')
+        scene.import_obj(path, group.path)
+        return [group.name]
+
+    return None
@@ -0,0 +1,193 @@
+"""
+Stand-in for the nuke module.  Nodes are plain objects whose knobs are made
+on first use; every created node is kept in the nodes_created list, which is
+the script until new_script() empties it.
+"""
+import functools
+
+call_counts = {}
+nodes_created = []
+
+
+def reset():
+    call_counts.clear()
+
+
+def new_script():
+    del nodes_created[:]
+
+
+def _counted(fn):
+    key = 'nuke.%s' % fn.__name__
+
+    @functools.wraps(fn)
+    def wrapper(*args, **kwargs):
+        call_counts[key] = call_counts.get(key, 0) + 1
+        return fn(*args, **kwargs)
+    return wrapper
+
+
+class AnimationKey(object):
+    __slots__ = ('x', 'y')
+
+    def __init__(self, x, y):
+        self.x = x
+        self.y = y
+
+
+class AnimationCurve(object):
+    def __init__(self):
+        self.keys = []
+
+    @_counted
+    def addKey(self, keys):
+        self.keys.extend(keys)
+
+
+class Knob(object):
+    def __init__(self, name, label=None, value=None):
+        self.name = name
+        self.label = label
+        self._value = None
+        self._values = []
+        self._curves = {}
+
+    @_counted
+    def setValue(self, value, index=None):
+        self._value = value
+
+    def value(self):
+        return self._value
+
+    def values(self):
+        return list(self._values)
+
+    def setValues(self, values):
+        self._values = list(values)
+
+    @_counted
+    def setAnimated(self, index=None):
+        self._curves.setdefault(index or 0, AnimationCurve())
+
+    def isAnimated(self, index=None):
+        return (index or 0) in self._curves
+
+    @_counted
+    def clearAnimated(self, index=None):
+        self._curves.pop(index or 0, None)
+
+    def animation(self, index=0):
+        return self._curves.get(index)
+
+
+class Tab_Knob(Knob):
+    pass
+
+
+class File_Knob(Knob):
+    pass
+
+
+class String_Knob(Knob):
+    pass
+
+
+class Int_Knob(Knob):
+    pass
+
+
+class PyScript_Knob(Knob):
+    def __init__(self, name, label=None, command=None):
+        Knob.__init__(self, name, label)
+        self.command = command
+
+
+class Node(object):
+    def __init__(self, node_class, **knobs):
+        self._class = node_class
+        self._knobs = {}
+        for name, value in knobs.items():
+            self[name].setValue(value)
+
+    def Class(self):
+        return self._class
+
+    def name(self):
+        return self['name'].value()
+
+    def knob(self, name):
+        return self._knobs.get(name)
+
+    @_counted
+    def setName(self, name):
+        self['name'].setValue(name)
+
+    @_counted
+    def addKnob(self, knob):
+        self._knobs[knob.name] = knob
+
+    def __getitem__(self, name):
+        if name not in self._knobs:
+            self._knobs[name] = Knob(name)
+        return self._knobs[name]
+
+    def showControlPanel(self):
+        # reading an FBX fills in the node and take names
+        if self['read_from_file'].value():
+            self['fbx_node_name'].setValues(['Producer Perspective', 'SHOT'])
+            self['fbx_take_name'].setValues(['Take 001'])
+
+
+class _Nodes(object):
+    def __getattr__(self, node_class):
+        key = 'nuke.nodes.%s' % node_class
+
+        def create(**knobs):
+            call_counts[key] = call_counts.get(key, 0) + 1
+            node = Node(node_class, **knobs)
+            nodes_created.append(node)
+            return node
+        return create
+
+
+nodes = _Nodes()
+
+
+@_counted
+def nodePaste(path):
+    with open(path) as fh:
+        fh.read()
+    node = Node('Group', name='pasted%d' % len(nodes_created))
+    nodes_created.append(node)
+    return node
+
+
+@_counted
+def allNodes(node_class=None):
+    return [n for n in nodes_created if node_class is None or n.Class() == node_class]
+
+
+def _find(name):
+    for node in nodes_created:
+        if node.name() == name:
+            return node
+    return None
+
+
+@_counted
+def toNode(name):
+    return _find(name)
+
+
+@_counted
+def exists(name):
+    return _find(name) is not None
+
+
+class _Root(object):
+    def name(self):
+        return 'Root'
+
+
+def root():
+    return _Root()
@@ -0,0 +1,23 @@
+"""
+Stand-in for the pymel.core names used by the Maya loader.
+"""
+import maya
+import maya.mel
+from maya import counted
+
+
+class _Mel(object):
+    def eval(self, command):
+        return maya.mel.eval(command)
+
+
+class _System(object):
+    @counted('pymel')
+    def createReference(self, path, **kwargs):
+        namespace = kwargs.get('namespace') or 'ref%d' % len(maya.scene.nodes)
+        maya.scene.add('|%s:root' % namespace, 'transform')
+        return path
+
+
+mel = _Mel()
+system = _System()
@@ -0,0 +1,15 @@
+"""
+Stand-in for the parts of the tank (Shotgun Pipeline Toolkit) API used by the
+matchmove hooks.
+"""
+from tank import util
+from tank.errors import TankError
+from tank.templates import Template
+
+
+class Hook(object):
+    """
+    Hooks are created with the app that runs them as their parent
+    """
+    def __init__(self, parent):
+        self.parent = parent
@@ -0,0 +1,2 @@
+class TankError(Exception):
+    pass
@@ -0,0 +1,66 @@
+"""
+Path templates such as sequences/{Sequence}/{Shot}/..._v{version}.nk, with
+the version key formatted as three digits like the project config.
+"""
+import os
+import re
+
+from tank.errors import TankError
+
+_KEY = re.compile(r'\{(\w+)\}')
+
+
+class Template(object):
+    def __init__(self, definition, root_path):
+        self.definition = definition
+        self.root_path = root_path
+        self.keys = _KEY.findall(definition)
+
+        pattern = []
+        seen = set()
+        position = 0
+        for match in _KEY.finditer(definition):
+            pattern.append(re.escape(definition[position:match.start()]))
+            key = match.group(1)
+            if key in seen:
+                pattern.append(r'(?P=%s)' % key)
+            elif key == 'version':
+                pattern.append(r'(?P<version>\d+)')
+            else:
+                pattern.append(r'(?P<%s>[^/]+?)' % key)
+            seen.add(key)
+            position = match.end()
+        pattern.append(re.escape(definition[position:]))
+        self._regex = re.compile('^%s$' % ''.join(pattern))
+
+    def apply_fields(self, fields):
+        def _value(match):
+            key = match.group(1)
+            if key not in fields:
+                raise TankError("Tried to resolve a path from the template %s and a set of input "
+                                "fields '%s' but the following required fields were missing "
+                                "from the input: ['%s']" % (self.definition, fields, key))
+            if key == 'version':
+                return '%03d' % fields[key]
+            return str(fields[key])
+        return os.path.join(self.root_path, _KEY.sub(_value, self.definition))
+
+    def get_fields(self, path):
+        rel_path = os.path.relpath(path, self.root_path).replace(os.sep, '/')
+        match = self._regex.match(rel_path)
+        if not match:
+            raise TankError("Template %s: Path '%s' is not a valid path for this template" % (self.definition, path))
+        fields = match.groupdict()
+        if 'version' in fields:
+            fields['version'] = int(fields['version'])
+        return fields
+
+    def validate(self, path):
+        try:
+            self.get_fields(path)
+            return True
+        except TankError:
+            return False
+
+    def __repr__(self):
+        return '<Template %s>' % self.definition
@@ -0,0 +1,55 @@
+"""
+Stand-ins for tank.util, making the same Shotgun requests as toolkit 0.13.
+"""
+import getpass
+import os
+
+
+def get_shotgun_user(sg):
+    return sg.find_one('HumanUser', [['login', 'is', getpass.getuser()]], ['id', 'name', 'login'])
+
+
+def register_publish(tk, context, path, name, version_number, **kwargs):
+    """
+    One tank type lookup, a storage lookup, the create, a lookup and create
+    per dependency and the thumbnail upload, as the real implementation does
+    """
+    sg = tk.shotgun
+    tank_type_code = kwargs.get('tank_type')
+    tank_type = None
+    if tank_type_code:
+        tank_type = sg.find_one('TankType', [['code', 'is', tank_type_code], ['project', 'is', context.project]])
+        if not tank_type:
+            tank_type = sg.create('TankType', {'code': tank_type_code, 'project': context.project})
+
+    storage = sg.find_one('LocalStorage', [['code', 'is', 'primary']], ['id', 'code'])
+    root = tk.project_path.replace(os.sep, '/').rstrip('/')
+    path_cache = '%s%s' % (os.path.basename(root), path.replace(os.sep, '/')[len(root):])
+
+    data = {
+        'code': os.path.basename(path),
+        'description': kwargs.get('comment'),
+        'name': name,
+        'project': context.project,
+        'entity': context.entity,
+        'task': kwargs.get('task'),
+        'version_number': version_number,
+        'path': {'local_path': path},
+        'path_cache': path_cache,
+        'path_cache_storage': storage,
+        'tank_type': tank_type,
+        'created_by': get_shotgun_user(sg),
+    }
+    entity = sg.create('TankPublishedFile', data)
+
+    for dependency_path in kwargs.get('dependency_paths') or []:
+        dependency_cache = '%s%s' % (os.path.basename(root), dependency_path.replace(os.sep, '/')[len(root):])
+        dependency = sg.find_one('TankPublishedFile', [['path_cache', 'is', dependency_cache]])
+        if dependency:
+            sg.create('TankDependency', {'tank_published_file': entity,
+                                         'dependent_tank_published_file': dependency})
+
+    if kwargs.get('thumbnail_path'):
+        sg.upload_thumbnail('TankPublishedFile', entity['id'], kwargs['thumbnail_path'])
+
+    return entity
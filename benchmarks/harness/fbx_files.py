@@ -0,0 +1,117 @@
+"""
+Copyright (c) 2013 Shotgun Software, Inc
+----------------------------------------------------
+
+Writes camera FBX files shaped like the ones Maya publishes, with a baked
+curve per channel over the given number of frames, in ASCII FBX 6.1 or
+binary FBX 7.x.  Used to benchmark and check matchmove_lib.fbx_header.
+"""
+import math
+import struct
+
+from harness.scene import CAMERA_ATTRS
+
+PRODUCER_CAMERAS = ['Producer Perspective', 'Producer Top', 'Producer Bottom', 'Producer Front',
+                    'Producer Back', 'Producer Right', 'Producer Left']
+
+BINARY_MAGIC = b'Kaydara FBX Binary  \x00\x1a\x00'
+
+
+def _curve(camera, attr, frames):
+    seed = sum(ord(c) for c in camera + attr)
+    return [math.sin(frame * 0.05 + seed) * 10.0 for frame in range(frames)]
+
+
+def write_ascii(path, cameras, frames, take='Take 001'):
+    """
+    An FBX 6.1 ASCII file with producer cameras, the given cameras and one
+    take holding every channel's keys
+    """
+    with open(path, 'w') as fh:
+        fh.write('; FBX 6.1.0 project file\n'
+                 'FBXHeaderExtension:  {\n    FBXHeaderVersion: 1003\n    FBXVersion: 6100\n}\n\n'
+                 'Objects:  {\n')
+        for name in PRODUCER_CAMERAS + list(cameras):
+            fh.write('    Model: "Model::%s", "Camera" {\n        Version: 232\n'
+                     '        Properties60:  {\n'
+                     '            Property: "FocalLength", "Number", "A+",35\n'
+                     '            Property: "FilmWidth", "double", "",1.417\n'
+                     '        }\n    }\n' % name)
+        fh.write('}\n\nTakes:  {\n    Current: "%s"\n    Take: "%s" {\n'
+                 '        FileName: "Take_001.tak"\n        LocalTime: 0,%d\n' % (take, take, frames))
+        for name in cameras:
+            fh.write('        Model: "Model::%s" {\n            Version: 1.1\n            Channel: "Transform" {\n' % name)
+            for attr in CAMERA_ATTRS:
+                values = _curve(name, attr, frames)
+                fh.write('                Channel: "%s" {\n                    Key: ' % attr)
+                fh.write(',\n                    '.join('%d,%f,L' % (frame * 1924423250, value)
+                                                       for frame, value in enumerate(values)))
+                fh.write('\n                }\n')
+            fh.write('            }\n        }\n')
+        fh.write('    }\n}\n')
+
+
+def _property(value):
+    if isinstance(value, bytes):
+        return b'S' + struct.pack('<I', len(value)) + value
+    if isinstance(value, int):
+        return b'L' + struct.pack('<q', value)
+    if isinstance(value, float):
+        return b'D' + struct.pack('<d', value)
+    if isinstance(value, list):
+        data = struct.pack('<%dd' % len(value), *value)
+        return b'd' + struct.pack('<III', len(value), 0, len(data)) + data
+    raise TypeError(value)
+
+
+def _record(offset, name, properties=(), children=(), wide=False):
+    """
+    Encode a record starting at offset with its children
+    """
+    header_size = 25 if wide else 13
+    props = b''.join(_property(value) for value in properties)
+    start = offset + header_size + len(name) + len(props)
+    body = b''
+    for child_name, child_props, grandchildren in children:
+        child = _record(start + len(body), child_name, child_props, grandchildren, wide)
+        body += child
+    if children:
+        body += b'\x00' * header_size
+    end = start + len(body)
+    fmt = '<QQQB' if wide else '<IIIB'
+    return struct.pack(fmt, end, len(properties), len(props), len(name)) + name + props + body
+
+
+def write_binary(path, cameras, frames, take='Take 001', version=7400):
+    """
+    A binary FBX 7 file with a Model, an AnimationStack and an animation
+    curve per channel of every camera
+    """
+    wide = version >= 7500
+    objects = []
+    object_id = 1000
+    for name in cameras:
+        object_id += 1
+        name_bytes = name.encode('utf-8')
+        objects.append((b'Model', [object_id, name_bytes + b'\x00\x01Model', b'Camera'],
+                        [(b'Version', [232], []),
+                         (b'Properties70', [], [(b'P', [b'FocalLength', b'Number', b'', b'A', 35.0], [])])]))
+        for attr in CAMERA_ATTRS:
+            object_id += 1
+            objects.append((b'AnimationCurve', [object_id, b'\x00\x01AnimCurve', b''],
+                            [(b'Default', [0.0], []),
+                             (b'KeyTime', [list(float(f * 1924423250) for f in range(frames))], []),
+                             (b'KeyValueFloat', [_curve(name, attr, frames)], [])]))
+    objects.append((b'AnimationStack', [object_id + 1, take.encode('utf-8') + b'\x00\x01AnimStack', b''], []))
+
+    top = [(b'FBXHeaderExtension', [], [(b'FBXHeaderVersion', [1003], []), (b'FBXVersion', [version], [])]),
+           (b'Objects', [], objects),
+           (b'Takes', [], [(b'Current', [take.encode('utf-8')], []),
+                           (b'Take', [take.encode('utf-8')], [(b'FileName', [b'Take_001.tak'], [])])])]
+
+    data = BINARY_MAGIC + struct.pack('<I', version)
+    for name, properties, children in top:
+        data += _record(len(data), name, properties, children, wide)
+    data += b'\x00' * (25 if wide else 13)
+    with open(path, 'wb') as fh:
+        fh.write(data)
@@ -0,0 +1,210 @@
+"""
+Copyright (c) 2013 Shotgun Software, Inc
+----------------------------------------------------
+
+An in-memory stand-in for the shotgun_api3 connection.
+
+Every public method counts as one request to the server and sleeps for
+latency seconds, so round trips show up in the benchmark wall times the way
+they do against a remote site.  A batch() is a single request however many
+creates it holds.
+
+Entities are stamped with created_at and updated_at in whole seconds of
+clock, as UTC datetimes, the way Shotgun stamps them.
+"""
+import copy
+import datetime
+import itertools
+import threading
+import time
+
+
+class MockShotgunError(Exception):
+    pass
+
+
+class _UTC(datetime.tzinfo):
+    def utcoffset(self, dt):
+        return datetime.timedelta(0)
+
+    def dst(self, dt):
+        return datetime.timedelta(0)
+
+    def tzname(self, dt):
+        return 'UTC'
+
+
+UTC = _UTC()
+
+
+class MockShotgun(object):
+    def __init__(self, latency=0.0, base_url='https://mock.shotgunstudio.com', clock=time.time):
+        self.latency = latency
+        self.base_url = base_url
+        self.calls = {}
+        self.entities = {}
+        self.clock = clock
+        self._ids = itertools.count(1)
+        self._lock = threading.Lock()
+
+    def reset_counts(self):
+        self.calls.clear()
+
+    def _request(self, method):
+        with self._lock:
+            self.calls[method] = self.calls.get(method, 0) + 1
+        if self.latency:
+            time.sleep(self.latency)
+
+    def add(self, entity_type, data):
+        """
+        Store an entity without counting a request, used to seed the site
+        """
+        now = self._now()
+        entity = dict(data, type=entity_type, id=next(self._ids))
+        entity.setdefault('created_at', now)
+        entity.setdefault('updated_at', now)
+        with self._lock:
+            self.entities.setdefault(entity_type, {})[entity['id']] = entity
+        return {'type': entity_type, 'id': entity['id']}
+
+    def all(self, entity_type):
+        return sorted(self.entities.get(entity_type, {}).values(), key=lambda e: e['id'])
+
+    def _now(self):
+        return datetime.datetime.fromtimestamp(int(self.clock()), UTC)
+
+    def _touch(self, entity, data):
+        entity.update(data)
+        entity['updated_at'] = self._now()
+
+    # filtering and field resolution
+
+    def _link(self, value):
+        """
+        Links come back with their display name, as they do from Shotgun
+        """
+        if isinstance(value, dict) and 'type' in value and 'id' in value:
+            target = self.entities.get(value['type'], {}).get(value['id'], {})
+            return {'type': value['type'], 'id': value['id'],
+                    'name': target.get('name', target.get('code', target.get('content')))}
+        if isinstance(value, list):
+            return [self._link(v) for v in value]
+        return copy.deepcopy(value)
+
+    def _field(self, entity, field):
+        """
+        The value of a field, following a deep link like
+        tank_published_file.TankPublishedFile.project
+        """
+        parts = field.split('.')
+        while len(parts) > 1:
+            link = entity.get(parts[0]) or {}
+            entity = self.entities.get(parts[1], {}).get(link.get('id'), {})
+            parts = parts[2:]
+        return entity.get(parts[0])
+
+    def _matches(self, entity, filters):
+        for field, operator, value in filters:
+            actual = self._field(entity, field)
+            if isinstance(actual, dict) and 'id' in actual:
+                actual = (actual['type'], actual['id'])
+            if isinstance(value, dict) and 'id' in value:
+                value = (value['type'], value['id'])
+
+            if operator == 'is' and actual != value:
+                return False
+            if operator == 'is_not' and actual == value:
+                return False
+            if operator == 'in':
+                values = [(v['type'], v['id']) if isinstance(v, dict) else v for v in value]
+                if actual not in values:
+                    return False
+            if operator == 'greater_than' and (actual is None or not actual > value):
+                return False
+            if operator == 'less_than' and (actual is None or not actual < value):
+                return False
+        return True
+
+    def _result(self, entity, fields):
+        result = {'type': entity['type'], 'id': entity['id']}
+        for field in fields or []:
+            result[field] = self._link(entity.get(field))
+        return result
+
+    # the Shotgun API
+
+    def find(self, entity_type, filters, fields=None, order=None, limit=0, **kwargs):
+        self._request('find')
+        found = [e for e in self.all(entity_type) if self._matches(e, filters)]
+        for sort in reversed(order or []):
+            found.sort(key=lambda e: self._field(e, sort['field_name']), reverse=sort.get('direction') == 'desc')
+        found = [self._result(e, fields) for e in found]
+        return found[:limit] if limit else found
+
+    def find_one(self, entity_type, filters, fields=None, order=None, **kwargs):
+        self._request('find_one')
+        for entity in self.all(entity_type):
+            if self._matches(entity, filters):
+                return self._result(entity, fields)
+        return None
+
+    def _create(self, entity_type, data, return_fields=None):
+        link = self.add(entity_type, data)
+        return self._result(self.entities[entity_type][link['id']], list(data) + list(return_fields or []))
+
+    def create(self, entity_type, data, return_fields=None):
+        self._request('create')
+        return self._create(entity_type, data, return_fields)
+
+    def update(self, entity_type, entity_id, data):
+        self._request('update')
+        entity = self.entities.get(entity_type, {}).get(entity_id)
+        if entity is None:
+            raise MockShotgunError('%s %s does not exist' % (entity_type, entity_id))
+        self._touch(entity, data)
+        return self._result(entity, list(data))
+
+    def delete(self, entity_type, entity_id):
+        self._request('delete')
+        return self.entities.get(entity_type, {}).pop(entity_id, None) is not None
+
+    def batch(self, requests):
+        self._request('batch')
+        results = []
+        for request in requests:
+            if request['request_type'] == 'create':
+                results.append(self._create(request['entity_type'], request['data'], request.get('return_fields')))
+            elif request['request_type'] == 'update':
+                entity = self.entities[request['entity_type']][request['entity_id']]
+                self._touch(entity, request['data'])
+                results.append(self._result(entity, list(request['data'])))
+            elif request['request_type'] == 'delete':
+                results.append(self.entities[request['entity_type']].pop(request['entity_id'], None) is not None)
+            else:
+                raise MockShotgunError('Unknown batch request type %s' % request['request_type'])
+        return results
+
+    def upload_thumbnail(self, entity_type, entity_id, path, **kwargs):
+        self._request('upload_thumbnail')
+        with open(path, 'rb') as fh:
+            fh.read()
+        self._touch(self.entities[entity_type][entity_id], {'image': path})
+        return entity_id
+
+    def share_thumbnail(self, entities, thumbnail_path=None, source_entity=None, filmstrip_thumbnail=False, **kwargs):
+        self._request('share_thumbnail')
+        if source_entity:
+            source = self.entities.get(source_entity['type'], {}).get(source_entity['id'])
+            if not source or not source.get('image'):
+                raise MockShotgunError('%s %s has no thumbnail to share' % (source_entity['type'], source_entity['id']))
+            image = source['image']
+        else:
+            image = thumbnail_path
+        for entity in entities:
+            self._touch(self.entities[entity['type']][entity['id']], {'image': image})
+        return len(entities)
+
+    def upload(self, entity_type, entity_id, path, field_name=None, **kwargs):
+        self._request('upload')
+        return self.add('Attachment', {'this_file': path, 'attachment_links': [{'type': entity_type, 'id': entity_id}]})['id']
@@ -0,0 +1,538 @@
+"""
+Copyright (c) 2013 Shotgun Software, Inc
+----------------------------------------------------
+
+Runs the matchmove hooks end to end against a generated scene:
+
+    scan        ScanSceneHook on a fresh session
+    rescan      ScanSceneHook again with the scene unchanged
+    validate    PrePublishHook on every scanned item
+    publish     PublishHook for version 1
+    republish   PublishHook for version 2 of the unchanged scene
+    load maya   AddFileToScene.execute in Maya for each v1 camera and obj file
+    reload maya the same files again, which are already in the scene
+    update maya the v2 files, replacing the v1 ones loaded, when republished
+    save maya   saving the scene the Maya loader left behind
+    open maya   opening that scene again
+    load nuke   AddFileToScene.execute in Nuke for every v1 publish
+    reload nuke the same publishes again
+    update nuke every v2 publish, when republished
+
+and records the wall time, fake Maya/Nuke call counts, Shotgun requests and
+peak memory of each stage, and the nodes each load stage added.  The loads
+run the hook once per file, as the loader app does.  With --fs-latency the
+project folder is on simulated slow storage, see harness.slow_fs, and each
+stage also records its file system round trips.  --set options apply to the
+loader hooks as well.  Meant to be run in a fresh interpreter per scenario,
+see run_benchmarks.py:
+
+    python -m harness.scenario --geo 200 --latency 0.05 --json result.json
+"""
+from __future__ import print_function
+
+import argparse
+import ast
+import getpass
+import json
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+from harness import install_fakes
+
+install_fakes()
+
+import maya
+import maya.cmds
+import nuke
+import tank
+
+from harness import mock_shotgun
+from harness import scene as fake_scene
+from harness import slow_fs
+
+REPO_ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..'))
+
+# mirrors templates.yml, plus a work file template for the scene
+TEMPLATES = {
+    'maya_shot_work': 'sequences/{Sequence}/{Shot}/3d/maya/scenes/{Shot}_matchmove_v{version}.ma',
+    '3de_shot_lens_work': 'sequences/{Sequence}/{Shot}/matchmove/trackWork/3de/lensDistort/{Shot}_lensDistort_v{version}.nk',
+    'mm_shot_scene_publish': 'sequences/{Sequence}/{Shot}/publish/mm/{Shot}_matchmove_v{version}/mayaScene/{Shot}_mayaScene_v{version}.ma',
+    'mm_shot_camera_publish': 'sequences/{Sequence}/{Shot}/publish/mm/{Shot}_matchmove_v{version}/camPublish/{Shot}_{name}_camPublish_v{version}.fbx',
+    'mm_shot_cones_publish': 'sequences/{Sequence}/{Shot}/publish/mm/{Shot}_matchmove_v{version}/conesPublish/{Shot}_cones_v{version}.obj',
+    'mm_shot_geo_publish': 'sequences/{Sequence}/{Shot}/publish/mm/{Shot}_matchmove_v{version}/geoPublish/{Shot}_{name}_geo_v{version}.obj',
+    'mm_shot_lens_publish': 'sequences/{Sequence}/{Shot}/publish/mm/{Shot}_matchmove_v{version}/lensDistortPublish/{Shot}_lensDistortPublish_v{version}.nk',
+    'mm_shot_note_publish': 'sequences/{Sequence}/{Shot}/publish/mm/{Shot}_matchmove_v{version}/{Shot}_metadata_v{version}.txt',
+}
+
+# scan item type -> secondary output, as configured in shot.yml
+OUTPUTS = {
+    'camera': ('camera_export', 'mm_shot_camera_publish', 'Matchmove Camera'),
+    'cones_geo': ('cone_geo_export', 'mm_shot_cones_publish', 'Matchmove Cones'),
+    'model_geo': ('model_geo_export', 'mm_shot_geo_publish', 'Matchmove Model'),
+    'lens_node': ('lens_distort_export', 'mm_shot_lens_publish', 'Matchmove Lens Distortion'),
+    'shotgun_note': ('shotgun_note_create', 'mm_shot_note_publish', None),
+}
+
+HOOKS = {
+    'scan': 'matchmove_publish/scan_scene_maya_matchmove.py',
+    'pre_publish': 'matchmove_publish/pre_publish_maya_matchmove.py',
+    'publish': 'matchmove_publish/publish_maya_matchmove.py',
+    'maya_loader': 'matchmove_import/matchmove_maya_add_file.py',
+    'nuke_loader': 'matchmove_import/matchmove_nuke_add_file.py',
+}
+
+
+class FakeContext(object):
+    def __init__(self, project, entity, sequence):
+        self.project = project
+        self.entity = entity
+        self.sequence = sequence
+
+    def as_template_fields(self, template):
+        fields = {'Sequence': self.sequence, 'Shot': self.entity['name']}
+        return dict((k, v) for k, v in fields.items() if k in template.keys)
+
+
+class FakeTk(object):
+    def __init__(self, shotgun, project_path):
+        self.shotgun = shotgun
+        self.project_path = project_path
+
+
+class FakeEngine(object):
+    def __init__(self, name, shotgun):
+        self.name = name
+        self.shotgun = shotgun
+        # the publish hook finds the icons folder from here
+        self.environment = {'disk_location': os.path.join(REPO_ROOT, 'env', 'shot.yml')}
+
+
+class FakeApp(object):
+    """
+    What a hook sees as self.parent
+    """
+    def __init__(self, tk, engine, context, templates):
+        self.tank = tk
+        self.engine = engine
+        self.context = context
+        self.templates = templates
+        self.errors = []
+
+    def get_template_by_name(self, name):
+        return self.templates[name]
+
+    def log_error(self, msg):
+        self.errors.append(msg)
+
+
+def load_hook(path, class_name):
+    """
+    Load a hook file the way tank does, as a fresh module each time
+    """
+    module_name = 'bench_' + os.path.splitext(os.path.basename(path))[0]
+    try:
+        import imp
+        module = imp.load_source(module_name, path)
+    except ImportError:
+        import importlib.util
+        spec = importlib.util.spec_from_file_location(module_name, path)
+        module = importlib.util.module_from_spec(spec)
+        spec.loader.exec_module(module)
+    return getattr(module, class_name)
+
+
+def peak_rss_mb():
+    try:
+        import resource
+    except ImportError:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # bytes on macOS, kilobytes elsewhere
+    return peak / (1024.0 * 1024.0) if sys.platform == 'darwin' else peak / 1024.0
+
+
+class Recorder(object):
+    """
+    Measures each stage, silencing the hooks' output unless verbose
+    """
+    def __init__(self, sg, verbose=False, fs=None):
+        self.sg = sg
+        self.verbose = verbose
+        self.fs = fs
+        self.stages = []
+
+    def measure(self, name, fn, *args, **kwargs):
+        maya.reset_counts()
+        nuke.reset()
+        self.sg.reset_counts()
+        if self.fs:
+            self.fs.calls = 0
+
+        stdout = sys.stdout
+        if not self.verbose:
+            sys.stdout = open(os.devnull, 'w')
+        try:
+            start = time.time()
+            result = fn(*args, **kwargs)
+            wall = time.time() - start
+        finally:
+            if not self.verbose:
+                sys.stdout.close()
+                sys.stdout = stdout
+
+        calls = dict(maya.call_counts)
+        calls.update(nuke.call_counts)
+        calls.update(('sg.%s' % k, v) for k, v in self.sg.calls.items())
+        stage = {'stage': name,
+                 'wall': wall,
+                 'host_calls': sum(maya.call_counts.values()) + sum(nuke.call_counts.values()),
+                 'sg_calls': sum(self.sg.calls.values()),
+                 'calls': calls,
+                 'peak_rss_mb': peak_rss_mb()}
+        if self.fs:
+            stage['fs_calls'] = self.fs.calls
+        self.stages.append(stage)
+        return stage, result
+
+
+def _progress(percent, msg=None, task=None):
+    pass
+
+
+def _write(path, text):
+    folder = os.path.dirname(path)
+    if not os.path.isdir(folder):
+        os.makedirs(folder)
+    with open(path, 'w') as fh:
+        fh.write(text)
+
+
+def _published_files(sg, version):
+    """
+    (path, shotgun data) of every secondary publish of version, as the loader app passes them
+    """
+    return [(p['path']['local_path'], {'type': 'TankPublishedFile', 'id': p['id']})
+            for p in sg.all('TankPublishedFile') if p.get('version_number') == version and p.get('task')]
+
+
+def _load(loader_class, app, engine_name, files):
+    """
+    Load files the way the loader app does, with a hook per file
+    """
+    for file_path, shotgun_data in files:
+        loader_class(app).execute(engine_name, file_path, shotgun_data)
+
+
+def _apply_settings(hook_classes, settings):
+    for name, value in settings.items():
+        applied = False
+        for hook_class in hook_classes:
+            if hasattr(hook_class, name):
+                setattr(hook_class, name, value)
+                applied = True
+        if not applied:
+            raise ValueError('No hook has a %s option' % name)
+
+
+class Site(object):
+    """
+    A generated project: the mock Shotgun site, the templates, a shot with its
+    lens work files and the scene of its Maya work file
+    """
+    def __init__(self, root, shot_code='seq010_0010', sequence='seq010', latency=0.0):
+        self.root = root
+        self.project_path = os.path.join(root, 'bench')
+        self.templates = dict((name, tank.Template(definition, self.project_path))
+                              for name, definition in TEMPLATES.items())
+        self.shot_fields = {'Sequence': sequence, 'Shot': shot_code}
+
+        self.sg = mock_shotgun.MockShotgun(latency=latency)
+        self.project = self.sg.add('Project', {'name': 'bench'})
+        self.shot = self.sg.add('Shot', {'code': shot_code, 'name': shot_code, 'project': self.project})
+        self.shot['name'] = shot_code
+        self.sg_task = self.sg.add('Task', {'content': 'Matchmove', 'entity': self.shot, 'project': self.project})
+        self.sg.add('Task', {'content': 'Layout', 'entity': self.shot, 'project': self.project})
+        self.sg.add('HumanUser', {'name': 'Bench User', 'login': getpass.getuser()})
+        self.sg.add('LocalStorage', {'code': 'primary'})
+
+        self.context = FakeContext(self.project, self.shot, sequence)
+        self.tk = FakeTk(self.sg, self.project_path)
+        self.scene = None
+
+    def app(self, engine_name):
+        return FakeApp(self.tk, FakeEngine(engine_name, self.sg), self.context, self.templates)
+
+    def write_lens_files(self, versions):
+        """
+        Lens work files, of which the scan offers the latest
+        """
+        for version in range(1, versions + 1):
+            _write(self.templates['3de_shot_lens_work'].apply_fields(dict(self.shot_fields, version=version)),
+                   'LD_3DE4_Anamorphic_Standard_Degree_4 {\n distortion 0.01\n}\n' * 20)
+
+    def work_path(self, version):
+        return self.templates['maya_shot_work'].apply_fields(dict(self.shot_fields, version=version))
+
+    def new_version(self, version):
+        """
+        Save the work file as version and register its primary publish
+        """
+        work_path = self.work_path(version)
+        primary_path = self.templates['mm_shot_scene_publish'].apply_fields(dict(self.shot_fields, version=version))
+        _write(work_path, '//Maya ASCII 2014 scene\n')
+        _write(primary_path, '//Maya ASCII 2014 scene\n')
+        self.sg.add('TankPublishedFile', {'code': os.path.basename(primary_path),
+                                          'name': 'mayaScene',
+                                          'entity': self.shot,
+                                          'project': self.project,
+                                          'version_number': version,
+                                          'path_cache': 'bench' + primary_path[len(self.project_path):].replace(os.sep, '/')})
+        if self.scene is not None:
+            self.scene.scene_path = work_path
+        return work_path, primary_path
+
+    def build_scene(self, work_path, config):
+        self.scene = fake_scene.build_scene(work_path,
+                                            cameras=config['cameras'],
+                                            cones_per_group=config['cones'],
+                                            geo=config['geo'],
+                                            mesh_size=config['mesh_size'],
+                                            hidden_geo=config.get('hidden_geo', 0),
+                                            end_frame=1000 + config['frames'])
+        maya.use_scene(self.scene)
+        return self.scene
+
+    def make_tasks(self, items):
+        tasks = []
+        for item in items:
+            if item['type'] not in OUTPUTS:
+                continue
+            output_name, template_name, tank_type = OUTPUTS[item['type']]
+            tasks.append({'item': item,
+                          'output': {'name': output_name,
+                                     'publish_template': self.templates[template_name],
+                                     'tank_type': tank_type}})
+        return tasks
+
+
+def load_publish_hooks(settings=None):
+    """
+    Load the scan, pre-publish and publish hooks with settings applied
+    """
+    hooks_path = os.path.join(REPO_ROOT, 'hooks')
+    hooks = {'hook_scan_scene': load_hook(os.path.join(hooks_path, HOOKS['scan']), 'ScanSceneHook'),
+             'hook_secondary_pre_publish': load_hook(os.path.join(hooks_path, HOOKS['pre_publish']), 'PrePublishHook'),
+             'hook_secondary_publish': load_hook(os.path.join(hooks_path, HOOKS['publish']), 'PublishHook')}
+    _apply_settings(list(hooks.values()), settings or {})
+    return hooks
+
+
+class PublishApp(FakeApp):
+    """
+    The publish app as the batch worker drives it, with the settings of
+    shot.yml and the hooks run through execute_hook
+    """
+    def __init__(self, tk, engine, context, templates, hooks):
+        FakeApp.__init__(self, tk, engine, context, templates)
+        self.hooks = hooks
+        self.settings = {
+            'template_work': 'maya_shot_work',
+            'primary_scene_item_type': 'work_file',
+            'primary_publish_template': 'mm_shot_scene_publish',
+            'primary_tank_type': 'Maya Scene',
+            'secondary_outputs': [{'name': name, 'scene_item_type': item_type,
+                                   'publish_template': template_name, 'tank_type': tank_type}
+                                  for item_type, (name, template_name, tank_type) in sorted(OUTPUTS.items())],
+        }
+
+    def get_setting(self, name, default=None):
+        return self.settings.get(name, default)
+
+    def get_template(self, name):
+        return self.templates[self.settings[name]]
+
+    def execute_hook(self, key, **kwargs):
+        if key == 'hook_primary_pre_publish':
+            return []
+        if key == 'hook_primary_publish':
+            return self._publish_primary(**kwargs)
+        if key == 'hook_post_publish':
+            return self._post_publish(**kwargs)
+        return self.hooks[key](self).execute(**kwargs)
+
+    def _publish_primary(self, task, work_template, comment, thumbnail_path, sg_task, progress_cb):
+        """
+        Copy the work file to the scene publish and register it, as the app's
+        default primary publish hook does
+        """
+        work_path = maya.scene.scene_path
+        fields = work_template.get_fields(work_path)
+        publish_path = task['output']['publish_template'].apply_fields(fields)
+        folder = os.path.dirname(publish_path)
+        if not os.path.isdir(folder):
+            os.makedirs(folder)
+        shutil.copy(work_path, publish_path)
+        tank.util.register_publish(self.tank, self.context, publish_path, 'mayaScene', fields['version'],
+                                   comment=comment, task=sg_task, tank_type=task['output']['tank_type'])
+        return publish_path
+
+    def _post_publish(self, work_template, progress_cb):
+        """
+        Save the scene as the next free version of the work file, as the
+        app's default post publish hook does
+        """
+        fields = work_template.get_fields(maya.scene.scene_path)
+        fields['version'] += 1
+        while os.path.exists(work_template.apply_fields(fields)):
+            fields['version'] += 1
+        maya.cmds.file(rename=work_template.apply_fields(fields))
+        maya.cmds.file(save=True)
+
+
+def run(config):
+    """
+    Run every stage for one scene size.  Returns the config and the list of
+    stage measurements.
+    """
+    root = tempfile.mkdtemp(prefix='mm_bench_')
+    os.environ['HOME'] = root
+    if config.get('trace'):
+        os.environ['MM_PUBLISH_TRACE'] = '1'
+
+    fs = None
+    try:
+        site = Site(root, latency=config['latency'])
+        sg = site.sg
+        maya_app = site.app('tk-maya')
+        nuke_app = site.app('tk-nuke')
+        site.write_lens_files(config['lens_versions'])
+
+        work_path, primary_path = site.new_version(1)
+        site.build_scene(work_path, config)
+
+        hooks = load_publish_hooks()
+        ScanSceneHook = hooks['hook_scan_scene']
+        PrePublishHook = hooks['hook_secondary_pre_publish']
+        PublishHook = hooks['hook_secondary_publish']
+        hooks_path = os.path.join(REPO_ROOT, 'hooks')
+        MayaLoader = load_hook(os.path.join(hooks_path, HOOKS['maya_loader']), 'AddFileToScene')
+        NukeLoader = load_hook(os.path.join(hooks_path, HOOKS['nuke_loader']), 'AddFileToScene')
+        _apply_settings(list(hooks.values()) + [MayaLoader, NukeLoader], config.get('settings') or {})
+        PublishHook.thumbnail_cache_path = os.path.join(root, 'thumbnail_cache.json')
+
+        if config.get('fs_latency'):
+            fs = slow_fs.SlowFilesystem(site.project_path, config['fs_latency']).install()
+        recorder = Recorder(sg, config.get('verbose'), fs)
+
+        stage, items = recorder.measure('scan', ScanSceneHook(maya_app).execute)
+        stage['items'] = len(items)
+        stage, items = recorder.measure('rescan', ScanSceneHook(maya_app).execute)
+        stage['items'] = len(items)
+
+        tasks = site.make_tasks(items)
+        work_template = site.templates['maya_shot_work']
+        stage, results = recorder.measure('validate', PrePublishHook(maya_app).execute,
+                                          tasks, work_template, _progress)
+        stage['errors'] = sum(len(r['errors']) for r in results)
+
+        failed = set(id(r['task']) for r in results)
+        tasks = [t for t in tasks if id(t) not in failed]
+
+        stage, results = recorder.measure('publish', PublishHook(maya_app).execute,
+                                          tasks, work_template, 'benchmark publish', None,
+                                          site.sg_task, primary_path, _progress)
+        stage['errors'] = sum(len(r['errors']) for r in results)
+        stage['outputs'] = len(tasks)
+
+        if config.get('republish', True):
+            work_path, primary_path = site.new_version(2)
+            tasks = site.make_tasks(items)
+            stage, results = recorder.measure('republish', PublishHook(maya_app).execute,
+                                              tasks, work_template, 'benchmark republish', None,
+                                              site.sg_task, primary_path, _progress)
+            stage['errors'] = sum(len(r['errors']) for r in results)
+            stage['outputs'] = len(tasks)
+
+        loads = [('load', _published_files(sg, 1)), ('reload', _published_files(sg, 1))]
+        if config.get('republish', True):
+            loads.append(('update', _published_files(sg, 2)))
+
+        for name, files in loads:
+            maya_files = [f for f in files if os.path.splitext(f[0])[1] in ('.fbx', '.obj')]
+            nodes = len(maya.scene.nodes)
+            stage, result = recorder.measure('%s maya' % name, _load, MayaLoader, maya_app, 'tk-maya', maya_files)
+            stage['files'] = len(maya_files)
+            stage['new_nodes'] = len(maya.scene.nodes) - nodes
+
+        loaded_path = os.path.join(root, 'loaded_scene.ma')
+        maya.cmds.file(rename=loaded_path)
+        stage, result = recorder.measure('save maya', maya.cmds.file, save=True)
+        stage['bytes'] = os.path.getsize(loaded_path)
+        stage, result = recorder.measure('open maya', maya.cmds.file, loaded_path, open=True, force=True)
+        stage['nodes'] = len(maya.scene.nodes)
+
+        for name, files in loads:
+            nodes = len(nuke.nodes_created)
+            stage, result = recorder.measure('%s nuke' % name, _load, NukeLoader, nuke_app, 'tk-nuke', files)
+            stage['files'] = len(files)
+            stage['new_nodes'] = len(nuke.nodes_created) - nodes
+
+        return {'config': config, 'stages': recorder.stages,
+                'log_errors': maya_app.errors + nuke_app.errors}
+    finally:
+        if fs:
+            fs.uninstall()
+        if not config.get('keep'):
+            shutil.rmtree(root, ignore_errors=True)
+
+
+def parse_args(argv):
+    parser = argparse.ArgumentParser(description='Run the matchmove hooks against a generated scene')
+    parser.add_argument('--cameras', type=int, default=1)
+    parser.add_argument('--cones', type=int, default=50, help='cones in the cones group')
+    parser.add_argument('--geo', type=int, default=10, help='geo pieces')
+    parser.add_argument('--mesh-size', type=int, default=10, help='vertices along each side of a geo grid')
+    parser.add_argument('--lens-versions', type=int, default=3, help='lens work file versions on disk')
+    parser.add_argument('--frames', type=int, default=100)
+    parser.add_argument('--latency', type=float, default=0.0, help='seconds per Shotgun request')
+    parser.add_argument('--fs-latency', type=float, default=0.0,
+                        help='seconds per file system round trip in the project folder')
+    parser.add_argument('--set', action='append', default=[], metavar='OPTION=VALUE',
+                        help='set a hook option, e.g. --set batch_registration=False')
+    parser.add_argument('--no-republish', dest='republish', action='store_false')
+    parser.add_argument('--trace', action='store_true', help='write Chrome traces (use with --keep)')
+    parser.add_argument('--keep', action='store_true', help='keep the generated project folder')
+    parser.add_argument('--verbose', action='store_true', help="show the hooks' output")
+    parser.add_argument('--json', help='write the results here instead of stdout')
+    args = parser.parse_args(argv)
+
+    settings = {}
+    for setting in args.set:
+        name, value = setting.split('=', 1)
+        try:
+            settings[name] = ast.literal_eval(value)
+        except (ValueError, SyntaxError):
+            settings[name] = value
+
+    config = dict(vars(args), settings=settings)
+    del config['set']
+    return config
+
+
+def main(argv=None):
+    config = parse_args(sys.argv[1:] if argv is None else argv)
+    output = config.pop('json')
+    result = run(config)
+    if output:
+        with open(output, 'w') as fh:
+            json.dump(result, fh, indent=1, sort_keys=True)
+    else:
+        print(json.dumps(result, indent=1, sort_keys=True))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
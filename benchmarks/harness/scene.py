@@ -0,0 +1,450 @@
+"""
+Copyright (c) 2013 Shotgun Software, Inc
+----------------------------------------------------
+
+An in-memory Maya scene laid out the way the matchmove specs expect:
+
+    |Scene|cameras|<camera>     baked cameras, every channel animated
+    |Scene|cones<n>|cone<m>     cones groups, one small mesh per cone
+    |Scene|geo|<piece>          geo pieces, one grid mesh each
+
+The fake maya modules answer their queries from the scene that is current
+in fakes/maya/__init__.py.  Scenes are saved as a line of JSON per node and
+reference, holding every vertex the way a .ma file does, so the cost of
+saving and opening grows with the geometry in the scene like it does in Maya.
+"""
+import fnmatch
+import json
+import math
+
+CAMERA_ATTRS = ['translateX', 'translateY', 'translateZ',
+                'rotateX', 'rotateY', 'rotateZ',
+                'scaleX', 'scaleY', 'scaleZ']
+
+# named as the publish validation expects, any more cameras fail it
+CAMERA_NAMES = ['SHOT', 'LEFT', 'RIGHT']
+
+SHORT_ATTRS = {'tx': 'translateX', 'ty': 'translateY', 'tz': 'translateZ',
+               'rx': 'rotateX', 'ry': 'rotateY', 'rz': 'rotateZ',
+               'sx': 'scaleX', 'sy': 'scaleY', 'sz': 'scaleZ'}
+
+
+class Node(object):
+    def __init__(self, path, node_type, parent=None, visible=True):
+        self.path = path
+        self.name = path.rsplit('|', 1)[-1]
+        self.type = node_type
+        self.parent = parent
+        self.children = []
+        self.visible = visible
+        self.attrs = {}
+        self.connections = {}
+        self.mesh = None
+        self.translate = (0.0, 0.0, 0.0)
+
+
+class Mesh(object):
+    """
+    Object space mesh data as the API returns it
+    """
+    def __init__(self, points, face_counts, face_connects, us=None, vs=None, uv_ids=None):
+        self.points = points
+        self.face_counts = face_counts
+        self.face_connects = face_connects
+        self.us = us or []
+        self.vs = vs or []
+        self.uv_ids = uv_ids or []
+
+
+def grid_mesh(size, offset=0.0):
+    """
+    A size x size vertex grid with per vertex uvs
+    """
+    size = max(2, size)
+    points = []
+    us = []
+    vs = []
+    for row in range(size):
+        for col in range(size):
+            points.append((col + offset, math.sin(row * 0.3) + offset, row + offset))
+            us.append(col / float(size - 1))
+            vs.append(row / float(size - 1))
+
+    face_counts = []
+    face_connects = []
+    for row in range(size - 1):
+        for col in range(size - 1):
+            first = row * size + col
+            face_counts.append(4)
+            face_connects.extend((first, first + 1, first + size + 1, first + size))
+    return Mesh(points, face_counts, face_connects, us, vs, list(face_connects))
+
+
+def cone_mesh(offset):
+    """
+    A four sided cone marking a tracked point
+    """
+    points = [(offset, 0.0, 0.0), (offset + 0.1, 0.0, 0.0), (offset + 0.1, 0.0, 0.1),
+              (offset, 0.0, 0.1), (offset + 0.05, 0.2, 0.05)]
+    face_counts = [4, 3, 3, 3, 3]
+    face_connects = [0, 3, 2, 1, 0, 1, 4, 1, 2, 4, 2, 3, 4, 3, 0, 4]
+    return Mesh(points, face_counts, face_connects)
+
+
+def read_obj(path):
+    """
+    Return the (group name, Mesh) of every group with faces in an OBJ file,
+    each holding the vertices its faces use
+    """
+    points = []
+    groups = []
+    faces = None
+    with open(path) as fh:
+        for line in fh:
+            if line.startswith('v '):
+                x, y, z = line.split()[1:4]
+                points.append((float(x), float(y), float(z)))
+            elif line.startswith('f '):
+                faces.append([int(corner.split('/')[0]) - 1 for corner in line.split()[1:]])
+            elif line.startswith('g '):
+                faces = []
+                groups.append((line[2:].strip(), faces))
+
+    meshes = []
+    for name, group_faces in groups:
+        if not group_faces:
+            continue
+        used = sorted(set(index for face in group_faces for index in face))
+        renumber = dict((index, position) for position, index in enumerate(used))
+        meshes.append((name, Mesh([points[index] for index in used], [len(face) for face in group_faces],
+                                  [renumber[index] for face in group_faces for index in face])))
+    return meshes
+
+
+class Reference(object):
+    """
+    A referenced file.  nodes holds the top nodes it created once loaded.
+    """
+    def __init__(self, node, path, namespace):
+        self.node = node
+        self.path = path
+        self.namespace = namespace
+        self.loaded = False
+        self.nodes = []
+
+
+class FakeScene(object):
+    """
+    Nodes keyed on their long name, plus the references, selection, playback
+    range and the callbacks registered through maya.OpenMaya.
+    """
+    def __init__(self, scene_path, start_frame=1001, end_frame=1100):
+        self.scene_path = scene_path
+        self.start_frame = start_frame
+        self.end_frame = end_frame
+        self.nodes = {}
+        self.short_names = {}
+        self.references = {}
+        self.selection = []
+        self.callbacks = {}
+        self.plugins = set()
+        self.add('|Scene', 'transform')
+
+    def add(self, path, node_type, visible=True):
+        """
+        Add a node, numbered like Maya does if path is taken
+        """
+        path = self._unique(path)
+        parent = self.nodes.get(path.rsplit('|', 1)[0]) if path.count('|') > 1 else None
+        node = Node(path, node_type, parent, visible)
+        self.nodes[path] = node
+        self.short_names.setdefault(node.name, []).append(node)
+        if parent is not None:
+            parent.children.append(node)
+        self.changed()
+        return node
+
+    def remove(self, node):
+        """
+        Delete node and everything under it
+        """
+        for each in [node] + list(self.descendants(node)):
+            self.nodes.pop(each.path, None)
+            self.short_names[each.name].remove(each)
+        if node.parent is not None:
+            node.parent.children.remove(node)
+        self.selection = [p for p in self.selection if p in self.nodes]
+        self.changed()
+
+    def reparent(self, node, new_parent):
+        """
+        Move node and everything under it below new_parent
+        """
+        moved = [node] + list(self.descendants(node))
+        old_prefix = node.path
+        new_prefix = '%s|%s' % (new_parent.path, node.name)
+        for each in moved:
+            del self.nodes[each.path]
+            each.path = new_prefix + each.path[len(old_prefix):]
+            self.nodes[each.path] = each
+        if node.parent is not None:
+            node.parent.children.remove(node)
+        node.parent = new_parent
+        new_parent.children.append(node)
+        self.changed()
+        return node
+
+    def rename(self, node, name):
+        """
+        Give node a new short name, keeping it under the same parent
+        """
+        parent_path = node.path.rsplit('|', 1)[0]
+        name = self._unique('%s|%s' % (parent_path, name), node).rsplit('|', 1)[-1]
+        self.short_names[node.name].remove(node)
+        old_prefix = node.path
+        node.name = name
+        self.short_names.setdefault(name, []).append(node)
+        for each in [node] + list(self.descendants(node)):
+            del self.nodes[each.path]
+            each.path = '%s|%s%s' % (parent_path, name, each.path[len(old_prefix):])
+            self.nodes[each.path] = each
+        self.changed()
+        return node
+
+    def _unique(self, path, node=None):
+        """
+        path, or path with the lowest number added that no other node has
+        """
+        found = path
+        number = 0
+        while self.nodes.get(found, node) is not node:
+            number += 1
+            found = '%s%d' % (path, number)
+        return found
+
+    def world_translate(self, node):
+        """
+        Sum of the translations of node and its parents, transforms only
+        ever translate in the fake scene
+        """
+        offset = [0.0, 0.0, 0.0]
+        while node is not None:
+            offset = [a + b for a, b in zip(offset, node.translate)]
+            node = node.parent
+        return offset
+
+    def changed(self):
+        """
+        Fire the scene change callbacks registered through the fake API
+        """
+        for callback in list(self.callbacks.values()):
+            callback()
+
+    def node(self, name):
+        """
+        Resolve a long name, or a short name that is unique in the scene
+        """
+        if name in self.nodes:
+            return self.nodes[name]
+        if name.startswith('|'):
+            return None
+        if '|' not in name:
+            matches = self.short_names.get(name, [])
+            return matches[0] if len(matches) == 1 else None
+        matches = [n for n in self.nodes.values() if n.name == name or n.path.endswith('|' + name)]
+        return matches[0] if len(matches) == 1 else None
+
+    def partial_name(self, node):
+        """
+        The shortest name that still resolves to the node, as Maya lists it
+        """
+        names = node.path.split('|')
+        for start in range(len(names) - 1, 0, -1):
+            name = '|'.join(names[start:])
+            if self.node(name) is node:
+                return name
+        return node.path
+
+    def descendants(self, node):
+        for child in node.children:
+            yield child
+            for grandchild in self.descendants(child):
+                yield grandchild
+
+    def is_visible(self, node):
+        while node is not None:
+            if not node.visible:
+                return False
+            node = node.parent
+        return True
+
+    def match(self, pattern, node_type=None):
+        """
+        Long names matching a Maya style pattern, where * never crosses a |
+        """
+        if pattern.startswith('|'):
+            parts = pattern.split('|')
+            found = []
+            for path, node in self.nodes.items():
+                if node_type and node.type != node_type:
+                    continue
+                names = path.split('|')
+                if len(names) == len(parts) and all(fnmatch.fnmatchcase(n, p) for n, p in zip(names, parts)):
+                    found.append(path)
+            return sorted(found)
+        return sorted(path for path, node in self.nodes.items()
+                      if fnmatch.fnmatchcase(node.name, pattern) and (not node_type or node.type == node_type))
+
+    def import_obj(self, path, parent_path='', prefix=''):
+        """
+        Add a transform and mesh per group of an OBJ under parent_path, or at
+        the top of the scene.  Returns the transforms.
+        """
+        transforms = []
+        for name, mesh in read_obj(path):
+            transform = self.add('%s|%s%s' % (parent_path, prefix, name), 'transform')
+            self.add('%s|%sShape' % (transform.path, transform.name), 'mesh').mesh = mesh
+            transforms.append(transform)
+        return transforms
+
+    def add_reference(self, path, namespace):
+        """
+        Add an unloaded reference to path
+        """
+        node = '%sRN' % namespace
+        while node in self.references:
+            node += '1'
+        self.references[node] = Reference(node, path, namespace)
+        return self.references[node]
+
+    def load_reference(self, reference):
+        reference.nodes = self.import_obj(reference.path, prefix=reference.namespace + ':')
+        reference.loaded = True
+
+    def repath_reference(self, reference, path):
+        """
+        Point reference at another file, reloading it under the same parents
+        if it is loaded the way Maya applies the reference edits again
+        """
+        reference.path = path
+        if not reference.loaded:
+            return
+        parents = dict((node.name, node.parent) for node in reference.nodes)
+        for node in reference.nodes:
+            self.remove(node)
+        self.load_reference(reference)
+        for node in list(reference.nodes):
+            if parents.get(node.name) is not None:
+                self.reparent(node, parents[node.name])
+
+    def save(self, path):
+        """
+        Write the scene to path, leaving out the nodes of loaded references
+        as Maya does.  Returns the bytes written.
+        """
+        referenced = set()
+        for reference in self.references.values():
+            for node in reference.nodes:
+                referenced.update(id(each) for each in [node] + list(self.descendants(node)))
+
+        lines = [json.dumps({'frames': [self.start_frame, self.end_frame]})]
+        for node in sorted(self.nodes.values(), key=lambda n: (n.path.count('|'), n.path)):
+            if id(node) in referenced:
+                continue
+            record = {'path': node.path, 'type': node.type, 'visible': node.visible,
+                      'translate': node.translate, 'attrs': node.attrs, 'connections': node.connections}
+            if node.mesh:
+                record['mesh'] = [node.mesh.points, node.mesh.face_counts, node.mesh.face_connects]
+            lines.append(json.dumps(record))
+        for reference in self.references.values():
+            lines.append(json.dumps({'reference': reference.node, 'file': reference.path,
+                                     'namespace': reference.namespace, 'loaded': reference.loaded,
+                                     'parents': [node.parent.path if node.parent else None for node in reference.nodes]}))
+
+        text = '\n'.join(lines) + '\n'
+        with open(path, 'w') as fh:
+            fh.write(text)
+        self.scene_path = path
+        return len(text)
+
+    def channel_value(self, node, attr, frame):
+        """
+        A smooth, distinct value for every animated channel
+        """
+        attr = SHORT_ATTRS.get(attr, attr)
+        if attr.startswith('scale'):
+            return 1.0
+        if attr == 'focalLength':
+            return 35.0 + 0.01 * frame
+        if attr == 'horizontalFilmAperture':
+            return 1.417
+        if attr == 'verticalFilmAperture':
+            return 0.945
+        seed = sum(ord(c) for c in node.name + attr)
+        return math.sin(frame * 0.05 + seed) * 10.0
+
+
+def open_scene(path):
+    """
+    Read a scene written by FakeScene.save, loading the references that were
+    loaded when it was saved
+    """
+    with open(path) as fh:
+        lines = [json.loads(line) for line in fh]
+
+    scene = FakeScene(path, *lines[0]['frames'])
+    for record in lines[1:]:
+        if 'reference' in record:
+            reference = Reference(record['reference'], record['file'], record['namespace'])
+            scene.references[reference.node] = reference
+            if record['loaded']:
+                scene.load_reference(reference)
+                for node, parent in zip(list(reference.nodes), record['parents']):
+                    if parent:
+                        scene.reparent(node, scene.nodes[parent])
+        elif record['path'] not in scene.nodes:
+            node = scene.add(record['path'], record['type'], record['visible'])
+            node.translate = tuple(record['translate'])
+            node.attrs = record['attrs']
+            node.connections = record['connections']
+            if 'mesh' in record:
+                points, face_counts, face_connects = record['mesh']
+                node.mesh = Mesh([tuple(point) for point in points], face_counts, face_connects)
+    return scene
+
+
+def build_scene(scene_path, cameras=1, cones_groups=1, cones_per_group=50, geo=10, mesh_size=10,
+                hidden_geo=0, start_frame=1001, end_frame=1100):
+    """
+    Generate a matchmove scene of the given size
+    """
+    scene = FakeScene(scene_path, start_frame, end_frame)
+
+    scene.add('|persp', 'transform')
+    scene.add('|persp|perspShape', 'camera')
+
+    scene.add('|Scene|cameras', 'transform')
+    for index in range(cameras):
+        name = CAMERA_NAMES[index] if index < len(CAMERA_NAMES) else 'cam%03d' % index
+        transform = scene.add('|Scene|cameras|%s' % name, 'transform')
+        transform.attrs['rotateOrder'] = 0
+        shape = scene.add('|Scene|cameras|%s|%sShape' % (name, name), 'camera')
+        for attr in CAMERA_ATTRS:
+            transform.connections[attr] = '%s_%s' % (name, attr)
+        shape.connections['focalLength'] = '%s_focalLength' % name
+
+    for group in range(cones_groups):
+        group_path = '|Scene|cones' if group == 0 else '|Scene|cones%d' % group
+        scene.add(group_path, 'transform')
+        for cone in range(cones_per_group):
+            cone_path = '%s|cone%04d' % (group_path, cone)
+            scene.add(cone_path, 'transform').translate = (cone * 0.5, 0.0, 0.0)
+            scene.add('%s|cone%04dShape' % (cone_path, cone), 'mesh').mesh = cone_mesh(0.0)
+
+    scene.add('|Scene|geo', 'transform')
+    for index in range(geo):
+        piece = '|Scene|geo|piece%04d' % index
+        scene.add(piece, 'transform', visible=index >= hidden_geo)
+        scene.add('%s|piece%04dShape' % (piece, index), 'mesh').mesh = grid_mesh(mesh_size, index)
+
+    return scene
@@ -0,0 +1,179 @@
+"""
+Copyright (c) 2013 Shotgun Software, Inc
+----------------------------------------------------
+
+Simulated slow storage for the benchmarks.
+
+SlowFilesystem(root, latency) makes every file system call on a path under
+root take latency seconds longer, the way a round trip to a file server
+does.  Closing a file there pays once more for every BLOCK_SIZE bytes read
+or written through it, and listing a folder for every ENTRIES_PER_READ
+names in it.  Kernel copies and fsync only see file descriptors,
+so they pay wherever they go; the hooks only use them when copying onto the
+publish storage.
+"""
+import io
+import os
+import threading
+import time
+
+try:
+    import __builtin__ as builtins
+except ImportError:
+    import builtins
+
+# bytes sent to the server in one round trip
+BLOCK_SIZE = 64 * 1024
+
+# names of a folder listed in one round trip
+ENTRIES_PER_READ = 100
+
+# os functions whose path arguments are checked
+PATH_FUNCTIONS = ['stat', 'lstat', 'mkdir', 'rename', 'remove', 'unlink', 'rmdir',
+                  'link', 'symlink', 'utime', 'chmod', 'access']
+
+# os functions listing a folder
+LISTDIR_FUNCTIONS = ['listdir', 'scandir']
+
+# os functions that are slow wherever they go
+FD_FUNCTIONS = ['fsync', 'copy_file_range', 'sendfile']
+
+
+def _close(fs, fh):
+    """
+    Pay for the close of fh and the blocks read or written through it
+    """
+    if not fh.closed:
+        try:
+            moved = fh.tell()
+        except (IOError, OSError, ValueError):
+            moved = 0
+        fs.wait('close', 1 + moved // BLOCK_SIZE)
+
+
+class _SlowFile(object):
+    """
+    A file opened under the slow root
+    """
+    def __init__(self, fs, fh):
+        self._fs = fs
+        self._fh = fh
+
+    def close(self):
+        _close(self._fs, self._fh)
+        self._fh.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def __iter__(self):
+        return iter(self._fh)
+
+    def __getattr__(self, name):
+        return getattr(self._fh, name)
+
+
+if hasattr(builtins, 'file'):
+    class _SlowFile2(builtins.file):
+        """
+        The Python 2 file opened under the slow root, which stays a file for
+        the C code that only writes to real ones
+        """
+        def __init__(self, fs, path, mode='r', *args):
+            builtins.file.__init__(self, path, mode, *args)
+            self._fs = fs
+
+        def close(self):
+            _close(self._fs, self)
+            builtins.file.close(self)
+
+        def __exit__(self, *args):
+            self.close()
+
+
+class SlowFilesystem(object):
+    """
+    Installs the latency on the os and open functions until uninstalled
+    """
+    def __init__(self, root, latency):
+        self.root = os.path.abspath(root)
+        self.latency = latency
+        self.calls = 0
+        self.counts = {}
+        self.listed = 0
+        self._lock = threading.Lock()
+        self._saved = []
+
+    def wait(self, name, count=1):
+        """
+        Pay for count round trips made by the function name
+        """
+        with self._lock:
+            self.calls += count
+            self.counts[name] = self.counts.get(name, 0) + count
+        time.sleep(self.latency * count)
+
+    def _slow(self, args):
+        for arg in args:
+            if isinstance(arg, str) and os.path.abspath(arg).startswith(self.root + os.sep):
+                return True
+        return False
+
+    def _wrap_path_function(self, name, fn):
+        def slow(*args, **kwargs):
+            if self._slow(args[:2]):
+                self.wait(name)
+            return fn(*args, **kwargs)
+        return slow
+
+    def _wrap_listdir_function(self, name, fn, listdir):
+        def slow(*args, **kwargs):
+            if self._slow(args[:1]):
+                names = len(listdir(args[0]))
+                with self._lock:
+                    self.listed += names
+                self.wait(name, 1 + names // ENTRIES_PER_READ)
+            return fn(*args, **kwargs)
+        return slow
+
+    def _wrap_fd_function(self, name, fn):
+        def slow(*args, **kwargs):
+            self.wait(name)
+            return fn(*args, **kwargs)
+        return slow
+
+    def _wrap_open(self, fn, python2_file=False):
+        def slow(path, mode='r', *args, **kwargs):
+            if not self._slow([path]):
+                return fn(path, mode, *args, **kwargs)
+            self.wait('open')
+            if python2_file:
+                return _SlowFile2(self, path, mode, *args)
+            return _SlowFile(self, fn(path, mode, *args, **kwargs))
+        return slow
+
+    def _patch(self, module, name, wrapped):
+        self._saved.append((module, name, getattr(module, name)))
+        setattr(module, name, wrapped)
+
+    def install(self):
+        for name in PATH_FUNCTIONS:
+            if hasattr(os, name):
+                self._patch(os, name, self._wrap_path_function(name, getattr(os, name)))
+        for name in LISTDIR_FUNCTIONS:
+            if hasattr(os, name):
+                self._patch(os, name, self._wrap_listdir_function(name, getattr(os, name), os.listdir))
+        for name in FD_FUNCTIONS:
+            if hasattr(os, name):
+                self._patch(os, name, self._wrap_fd_function(name, getattr(os, name)))
+        self._patch(builtins, 'open', self._wrap_open(builtins.open, hasattr(builtins, 'file')))
+        self._patch(io, 'open', self._wrap_open(io.open))
+        return self
+
+    def uninstall(self):
+        while self._saved:
+            module, name, fn = self._saved.pop()
+            setattr(module, name, fn)
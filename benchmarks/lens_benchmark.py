@@ -0,0 +1,121 @@
+"""
+Copyright (c) 2013 Shotgun Software, Inc
+----------------------------------------------------
+
+Count the file system calls of finding the lens work files to publish.
+
+A lens folder gets --versions versions of the 3de_shot_lens_work file, on
+simulated slow storage (see harness.slow_fs), and is scanned --scans times
+the way tk.paths_from_template with skip_keys=['version'] finds them, then
+with matchmove_lib.lens_index.  A new version is saved and both are run once
+more, which the index has to notice:
+
+    python2.7 lens_benchmark.py --versions 500 --fs-latency 0.002
+
+Every row has the stat calls made, the round trips spent listing folders,
+at one per harness.slow_fs.ENTRIES_PER_READ names as on a file server, the
+names listed, the paths found and the time taken.
+"""
+from __future__ import print_function
+
+import argparse
+import glob
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+from harness import install_fakes
+
+install_fakes()
+
+import tank
+
+from harness import slow_fs
+from harness.scenario import TEMPLATES
+from matchmove_lib import lens_index
+
+FIELDS = {'Sequence': 'seq010', 'Shot': 'seq010_0010'}
+
+STAT_FUNCTIONS = ('stat', 'lstat', 'access')
+LISTDIR_FUNCTIONS = ('listdir', 'scandir')
+
+
+def _paths_from_template(template, fields):
+    """
+    What tk.paths_from_template(template, fields, skip_keys=['version'])
+    does: glob the template with the version left open and keep the paths
+    that fit it
+    """
+    head, tail = template.apply_fields(dict(fields, version=0)).rsplit('000', 1)
+    return [path for path in glob.glob(head + '*' + tail) if template.validate(path)]
+
+
+def _write_version(template, version):
+    path = template.apply_fields(dict(FIELDS, version=version))
+    with open(path, 'w') as fh:
+        fh.write('LD_3DE4_Anamorphic_Standard_Degree_4 {\n distortion 0.01\n}\n' * 20)
+    # a new save always moves the folder's mtime on, however coarse it is
+    stat = os.stat(os.path.dirname(path))
+    os.utime(os.path.dirname(path), (stat.st_atime, stat.st_mtime + 1))
+
+
+def _measure(fs, label, scans, fn):
+    fs.counts.clear()
+    fs.listed = 0
+    start = time.time()
+    for i in range(scans):
+        paths = fn()
+    elapsed = time.time() - start
+    stats = sum(fs.counts.get(name, 0) for name in STAT_FUNCTIONS)
+    listdirs = sum(fs.counts.get(name, 0) for name in LISTDIR_FUNCTIONS)
+    return (label, scans, stats, listdirs, fs.listed, len(paths), elapsed)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Count the file system calls of the lens scan')
+    parser.add_argument('--versions', type=int, default=300, help='lens work file versions on disk')
+    parser.add_argument('--scans', type=int, default=10)
+    parser.add_argument('--fs-latency', type=float, default=0.002, help='seconds per file system round trip')
+    options = parser.parse_args(sys.argv[1:] if argv is None else argv)
+
+    root = tempfile.mkdtemp(prefix='mm_lens_bench_')
+    try:
+        template = tank.Template(TEMPLATES['3de_shot_lens_work'], root)
+        folder = os.path.dirname(template.apply_fields(dict(FIELDS, version=0)))
+        os.makedirs(folder)
+        for version in range(1, options.versions + 1):
+            _write_version(template, version)
+
+        index = lens_index.DirectoryIndex()
+        scans = [('paths_from_template', lambda: _paths_from_template(template, FIELDS)),
+                 ('lens index', lambda: lens_index.find_versions(index, template, FIELDS))]
+
+        rows = []
+        fs = slow_fs.SlowFilesystem(root, options.fs_latency).install()
+        try:
+            for label, fn in scans:
+                rows.append(_measure(fs, label, options.scans, fn))
+        finally:
+            fs.uninstall()
+
+        _write_version(template, options.versions + 1)
+        fs.install()
+        try:
+            for label, fn in scans:
+                rows.append(_measure(fs, '%s, new version' % label, 1, fn))
+        finally:
+            fs.uninstall()
+
+        print('%-32s %6s %8s %8s %10s %6s %10s' % ('scan', 'scans', 'stat', 'listdir', 'names', 'paths', 'ms'))
+        for label, count, stats, listdirs, names, paths, elapsed in rows:
+            print('%-32s %6d %8d %8d %10d %6d %10.1f' % (label, count, stats, listdirs, names, paths,
+                                                       elapsed * 1000.0))
+    finally:
+        shutil.rmtree(root, ignore_errors=True)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
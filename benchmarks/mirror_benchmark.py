@@ -0,0 +1,211 @@
+"""
+Copyright (c) 2013 Shotgun Software, Inc
+----------------------------------------------------
+
+Sync a matchmove_lib.publish_mirror.PublishMirror from a mock Shotgun site and
+compare answering the loaders' lookups from it with asking Shotgun.
+
+The site gets --shots shots with --versions versions of a Maya scene publish
+each, and --names geo publishes depending on every scene.  The records are stamped
+--spacing seconds apart on a fake clock, which then drives the mirror through
+the paged full sync a first load starts, an incremental sync after new,
+changed and retired publishes, and the next full sync:
+
+    python2.7 mirror_benchmark.py --shots 200 --latency 0.05
+
+Every sync is shown with its Shotgun calls and rows read, so the cost one
+load pays for keeping the mirror up to date can be read off directly.  The
+lookups are the loaders' records by id, the latest versions of a shot and
+what was published from a scene, each from the mirror and from Shotgun.
+"""
+from __future__ import print_function
+
+import argparse
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+from harness import install_fakes
+
+install_fakes()
+
+from harness import mock_shotgun
+from matchmove_lib import publish_mirror
+
+SCENE_TYPE = 'Maya Scene'
+GEO_TYPE = 'Geo'
+
+
+class Clock(object):
+    """
+    A clock that only moves when told to
+    """
+    def __init__(self, now):
+        self.now = now
+
+    def __call__(self):
+        return self.now
+
+    def advance(self, seconds):
+        self.now += seconds
+
+
+def _publish(sg, project, shot, tank_type, name, version):
+    path = '/bench/%s/%s/%s_v%03d.%s' % (shot['name'], tank_type['name'], name, version,
+                                        'ma' if tank_type['name'] == SCENE_TYPE else 'obj')
+    return sg.add('TankPublishedFile', {'project': project, 'entity': shot, 'tank_type': tank_type,
+                                        'name': name, 'version_number': version,
+                                        'path': {'local_path': path}, 'path_cache': path.lstrip('/')})
+
+
+def _publish_version(sg, clock, options, project, shot, types, version):
+    """
+    Publish version of the scene of shot and its geo, spacing seconds after
+    the last publish
+    """
+    clock.advance(options.spacing)
+    scene = _publish(sg, project, shot, types[SCENE_TYPE], 'scene', version)
+    for index in range(options.names):
+        geo = _publish(sg, project, shot, types[GEO_TYPE], 'geo%02d' % index, version)
+        sg.add('TankDependency', {'tank_published_file': geo, 'dependent_tank_published_file': scene})
+    return scene
+
+
+def _seed(sg, clock, options):
+    project = sg.add('Project', {'name': 'bench'})
+    types = dict((name, dict(sg.add('TankType', {'code': name}), name=name)) for name in (SCENE_TYPE, GEO_TYPE))
+    shots = []
+    for index in range(options.shots):
+        code = 'sh%04d' % index
+        shot = dict(sg.add('Shot', {'code': code, 'name': code, 'project': project}), name=code)
+        shots.append(shot)
+        for version in range(1, options.versions + 1):
+            _publish_version(sg, clock, options, project, shot, types, version)
+    return project, shots, types
+
+
+def _sync(sg, mirror):
+    sg.reset_counts()
+    start = time.time()
+    mirror.sync(sg)
+    return time.time() - start, sum(sg.calls.values()), mirror.rows_read
+
+
+def _live_records(sg, ids):
+    return dict((r['id'], r) for r in sg.find('TankPublishedFile', [['id', 'in', ids]],
+                                              publish_mirror.RECORD_FIELDS))
+
+
+def _live_latest(sg, shot):
+    latest = {}
+    for record in sg.find('TankPublishedFile', [['entity', 'is', shot]], publish_mirror.RECORD_FIELDS):
+        key = (record['tank_type']['name'], record['name'])
+        if key not in latest or record['version_number'] > latest[key]['version_number']:
+            latest[key] = record
+    return [latest[key] for key in sorted(latest)]
+
+
+def _live_dependents(sg, scene):
+    links = sg.find('TankDependency', [['dependent_tank_published_file', 'is', scene]], ['tank_published_file'])
+    return sg.find('TankPublishedFile', [['id', 'in', [link['tank_published_file']['id'] for link in links]]],
+                   publish_mirror.RECORD_FIELDS, order=[{'field_name': 'id', 'direction': 'asc'}])
+
+
+def _best_of(repeat, fn, *args):
+    best = None
+    for i in range(repeat):
+        start = time.time()
+        fn(*args)
+        elapsed = time.time() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+
+def _full_sync(sg, clock, mirror, label, syncs):
+    """
+    Sync a load at a time until the full sync is through
+    """
+    count = rows = calls = 0
+    worst = 0.0
+    while True:
+        elapsed, sync_calls, sync_rows = _sync(sg, mirror)
+        count += 1
+        rows += sync_rows
+        calls += sync_calls
+        worst = max(worst, elapsed)
+        clock.advance(publish_mirror.MIN_SYNC_INTERVAL)
+        if mirror._state(mirror._connection(), 'full start') is None:
+            break
+    syncs.append(('%s (%d syncs)' % (label, count), calls, rows, worst))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Benchmark the local mirror of publish records')
+    parser.add_argument('--shots', type=int, default=50)
+    parser.add_argument('--names', type=int, default=10, help='geo publishes per scene')
+    parser.add_argument('--versions', type=int, default=3)
+    parser.add_argument('--spacing', type=float, default=5.0, help='seconds between publishes')
+    parser.add_argument('--lookup', type=int, default=20, help='publishes looked up at once, as a load does')
+    parser.add_argument('--latency', type=float, default=0.0, help='seconds per Shotgun request')
+    parser.add_argument('--repeat', type=int, default=5)
+    options = parser.parse_args(sys.argv[1:] if argv is None else argv)
+
+    folder = tempfile.mkdtemp(prefix='mm_mirror_bench_')
+    clock = Clock(1.5e9)
+    sg = mock_shotgun.MockShotgun(clock=clock)
+    try:
+        project, shots, types = _seed(sg, clock, options)
+        mirror = publish_mirror.PublishMirror(os.path.join(folder, 'publishes.sqlite'), project, clock)
+        sg.latency = options.latency
+
+        # the syncs of loads, one per MIN_SYNC_INTERVAL, columns are the
+        # totals and the slowest single sync
+        syncs = []
+        _full_sync(sg, clock, mirror, 'first full', syncs)
+
+        # a new version of a tenth of the shots, a changed path and a retired publish
+        for shot in shots[::10]:
+            _publish_version(sg, clock, options, project, shot, types, options.versions + 1)
+        changed = [p for p in sg.all('TankPublishedFile') if p['entity']['id'] == shots[1]['id']][0]
+        sg.update('TankPublishedFile', changed['id'], {'path_cache': 'moved/' + changed['path_cache']})
+        retired = [p for p in sg.all('TankPublishedFile') if p['entity']['id'] == shots[-1]['id']][-1]
+        sg.delete('TankPublishedFile', retired['id'])
+        clock.advance(publish_mirror.MIN_SYNC_INTERVAL)
+        elapsed, calls, rows = _sync(sg, mirror)
+        syncs.append(('incremental', calls, rows, elapsed))
+
+        clock.advance(publish_mirror.FULL_SYNC_AGE)
+        _full_sync(sg, clock, mirror, 'daily full', syncs)
+
+        lookups = []
+        ids = [p['id'] for p in sg.all('TankPublishedFile')][:options.lookup]
+        mirror_time = _best_of(options.repeat, mirror.records, ids)
+        live_time = _best_of(options.repeat, _live_records, sg, ids)
+        lookups.append(('%d records' % len(ids), mirror_time, live_time))
+        shot = shots[0]
+        lookups.append(('latest of a shot', _best_of(options.repeat, mirror.latest, shot),
+                        _best_of(options.repeat, _live_latest, sg, shot)))
+        scene = mirror.latest(shot, types[SCENE_TYPE])[0]
+        lookups.append(('dependents of a scene', _best_of(options.repeat, mirror.dependents, scene),
+                        _best_of(options.repeat, _live_dependents, sg, scene)))
+        sg.latency = 0.0
+        mirror.close()
+
+        print('%d publishes, %.2f MB mirror, %d records a page' % (
+            len(sg.all('TankPublishedFile')), os.path.getsize(mirror.path) / 1e6, publish_mirror.FULL_SYNC_PAGE))
+        print('%-24s %10s %10s %12s' % ('sync', 'sg calls', 'rows', 'slowest ms'))
+        for label, calls, rows, elapsed in syncs:
+            print('%-24s %10d %10d %12.2f' % (label, calls, rows, elapsed * 1000.0))
+        print('%-24s %10s %10s %12s' % ('lookup', 'mirror us', 'live us', 'speedup'))
+        for label, mirror_time, live_time in lookups:
+            print('%-24s %10.1f %10.1f %11.0fx' % (label, mirror_time * 1e6, live_time * 1e6,
+                                                   live_time / max(mirror_time, 1e-9)))
+    finally:
+        shutil.rmtree(folder, ignore_errors=True)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,126 @@
+"""
+Copyright (c) 2013 Shotgun Software, Inc
+----------------------------------------------------
+
+Report what each proxy level of published geo costs and saves.
+
+For a flat grid and a sphere with --mesh-size vertices along each side, the
+proxies are built with matchmove_lib.proxy_mesh and every level is written
+out.  Each level is reported with its triangle count, file size and the time
+to load it, measured as parsing every vertex and face of the OBJ, which is
+the least any loader has to do.  The full resolution row has the time taken
+to build all of the proxies:
+
+    python2.7 proxy_benchmark.py --mesh-size 300
+
+Exits with status 1 if a level keeps more triangles than a finer one.
+"""
+from __future__ import print_function
+
+import argparse
+import math
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+from harness import install_fakes
+
+install_fakes()
+
+from harness import scene
+from matchmove_lib import obj_writer
+from matchmove_lib import proxy_mesh
+
+
+def _grid(size):
+    mesh = scene.grid_mesh(size)
+    return obj_writer.Mesh('grid', [v for point in mesh.points for v in point],
+                           mesh.face_counts, mesh.face_connects)
+
+
+def _sphere(size):
+    rows = max(3, size // 2)
+    points = []
+    for row in range(rows):
+        theta = math.pi * (row + 0.5) / rows
+        for col in range(size):
+            phi = 2.0 * math.pi * col / size
+            points.extend((math.sin(theta) * math.cos(phi), math.cos(theta), math.sin(theta) * math.sin(phi)))
+    face_counts = []
+    face_connects = []
+    for row in range(rows - 1):
+        for col in range(size):
+            first = row * size + col
+            second = row * size + (col + 1) % size
+            face_counts.append(4)
+            face_connects.extend((first, second, second + size, first + size))
+    return obj_writer.Mesh('sphere', points, face_counts, face_connects)
+
+
+SHAPES = [('grid', _grid), ('sphere', _sphere)]
+
+
+def _best_of(repeat, fn, *args):
+    best = None
+    result = None
+    for i in range(repeat):
+        start = time.time()
+        result = fn(*args)
+        elapsed = time.time() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best, result
+
+
+def _load_obj(path):
+    points = []
+    faces = []
+    with open(path) as fh:
+        for line in fh:
+            if line.startswith('v '):
+                points.append([float(v) for v in line.split()[1:]])
+            elif line.startswith('f '):
+                faces.append([int(v.split('/')[0]) for v in line.split()[1:]])
+    return len(faces)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Benchmark the proxy levels of published geo')
+    parser.add_argument('--mesh-size', type=int, default=300, help='vertices along each side of the meshes')
+    parser.add_argument('--repeat', type=int, default=3)
+    options = parser.parse_args(sys.argv[1:] if argv is None else argv)
+
+    folder = tempfile.mkdtemp(prefix='mm_proxy_bench_')
+    status = 0
+    try:
+        print('%-8s %-8s %10s %8s %10s %10s' % ('shape', 'level', 'triangles', 'MB', 'build ms', 'load ms'))
+        for name, make in SHAPES:
+            meshes = [make(options.mesh_size)]
+            path = os.path.join(folder, '%s.obj' % name)
+            obj_writer.write_obj(path, meshes)
+
+            build, proxies = _best_of(options.repeat, proxy_mesh.build_proxies, meshes)
+            rows = [('full', proxy_mesh.triangle_count(meshes), path, build)]
+            for level, proxy, triangles in proxies:
+                level_path = proxy_mesh.proxy_path(path, level)
+                proxy_mesh.write_proxy(level_path, proxy)
+                rows.append(('proxy%d' % level, triangles, level_path, None))
+
+            for label, triangles, level_path, seconds in rows:
+                load, faces = _best_of(options.repeat, _load_obj, level_path)
+                print('%-8s %-8s %10d %8.2f %10s %10.2f' % (
+                    name, label, triangles, os.path.getsize(level_path) / 1e6,
+                    '%.2f' % (seconds * 1000.0) if seconds is not None else '-', load * 1000.0))
+
+            counts = [triangles for label, triangles, level_path, seconds in rows]
+            if counts != sorted(counts, reverse=True) or len(counts) == 1:
+                print('%s: the levels do not get lighter: %s' % (name, counts))
+                status = 1
+    finally:
+        shutil.rmtree(folder, ignore_errors=True)
+    return status
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,179 @@
+"""
+Copyright (c) 2013 Shotgun Software, Inc
+----------------------------------------------------
+
+Benchmark the matchmove hooks over growing scene sizes.
+
+Every (variant, size) pair runs harness.scenario in its own interpreter, so
+session caches and peak memory never carry over between runs.  The hooks are
+Python 2 code, so run this with (or point --python at) the interpreter the
+hooks are written for:
+
+    python2.7 run_benchmarks.py --sizes 10,100,500 --latency 0.05
+    python2.7 run_benchmarks.py --variants all --save baseline.json
+    python2.7 run_benchmarks.py --baseline baseline.json
+    python2.7 run_benchmarks.py --variants default,staged --fs-latency 0.005
+
+Variants switch hook options to compare against the older code paths.
+--fs-latency puts the project on simulated slow storage, so the staged
+variant can be compared with writing publishes straight to it.  A saved run
+can be used as a baseline: any stage that got slower than the tolerance, or
+makes more host or Shotgun calls, is reported and the script exits with
+status 1.
+"""
+from __future__ import print_function
+
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+
+BENCH_PATH = os.path.dirname(os.path.abspath(__file__))
+
+# name -> hook option overrides
+VARIANTS = {
+    'default': [],
+    'unbatched': ['batch_registration=False'],
+    'serial-io': ['max_io_workers=1'],
+    'objexport': ['use_builtin_obj_writer=False'],
+    'staged': ['stage_locally=True'],
+    'no-fingerprints': ['skip_unchanged_geometry=False'],
+    'no-dedupe': ['dedupe_outputs=False'],
+    'referenced-geo': ['reference_geo=True'],
+    'no-reuse': ['reuse_loaded_publishes=False'],
+    'no-mirror': ['use_publish_mirror=False'],
+}
+
+# stages faster than this are too noisy to compare wall times
+MIN_COMPARABLE_WALL = 0.005
+
+
+def scene_args(size, options):
+    """
+    Scenario arguments for a scene with size geo pieces
+    """
+    return ['--geo', str(size),
+            '--cones', str(size * 5),
+            '--cameras', str(min(3, 1 + size // 100)),
+            '--lens-versions', str(3 + size // 20),
+            '--mesh-size', str(options.mesh_size),
+            '--frames', str(options.frames),
+            '--latency', str(options.latency),
+            '--fs-latency', str(options.fs_latency)]
+
+
+def run_scenario(python, size, variant, options):
+    handle, output = tempfile.mkstemp(prefix='mm_bench_', suffix='.json')
+    os.close(handle)
+    try:
+        command = [python, '-m', 'harness.scenario', '--json', output] + scene_args(size, options)
+        for setting in VARIANTS[variant]:
+            command.extend(['--set', setting])
+        if options.trace:
+            command.extend(['--trace', '--keep'])
+
+        with open(os.devnull, 'w') as devnull:
+            status = subprocess.call(command, cwd=BENCH_PATH, stdout=None if options.verbose else devnull)
+        if status != 0:
+            raise RuntimeError('%s exited with status %d' % (' '.join(command), status))
+        with open(output) as fh:
+            return json.load(fh)
+    finally:
+        os.remove(output)
+
+
+def format_table(runs):
+    lines = ['%-16s %6s  %-10s %10s %8s %7s %7s %9s %7s' % ('variant', 'size', 'stage', 'wall ms',
+                                                             'host', 'sg', 'fs', 'rss MB', 'errors')]
+    for run in runs:
+        for stage in run['stages']:
+            rss = stage['peak_rss_mb']
+            lines.append('%-16s %6d  %-10s %10.1f %8d %7d %7s %9s %7s' % (
+                run['variant'], run['size'], stage['stage'], stage['wall'] * 1000.0,
+                stage['host_calls'], stage['sg_calls'], stage.get('fs_calls', '-'),
+                '%.1f' % rss if rss is not None else '-',
+                stage.get('errors', '')))
+    return '\n'.join(lines)
+
+
+def compare(runs, baseline_runs, tolerance):
+    """
+    Return a description of every stage that regressed against the baseline
+    """
+    baseline = {}
+    for run in baseline_runs:
+        for stage in run['stages']:
+            baseline[(run['variant'], run['size'], stage['stage'])] = stage
+
+    regressions = []
+    for run in runs:
+        for stage in run['stages']:
+            key = (run['variant'], run['size'], stage['stage'])
+            before = baseline.get(key)
+            if before is None:
+                continue
+            label = '%s size %d %s' % key
+            if before['wall'] >= MIN_COMPARABLE_WALL and stage['wall'] > before['wall'] * (1.0 + tolerance):
+                regressions.append('%s: %.1f ms, was %.1f ms' % (label, stage['wall'] * 1000.0, before['wall'] * 1000.0))
+            for counter in ('host_calls', 'sg_calls'):
+                if stage[counter] > before[counter]:
+                    regressions.append('%s: %d %s, was %d' % (label, stage[counter], counter, before[counter]))
+            if stage.get('errors', 0) > before.get('errors', 0):
+                regressions.append('%s: %d errors, was %d' % (label, stage['errors'], before.get('errors', 0)))
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Benchmark the matchmove hooks as the scene grows')
+    parser.add_argument('--sizes', default='10,50,200', help='comma separated numbers of geo pieces')
+    parser.add_argument('--variants', default='default',
+                        help='comma separated variants or "all": %s' % ', '.join(sorted(VARIANTS)))
+    parser.add_argument('--latency', type=float, default=0.02, help='seconds per Shotgun request')
+    parser.add_argument('--fs-latency', type=float, default=0.0,
+                        help='seconds per file system round trip in the project folder')
+    parser.add_argument('--mesh-size', type=int, default=10)
+    parser.add_argument('--frames', type=int, default=100)
+    parser.add_argument('--python', default=sys.executable, help='interpreter to run the hooks with')
+    parser.add_argument('--save', help='write the results to this file')
+    parser.add_argument('--baseline', help='compare against results saved with --save')
+    parser.add_argument('--tolerance', type=float, default=0.25, help='allowed wall time increase')
+    parser.add_argument('--trace', action='store_true', help='keep the projects and write Chrome traces')
+    parser.add_argument('--verbose', action='store_true')
+    options = parser.parse_args(sys.argv[1:] if argv is None else argv)
+
+    sizes = [int(size) for size in options.sizes.split(',')]
+    variants = sorted(VARIANTS) if options.variants == 'all' else options.variants.split(',')
+    for variant in variants:
+        if variant not in VARIANTS:
+            parser.error('unknown variant %s' % variant)
+
+    runs = []
+    for variant in variants:
+        for size in sizes:
+            result = run_scenario(options.python, size, variant, options)
+            runs.append({'variant': variant, 'size': size, 'stages': result['stages'],
+                         'log_errors': result['log_errors']})
+            sys.stderr.write('finished %s size %d\n' % (variant, size))
+
+    print(format_table(runs))
+
+    if options.save:
+        with open(options.save, 'w') as fh:
+            json.dump({'latency': options.latency, 'fs_latency': options.fs_latency, 'runs': runs}, fh, indent=1, sort_keys=True)
+
+    if options.baseline:
+        with open(options.baseline) as fh:
+            regressions = compare(runs, json.load(fh)['runs'], options.tolerance)
+        if regressions:
+            print('\nregressions:')
+            for regression in regressions:
+                print('  ' + regression)
+            return 1
+        print('\nno regressions against %s' % options.baseline)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -11,15 +11,72 @@ different. See code comments for details.
 """
 import tank
 import os
+import sys
+
+# shared matchmove helpers live next to the hook folders
+_hooks_path = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+if _hooks_path not in sys.path:
+    sys.path.append(_hooks_path)
+
+from matchmove_lib import cone_cloud
+from matchmove_lib import geo_references
+from matchmove_lib import loaded_publishes
+from matchmove_lib import proxy_mesh
+from matchmove_lib import publish_cache
+from matchmove_lib import publish_mirror
+from matchmove_lib import tracing
 
 class AddFileToScene(tank.Hook):
 
+    # proxy level imported for geo published with proxies, 0 imports the full
+    # resolution OBJ.  Either way matchmove_lib.proxy_mesh.swap_maya_resolution
+    # switches the group over afterwards.
+    proxy_level = 1
+
+    # bring geo in as an unloaded reference rather than importing it, under
+    # the same group name, with the proxy_level proxy imported as a stand-in
+    # if one was published.  matchmove_lib.geo_references.load_references
+    # loads the full geometry of the selected groups.
+    reference_geo = False
+
+    # answer publish lookups from a local mirror of the project's publishes,
+    # synced incrementally from Shotgun, and query Shotgun for what it lacks
+    use_publish_mirror = True
+
+    # file of the mirror, one per site and project under ~/.matchmove if None
+    publish_mirror_path = None
+
+    # on the first publish the session cache misses, fetch the records of
+    # every publish made from the same scene, which is what the loader lists,
+    # so the rest of the selection needs no lookup of its own
+    prefetch_scene_publishes = True
+
+    # skip publishes already in the scene and update another loaded version
+    # of a publish in place, found through the tags left on the nodes the
+    # loader creates.  False loads every file afresh.
+    reuse_loaded_publishes = True
+
     def execute(self, engine_name, file_path, shotgun_data, **kwargs):
         """
         Hook entry point and app-specific code dispatcher
         """
 
-        publish_record = self.parent.engine.shotgun.find_one('TankPublishedFile', [['id', 'is', shotgun_data['id']]] ,['entity','name','version_number','tank_type'])
+        tracer = tracing.session_tracer()
+        tracer.instrument(self.parent.engine.shotgun)
+
+        with tracer.span('load', path=file_path):
+            self._load_file(engine_name, file_path, shotgun_data)
+
+        if tracer.enabled:
+            path = tracer.write(tracing.local_trace_path('load'))
+            if path:
+                print "wrote trace %s" % path
+
+    def _load_file(self, engine_name, file_path, shotgun_data):
+        """
+        Load one file into the current engine
+        """
+        publish_record = self._get_publish_record(shotgun_data)
 
         if engine_name == "tk-maya":
             self.add_file_to_maya(file_path, shotgun_data, publish_record)
@@ -39,6 +96,39 @@ class AddFileToScene(tank.Hook):
         else:
             raise Exception("Don't know how to load file into unknown engine %s" % engine_name)
 
+    def _get_publish_record(self, shotgun_data):
+        """
+        Return the publish record for shotgun_data, from the session cache if possible
+        """
+        cache = publish_cache.session_cache()
+
+        record = publish_cache.complete_record(shotgun_data)
+        if record:
+            cache.put(record)
+            return record
+
+        record = cache.get(shotgun_data['id'])
+        if record is None and self.prefetch_scene_publishes:
+            with tracing.session_tracer().span('fetch scene records'):
+                record = cache.fetch_scene(self.parent.engine.shotgun, shotgun_data['id'],
+                                           mirror=self._publish_mirror).get(shotgun_data['id'])
+        elif record is None:
+            record = cache.fetch(self.parent.engine.shotgun, [shotgun_data['id']],
+                                 mirror=self._publish_mirror).get(shotgun_data['id'])
+        if not record:
+            raise Exception("Unable to find the published file %s in Shotgun" % shotgun_data['id'])
+        return record
+
+    def _publish_mirror(self):
+        """
+        Return the project's publish mirror, synced for the publishes the
+        session cache missed, or None if they should come from Shotgun
+        """
+        if not self.use_publish_mirror:
+            return None
+        return publish_mirror.lookup(self.parent.engine.shotgun, self.parent.context.project,
+                                     self.publish_mirror_path)
+
     ###############################################################################################
     # app specific implementations
 
@@ -47,6 +137,9 @@ class AddFileToScene(tank.Hook):
         Load file into Maya.
 
         This implementation creates a standard maya reference file for any item.
+        Cameras, cones and geo are tagged with their publish, so loading one
+        that is already in the scene does nothing and loading another version
+        of it updates the loaded one.
         """
 
         import pymel.core as pm
@@ -65,6 +158,23 @@ class AddFileToScene(tank.Hook):
         texture_extensions = [".png", ".jpg", ".jpeg", ".exr", ".cin", ".dpx",
                               ".psd", ".tiff", ".tga"]
 
+        index = loaded_publishes.maya_index() if self.reuse_loaded_publishes else None
+        loaded = index.find(publish_data) if index else None
+        if loaded is not None and loaded.publish_id == publish_data['id']:
+            print "%s is already loaded as %s" % (import_name, loaded.node)
+            cmds.select(loaded.node, replace=True)
+            return
+
+        # the node tagged with the publish, if there is one, and the parent
+        # of the cones it replaces
+        x = None
+        parents = None
+
+        if loaded is not None and publish_data['tank_type']['name'] == 'Matchmove Cones':
+            # cones are built again under the same parent rather than updated
+            parents = cmds.listRelatives(loaded.node, parent=True, fullPath=True)
+            cmds.delete(loaded.node)
+
         if ext in [".ma", ".mb"]:
             # maya file - load it as a reference
             pm.system.createReference(file_path)
@@ -75,15 +185,36 @@ class AddFileToScene(tank.Hook):
             cmds.setAttr( "%s.fileTextureName" % x, file_path, type="string" )
 
         elif ext == ".fbx":
-            # camera publishes
+            # camera publishes, merged into the camera of another version if loaded
             try:
                 cmds.loadPlugin('fbxmaya')
+                before = set(cmds.ls(assemblies=True, long=True))
                 pm.mel.eval('FBXImportCameras -v 1')
                 pm.mel.eval('FBXImportMode -v merge')
                 pm.mel.eval('FBXImport -f "%s"' % file_path)
+                new_nodes = [n for n in cmds.ls(assemblies=True, long=True) if n not in before]
+                x = new_nodes[0] if new_nodes else (loaded.node if loaded else None)
             except RuntimeError:
                 self.parent.log_error('Unable to load FBX plugin. We will be unable to load published cameras')
 
+        elif ext == ".obj" and os.path.isfile(cone_cloud.cloud_path(file_path)):
+            # cones published as records, built straight from them
+            with cone_cloud.ConeCloud(cone_cloud.cloud_path(file_path)) as cloud:
+                x = cone_cloud.build_maya_mesh(cloud, import_name)
+            x = self._parent_rebuilt(cmds.ls(x, long=True)[0], parents)
+            cmds.select(x, replace=True)
+
+        elif ext == ".obj" and loaded is not None and publish_data['tank_type']['name'] == 'Matchmove Model':
+            # another version is loaded, its group switches over to this one
+            x = self._update_maya_geo(loaded.node, file_path, import_name)
+            cmds.select(x, replace=True)
+
+        elif ext == ".obj" and self.reference_geo and publish_data['tank_type']['name'] == 'Matchmove Model':
+            # deferred reference, the geometry is read once it is loaded
+            stand_in = proxy_mesh.load_path(file_path, self.proxy_level).replace(os.path.sep, "/")
+            x = geo_references.reference_geo(file_path, import_name, stand_in if stand_in != file_path else None)
+            cmds.select(x, replace=True)
+
         elif ext == ".obj":
             # geo or cones
 
@@ -100,12 +231,54 @@ class AddFileToScene(tank.Hook):
             #               rpr=import_name,
             #               options='mo=0',
             #               lrd="all")
-            x = pm.mel.eval('file -import -type "OBJ" -gr -gn "{0}"-ra true -rdn -rpr "{0}" -options "mo=0" -loadReferenceDepth "all" "{1}"'.format(import_name, file_path))
-            cmds.select(x, replace=True)
+            proxy_path = proxy_mesh.load_path(file_path, self.proxy_level or 1).replace(os.path.sep, "/")
+            load_path = proxy_path if self.proxy_level else file_path
+            new_nodes = pm.mel.eval(proxy_mesh.IMPORT_COMMAND % (import_name, import_name, load_path))
+            cmds.select(new_nodes, replace=True)
+            if proxy_path != file_path or index is not None:
+                groups = cmds.ls(new_nodes, assemblies=True, long=True) or []
+                if proxy_path != file_path:
+                    for group in groups:
+                        proxy_mesh.tag_maya_group(group, file_path, proxy_path, load_path)
+                if groups:
+                    x = self._parent_rebuilt(groups[0], parents)
 
         else:
             self.parent.log_error("Unsupported file extension for %s! Nothing will be loaded." % file_path)
 
+        if index is not None and x:
+            index.add(publish_data, x)
+
+    def _update_maya_geo(self, group, file_path, import_name):
+        """
+        Switch a loaded geo group over to the OBJ at file_path, keeping it
+        referenced or imported as it was.  Returns the renamed group.
+        """
+        import maya.cmds as cmds
+
+        if geo_references.is_reference_group(group):
+            stand_in = proxy_mesh.load_path(file_path, self.proxy_level).replace(os.path.sep, "/")
+            geo_references.update_reference(group, file_path, stand_in if stand_in != file_path else None)
+        else:
+            proxy_path = proxy_mesh.load_path(file_path, self.proxy_level or 1).replace(os.path.sep, "/")
+            load_path = proxy_path if self.proxy_level else file_path
+            proxy_mesh.replace_maya_children(group, load_path)
+            tagged = cmds.attributeQuery(proxy_mesh.FULL_ATTR, node=group, exists=True)
+            if proxy_path != file_path or tagged:
+                proxy_mesh.tag_maya_group(group, file_path, proxy_path, load_path, tagged)
+        return cmds.ls(cmds.rename(group, import_name), long=True)[0]
+
+    def _parent_rebuilt(self, node, parents):
+        """
+        Move a node built in place of a deleted one under the deleted node's
+        parent, if it had one.  Takes and returns long names.
+        """
+        import maya.cmds as cmds
+
+        if not parents:
+            return node
+        return cmds.ls(cmds.parent(node, parents[0])[0], long=True)[0]
+
     def add_file_to_nuke(self, file_path, shotgun_data):
         """
         Load item into Nuke.
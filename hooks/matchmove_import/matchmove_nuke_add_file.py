@@ -11,40 +11,197 @@ different. See code comments for details.
 """
 import tank
 import os
+import sys
+
+# shared matchmove helpers live next to the hook folders
+_hooks_path = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+if _hooks_path not in sys.path:
+    sys.path.append(_hooks_path)
+
+from matchmove_lib import camera_cache
+from matchmove_lib import cone_cloud
+from matchmove_lib import fbx_header
+from matchmove_lib import loaded_publishes
+from matchmove_lib import proxy_mesh
+from matchmove_lib import publish_cache
+from matchmove_lib import publish_mirror
+from matchmove_lib import tracing
+
+# script of the button swapping a ReadGeo between its proxy and full resolution OBJ
+SWAP_RESOLUTION_SCRIPT = """node = nuke.thisNode()
+full = node['mm_full_file'].value()
+node['file'].setValue(node['mm_proxy_file'].value() if node['file'].value() == full else full)
+"""
+
+# fields of the publish records, with the paths of the camera FBX files to read ahead
+RECORD_FIELDS = publish_cache.PUBLISH_FIELDS + ['path']
 
 class AddFileToScene(tank.Hook):
 
+    # threads reading the camera names out of the FBX files of the cameras
+    # published from a scene, started by the first of them loaded
+    max_io_workers = 4
+
+    # proxy level loaded for geo published with proxies, 0 loads the full
+    # resolution OBJ.  Either way the node can be swapped after loading.
+    proxy_level = 1
+
+    # answer publish lookups from a local mirror of the project's publishes,
+    # synced incrementally from Shotgun, and query Shotgun for what it lacks
+    use_publish_mirror = True
+
+    # file of the mirror, one per site and project under ~/.matchmove if None
+    publish_mirror_path = None
+
+    # on the first publish the session cache misses, fetch the records of
+    # every publish made from the same scene, which is what the loader lists,
+    # so the rest of the selection needs no lookup of its own.  The first
+    # camera loaded also starts reading the FBX files of the other cameras.
+    prefetch_scene_publishes = True
+
+    # skip publishes already in the script and update the node of another
+    # loaded version of a publish in place, found through the knobs the
+    # loader adds to the nodes it creates.  False loads every file afresh.
+    reuse_loaded_publishes = True
+
     def execute(self, engine_name, file_path, shotgun_data, **kwargs):
         """
         Hook entry point and app-specific code dispatcher
         """
 
-        publish_record = self.parent.engine.shotgun.find_one('TankPublishedFile', [['id', 'is', shotgun_data['id']]] ,['entity','name','version_number','tank_type'])
+        tracer = tracing.session_tracer()
+        tracer.instrument(self.parent.engine.shotgun)
+
+        with tracer.span('load', path=file_path):
+            self._load_file(engine_name, file_path, shotgun_data)
+
+        if tracer.enabled:
+            path = tracer.write(tracing.local_trace_path('load'))
+            if path:
+                print "wrote trace %s" % path
+
+    def _load_file(self, engine_name, file_path, shotgun_data):
+        """
+        Load one file into the current engine.
+
+        A publish already in the script is skipped, and the node of another
+        version of it is updated rather than a new one created.
+        """
+        import nuke
+
+        publish_record = self._get_publish_record(shotgun_data)
 
         if engine_name != "tk-nuke":
             raise Exception("This AddFileToScene hook only works in Nuke!")
 
-        elif publish_record['tank_type']['name'] == 'Matchmove Camera':
-            self.add_camera_to_nuke(file_path, shotgun_data, publish_record)
+        index = loaded_publishes.nuke_index() if self.reuse_loaded_publishes else None
+        loaded = index.find(publish_record) if index else None
+        if loaded is not None and loaded.publish_id == publish_record['id']:
+            print "%s is already loaded as %s" % (file_path, loaded.node)
+            return
+        node = nuke.toNode(loaded.node) if loaded else None
+
+        if publish_record['tank_type']['name'] == 'Matchmove Camera':
+            self._prefetch_fbx_headers(file_path, publish_record)
+            node = self.add_camera_to_nuke(file_path, shotgun_data, publish_record, None, node)
 
         elif publish_record['tank_type']['name'] == 'Matchmove Cones':
-            self.add_cones_to_nuke(file_path, shotgun_data, publish_record)
+            node = self.add_cones_to_nuke(file_path, shotgun_data, publish_record, node)
 
         elif publish_record['tank_type']['name'] == 'Matchmove Model':
-            self.add_model_to_nuke(file_path, shotgun_data, publish_record)
+            node = self.add_model_to_nuke(file_path, shotgun_data, publish_record, node)
 
         elif publish_record['tank_type']['name'] == 'Matchmove Lens Distortion Node':
-            self.add_lens_to_nuke(file_path, shotgun_data, publish_record)
+            # lens scripts paste any number of nodes and are not tracked
+            node = self.add_lens_to_nuke(file_path, shotgun_data, publish_record)
 
         else:
             raise Exception("Don't know how to load file into Nuke")
 
+        if index is not None and node is not None:
+            index.add(publish_record, node)
+
+
+    def _prefetch_fbx_headers(self, file_path, publish_record):
+        """
+        Start reading the camera names of the FBX files of every camera
+        published from the same scene as publish_record on worker threads,
+        unless file_path is being read already.  Files with a channel cache
+        are never read.
+        """
+        reader = fbx_header.session_reader()
+        if (not self.prefetch_scene_publishes or reader.submitted(file_path) or
+                os.path.exists(camera_cache.cache_path(file_path))):
+            return
+
+        records = self._fetch_records(publish_record['id']).values()
+        paths = [file_path] + [(r.get('path') or {}).get('local_path') for r in records
+                               if (r.get('tank_type') or {}).get('name') == 'Matchmove Camera']
+        paths = [p for p in paths if p and p.lower().endswith('.fbx')
+                 and not os.path.exists(camera_cache.cache_path(p))]
+        with tracing.session_tracer().span('read fbx headers', files=len(paths)):
+            reader.prefetch(paths, self.max_io_workers)
+
+    def _get_publish_record(self, shotgun_data):
+        """
+        Return the publish record for shotgun_data, from the session cache if possible
+        """
+        cache = publish_cache.session_cache()
+
+        record = publish_cache.complete_record(shotgun_data)
+        if record:
+            cache.put(record)
+            return record
+
+        record = cache.get(shotgun_data['id'])
+        if record is None:
+            record = self._fetch_records(shotgun_data['id']).get(shotgun_data['id'])
+        if not record:
+            raise Exception("Unable to find the published file %s in Shotgun" % shotgun_data['id'])
+        return record
 
-    def add_camera_to_nuke(self, file_path, shotgun_data, publish_record):
+    def _fetch_records(self, publish_id):
+        """
+        Return a dict of publish id to record holding publish_id, and every
+        publish made from the same scene if prefetch_scene_publishes is on
+        """
+        cache = publish_cache.session_cache()
+        if self.prefetch_scene_publishes:
+            with tracing.session_tracer().span('fetch scene records'):
+                return cache.fetch_scene(self.parent.engine.shotgun, publish_id, RECORD_FIELDS,
+                                         mirror=self._publish_mirror)
+        return cache.fetch(self.parent.engine.shotgun, [publish_id], RECORD_FIELDS, mirror=self._publish_mirror)
+
+    def _publish_mirror(self):
+        """
+        Return the project's publish mirror, synced for the publishes the
+        session cache missed, or None if they should come from Shotgun
+        """
+        if not self.use_publish_mirror:
+            return None
+        return publish_mirror.lookup(self.parent.engine.shotgun, self.parent.context.project,
+                                     self.publish_mirror_path)
+
+    def _make_node(self, node_class, node, **knobs):
+        """
+        Create a node_class node with knobs, or set them on node if given
+        """
+        import nuke
+
+        if node is None:
+            return getattr(nuke.nodes, node_class)(**knobs)
+        node.setName(knobs.pop('name'))
+        for name, value in knobs.items():
+            node[name].setValue(value)
+        return node
+
+    def add_camera_to_nuke(self, file_path, shotgun_data, publish_record, header=None, cam=None):
         """
         Load camera into Nuke.
 
-        This implementation will create a Camera node and set the file input from the cached camera.
+        This implementation will create a Camera node and set the file input from the cached camera,
+        or update cam when given.  The node and take names come from header, or are read from the
+        file, ahead of time if it was prefetched, when it isn't given.  Returns the camera.
         """
 
         import nuke
@@ -54,9 +211,32 @@ class AddFileToScene(tank.Hook):
         (path, ext) = os.path.splitext(file_path)
         file_name = "%s_%s_v%03d" % (publish_record['entity']['name'], publish_record['name'], publish_record['version_number'])
 
-        if ext == ".fbx":
+        if ext == ".fbx" and os.path.exists(camera_cache.cache_path(file_path)):
+            # the binary channel cache is much quicker to load than the FBX
+            print "Keying %s from the camera cache next to it" % file_path
+            if cam is not None:
+                cam = self._make_node('Camera2', cam, name=file_name, read_from_file=False)
+            else:
+                cam = nuke.nodes.Camera2(name=file_name)
+            self._apply_camera_cache(cam, camera_cache.cache_path(file_path))
+            return cam
+
+        if ext == ".fbx" and header is None:
+            try:
+                header = fbx_header.session_reader().header(file_path)
+            except fbx_header.FbxError as e:
+                print "Unable to read the FBX header of %s: %s" % (file_path, e)
+
+        if ext == ".fbx" and header is not None and header.camera and header.take:
+            # the names were read from the file, so no control panel is needed
+            cam = self._make_node('Camera2', cam, name=file_name, read_from_file=True, file=file_path)
+            cam['fbx_node_name'].setValue(header.camera)
+            cam['fbx_take_name'].setValue(header.take)
+            return cam
+
+        elif ext == ".fbx":
             # create the camera node
-            cam = nuke.nodes.Camera2(name=file_name)
+            cam = self._make_node('Camera2', cam, name=file_name)
             cam['read_from_file'].setValue(True)
             cam['file'].setValue(file_path)
 
@@ -67,24 +247,60 @@ class AddFileToScene(tank.Hook):
 
             cam['fbx_node_name'].setValue(fbx_node_names[-1])
             cam['fbx_take_name'].setValue(fbx_take_names[-1])
+            return cam
         else:
             self.parent.log_error("Unsupported file extension for %s - no read node will be created." % file_path)
 
 
-    def add_cones_to_nuke(self, file_path, shotgun_data, publish_record):
+    def _apply_camera_cache(self, cam, path):
         """
-        Cheat Method, reuse the generic model load method to bring in cones.
+        Key the camera knobs from a published channel cache.
         """
-        self.add_model_to_nuke(file_path, shotgun_data, publish_record)
+        import nuke
 
-    def add_model_to_nuke(self, file_path, shotgun_data, publish_record):
+        # knob, knob index, channel, scale from Maya units
+        knob_map = [('translate', 0, 'tx', 1.0), ('translate', 1, 'ty', 1.0), ('translate', 2, 'tz', 1.0),
+                    ('rotate', 0, 'rx', 1.0), ('rotate', 1, 'ry', 1.0), ('rotate', 2, 'rz', 1.0),
+                    ('scaling', 0, 'sx', 1.0), ('scaling', 1, 'sy', 1.0), ('scaling', 2, 'sz', 1.0),
+                    ('focal', 0, 'focalLength', 1.0),
+                    ('haperture', 0, 'horizontalFilmAperture', 25.4),
+                    ('vaperture', 0, 'verticalFilmAperture', 25.4)]
+
+        with camera_cache.CameraCache(path) as cache:
+            frames = cache.frames()
+            cam['rot_order'].setValue(cache.rotate_order.upper())
+            for knob_name, index, channel, scale in knob_map:
+                values = cache.channel(channel)
+                knob = cam[knob_name]
+                if knob.isAnimated(index):
+                    knob.clearAnimated(index)
+                knob.setAnimated(index)
+                knob.animation(index).addKey([nuke.AnimationKey(f, v * scale) for f, v in zip(frames, values)])
+
+    def add_cones_to_nuke(self, file_path, shotgun_data, publish_record, node=None):
         """
-        Load obj data into Nuke.
+        Cones published as records come with an OBJ holding a vertex per cone,
+        which ReadGeo reads as a point cloud.  Otherwise reuse the generic
+        model load method to bring in the cone meshes.  Returns the ReadGeo.
+        """
+        if not os.path.isfile(cone_cloud.cloud_path(file_path)):
+            return self.add_model_to_nuke(file_path, shotgun_data, publish_record, node)
+
+        with cone_cloud.ConeCloud(cone_cloud.cloud_path(file_path)) as cloud:
+            count = cloud.count
+        file_path = file_path.replace(os.path.sep, "/")
+        file_name = "%s_%s_v%03d" % (publish_record['entity']['name'], publish_record['name'], publish_record['version_number'])
+        return self._make_node('ReadGeo', node, name=file_name, file=file_path, display='solid+lines',
+                               label='%d cones' % count)
 
-        This implementation will create a ReadGeo Node in Nuke.
+    def add_model_to_nuke(self, file_path, shotgun_data, publish_record, node=None):
         """
+        Load obj data into Nuke.
 
-        import nuke
+        This implementation will create a ReadGeo Node in Nuke, or update node
+        when given, reading the proxy of the OBJ when one was published.
+        Returns the ReadGeo.
+        """
 
         # get the slashes right
         file_path = file_path.replace(os.path.sep, "/")
@@ -93,12 +309,36 @@ class AddFileToScene(tank.Hook):
 
         if ext == ".obj":
             # create the Geo node
-            model = nuke.nodes.ReadGeo(name=file_name, file=file_path)
-            model['display'].setValue('solid+lines')
+            proxy_path = proxy_mesh.load_path(file_path, self.proxy_level or 1).replace(os.path.sep, "/")
+            load_path = proxy_path if self.proxy_level else file_path
+            model = self._make_node('ReadGeo', node, name=file_name, file=load_path, display='solid+lines')
+            if proxy_path != file_path or model.knob('mm_full_file') is not None:
+                self._add_resolution_knobs(model, file_path, proxy_path)
+            return model
 
         else:
             self.parent.log_error("Unsupported file extension for %s - no ReadGeo node will be created." % file_path)
 
+    def _add_resolution_knobs(self, node, full_path, proxy_path):
+        """
+        Keep both OBJ paths on a ReadGeo, with a button swapping between them
+        """
+        import nuke
+
+        if node.knob('mm_full_file') is not None:
+            node['mm_full_file'].setValue(full_path)
+            node['mm_proxy_file'].setValue(proxy_path)
+            return
+
+        if node.knob('matchmove') is None:
+            node.addKnob(nuke.Tab_Knob('matchmove', 'Matchmove'))
+        for name, label, value in (('mm_full_file', 'full resolution', full_path),
+                                   ('mm_proxy_file', 'proxy', proxy_path)):
+            knob = nuke.File_Knob(name, label)
+            node.addKnob(knob)
+            knob.setValue(value)
+        node.addKnob(nuke.PyScript_Knob('mm_swap_resolution', 'swap resolution', SWAP_RESOLUTION_SCRIPT))
+
     def add_lens_to_nuke(self, file_path, shotgun_data, publish_record):
         """
         Import a lens node script to the current scene
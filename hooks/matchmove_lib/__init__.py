@@ -0,0 +1,9 @@
+"""
+Copyright (c) 2013 Shotgun Software, Inc
+----------------------------------------------------
+
+Helpers shared by the matchmove publish and import hooks.
+
+Tank loads hooks straight from their file paths, so each hook adds the parent
+'hooks' folder to sys.path before importing from this package.
+"""
@@ -0,0 +1,191 @@
+"""
+Copyright (c) 2013 Shotgun Software, Inc
+----------------------------------------------------
+
+Headless publish of many shots at once, e.g. to republish a sequence after a
+lens recalibration:
+
+    python -m matchmove_lib.batch_publish --jobs 8 --comment "lens recal" shot_a.ma shot_b.ma
+    python -m matchmove_lib.batch_publish --project /mnt/shows/fragrance --shots shots.txt
+
+Each shot is published by its own matchmove_lib.batch_worker process, so a
+crash or a leaking Maya session only ever takes one shot down, and shots
+publish in parallel up to the --jobs limit.  The worker interpreter is mayapy
+unless $MAYAPY or --interpreter says otherwise.
+"""
+import argparse
+import json
+import multiprocessing
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+from . import pipeline
+
+WORKER_SCRIPT = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'batch_worker.py')
+DEFAULT_INTERPRETER = os.environ.get('MAYAPY', 'mayapy')
+
+# lines of worker output kept for the report of a failed shot
+LOG_TAIL = 20
+
+
+class ShotResult(object):
+    """
+    The outcome of publishing one shot
+    """
+    def __init__(self, target, returncode, seconds, report, log):
+        self.target = target
+        self.returncode = returncode
+        self.seconds = seconds
+        self.work_file = report.get('work_file')
+        self.published = report.get('published', [])
+        self.failed = report.get('failed', {})
+        self.error = report.get('error')
+        self.log = log
+
+    @property
+    def ok(self):
+        return self.returncode == 0 and not self.error and not self.failed
+
+    def as_dict(self):
+        return {'target': self.target, 'work_file': self.work_file, 'ok': self.ok,
+                'returncode': self.returncode, 'seconds': self.seconds,
+                'published': self.published, 'failed': self.failed, 'error': self.error}
+
+
+class BatchPublisher(object):
+    """
+    Publishes shots in worker processes, at most max_workers at a time.
+    command is the worker command line the shot arguments are appended to.
+    """
+    def __init__(self, command=None, max_workers=None, timeout=None, env=None):
+        self.command = list(command or [DEFAULT_INTERPRETER, WORKER_SCRIPT])
+        self.max_workers = max_workers or multiprocessing.cpu_count()
+        self.timeout = timeout
+        self.env = env
+
+    def run(self, targets, comment, extra_args=None, progress_cb=None):
+        """
+        Publish every target and return their ShotResults in the same order.
+        progress_cb(done, total) is called as shots finish.
+        """
+        pool = pipeline.WorkerPool(min(self.max_workers, max(1, len(targets))), name='batch-publish')
+        try:
+            for target in targets:
+                pool.submit(target, self.publish, target, comment, extra_args)
+            results = []
+            for job in pool.join(progress_cb):
+                if job.errors:
+                    results.append(ShotResult(job.owner, None, 0.0, {'error': '; '.join(job.errors)}, ''))
+                else:
+                    results.append(job.result)
+            return results
+        finally:
+            pool.shutdown()
+
+    def publish(self, target, comment, extra_args=None):
+        """
+        Run the worker for one shot and collect its result
+        """
+        handle, report_path = tempfile.mkstemp(prefix='mm_batch_', suffix='.json')
+        os.close(handle)
+        log_file = tempfile.TemporaryFile()
+        command = self.command + ['--json', report_path, '--comment', comment] + list(extra_args or []) + [target]
+
+        start = time.time()
+        try:
+            process = subprocess.Popen(command, stdout=log_file, stderr=subprocess.STDOUT, env=self.env)
+            if not self.timeout:
+                process.wait()
+            while process.poll() is None:
+                if time.time() - start > self.timeout:
+                    process.kill()
+                    process.wait()
+                    break
+                time.sleep(0.2)
+            seconds = time.time() - start
+
+            log_file.seek(0)
+            log = log_file.read().decode('utf-8', 'replace')
+            try:
+                with open(report_path) as fh:
+                    report = json.load(fh)
+            except (IOError, OSError, ValueError):
+                report = {}
+            if not report:
+                if self.timeout and seconds > self.timeout:
+                    report = {'error': 'Timed out after %d seconds' % self.timeout}
+                else:
+                    report = {'error': 'The worker exited with status %s without a result' % process.returncode}
+            return ShotResult(target, process.returncode, seconds, report, log)
+        finally:
+            log_file.close()
+            os.remove(report_path)
+
+
+def format_report(results):
+    """
+    Return a readable per shot summary
+    """
+    lines = []
+    for result in results:
+        state = 'ok' if result.ok else 'FAILED'
+        lines.append('%-6s %-40s %3d published %3d failed %7.1fs' % (
+            state, result.target, len(result.published), len(result.failed), result.seconds))
+        if result.error:
+            lines.append('       error: %s' % result.error)
+        for name, errors in sorted(result.failed.items()):
+            lines.append('       %s: %s' % (name, '; '.join(errors)))
+        if not result.ok and result.log:
+            lines.extend('       | %s' % line for line in result.log.splitlines()[-LOG_TAIL:])
+
+    ok = len([r for r in results if r.ok])
+    lines.append('%d of %d shots published, %.1fs of worker time' % (
+        ok, len(results), sum(r.seconds for r in results)))
+    return '\n'.join(lines)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Publish matchmove for many shots without the publish dialog')
+    parser.add_argument('targets', nargs='*', help='work files, or shot codes with --project')
+    parser.add_argument('--shots', help='file listing one work file or shot code per line')
+    parser.add_argument('--comment', required=True)
+    parser.add_argument('--jobs', type=int, default=multiprocessing.cpu_count(), help='shots published at once')
+    parser.add_argument('--timeout', type=float, help='seconds before a shot is given up on')
+    parser.add_argument('--interpreter', default=DEFAULT_INTERPRETER, help='python that runs the worker')
+    parser.add_argument('--worker', default=WORKER_SCRIPT, help='worker script')
+    parser.add_argument('--project', help='project root, for shot codes')
+    parser.add_argument('--task', help='name of the Task to publish against')
+    parser.add_argument('--json', help='also write the report here')
+    options = parser.parse_args(sys.argv[1:] if argv is None else argv)
+
+    targets = list(options.targets)
+    if options.shots:
+        with open(options.shots) as fh:
+            targets.extend(line.strip() for line in fh if line.strip() and not line.startswith('#'))
+    if not targets:
+        parser.error('nothing to publish')
+
+    extra_args = []
+    if options.project:
+        extra_args.extend(['--project', options.project])
+    if options.task:
+        extra_args.extend(['--task', options.task])
+
+    def _progress(done, total):
+        sys.stderr.write('%d/%d shots done\n' % (done, total))
+
+    publisher = BatchPublisher([options.interpreter, options.worker], options.jobs, options.timeout)
+    results = publisher.run(targets, options.comment, extra_args, _progress)
+
+    sys.stdout.write(format_report(results) + '\n')
+    if options.json:
+        with open(options.json, 'w') as fh:
+            json.dump([r.as_dict() for r in results], fh, indent=1, sort_keys=True)
+    return 0 if all(r.ok for r in results) else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,198 @@
+"""
+Copyright (c) 2013 Shotgun Software, Inc
+----------------------------------------------------
+
+Publishes a single shot without the publish dialog.  This is the worker
+process started by matchmove_lib.batch_publish, normally under mayapy:
+
+    mayapy batch_worker.py --json result.json --comment "lens recal" /path/to/work_file.ma
+    mayapy batch_worker.py --json result.json --project /mnt/shows/fragrance seq010_0010
+
+A target that isn't a file is taken to be a shot code, whose latest work
+file is published.  The worker opens the work file, starts the tk-maya
+engine and runs the publish app's hooks in the order the dialog does: scan,
+pre-publish, primary publish, secondary publish and post publish, which
+versions up and saves the work file.  Every scanned item is published, so
+items that fail validation are reported and left out.
+
+The result is written as JSON and the exit status is 0 only if everything
+was published.
+"""
+import argparse
+import json
+import os
+import sys
+import time
+import traceback
+
+DEFAULT_ENGINE = 'tk-maya'
+DEFAULT_APP = 'matchmove-multi-publish'
+DEFAULT_TASK = 'Matchmove'
+
+
+class BatchError(Exception):
+    pass
+
+
+def _progress(percent, msg=None, task=None):
+    pass
+
+
+def _describe(task):
+    return '%s (%s)' % (task['item']['name'], task['output']['name'])
+
+
+def publish_shot(app, work_file, comment, sg_task):
+    """
+    Run the publish hooks of app on the open work file.  Returns a result
+    dict with the published and failed items.
+    """
+    work_template = app.get_template('template_work')
+    primary_type = app.get_setting('primary_scene_item_type')
+
+    items = app.execute_hook('hook_scan_scene')
+
+    primary_items = [item for item in items if item['type'] == primary_type]
+    if len(primary_items) != 1:
+        raise BatchError('Expected one %s item from the scan, found %d' % (primary_type, len(primary_items)))
+    primary_task = {'item': primary_items[0],
+                    'output': {'name': 'primary',
+                               'publish_template': app.get_template('primary_publish_template'),
+                               'tank_type': app.get_setting('primary_tank_type')}}
+
+    tasks = []
+    for output in app.get_setting('secondary_outputs'):
+        publish_template = app.get_template_by_name(output['publish_template']) if output.get('publish_template') else None
+        for item in items:
+            if item['type'] == output['scene_item_type']:
+                tasks.append({'item': item,
+                              'output': {'name': output['name'],
+                                         'publish_template': publish_template,
+                                         'tank_type': output.get('tank_type')}})
+
+    result = {'work_file': work_file, 'items': len(items), 'published': [], 'failed': {}}
+
+    errors = app.execute_hook('hook_primary_pre_publish', task=primary_task,
+                              work_template=work_template, progress_cb=_progress)
+    if errors:
+        result['failed'][_describe(primary_task)] = list(errors)
+        return result
+
+    for task_result in app.execute_hook('hook_secondary_pre_publish', tasks=tasks,
+                                        work_template=work_template, progress_cb=_progress):
+        result['failed'][_describe(task_result['task'])] = list(task_result['errors'])
+    tasks = [task for task in tasks if _describe(task) not in result['failed']]
+
+    primary_path = app.execute_hook('hook_primary_publish', task=primary_task, work_template=work_template,
+                                    comment=comment, thumbnail_path=None, sg_task=sg_task,
+                                    progress_cb=_progress)
+    result['primary'] = primary_path
+
+    task_results = app.execute_hook('hook_secondary_publish', tasks=tasks, work_template=work_template,
+                                    comment=comment, thumbnail_path=None, sg_task=sg_task,
+                                    primary_publish_path=primary_path, progress_cb=_progress)
+    failed = set()
+    for task_result in task_results:
+        result['failed'][_describe(task_result['task'])] = list(task_result['errors'])
+        failed.add(id(task_result['task']))
+    result['published'] = [_describe(task) for task in tasks if id(task) not in failed]
+
+    # the dialog versions up the work file once the primary is published, so
+    # the next publish of the shot doesn't collide with this one
+    try:
+        app.execute_hook('hook_post_publish', work_template=work_template, progress_cb=_progress)
+    except Exception as e:
+        result['failed']['post publish'] = ['%s: %s' % (e.__class__.__name__, e)]
+    return result
+
+
+def find_task(sg, entity, task_name):
+    """
+    Return the Task to publish against, or None
+    """
+    return sg.find_one('Task', [['entity', 'is', entity], ['content', 'is', task_name]], ['content'])
+
+
+def latest_work_file(tk, shot_code, template_name):
+    """
+    Return the latest work file of a shot
+    """
+    sg_shot = tk.shotgun.find_one('Shot', [['code', 'is', shot_code]], ['code'])
+    if not sg_shot:
+        raise BatchError('No shot called %s in Shotgun' % shot_code)
+    context = tk.context_from_entity('Shot', sg_shot['id'])
+    template = tk.templates[template_name]
+    paths = tk.paths_from_template(template, context.as_template_fields(template))
+    if not paths:
+        raise BatchError('%s has no work files matching %s' % (shot_code, template_name))
+    return max(paths, key=lambda path: template.get_fields(path).get('version', 0))
+
+
+def start_app(target, options):
+    """
+    Open the work file in Maya and start the publish app on it.  Returns the
+    app and the work file path.
+    """
+    import maya.standalone
+    maya.standalone.initialize(name='python')
+
+    import maya.cmds as cmds
+    import tank
+    import tank.platform
+
+    if os.path.isfile(target):
+        work_file = os.path.abspath(target)
+        tk = tank.tank_from_path(work_file)
+    else:
+        if not options.project:
+            raise BatchError('%s is not a file, --project is needed to find its work file' % target)
+        tk = tank.tank_from_path(options.project)
+        work_file = latest_work_file(tk, target, options.work_template)
+
+    cmds.file(work_file, open=True, force=True)
+    engine = tank.platform.start_engine(options.engine, tk, tk.context_from_path(work_file))
+    if options.app not in engine.apps:
+        raise BatchError('The %s engine has no %s app' % (options.engine, options.app))
+    return engine.apps[options.app], work_file
+
+
+def parse_args(argv):
+    parser = argparse.ArgumentParser(description='Publish one matchmove shot without the publish dialog')
+    parser.add_argument('target', help='work file, or shot code with --project')
+    parser.add_argument('--json', required=True, help='where to write the result')
+    parser.add_argument('--comment', default='Batch publish')
+    parser.add_argument('--task', default=DEFAULT_TASK, help='name of the Task to publish against')
+    parser.add_argument('--project', help='project root, to find the latest work file of a shot')
+    parser.add_argument('--work-template', default='maya_shot_work')
+    parser.add_argument('--engine', default=DEFAULT_ENGINE)
+    parser.add_argument('--app', default=DEFAULT_APP)
+    return parser.parse_args(argv)
+
+
+def main(argv=None, bootstrap=start_app):
+    """
+    Publish the target and write the result.  bootstrap(target, options)
+    returns the publish app and work file, which lets the benchmark harness
+    run the worker without Maya.
+    """
+    options = parse_args(sys.argv[1:] if argv is None else argv)
+    start = time.time()
+    result = {'target': options.target, 'work_file': None, 'published': [], 'failed': {}}
+    try:
+        app, work_file = bootstrap(options.target, options)
+        sg_task = find_task(app.tank.shotgun, app.context.entity, options.task)
+        if sg_task is None:
+            raise BatchError('%s has no %s task' % (app.context.entity.get('name'), options.task))
+        result.update(publish_shot(app, work_file, options.comment, sg_task))
+    except Exception as e:
+        result['error'] = '%s: %s' % (e.__class__.__name__, e)
+        result['traceback'] = traceback.format_exc()
+    result['seconds'] = time.time() - start
+
+    with open(options.json, 'w') as fh:
+        json.dump(result, fh, indent=1, sort_keys=True)
+    return 0 if not result.get('error') and not result['failed'] else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
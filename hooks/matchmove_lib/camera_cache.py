@@ -0,0 +1,232 @@
+"""
+Copyright (c) 2013 Shotgun Software, Inc
+----------------------------------------------------
+
+Compact binary cache of baked camera channels, published next to the camera FBX.
+
+Layout (all little endian):
+
+    header      struct HEADER_FORMAT, HEADER_SIZE bytes
+                magic 'MMCC', format version, channel count, first frame,
+                frame count, rotate order, offset of the channel data
+    names       channel count * 32 byte NUL padded channel names
+    data        channel count * frame count float64 values, one channel after
+                the other, starting at the 8 byte aligned data offset
+
+Every channel is a contiguous run of doubles, so a channel or a window of frames
+is a single slice of the file and the reader never has to load the rest.
+"""
+import array
+import mmap
+import os
+import struct
+import sys
+
+MAGIC = b'MMCC'
+FORMAT_VERSION = 1
+EXTENSION = '.mmcam'
+
+HEADER_FORMAT = '<4sHHii4sI8x'
+HEADER_SIZE = struct.calcsize(HEADER_FORMAT)
+NAME_SIZE = 32
+VALUE_SIZE = 8
+
+# world space transform channels, which are the local ones of a camera with
+# no transformed parents, plus the camera shape attributes Nuke needs.
+# focal length is in mm, the film apertures are in inches as in Maya.
+CHANNELS = ['tx', 'ty', 'tz', 'rx', 'ry', 'rz', 'sx', 'sy', 'sz',
+            'focalLength', 'horizontalFilmAperture', 'verticalFilmAperture']
+
+ROTATE_ORDERS = ['xyz', 'yzx', 'zxy', 'xzy', 'yxz', 'zyx']
+
+_IDENTITY = [1.0, 0.0, 0.0, 0.0, 0.0, 1.0, 0.0, 0.0, 0.0, 0.0, 1.0, 0.0, 0.0, 0.0, 0.0, 1.0]
+
+
+class CameraCacheError(Exception):
+    pass
+
+
+class UncachableCamera(CameraCacheError):
+    """
+    The camera's channels can't be cached, which leaves it to the FBX
+    """
+    pass
+
+
+def cache_path(fbx_path):
+    """
+    Return the path of the channel cache published alongside a camera FBX
+    """
+    return os.path.splitext(fbx_path)[0] + EXTENSION
+
+
+def write_cache(path, first_frame, channels, rotate_order='xyz'):
+    """
+    Write a channel cache.  channels is an ordered list of (name, values)
+    pairs, every values sequence holding one float per frame.
+    """
+    frame_count = len(channels[0][1]) if channels else 0
+    for name, values in channels:
+        if len(values) != frame_count:
+            raise CameraCacheError("Channel %s has %d frames, expected %d" % (name, len(values), frame_count))
+        if len(name) > NAME_SIZE:
+            raise CameraCacheError("Channel name %s is too long" % name)
+
+    names_size = NAME_SIZE * len(channels)
+    data_offset = (HEADER_SIZE + names_size + 7) & ~7
+
+    with open(path, 'wb') as fh:
+        fh.write(struct.pack(HEADER_FORMAT, MAGIC, FORMAT_VERSION, len(channels),
+                             first_frame, frame_count, rotate_order.encode('ascii'), data_offset))
+        for name, values in channels:
+            fh.write(struct.pack('%ds' % NAME_SIZE, name.encode('ascii')))
+        fh.write(b'\0' * (data_offset - HEADER_SIZE - names_size))
+
+        for name, values in channels:
+            data = array.array('d', values)
+            if sys.byteorder != 'little':
+                data.byteswap()
+            data.tofile(fh)
+
+
+class CameraCache(object):
+    """
+    Memory mapped reader for a channel cache.
+    """
+    def __init__(self, path):
+        self.path = path
+        self._file = open(path, 'rb')
+        try:
+            self._map = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        except (ValueError, EnvironmentError):
+            self._file.close()
+            raise CameraCacheError("%s is not a camera cache" % path)
+
+        if len(self._map) < HEADER_SIZE:
+            self.close()
+            raise CameraCacheError("%s is not a camera cache" % path)
+
+        (magic, version, channel_count, self.first_frame, self.frame_count,
+         rotate_order, self._data_offset) = struct.unpack_from(HEADER_FORMAT, self._map, 0)
+        if magic != MAGIC or version != FORMAT_VERSION:
+            self.close()
+            raise CameraCacheError("%s is not a version %d camera cache" % (path, FORMAT_VERSION))
+
+        self.rotate_order = rotate_order.rstrip(b'\0').decode('ascii')
+        self.channels = []
+        for index in range(channel_count):
+            name = struct.unpack_from('%ds' % NAME_SIZE, self._map, HEADER_SIZE + index * NAME_SIZE)[0]
+            self.channels.append(name.rstrip(b'\0').decode('ascii'))
+
+        expected = self._data_offset + channel_count * self.frame_count * VALUE_SIZE
+        if len(self._map) < expected:
+            self.close()
+            raise CameraCacheError("%s is truncated" % path)
+
+    @property
+    def last_frame(self):
+        return self.first_frame + self.frame_count - 1
+
+    def channel(self, name, start=None, end=None):
+        """
+        Return the values of a channel for frames start to end inclusive,
+        defaulting to the whole frame range.
+        """
+        try:
+            index = self.channels.index(name)
+        except ValueError:
+            raise CameraCacheError("%s has no channel %s" % (self.path, name))
+
+        start = self.first_frame if start is None else max(start, self.first_frame)
+        end = self.last_frame if end is None else min(end, self.last_frame)
+        if end < start:
+            return []
+
+        offset = (self._data_offset
+                  + (index * self.frame_count + start - self.first_frame) * VALUE_SIZE)
+        return list(struct.unpack_from('<%dd' % (end - start + 1), self._map, offset))
+
+    def frames(self, start=None, end=None):
+        """
+        Return the frame numbers covered by channel(name, start, end)
+        """
+        start = self.first_frame if start is None else max(start, self.first_frame)
+        end = self.last_frame if end is None else min(end, self.last_frame)
+        return list(range(start, end + 1))
+
+    def close(self):
+        self._map.close()
+        self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+
+def bake_camera(camera, start, end):
+    """
+    Sample the CHANNELS of a Maya camera transform and its shape for every
+    frame from start to end.  Returns (channels, rotate_order) ready for
+    write_cache.
+
+    The transform channels are only the camera's world space ones if none of
+    its parents move it, so UncachableCamera is raised for a camera under a
+    transformed or animated group, which only the FBX can carry.
+    """
+    import maya.cmds as cmds
+
+    camera = cmds.ls(camera, long=True)[0]
+    _check_parents(camera, start)
+
+    shape = cmds.listRelatives(camera, shapes=True, type='camera', fullPath=True)[0]
+    frames = list(range(int(start), int(end) + 1))
+    channels = []
+    for name in CHANNELS:
+        node = camera if len(name) == 2 else shape
+        channels.append((name, _sample('%s.%s' % (node, name), frames)))
+
+    rotate_order = ROTATE_ORDERS[cmds.getAttr('%s.rotateOrder' % camera)]
+    return channels, rotate_order
+
+
+def _check_parents(camera, frame):
+    """
+    Raise UncachableCamera if a parent of the camera at the long name camera
+    is animated, or doesn't leave its world matrix the same as its local one
+    """
+    import maya.cmds as cmds
+
+    parts = camera.split('|')
+    parents = ['|'.join(parts[:index]) for index in range(2, len(parts))]
+    if not parents:
+        return
+
+    plugs = ['%s.%s' % (parent, name) for parent in parents for name in CHANNELS[:9]]
+    animated = cmds.listConnections(plugs, source=True, destination=False, connections=True) or []
+    if animated:
+        raise UncachableCamera("%s is under the animated group %s" % (camera, animated[0].rsplit('.', 1)[0]))
+
+    matrix = cmds.getAttr('%s.worldMatrix' % parents[-1], time=frame)
+    if any(abs(value - expected) > 1e-9 for value, expected in zip(matrix, _IDENTITY)):
+        raise UncachableCamera("%s is under the transformed group %s" % (camera, parents[-1]))
+
+
+def _sample(plug, frames):
+    """
+    The value of plug on every frame.  A channel keyed on every frame, as a
+    baked one is, is read with a single query of its keys, and an unconnected
+    one with a single getAttr.  Anything else is sampled frame by frame.
+    """
+    import maya.cmds as cmds
+
+    keys = cmds.keyframe(plug, query=True, time=(frames[0], frames[-1]),
+                         timeChange=True, valueChange=True) or []
+    if [float(frame) for frame in frames] == [float(time) for time in keys[0::2]]:
+        return list(keys[1::2])
+
+    if not keys and not cmds.listConnections(plug, source=True, destination=False):
+        return [cmds.getAttr(plug)] * len(frames)
+
+    return [cmds.getAttr(plug, time=frame) for frame in frames]
@@ -0,0 +1,348 @@
+"""
+Copyright (c) 2013 Shotgun Software, Inc
+----------------------------------------------------
+
+Compact binary record of the marker cones, published next to the cones OBJ.
+
+Every cone of a group is the same small mesh placed at a tracked point, so
+only its name and world transform are stored, plus the cone mesh itself once
+as a prototype.  The loaders rebuild the cones from the prototype instead of
+parsing every cone's vertices and faces out of an OBJ.
+
+Layout (all little endian):
+
+    header      struct HEADER_FORMAT, HEADER_SIZE bytes
+                magic 'MMCN', format version, cone count, prototype point,
+                face and face vertex counts, size of the names, offset of
+                the channel data
+    names       utf-8 cone names separated by newlines
+    channels    a run of cone count values per CHANNELS entry, one channel
+                after the other, starting at the 8 byte aligned data offset.
+                Translations are float64, rotations and scales float32.
+    prototype   point count * 3 float64 object space positions, then the
+                int32 face counts and face vertex indices, starting at the
+                next 8 byte boundary
+
+Rotations are in degrees in xyz order, whatever the rotate order of the cones
+in the scene was, as they are decomposed from the world matrix.
+"""
+import array
+import math
+import mmap
+import os
+import struct
+import sys
+
+from . import obj_writer
+
+MAGIC = b'MMCN'
+FORMAT_VERSION = 1
+EXTENSION = '.mmcones'
+
+HEADER_FORMAT = '<4sHxxIIIIII'
+HEADER_SIZE = struct.calcsize(HEADER_FORMAT)
+VALUE_SIZE = 8
+INDEX_SIZE = 4
+
+CHANNELS = ['tx', 'ty', 'tz', 'rx', 'ry', 'rz', 'sx', 'sy', 'sz']
+
+# array typecode of each channel, positions need more precision than the rest
+CHANNEL_TYPES = 'dddffffff'
+
+# relative difference below which a cone still matches the prototype
+TOLERANCE = 1e-6
+
+
+class ConeCloudError(Exception):
+    pass
+
+
+def cloud_path(obj_path):
+    """
+    Return the path of the cone records published alongside a cones OBJ
+    """
+    return os.path.splitext(obj_path)[0] + EXTENSION
+
+
+def _elements(rx, ry, rz, kx, ky, kz):
+    """
+    The nine elements, row by row, of the scaled xyz rotation matrix as Maya
+    composes it for row vectors.  Takes a list of angles in degrees or of
+    scales per channel and returns a list per element, so many transforms
+    are worked out a list at a time.
+    """
+    sin_x, cos_x = [math.sin(math.radians(a)) for a in rx], [math.cos(math.radians(a)) for a in rx]
+    sin_y, cos_y = [math.sin(math.radians(a)) for a in ry], [math.cos(math.radians(a)) for a in ry]
+    sin_z, cos_z = [math.sin(math.radians(a)) for a in rz], [math.cos(math.radians(a)) for a in rz]
+    sxsy = [sx * sy for sx, sy in zip(sin_x, sin_y)]
+    cxsy = [cx * sy for cx, sy in zip(cos_x, sin_y)]
+    return [[cy * cz * k for cy, cz, k in zip(cos_y, cos_z, kx)],
+            [cy * sz * k for cy, sz, k in zip(cos_y, sin_z, kx)],
+            [-sy * k for sy, k in zip(sin_y, kx)],
+            [(a * cz - cx * sz) * k for a, cx, sz, cz, k in zip(sxsy, cos_x, sin_z, cos_z, ky)],
+            [(a * sz + cx * cz) * k for a, cx, sz, cz, k in zip(sxsy, cos_x, sin_z, cos_z, ky)],
+            [sx * cy * k for sx, cy, k in zip(sin_x, cos_y, ky)],
+            [(a * cz + sx * sz) * k for a, sx, sz, cz, k in zip(cxsy, sin_x, sin_z, cos_z, kz)],
+            [(a * sz - sx * cz) * k for a, sx, sz, cz, k in zip(cxsy, sin_x, sin_z, cos_z, kz)],
+            [cx * cy * k for cx, cy, k in zip(cos_x, cos_y, kz)]]
+
+
+def compose_matrix(translate, rotate, scale):
+    """
+    Return the flat 4x4 matrix of a transform, as xform(matrix=True) does
+    """
+    m = [values[0] for values in _elements(*[[value] for value in list(rotate) + list(scale)])]
+    return m[0:3] + [0.0] + m[3:6] + [0.0] + m[6:9] + [0.0] + list(translate) + [1.0]
+
+
+def decompose_matrix(matrix):
+    """
+    Split a flat 4x4 matrix without shear into its translate, rotate and
+    scale, the inverse of compose_matrix
+    """
+    rows = [matrix[0:3], matrix[4:7], matrix[8:11]]
+    scale = [math.sqrt(sum(value * value for value in row)) for row in rows]
+    rows = [[value / factor for value in row] if factor else row for row, factor in zip(rows, scale)]
+
+    ry = math.asin(max(-1.0, min(1.0, -rows[0][2])))
+    if abs(math.cos(ry)) > 1e-9:
+        rx = math.atan2(rows[1][2], rows[2][2])
+        rz = math.atan2(rows[0][1], rows[0][0])
+    else:
+        # gimbal lock, all of the remaining rotation goes on x
+        rx = math.atan2(-rows[2][1], rows[1][1])
+        rz = 0.0
+    return list(matrix[12:15]), [math.degrees(rx), math.degrees(ry), math.degrees(rz)], scale
+
+
+def write_cloud(path, names, channels, prototype):
+    """
+    Write the cone records, renaming the file into place once complete.
+    channels holds a sequence of one float per cone for every entry of
+    CHANNELS, in order, and prototype is the obj_writer.Mesh of a cone in
+    object space.  Returns the bytes written.
+    """
+    if len(channels) != len(CHANNELS):
+        raise ConeCloudError("Expected %d channels, got %d" % (len(CHANNELS), len(channels)))
+    for name, values in zip(CHANNELS, channels):
+        if len(values) != len(names):
+            raise ConeCloudError("Channel %s has %d values for %d cones" % (name, len(values), len(names)))
+    encoded = '\n'.join(names).encode('utf-8')
+    data_offset = (HEADER_SIZE + len(encoded) + 7) & ~7
+
+    tmp_path = '%s.%d.tmp' % (path, os.getpid())
+    try:
+        with open(tmp_path, 'wb') as fh:
+            fh.write(struct.pack(HEADER_FORMAT, MAGIC, FORMAT_VERSION, len(names), prototype.num_points,
+                                 len(prototype.face_counts), len(prototype.face_connects),
+                                 len(encoded), data_offset))
+            fh.write(encoded)
+            fh.write(b'\0' * (data_offset - HEADER_SIZE - len(encoded)))
+
+            blocks = [array.array(typecode, values) for typecode, values in zip(CHANNEL_TYPES, channels)]
+            blocks.append(array.array('d', prototype.points))
+            blocks.append(array.array('i', prototype.face_counts))
+            blocks.append(array.array('i', prototype.face_connects))
+            for data in blocks:
+                if data.typecode == 'd':
+                    fh.write(b'\0' * (-fh.tell() % VALUE_SIZE))
+                if sys.byteorder != 'little':
+                    data.byteswap()
+                data.tofile(fh)
+            size = fh.tell()
+
+        if os.path.exists(path):
+            os.remove(path)
+        os.rename(tmp_path, path)
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+    return size
+
+
+class ConeCloud(object):
+    """
+    Memory mapped reader for the cone records.
+    """
+    def __init__(self, path):
+        self.path = path
+        self._file = open(path, 'rb')
+        try:
+            self._map = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        except (ValueError, EnvironmentError):
+            self._file.close()
+            raise ConeCloudError("%s is not a cone cloud" % path)
+
+        if len(self._map) < HEADER_SIZE:
+            self.close()
+            raise ConeCloudError("%s is not a cone cloud" % path)
+
+        (magic, version, self.count, self._point_count, self._face_count,
+         self._connect_count, self._names_size, self._data_offset) = struct.unpack_from(HEADER_FORMAT, self._map, 0)
+        if magic != MAGIC or version != FORMAT_VERSION:
+            self.close()
+            raise ConeCloudError("%s is not a version %d cone cloud" % (path, FORMAT_VERSION))
+
+        self._channel_offsets = [self._data_offset]
+        for typecode in CHANNEL_TYPES:
+            self._channel_offsets.append(self._channel_offsets[-1] + self.count * struct.calcsize(typecode))
+        self._prototype_offset = (self._channel_offsets.pop() + VALUE_SIZE - 1) & ~(VALUE_SIZE - 1)
+        expected = (self._prototype_offset + self._point_count * 3 * VALUE_SIZE
+                    + (self._face_count + self._connect_count) * INDEX_SIZE)
+        if len(self._map) < expected:
+            self.close()
+            raise ConeCloudError("%s is truncated" % path)
+
+    def names(self):
+        if not self.count:
+            return []
+        return self._map[HEADER_SIZE:HEADER_SIZE + self._names_size].decode('utf-8').split('\n')
+
+    def channel(self, name):
+        """
+        Return the value of a channel for every cone
+        """
+        try:
+            index = CHANNELS.index(name)
+        except ValueError:
+            raise ConeCloudError("%s has no channel %s" % (self.path, name))
+        fmt = '<%d%s' % (self.count, CHANNEL_TYPES[index])
+        return list(struct.unpack_from(fmt, self._map, self._channel_offsets[index]))
+
+    def positions(self):
+        """
+        Return the flat x, y, z position of every cone
+        """
+        points = [0.0] * (self.count * 3)
+        for axis, name in enumerate(CHANNELS[:3]):
+            points[axis::3] = self.channel(name)
+        return points
+
+    def prototype(self):
+        """
+        Return the object space obj_writer.Mesh every cone is made of
+        """
+        offset = self._prototype_offset
+        points = struct.unpack_from('<%dd' % (self._point_count * 3), self._map, offset)
+        offset += self._point_count * 3 * VALUE_SIZE
+        face_counts = struct.unpack_from('<%di' % self._face_count, self._map, offset)
+        offset += self._face_count * INDEX_SIZE
+        face_connects = struct.unpack_from('<%di' % self._connect_count, self._map, offset)
+        return obj_writer.Mesh('cone', list(points), list(face_counts), list(face_connects))
+
+    def mesh(self, name):
+        """
+        Return a single obj_writer.Mesh holding every cone in world space
+        """
+        cone = self.prototype()
+        count = cone.num_points
+        channels = [self.channel(channel) for channel in CHANNELS]
+
+        # each coordinate of a prototype point is placed for every cone in one go
+        m = _elements(*channels[3:9])
+        points = [0.0] * (self.count * count * 3)
+        for index in range(count):
+            x, y, z = cone.points[index * 3:index * 3 + 3]
+            for axis in range(3):
+                points[index * 3 + axis::count * 3] = [
+                    x * a + y * b + z * c + t for a, b, c, t in
+                    zip(m[axis], m[axis + 3], m[axis + 6], channels[axis])]
+
+        face_connects = [index + cone_index * count
+                         for cone_index in range(self.count) for index in cone.face_connects]
+        return obj_writer.Mesh(name, points, cone.face_counts * self.count, face_connects)
+
+    def close(self):
+        self._map.close()
+        self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+
+def points_mesh(name, channels):
+    """
+    An obj_writer.Mesh with a vertex at every cone and no faces, which
+    ReadGeo shows as a point cloud
+    """
+    points = [0.0] * (len(channels[0]) * 3)
+    for axis in range(3):
+        points[axis::3] = channels[axis]
+    return obj_writer.Mesh(name, points, [], [])
+
+
+def collect_cones(root):
+    """
+    Read the cones under a Maya group: the transform of every visible mesh
+    is a cone, and the mesh of the first one is taken as the prototype.
+    Returns (names, channels, prototype, mismatched) ready for write_cloud,
+    where mismatched lists the cones that can't be rebuilt from the
+    prototype, as their mesh differs from it in object space, which is what
+    freezing or editing a cone does, or their world matrix has shear.
+    """
+    import maya.cmds as cmds
+    import maya.api.OpenMaya as om
+
+    shapes = cmds.listRelatives(root, allDescendents=True, type='mesh', fullPath=True) or []
+    shapes = cmds.ls(shapes, visible=True, noIntermediate=True, long=True) or []
+    if not shapes:
+        raise ConeCloudError("There are no cones under %s" % root)
+
+    prototype = None
+    names = []
+    channels = [[] for channel in CHANNELS]
+    mismatched = []
+    for shape, transform in zip(shapes, cmds.listRelatives(shapes, parent=True, fullPath=True)):
+        fn = om.MFnMesh(om.MSelectionList().add(shape).getDagPath(0))
+        points = []
+        for point in fn.getPoints(om.MSpace.kObject):
+            points.extend((point.x, point.y, point.z))
+        face_counts, face_connects = fn.getVertices()
+        mesh = obj_writer.Mesh('cone', points, list(face_counts), list(face_connects))
+        if prototype is None:
+            prototype = mesh
+
+        matrix = cmds.xform(transform, query=True, worldSpace=True, matrix=True)
+        translate, rotate, scale = decompose_matrix(matrix)
+        if not (_same_mesh(mesh, prototype) and _close(compose_matrix(translate, rotate, scale), matrix)):
+            mismatched.append(transform)
+            continue
+
+        names.append(transform.rsplit('|', 1)[-1])
+        for values, value in zip(channels, translate + rotate + scale):
+            values.append(value)
+    return names, channels, prototype, mismatched
+
+
+def _same_mesh(mesh, prototype):
+    return (mesh.face_counts == prototype.face_counts and mesh.face_connects == prototype.face_connects
+            and _close(mesh.points, prototype.points))
+
+
+def _close(values, expected):
+    """
+    True if two lists of coordinates match to within TOLERANCE of their size
+    """
+    if len(values) != len(expected):
+        return False
+    tolerance = TOLERANCE * max([1.0] + [abs(value) for value in expected])
+    return all(abs(a - b) <= tolerance for a, b in zip(values, expected))
+
+
+def build_maya_mesh(cloud, name):
+    """
+    Create every cone of a cloud as a single Maya mesh named name, with the
+    API rather than an OBJ import.  Returns the name of its transform.
+    """
+    import maya.cmds as cmds
+    import maya.api.OpenMaya as om
+
+    mesh = cloud.mesh(name)
+    points = [om.MPoint(x, y, z) for x, y, z in zip(mesh.points[0::3], mesh.points[1::3], mesh.points[2::3])]
+    transform = om.MFnMesh().create(points, mesh.face_counts, mesh.face_connects)
+    name = om.MFnDependencyNode(transform).setName(name)
+    cmds.sets(name, edit=True, forceElement='initialShadingGroup')
+    return name
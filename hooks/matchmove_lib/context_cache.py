@@ -0,0 +1,93 @@
+"""
+Copyright (c) 2013 Shotgun Software, Inc
+----------------------------------------------------
+
+Session cache of the Shotgun context lookups made on every publish.
+
+The shot's tasks, the current user and the project hardly ever change during
+an artist session, so they are looked up once and kept until invalidate() is
+called.  Like the other session caches this lives in a module that is only
+imported once, as Tank reloads the hook files.
+"""
+import threading
+
+
+class ContextCache(object):
+    """
+    Caches Task lists per entity, the Shotgun user and the project entity.
+    """
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._tasks = {}
+        self._user = None
+        self._project = None
+        self.hits = 0
+        self.misses = 0
+
+    def tasks(self, sg, entity, fields=('id', 'content')):
+        """
+        Return the tasks linked to entity
+        """
+        key = (entity['type'], entity['id'], tuple(fields))
+        with self._lock:
+            if key in self._tasks:
+                self.hits += 1
+                return list(self._tasks[key])
+            self.misses += 1
+
+        tasks = sg.find('Task', [['entity', 'is', entity]], list(fields))
+        with self._lock:
+            self._tasks[key] = tasks
+        return list(tasks)
+
+    def user(self, sg):
+        """
+        Return the HumanUser for the current login
+        """
+        with self._lock:
+            if self._user is not None:
+                self.hits += 1
+                return self._user
+            self.misses += 1
+
+        import tank
+        user = tank.util.get_shotgun_user(sg)
+        with self._lock:
+            self._user = user
+        return user
+
+    def project(self, context):
+        """
+        Return the project entity of the context
+        """
+        with self._lock:
+            if self._project is None or self._project['id'] != context.project['id']:
+                self._project = {'type': context.project['type'], 'id': context.project['id']}
+            return self._project
+
+    def invalidate(self, entity=None):
+        """
+        Forget the tasks of one entity, or everything if no entity is given
+        """
+        with self._lock:
+            if entity is None:
+                self._tasks.clear()
+                self._user = None
+                self._project = None
+            else:
+                for key in list(self._tasks):
+                    if key[:2] == (entity['type'], entity['id']):
+                        del self._tasks[key]
+
+
+_session_cache = None
+
+
+def session_cache():
+    """
+    Return the context cache shared by every hook in this session
+    """
+    global _session_cache
+    if _session_cache is None:
+        _session_cache = ContextCache()
+    return _session_cache
@@ -0,0 +1,140 @@
+"""
+Copyright (c) 2013 Shotgun Software, Inc
+----------------------------------------------------
+
+Checksummed, atomic file copies into the publish area.
+
+The data is written to a hidden temporary file next to the destination, its
+size is checked against the source and it is flushed to disk before being
+renamed into place, so a partial write on network storage can never be
+mistaken for a finished publish.
+
+Where the interpreter exposes them, os.copy_file_range or os.sendfile copy the
+data inside the kernel and the checksum is taken from a memory map of the
+source.  Otherwise the file is copied in chunks through a single reusable
+buffer, hashing each chunk as it goes.
+"""
+import hashlib
+import mmap
+import os
+import threading
+import time
+
+from collections import namedtuple
+
+DEFAULT_CHUNK_SIZE = 4 * 1024 * 1024
+DEFAULT_ALGORITHM = 'md5'
+
+
+class CopyError(Exception):
+    pass
+
+
+class CopyResult(namedtuple('CopyResult', 'path bytes seconds checksum method')):
+    """
+    What was copied where, how fast, and the checksum of the data
+    """
+    @property
+    def throughput(self):
+        """
+        Bytes per second
+        """
+        return self.bytes / self.seconds if self.seconds > 0 else float(self.bytes)
+
+
+def copy_file(src, dst, algorithm=DEFAULT_ALGORITHM, chunk_size=DEFAULT_CHUNK_SIZE):
+    """
+    Copy src to dst and return a CopyResult.  The parent folder of dst must
+    exist.  Raises CopyError if the copy fails, in which case dst is untouched.
+    """
+    start = time.time()
+    tmp_path = os.path.join(os.path.dirname(dst), '.%s.%d.%d.tmp' % (os.path.basename(dst),
+                                                                       os.getpid(),
+                                                                       threading.current_thread().ident))
+    try:
+        with open(src, 'rb') as fsrc:
+            size = os.fstat(fsrc.fileno()).st_size
+            with open(tmp_path, 'wb') as fdst:
+                method, checksum = _copy(fsrc, fdst, size, algorithm, chunk_size)
+                fdst.flush()
+                os.fsync(fdst.fileno())
+                written = os.fstat(fdst.fileno()).st_size
+
+        if written != size:
+            raise CopyError("Only %d of %d bytes were written to %s" % (written, size, dst))
+
+        os.rename(tmp_path, dst)
+    except (IOError, OSError) as e:
+        _remove(tmp_path)
+        raise CopyError("Unable to copy %s to %s: %s" % (src, dst, e))
+    except CopyError:
+        _remove(tmp_path)
+        raise
+
+    return CopyResult(dst, size, time.time() - start, checksum, method)
+
+
+def _copy(fsrc, fdst, size, algorithm, chunk_size):
+    """
+    Copy the open files with the best method available.  Returns the method
+    used and the hex digest of the data.
+    """
+    if size and (hasattr(os, 'copy_file_range') or hasattr(os, 'sendfile')):
+        try:
+            method = _kernel_copy(fsrc.fileno(), fdst.fileno(), size, chunk_size)
+            return method, _mmap_checksum(fsrc, algorithm)
+        except OSError:
+            # not supported between these file systems, start again in user space
+            fsrc.seek(0)
+            fdst.seek(0)
+            fdst.truncate()
+
+    return 'chunked', _chunked_copy(fsrc, fdst, algorithm, chunk_size)
+
+
+def _kernel_copy(src_fd, dst_fd, size, chunk_size):
+    copy_range = getattr(os, 'copy_file_range', None)
+    method = 'copy_file_range' if copy_range else 'sendfile'
+
+    offset = 0
+    while offset < size:
+        count = min(chunk_size, size - offset)
+        if copy_range:
+            sent = copy_range(src_fd, dst_fd, count, offset, offset)
+        else:
+            sent = os.sendfile(dst_fd, src_fd, offset, count)
+        if sent == 0:
+            break
+        offset += sent
+    return method
+
+
+def _mmap_checksum(fsrc, algorithm):
+    digest = hashlib.new(algorithm)
+    mapped = mmap.mmap(fsrc.fileno(), 0, access=mmap.ACCESS_READ)
+    try:
+        digest.update(mapped)
+    finally:
+        mapped.close()
+    return digest.hexdigest()
+
+
+def _chunked_copy(fsrc, fdst, algorithm, chunk_size):
+    digest = hashlib.new(algorithm)
+    buf = bytearray(chunk_size)
+    view = memoryview(buf)
+    while True:
+        count = fsrc.readinto(buf)
+        if not count:
+            break
+        chunk = view[:count]
+        digest.update(chunk)
+        fdst.write(chunk)
+    return digest.hexdigest()
+
+
+def _remove(path):
+    try:
+        os.remove(path)
+    except OSError:
+        pass
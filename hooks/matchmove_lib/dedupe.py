@@ -0,0 +1,141 @@
+"""
+Copyright (c) 2013 Shotgun Software, Inc
+----------------------------------------------------
+
+Content addressed store that de-duplicates publish outputs across versions.
+
+Every output is hashed once it has been written.  The first file with a given
+hash is hard linked into the store as its blob; later files with the same
+content are replaced by a hard link to that blob.  The versioned publish
+paths stay exactly as they were, they just share their data on disk.
+
+The store lives next to the version folders (publish/mm/.blobs) so that it is
+always on the same file system as the files it links to.  File systems
+without hard link support are left alone.
+
+Run as a script to print the storage report of a shot:
+
+    python -m matchmove_lib.dedupe /path/to/shot/publish/mm
+"""
+import errno
+import hashlib
+import os
+import sys
+
+STORE_FOLDER = '.blobs'
+HASH_ALGORITHM = 'sha1'
+CHUNK_SIZE = 4 * 1024 * 1024
+
+
+class BlobStore(object):
+    """
+    Hard link based content store rooted at root.
+    """
+    def __init__(self, root):
+        self.root = root
+        self.enabled = hasattr(os, 'link')
+
+    @classmethod
+    def for_version_folder(cls, version_folder):
+        """
+        Return the store shared by every version folder next to this one
+        """
+        return cls(os.path.join(os.path.dirname(os.path.normpath(version_folder)), STORE_FOLDER))
+
+    def blob_path(self, digest):
+        return os.path.join(self.root, digest[:2], digest)
+
+    def dedupe(self, path, digest=None):
+        """
+        Link path to the blob with the same content, adding a new blob if
+        there isn't one.  digest is the file_digest() of path, taken from the
+        file unless it is already known.  Returns the number of bytes saved.
+        """
+        if not self.enabled:
+            return 0
+
+        if digest is None:
+            digest = file_digest(path)
+        blob = self.blob_path(digest)
+        try:
+            if not os.path.exists(blob):
+                folder = os.path.dirname(blob)
+                if not os.path.isdir(folder):
+                    os.makedirs(folder)
+                try:
+                    os.link(path, blob)
+                    return 0
+                except OSError as e:
+                    # someone else stored the same content in the meantime
+                    if e.errno != errno.EEXIST:
+                        raise
+
+            if os.path.samefile(blob, path):
+                return 0
+
+            size = os.path.getsize(path)
+            tmp_path = '%s.dedupe-%d' % (path, os.getpid())
+            os.link(blob, tmp_path)
+            try:
+                os.rename(tmp_path, path)
+            except OSError:
+                os.remove(tmp_path)
+                raise
+            return size
+        except OSError as e:
+            if e.errno in (errno.EPERM, errno.EXDEV, getattr(errno, 'ENOTSUP', None), getattr(errno, 'EOPNOTSUPP', None)):
+                # no hard links here, don't keep trying
+                self.enabled = False
+                return 0
+            raise
+
+    def report(self):
+        """
+        Return the storage totals of the store.  bytes_referenced is the size
+        the linked files would take without de-duplication.
+        """
+        blobs = 0
+        stored = 0
+        referenced = 0
+        for folder, dirs, files in os.walk(self.root):
+            for name in files:
+                st = os.stat(os.path.join(folder, name))
+                blobs += 1
+                stored += st.st_size
+                # one link is the blob itself
+                referenced += st.st_size * max(1, st.st_nlink - 1)
+        return {'blobs': blobs,
+                'bytes_stored': stored,
+                'bytes_referenced': referenced,
+                'bytes_saved': referenced - stored}
+
+
+def file_digest(path, algorithm=HASH_ALGORITHM):
+    """
+    Return the hex digest of a file's content
+    """
+    digest = hashlib.new(algorithm)
+    buf = bytearray(CHUNK_SIZE)
+    view = memoryview(buf)
+    with open(path, 'rb') as fh:
+        while True:
+            count = fh.readinto(buf)
+            if not count:
+                break
+            digest.update(view[:count])
+    return digest.hexdigest()
+
+
+def main(argv):
+    if len(argv) != 2:
+        sys.stderr.write("usage: %s <shot publish/mm folder>\n" % argv[0])
+        return 1
+
+    report = BlobStore(os.path.join(argv[1], STORE_FOLDER)).report()
+    for key in ('blobs', 'bytes_stored', 'bytes_referenced', 'bytes_saved'):
+        sys.stdout.write('%-18s %d\n' % (key, report[key]))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv))
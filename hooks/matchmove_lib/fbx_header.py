@@ -0,0 +1,324 @@
+"""
+Copyright (c) 2013 Shotgun Software, Inc
+----------------------------------------------------
+
+Reads the camera and take names out of an FBX file without loading it.
+
+Nuke only fills in the fbx_node_name and fbx_take_name knobs of a Camera
+once its control panel has been shown, which means a panel per camera and a
+full read of every file.  read_header() gets the same names straight from
+the file:
+
+ASCII files are read in large chunks that are searched for quoted strings.
+Only the lines holding one are matched against the patterns for a camera
+Model, a Take and (FBX 7) an AnimationStack, so the animation data in
+between is never parsed.
+
+Binary files are walked record by record.  Only the Objects and Takes
+records are descended into; every other record, and every Model's children,
+is skipped by seeking to its end offset, so the curve arrays are never read.
+
+The loader runs its hook once per file, so session_reader() keeps a
+HeaderReader for the session: the first camera loaded starts reading the
+headers of the other cameras on worker threads, and the cameras loaded after
+it find them already read.
+
+Run as a script to print the names found in some files:
+
+    python -m matchmove_lib.fbx_header camera_v001.fbx
+"""
+import os
+import re
+import struct
+import sys
+
+from collections import namedtuple
+
+from . import pipeline
+
+BINARY_MAGIC = b'Kaydara FBX Binary  \x00'
+CHUNK_SIZE = 1024 * 1024
+
+# cameras every FBX 6 file from Maya has, which are never the published one
+PRODUCER_PREFIX = 'Producer '
+
+# the names are always quoted and the key data never is, so only the lines
+# with a quote are matched against these
+_ASCII_VERSION = re.compile(br'FBXVersion:\s*(\d+)')
+_ASCII_CAMERA = re.compile(br'\s*Model:\s*(?:\d+\s*,\s*)?"Model::([^"]*)"\s*,\s*"Camera"')
+_ASCII_TAKE = re.compile(br'\s*Take:\s*"([^"]*)"')
+_ASCII_STACK = re.compile(br'\s*AnimationStack:\s*(?:\d+\s*,\s*)?"AnimStack::([^"]*)"')
+
+# property type -> struct format of the scalar types
+_SCALARS = {b'Y': '<h', b'C': '<?', b'I': '<i', b'F': '<f', b'D': '<d', b'L': '<q'}
+_ARRAYS = b'fdlib'
+
+
+class FbxError(Exception):
+    pass
+
+
+class FbxHeader(namedtuple('FbxHeader', 'cameras takes binary version')):
+    """
+    The camera model names and take names of an FBX file, in file order
+    """
+    @property
+    def camera(self):
+        """
+        The published camera, which Maya writes after its producer cameras
+        """
+        cameras = [name for name in self.cameras if not name.startswith(PRODUCER_PREFIX)]
+        return cameras[-1] if cameras else None
+
+    @property
+    def take(self):
+        return self.takes[-1] if self.takes else None
+
+
+def read_header(path):
+    """
+    Return the FbxHeader of the file at path.  Raises FbxError if it can't
+    be read.
+    """
+    try:
+        with open(path, 'rb') as fh:
+            magic = fh.read(len(BINARY_MAGIC))
+            fh.seek(0)
+            if magic == BINARY_MAGIC:
+                return _read_binary(fh)
+            return _read_ascii(fh)
+    except (IOError, OSError, struct.error) as e:
+        raise FbxError('Unable to read %s: %s' % (path, e))
+
+
+def _text(value):
+    return value.decode('utf-8', 'replace')
+
+
+def _read_ascii(fh):
+    cameras = []
+    takes = []
+    stacks = []
+    version = None
+    remainder = b''
+    while True:
+        chunk = fh.read(CHUNK_SIZE)
+        data = remainder + chunk if remainder else chunk
+        # only scan whole lines, the rest waits for the next chunk
+        cut = data.rfind(b'\n') + 1 if chunk else len(data)
+        if version is None:
+            match = _ASCII_VERSION.search(data, 0, cut)
+            if match:
+                version = int(match.group(1))
+        _scan(data, cut, cameras, takes, stacks)
+        remainder = data[cut:]
+        if not chunk:
+            break
+    return FbxHeader(cameras, takes or stacks, False, version)
+
+
+def _scan(data, cut, cameras, takes, stacks):
+    """
+    Add the names declared on the quoted lines of data[:cut] to the lists
+    """
+    index = data.find(b'"', 0, cut)
+    while index != -1:
+        start = data.rfind(b'\n', 0, index) + 1
+        end = data.find(b'\n', index, cut)
+        if end == -1:
+            end = cut
+        for pattern, names in ((_ASCII_CAMERA, cameras), (_ASCII_TAKE, takes), (_ASCII_STACK, stacks)):
+            match = pattern.match(data, start, end)
+            if match:
+                names.append(_text(match.group(1)))
+                break
+        index = data.find(b'"', end, cut)
+
+
+_Record = namedtuple('_Record', 'name end props_start props_end property_count')
+
+
+def _read_record(fh, offset, wide):
+    """
+    Return the record starting at offset, or None for the null record that
+    ends a list of records and at the end of the file
+    """
+    fh.seek(offset)
+    header = fh.read(25 if wide else 13)
+    if not header:
+        return None
+    if len(header) < (25 if wide else 13):
+        raise FbxError('The file ends inside a record at %d' % offset)
+    if wide:
+        end, count, length = struct.unpack('<QQQ', header[:24])
+        name_length = ord(header[24:25])
+    else:
+        end, count, length = struct.unpack('<III', header[:12])
+        name_length = ord(header[12:13])
+    if end == 0:
+        return None
+    if end <= offset:
+        raise FbxError('Bad end offset %d for the record at %d' % (end, offset))
+    name = fh.read(name_length)
+    props_start = fh.tell()
+    return _Record(name, end, props_start, props_start + length, count)
+
+
+def _children(fh, record, wide):
+    offset = record.props_end
+    while offset < record.end:
+        child = _read_record(fh, offset, wide)
+        if child is None:
+            return
+        yield child
+        offset = child.end
+
+
+def _properties(fh, record, limit):
+    """
+    Read up to limit properties of a record.  Arrays are skipped.
+    """
+    fh.seek(record.props_start)
+    values = []
+    for index in range(min(limit, record.property_count)):
+        code = fh.read(1)
+        if code in _SCALARS:
+            fmt = _SCALARS[code]
+            values.append(struct.unpack(fmt, fh.read(struct.calcsize(fmt)))[0])
+        elif code in (b'S', b'R'):
+            length = struct.unpack('<I', fh.read(4))[0]
+            values.append(fh.read(length))
+        elif code and code in _ARRAYS:
+            count, encoding, length = struct.unpack('<III', fh.read(12))
+            fh.seek(length, 1)
+            values.append(None)
+        else:
+            raise FbxError('Unknown property type %r' % code)
+    return values
+
+
+def _object_name(value):
+    """
+    Binary names are 'name\\x00\\x01Class' in FBX 7 and 'Class::name' before
+    """
+    if b'\x00\x01' in value:
+        return _text(value.split(b'\x00\x01', 1)[0])
+    if b'::' in value:
+        return _text(value.split(b'::', 1)[1])
+    return _text(value)
+
+
+def _read_binary(fh):
+    fh.seek(len(BINARY_MAGIC) + 2)
+    version = struct.unpack('<I', fh.read(4))[0]
+    wide = version >= 7500
+
+    cameras = []
+    takes = []
+    stacks = []
+    size = os.fstat(fh.fileno()).st_size
+    offset = fh.tell()
+    while True:
+        record = _read_record(fh, offset, wide)
+        if record is None:
+            break
+        # children end inside their record, so this catches any cut off file
+        if record.end > size:
+            raise FbxError('The file ends inside the %s record at %d' % (_text(record.name), offset))
+        if record.name == b'Objects':
+            for child in _children(fh, record, wide):
+                if child.name == b'Model':
+                    strings = [v for v in _properties(fh, child, 3) if isinstance(v, bytes)]
+                    if len(strings) >= 2 and strings[1] == b'Camera':
+                        cameras.append(_object_name(strings[0]))
+                elif child.name == b'AnimationStack':
+                    strings = [v for v in _properties(fh, child, 2) if isinstance(v, bytes)]
+                    if strings:
+                        stacks.append(_object_name(strings[0]))
+        elif record.name == b'Takes':
+            for child in _children(fh, record, wide):
+                names = _properties(fh, child, 1) if child.name == b'Take' else []
+                if names and isinstance(names[0], bytes):
+                    takes.append(_text(names[0]))
+        offset = record.end
+    return FbxHeader(cameras, takes or stacks, True, version)
+
+
+def _read_or_error(path):
+    try:
+        return read_header(path)
+    except FbxError as e:
+        return e
+
+
+def _key(path):
+    return os.path.normcase(os.path.normpath(path))
+
+
+class HeaderReader(object):
+    """
+    Reads headers on worker threads ahead of the loads that need them
+    """
+    def __init__(self):
+        self._jobs = {}
+        self._pool = None
+
+    def submitted(self, path):
+        return _key(path) in self._jobs
+
+    def prefetch(self, paths, max_workers=4):
+        """
+        Start reading the headers of the paths that aren't read or being
+        read yet
+        """
+        paths = [path for path in paths if not self.submitted(path)]
+        if paths and self._pool is None:
+            self._pool = pipeline.WorkerPool(min(max_workers, len(paths)), name='fbx-headers')
+        for path in paths:
+            self._jobs[_key(path)] = self._pool.submit(path, _read_or_error, path)
+
+    def header(self, path):
+        """
+        Return the FbxHeader of path, waiting for it if it was prefetched and
+        reading it now otherwise.  Raises FbxError if it can't be read.
+        """
+        job = self._jobs.get(_key(path))
+        if job is None:
+            return read_header(path)
+        # wake up now and then so that a KeyboardInterrupt gets through
+        while not job.done.wait(0.1):
+            pass
+        if self._pool is not None and all(each.done.is_set() for each in self._jobs.values()):
+            # nothing left to read, the threads aren't kept around idle
+            self._pool.shutdown()
+            self._pool = None
+        if job.errors:
+            raise FbxError('; '.join(job.errors))
+        if isinstance(job.result, FbxError):
+            raise job.result
+        return job.result
+
+
+_session_reader = None
+
+
+def session_reader():
+    """
+    Return the HeaderReader shared by every load in this session
+    """
+    global _session_reader
+    if _session_reader is None:
+        _session_reader = HeaderReader()
+    return _session_reader
+
+
+def main(argv=None):
+    for path in (sys.argv[1:] if argv is None else argv):
+        header = read_header(path)
+        sys.stdout.write('%s\n  cameras: %s\n  takes:   %s\n  use:     %s / %s\n' % (
+            path, ', '.join(header.cameras), ', '.join(header.takes), header.camera, header.take))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,149 @@
+"""
+Copyright (c) 2013 Shotgun Software, Inc
+----------------------------------------------------
+
+Mesh fingerprints used to skip re-exporting geometry that hasn't changed.
+
+A fingerprint hashes everything that ends up in an exported OBJ: the names of
+the visible meshes under a group, their object space points, topology and uvs,
+and their world matrices.  Each array is fetched with one call per mesh, so
+taking a fingerprint costs a fraction of formatting and writing the OBJ.
+
+Each version folder keeps a small manifest of the fingerprints of what was
+exported into it, so the next publish can find the previous output of an
+unchanged item and link it into the new version instead of exporting again.
+The manifest keeps the fingerprint combined with the export settings, so an
+output written in another format is never taken for an unchanged one.
+"""
+import array
+import hashlib
+import json
+import os
+import re
+
+MANIFEST_NAME = '.fingerprints.json'
+
+_VERSION_FOLDER = re.compile(r'^(?P<prefix>.*_v)(?P<version>\d+)$')
+
+
+def _bytes(values, typecode):
+    data = array.array(typecode, values)
+    return data.tobytes() if hasattr(data, 'tobytes') else data.tostring()
+
+
+def fingerprint(root):
+    """
+    Return the fingerprint of every visible mesh under root in Maya
+    """
+    import maya.cmds as cmds
+    import maya.api.OpenMaya as om
+
+    shapes = cmds.listRelatives(root, allDescendents=True, type='mesh', fullPath=True) or []
+    shapes = sorted(cmds.ls(shapes, visible=True, noIntermediate=True, long=True) or [])
+
+    digest = hashlib.sha1()
+    selection = om.MSelectionList()
+    for shape in shapes:
+        selection.add(shape)
+
+    for index, shape in enumerate(shapes):
+        fn = om.MFnMesh(selection.getDagPath(index))
+        digest.update(shape.encode('utf-8'))
+
+        digest.update(_bytes(cmds.xform('%s.vtx[*]' % shape, query=True, objectSpace=True, translation=True) or [], 'd'))
+
+        face_counts, face_connects = fn.getVertices()
+        digest.update(_bytes(face_counts, 'i'))
+        digest.update(_bytes(face_connects, 'i'))
+
+        if fn.numUVs():
+            us, vs = fn.getUVs()
+            uv_counts, uv_ids = fn.getAssignedUVs()
+            digest.update(_bytes(us, 'f'))
+            digest.update(_bytes(vs, 'f'))
+            digest.update(_bytes(uv_ids, 'i'))
+
+        transform = cmds.listRelatives(shape, parent=True, fullPath=True)[0]
+        digest.update(_bytes(cmds.xform(transform, query=True, worldSpace=True, matrix=True), 'd'))
+
+    return digest.hexdigest()
+
+
+def fingerprint_all(roots):
+    """
+    Return a dict of root to fingerprint
+    """
+    return dict((root, fingerprint(root)) for root in roots)
+
+
+def with_settings(fingerprint, settings):
+    """
+    Combine a fingerprint with the dict of settings its output was exported
+    with
+    """
+    key = '%s %s' % (fingerprint, json.dumps(settings, sort_keys=True))
+    return hashlib.sha1(key.encode('utf-8')).hexdigest()
+
+
+class Manifest(object):
+    """
+    The fingerprints of the outputs exported into one version folder, keyed
+    on item name.  Output paths are stored relative to the version folder.
+    """
+    def __init__(self, root, entries=None):
+        self.root = root
+        self.entries = entries or {}
+
+    @classmethod
+    def load(cls, root):
+        try:
+            with open(os.path.join(root, MANIFEST_NAME)) as fh:
+                return cls(root, json.load(fh))
+        except (IOError, OSError, ValueError):
+            return None
+
+    def add(self, item_name, fingerprint, path):
+        self.entries[item_name] = {'fingerprint': fingerprint,
+                                   'path': os.path.relpath(path, self.root)}
+
+    def output_for(self, item_name, fingerprint):
+        """
+        Return the absolute path of the output exported for item_name, if it
+        was exported with the same fingerprint and still exists.
+        """
+        entry = self.entries.get(item_name)
+        if not entry or entry['fingerprint'] != fingerprint:
+            return None
+        path = os.path.join(self.root, entry['path'])
+        return path if os.path.isfile(path) else None
+
+    def save(self):
+        path = os.path.join(self.root, MANIFEST_NAME)
+        with open(path, 'w') as fh:
+            json.dump(self.entries, fh, indent=1, sort_keys=True)
+        return path
+
+
+def previous_manifest(version_folder):
+    """
+    Return the manifest of the most recent earlier version folder that has
+    one, or None.  Only the parent folder is listed.
+    """
+    version_folder = os.path.normpath(version_folder)
+    match = _VERSION_FOLDER.match(os.path.basename(version_folder))
+    if not match:
+        return None
+
+    parent = os.path.dirname(version_folder)
+    current = int(match.group('version'))
+    versions = []
+    for name in os.listdir(parent):
+        other = _VERSION_FOLDER.match(name)
+        if other and other.group('prefix') == match.group('prefix') and int(other.group('version')) < current:
+            versions.append((int(other.group('version')), name))
+
+    for version, name in sorted(versions, reverse=True):
+        manifest = Manifest.load(os.path.join(parent, name))
+        if manifest is not None:
+            return manifest
+    return None
@@ -0,0 +1,111 @@
+"""
+Copyright (c) 2013 Shotgun Software, Inc
+----------------------------------------------------
+
+Geo brought into Maya as deferred references instead of imports.
+
+An import copies every vertex of a geo publish into the artist's scene, which
+is then written out and read back on every save and open.  reference_geo()
+creates an unloaded reference to the OBJ instead, under a group named as the
+import's would have been.  The group holds a proxy imported as a stand-in
+when one was published, or nothing at all.  The full geometry is only read
+once the reference is loaded, which can be done for any number of groups in
+one go:
+
+    from matchmove_lib import geo_references
+    geo_references.load_references()        # the selected groups
+"""
+from . import proxy_mesh
+
+# string attribute on the group holding the reference node
+REFERENCE_ATTR = 'mmGeoReference'
+
+
+def reference_geo(path, name, stand_in=None):
+    """
+    Create a deferred reference to the OBJ at path and its group named name,
+    importing the stand_in OBJ into the group if given.  Returns the long
+    name of the group.
+    """
+    import maya.cmds as cmds
+    import maya.mel as mel
+
+    if stand_in:
+        new_nodes = mel.eval(proxy_mesh.IMPORT_COMMAND % (name, name, stand_in)) or []
+        group = cmds.ls(new_nodes, assemblies=True, long=True)[0]
+    else:
+        group = cmds.ls(cmds.group(empty=True, name=name), long=True)[0]
+
+    reference = cmds.file(path, reference=True, type='OBJ', deferReference=True,
+                          namespace=name, options='mo=0')
+    node = cmds.file(reference, query=True, referenceNode=True)
+    cmds.addAttr(group, longName=REFERENCE_ATTR, dataType='string')
+    cmds.setAttr('%s.%s' % (group, REFERENCE_ATTR), node, type='string')
+    return group
+
+
+def load_references(groups=None):
+    """
+    Load the references of geo groups, the selected ones by default, moving
+    the referenced meshes into each group in place of its stand-in.
+    Returns the groups loaded.
+    """
+    import maya.cmds as cmds
+
+    if groups is None:
+        groups = cmds.ls(selection=True, long=True) or []
+
+    loaded = []
+    for group in groups:
+        if not cmds.attributeQuery(REFERENCE_ATTR, node=group, exists=True):
+            continue
+        node = cmds.getAttr('%s.%s' % (group, REFERENCE_ATTR))
+        if cmds.referenceQuery(node, isLoaded=True):
+            continue
+
+        stand_ins = cmds.listRelatives(group, children=True, fullPath=True) or []
+        if stand_ins:
+            cmds.delete(stand_ins)
+        cmds.file(loadReference=node)
+        _adopt(group, node)
+        loaded.append(group)
+    return loaded
+
+
+def is_reference_group(group):
+    """
+    True if group was made by reference_geo()
+    """
+    import maya.cmds as cmds
+    return cmds.attributeQuery(REFERENCE_ATTR, node=group, exists=True)
+
+
+def update_reference(group, path, stand_in=None):
+    """
+    Point the reference of a group made by reference_geo() at the OBJ at
+    path, leaving it loaded or not as it was.  An unloaded reference gets
+    the stand_in OBJ in place of its old one, if given.
+    """
+    import maya.cmds as cmds
+
+    node = cmds.getAttr('%s.%s' % (group, REFERENCE_ATTR))
+    if cmds.referenceQuery(node, isLoaded=True):
+        cmds.file(path, loadReference=node)
+        _adopt(group, node)
+        return
+
+    cmds.file(path, loadReference=node, loadReferenceDepth='none')
+    if stand_in:
+        proxy_mesh.replace_maya_children(group, stand_in)
+
+
+def _adopt(group, node):
+    """
+    Move the top nodes of the loaded reference node into group
+    """
+    import maya.cmds as cmds
+
+    nodes = cmds.referenceQuery(node, nodes=True, dagPath=True) or []
+    top = cmds.ls(nodes, assemblies=True, long=True) or []
+    if top:
+        cmds.parent(top, group)
@@ -0,0 +1,179 @@
+"""
+Copyright (c) 2013 Shotgun Software, Inc
+----------------------------------------------------
+
+Append-only progress journal that lets a failed publish be resumed.
+
+Each version folder gets a .publish_journal file with one JSON record per
+line: the start of a publish, every finished export with its size and
+checksum, every registration with the entity it created, and the end of a
+successful publish.  Records are flushed as they are written, so after a
+crash the journal still says exactly which outputs are complete.  A publish
+staged on local scratch starts its journal once it has been committed.
+
+A journal that was started but never finished means the version folder
+holds a partial publish.  The next publish of the same version skips the
+exports that are still on disk with their journaled size, registers only what
+wasn't registered, and treats any other file in its way as a leftover of the
+failed attempt.
+"""
+import json
+import os
+import threading
+import time
+
+from . import dedupe
+
+JOURNAL_NAME = '.publish_journal'
+
+
+class PublishJournal(object):
+    """
+    The journal of one version folder.  Output paths are stored relative to
+    the folder, registrations are keyed on that path or on the record name
+    for requests that don't publish a file.
+    """
+    def __init__(self, folder):
+        self.folder = os.path.normpath(folder)
+        self.path = os.path.join(self.folder, JOURNAL_NAME)
+        self.started = False
+        self.finished = False
+        self.scene = None
+        self.exports = {}
+        self.registrations = {}
+        self._lock = threading.Lock()
+
+    @classmethod
+    def load(cls, folder):
+        """
+        Read the journal of folder.  A missing journal is an empty one, and a
+        torn last line from a crash is ignored.
+        """
+        journal = cls(folder)
+        try:
+            with open(journal.path) as fh:
+                lines = fh.readlines()
+        except (IOError, OSError):
+            return journal
+
+        for line in lines:
+            try:
+                record = json.loads(line)
+            except ValueError:
+                continue
+            journal._apply(record)
+        return journal
+
+    def _apply(self, record):
+        event = record.get('event')
+        if event == 'start':
+            # a start after a finished publish begins a new one from scratch
+            if self.finished:
+                self.exports.clear()
+                self.registrations.clear()
+            self.started = True
+            self.finished = False
+            self.scene = record.get('scene')
+        elif event == 'export':
+            self.exports[record['key']] = record
+        elif event == 'register':
+            self.registrations[record['key']] = record['entity']
+        elif event == 'finish':
+            self.finished = True
+
+    def resumable(self, scene_path=None):
+        """
+        True if an earlier publish into this folder started and never
+        finished, from scene_path if given
+        """
+        if scene_path is not None and self.scene is not None and \
+                os.path.normcase(os.path.abspath(scene_path)) != os.path.normcase(os.path.abspath(self.scene)):
+            return False
+        return self.started and not self.finished
+
+    def key(self, path_or_name):
+        if os.path.isabs(path_or_name):
+            return os.path.relpath(os.path.normpath(path_or_name), self.folder).replace(os.sep, '/')
+        return path_or_name
+
+    def exported(self, path):
+        """
+        Return the export record of path if it is still on disk with the
+        journaled size, otherwise None
+        """
+        record = self.exports.get(self.key(path))
+        if record is None:
+            return None
+        try:
+            if os.path.getsize(path) != record['bytes']:
+                return None
+        except OSError:
+            return None
+        return record
+
+    def registration(self, path_or_name):
+        """
+        Return the entity registered for a path or record name, or None
+        """
+        return self.registrations.get(self.key(path_or_name))
+
+    def record_start(self, scene_path):
+        self._write({'event': 'start', 'scene': scene_path})
+
+    def record_export(self, path, checksum=None):
+        """
+        Record a finished output.  The checksum, a dedupe.file_digest(), is
+        taken from the file unless it is already known.
+        """
+        if checksum is None:
+            checksum = dedupe.file_digest(path)
+        self._write({'event': 'export', 'key': self.key(path),
+                     'bytes': os.path.getsize(path), 'checksum': checksum})
+
+    def record_registration(self, path_or_name, entity):
+        self._write({'event': 'register', 'key': self.key(path_or_name),
+                     'entity': {'type': entity['type'], 'id': entity['id']}})
+
+    def record_finish(self):
+        self._write({'event': 'finish'})
+
+    def _write(self, record):
+        record['time'] = time.time()
+        line = json.dumps(record, sort_keys=True) + '\n'
+        with self._lock:
+            if not os.path.isdir(self.folder):
+                os.makedirs(self.folder)
+            with open(self.path, 'a') as fh:
+                fh.write(line)
+                fh.flush()
+                os.fsync(fh.fileno())
+            self._apply(record)
+
+
+class NullJournal(object):
+    """
+    Stands in for the journal when resuming is switched off
+    """
+    def resumable(self, scene_path=None):
+        return False
+
+    def exported(self, path):
+        return None
+
+    def registration(self, path_or_name):
+        return None
+
+    def record_start(self, scene_path):
+        pass
+
+    def record_export(self, path, checksum=None):
+        pass
+
+    def record_registration(self, path_or_name, entity):
+        pass
+
+    def record_finish(self):
+        pass
+
+
+NULL_JOURNAL = NullJournal()
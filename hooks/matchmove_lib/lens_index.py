@@ -0,0 +1,100 @@
+"""
+Copyright (c) 2013 Shotgun Software, Inc
+----------------------------------------------------
+
+Indexed lookup of work files for a template whose only varying key is version.
+
+paths_from_template walks the file system and returns every historical
+version.  The lens distortion work files all live in one folder, so the index
+lists that folder once and keeps the listing for as long as the folder's
+mtime is unchanged, which costs a single stat per lookup.  The index counts
+its stats, listings and cache hits in stats, which the scan reports.
+"""
+import os
+
+from tank import TankError
+
+
+class DirectoryIndex(object):
+    """
+    Caches directory listings, invalidated by the directory mtime.
+    """
+    def __init__(self):
+        self._listings = {}
+        self.stats = {'stat': 0, 'listdir': 0, 'hits': 0}
+
+    def listdir(self, path):
+        """
+        Return the file names in path, or an empty list if it does not exist
+        """
+        self.stats['stat'] += 1
+        try:
+            mtime = os.stat(path).st_mtime
+        except OSError:
+            self._listings.pop(path, None)
+            return []
+
+        cached = self._listings.get(path)
+        if cached and cached[0] == mtime:
+            self.stats['hits'] += 1
+            return cached[1]
+
+        self.stats['listdir'] += 1
+        names = sorted(os.listdir(path))
+        self._listings[path] = (mtime, names)
+        return names
+
+    def invalidate(self, path=None):
+        if path is None:
+            self._listings.clear()
+        else:
+            self._listings.pop(path, None)
+
+
+def find_versions(index, template, fields, versions=None):
+    """
+    Return the paths matching template and fields.  versions may be None for
+    the latest version of each file, 'all' for every version, or a collection
+    of version numbers to pick.
+    """
+    probe = dict(fields)
+    probe['version'] = 0
+    folder = os.path.dirname(template.apply_fields(probe))
+
+    # group by every field except the version so each lens keeps its own latest
+    found = {}
+    for name in index.listdir(folder):
+        path = os.path.join(folder, name)
+        try:
+            path_fields = template.get_fields(path)
+        except TankError:
+            continue
+        if any(path_fields.get(k) != v for k, v in fields.items() if k != 'version'):
+            continue
+
+        key = tuple(sorted((k, v) for k, v in path_fields.items() if k != 'version'))
+        found.setdefault(key, []).append((path_fields['version'], path))
+
+    paths = []
+    for key in sorted(found):
+        candidates = sorted(found[key])
+        if versions is None:
+            paths.append(candidates[-1][1])
+        elif versions == 'all':
+            paths.extend(path for version, path in candidates)
+        else:
+            paths.extend(path for version, path in candidates if version in versions)
+    return paths
+
+
+_session_index = None
+
+
+def session_index():
+    """
+    Return the directory index shared by every scan in this session
+    """
+    global _session_index
+    if _session_index is None:
+        _session_index = DirectoryIndex()
+    return _session_index
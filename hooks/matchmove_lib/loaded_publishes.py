@@ -0,0 +1,178 @@
+"""
+Copyright (c) 2013 Shotgun Software, Inc
+----------------------------------------------------
+
+Index of the publishes loaded into the current Maya or Nuke scene.
+
+The loaders tag every node they create with the id and version of its
+publish and a key shared by every version of it, made of the entity, name
+and type.  The tag is a single JSON string attribute or knob, so tagging a
+node takes as few calls into the host as possible.
+
+The index maps each key to the node carrying it, so a loader can tell with
+one lookup that a publish is already in the scene, or that another version
+of it is and should be updated in place instead of loaded again.
+
+Tank reloads hook files, so the indexes live in this module.  Each one is
+built by scanning the scene for the tags the first time it is needed and
+kept up to date by the loaders after that.  It is scanned again once another
+scene is open, or when a node it holds has been deleted or renamed.
+"""
+import json
+
+from collections import namedtuple
+
+# string attribute on the Maya nodes and knob on the Nuke nodes loaded from a publish
+MAYA_ATTR = 'mmPublish'
+NUKE_KNOB = 'mm_publish'
+NUKE_TAB_KNOB = 'matchmove'
+
+# a node in the scene and the publish it was loaded from
+Loaded = namedtuple('Loaded', ['node', 'publish_id', 'version'])
+
+
+def publish_key(record):
+    """
+    The key shared by every version of the publish of record
+    """
+    return '%s/%s/%s' % (record['entity']['name'], record['name'], record['tank_type']['name'])
+
+
+def _tag(key, publish_id, version):
+    return json.dumps({'key': key, 'id': publish_id, 'version': version}, sort_keys=True)
+
+
+def _read_tag(node, tag):
+    """
+    (node, key, publish id, version) from a tag, or None if it is damaged
+    """
+    try:
+        tag = json.loads(tag)
+        return node, tag['key'], tag['id'], tag['version']
+    except (TypeError, ValueError, KeyError):
+        return None
+
+
+class PublishIndex(object):
+    """
+    A map of publish key to Loaded for the scene currently open in host
+    """
+    def __init__(self, host):
+        self.host = host
+        self.scene = None
+        self.scans = 0
+        self._loaded = None
+
+    def find(self, record):
+        """
+        Return the Loaded of any version of the publish of record, or None
+        """
+        self._check_scene()
+        key = publish_key(record)
+        loaded = self._loaded.get(key)
+        if loaded is not None and not self.host.exists(loaded.node):
+            self._scan()
+            loaded = self._loaded.get(key)
+        return loaded
+
+    def add(self, record, node):
+        """
+        Tag node as loaded from record, replacing whatever held its key.
+        Meant to follow find(), so the scene isn't checked again.
+        """
+        if self._loaded is None:
+            self._scan()
+        key = publish_key(record)
+        self.host.tag(node, key, record['id'], record['version_number'])
+        self._loaded[key] = Loaded(self.host.name(node), record['id'], record['version_number'])
+
+    def _check_scene(self):
+        if self._loaded is None or self.host.scene() != self.scene:
+            self._scan()
+
+    def _scan(self):
+        self.scene = self.host.scene()
+        self.scans += 1
+        self._loaded = dict((found[1], Loaded(found[0], found[2], found[3]))
+                            for found in self.host.scan() if found)
+
+
+class MayaHost(object):
+    """
+    Finds and tags loaded nodes by their long names
+    """
+    def scene(self):
+        import maya.cmds as cmds
+        return cmds.file(query=True, sceneName=True)
+
+    def name(self, node):
+        return node
+
+    def exists(self, node):
+        import maya.cmds as cmds
+        return cmds.objExists(node)
+
+    def scan(self):
+        import maya.cmds as cmds
+
+        return [_read_tag(node, cmds.getAttr('%s.%s' % (node, MAYA_ATTR)))
+                for node in cmds.ls('*.%s' % MAYA_ATTR, objectsOnly=True, long=True) or []]
+
+    def tag(self, node, key, publish_id, version):
+        import maya.cmds as cmds
+
+        if not cmds.attributeQuery(MAYA_ATTR, node=node, exists=True):
+            cmds.addAttr(node, longName=MAYA_ATTR, dataType='string')
+        cmds.setAttr('%s.%s' % (node, MAYA_ATTR), _tag(key, publish_id, version), type='string')
+
+
+class NukeHost(object):
+    """
+    Finds loaded nodes by their names and tags them on their Matchmove tab
+    """
+    def scene(self):
+        import nuke
+        return nuke.root().name()
+
+    def name(self, node):
+        return node.name()
+
+    def exists(self, node):
+        import nuke
+        return nuke.exists(node)
+
+    def scan(self):
+        import nuke
+
+        return [_read_tag(node.name(), node.knob(NUKE_KNOB).value())
+                for node in nuke.allNodes() if node.knob(NUKE_KNOB) is not None]
+
+    def tag(self, node, key, publish_id, version):
+        import nuke
+
+        if node.knob(NUKE_KNOB) is None:
+            if node.knob(NUKE_TAB_KNOB) is None:
+                node.addKnob(nuke.Tab_Knob(NUKE_TAB_KNOB, 'Matchmove'))
+            node.addKnob(nuke.String_Knob(NUKE_KNOB, 'publish'))
+        node[NUKE_KNOB].setValue(_tag(key, publish_id, version))
+
+
+_indexes = {}
+
+
+def maya_index():
+    """
+    Return the index of the publishes loaded into Maya this session
+    """
+    if 'maya' not in _indexes:
+        _indexes['maya'] = PublishIndex(MayaHost())
+    return _indexes['maya']
+
+
+def nuke_index():
+    """
+    Return the index of the publishes loaded into Nuke this session
+    """
+    if 'nuke' not in _indexes:
+        _indexes['nuke'] = PublishIndex(NukeHost())
+    return _indexes['nuke']
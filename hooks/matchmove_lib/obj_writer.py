@@ -0,0 +1,183 @@
+"""
+Copyright (c) 2013 Shotgun Software, Inc
+----------------------------------------------------
+
+Streaming OBJ writer used in place of Maya's objExport plugin.
+
+Meshes are given as flat arrays, so the writer works the same on data pulled
+from Maya in bulk (see collect_meshes) or built by hand outside of Maya.  Each
+chunk of vertices is formatted with a single '%' operation on a repeated format
+string and written straight to disk, so the whole file never sits in memory.
+
+The output follows objExport with "groups=1; ptgroups=0; materials=0;
+smoothing=0; normals=0": a 'g default' block holding the vertices and uvs,
+then a group per mesh holding its faces.  Indices are global and 1-based.
+"""
+
+# number of vertices / faces formatted per write
+DEFAULT_CHUNK_SIZE = 8192
+
+HEADER = "# This file uses centimeters as units for non-parametric coordinates.\n\n"
+
+
+class Mesh(object):
+    """
+    Plain array description of a polygon mesh.
+
+    :points:        flat sequence of x, y, z world space positions
+    :face_counts:   number of vertices in each face
+    :face_connects: flat sequence of 0-based vertex indices for every face
+    :uvs:           optional flat sequence of u, v pairs
+    :uv_ids:        optional 0-based uv index per face vertex, parallel to face_connects
+    """
+    def __init__(self, name, points, face_counts, face_connects, uvs=None, uv_ids=None):
+        self.name = name
+        self.points = points
+        self.face_counts = face_counts
+        self.face_connects = face_connects
+        self.uvs = uvs if uv_ids is not None else None
+        self.uv_ids = uv_ids if uvs is not None else None
+
+    @property
+    def num_points(self):
+        return len(self.points) // 3
+
+    @property
+    def num_uvs(self):
+        return len(self.uvs) // 2 if self.uvs is not None else 0
+
+
+def write_obj(path, meshes, chunk_size=DEFAULT_CHUNK_SIZE):
+    """
+    Write meshes to an OBJ file and return the number of bytes written.
+    """
+    with open(path, 'w') as fh:
+        return write_obj_stream(fh, meshes, chunk_size)
+
+
+def write_obj_stream(fh, meshes, chunk_size=DEFAULT_CHUNK_SIZE):
+    """
+    Write meshes to an open file object and return the number of bytes written.
+    """
+    meshes = list(meshes)
+    written = _write(fh, HEADER)
+
+    written += _write(fh, "g default\n")
+    for mesh in meshes:
+        written += _write_floats(fh, "v %f %f %f\n", mesh.points, 3, chunk_size)
+    for mesh in meshes:
+        if mesh.uvs is not None:
+            written += _write_floats(fh, "vt %f %f\n", mesh.uvs, 2, chunk_size)
+
+    point_offset = 1
+    uv_offset = 1
+    for mesh in meshes:
+        written += _write(fh, "g %s\n" % mesh.name)
+        written += _write_faces(fh, mesh, point_offset, uv_offset, chunk_size)
+        point_offset += mesh.num_points
+        uv_offset += mesh.num_uvs
+
+    return written
+
+
+def _write(fh, text):
+    fh.write(text)
+    return len(text)
+
+
+def _write_floats(fh, line_format, values, width, chunk_size):
+    """
+    Write fixed width records, formatting chunk_size records per '%' operation
+    """
+    written = 0
+    count = len(values) // width
+    for start in range(0, count, chunk_size):
+        n = min(chunk_size, count - start)
+        text = (line_format * n) % tuple(values[start * width:(start + n) * width])
+        written += _write(fh, text)
+    return written
+
+
+def _write_faces(fh, mesh, point_offset, uv_offset, chunk_size):
+    """
+    Write 'f' records for a mesh, a chunk of faces at a time
+    """
+    written = 0
+    counts = mesh.face_counts
+    connects = mesh.face_connects
+    uv_ids = mesh.uv_ids
+
+    position = 0
+    for start in range(0, len(counts), chunk_size):
+        chunk_counts = counts[start:start + chunk_size]
+        end = position + sum(chunk_counts)
+
+        # format every index of the chunk in one go, then split per face
+        if uv_ids is not None:
+            n = end - position
+            pairs = [None] * (n * 2)
+            pairs[0::2] = [i + point_offset for i in connects[position:end]]
+            pairs[1::2] = [i + uv_offset for i in uv_ids[position:end]]
+            tokens = (("%d/%d " * n) % tuple(pairs)).split()
+        else:
+            tokens = [str(i + point_offset) for i in connects[position:end]]
+
+        lines = []
+        p = 0
+        for c in chunk_counts:
+            lines.append("f %s\n" % " ".join(tokens[p:p + c]))
+            p += c
+        written += _write(fh, "".join(lines))
+        position = end
+
+    return written
+
+
+def collect_meshes(root):
+    """
+    Pull world space mesh data for every visible mesh under root out of Maya
+    using the API, one bulk call per array.
+    """
+    import maya.cmds as cmds
+    import maya.api.OpenMaya as om
+
+    shapes = cmds.listRelatives(root, allDescendents=True, type='mesh', fullPath=True) or []
+    shapes = cmds.ls(shapes, visible=True, noIntermediate=True, long=True) or []
+
+    meshes = []
+    selection = om.MSelectionList()
+    for shape in shapes:
+        selection.add(shape)
+
+    for index, shape in enumerate(shapes):
+        fn = om.MFnMesh(selection.getDagPath(index))
+
+        points = []
+        for point in fn.getPoints(om.MSpace.kWorld):
+            points.extend((point.x, point.y, point.z))
+        face_counts, face_connects = fn.getVertices()
+
+        uvs = uv_ids = None
+        if fn.numUVs():
+            us, vs = fn.getUVs()
+            uvs = [None] * (len(us) * 2)
+            uvs[0::2] = us
+            uvs[1::2] = vs
+            uv_counts, uv_ids = fn.getAssignedUVs()
+            if len(uv_ids) != len(face_connects):
+                # faces without uvs can't be written as v/vt pairs, so leave the uvs out
+                uvs = uv_ids = None
+
+        transform = cmds.listRelatives(shape, parent=True)[0]
+        meshes.append(Mesh(transform, points, list(face_counts), list(face_connects),
+                           uvs, list(uv_ids) if uv_ids is not None else None))
+
+    return meshes
+
+
+def export_meshes(root, path, chunk_size=DEFAULT_CHUNK_SIZE):
+    """
+    Export every visible mesh under root to path, in place of
+    cmds.file(path, typ="OBJexport", es=1, ...).  Returns the bytes written.
+    """
+    return write_obj(path, collect_meshes(root), chunk_size)
@@ -0,0 +1,106 @@
+"""
+Copyright (c) 2013 Shotgun Software, Inc
+----------------------------------------------------
+
+A small bounded worker pool used to overlap file and network work with the
+Maya exports, which have to stay on the main thread.
+
+A job's return value is kept on job.result and an exception raised by the job
+is turned into an error string on job.errors.  Completion callbacks and
+progress reporting always run on the thread that calls join(), so they are
+free to touch Maya or the UI.
+"""
+import sys
+import threading
+import traceback
+
+try:
+    import Queue as queue
+except ImportError:
+    import queue
+
+
+class Job(object):
+    """
+    A unit of work submitted to a WorkerPool.
+    """
+    def __init__(self, owner, fn, args, kwargs, on_done=None):
+        self.owner = owner
+        self.fn = fn
+        self.args = args
+        self.kwargs = kwargs
+        self.on_done = on_done
+        self.result = None
+        self.errors = []
+        self.done = threading.Event()
+
+    def run(self):
+        try:
+            self.result = self.fn(*self.args, **self.kwargs)
+        except Exception as e:
+            traceback.print_exc(file=sys.stdout)
+            self.errors.append('%s failed: %s' % (getattr(self.fn, '__name__', 'job'), e))
+        finally:
+            self.done.set()
+
+
+class WorkerPool(object):
+    """
+    Runs jobs on a fixed number of daemon threads.  A pool of one worker runs
+    jobs serially in submission order.
+    """
+    def __init__(self, max_workers=4, name='matchmove-worker'):
+        self._queue = queue.Queue()
+        self._jobs = []
+        self._threads = []
+        for i in range(max(1, max_workers)):
+            thread = threading.Thread(target=self._work, name='%s-%d' % (name, i))
+            thread.daemon = True
+            thread.start()
+            self._threads.append(thread)
+
+    def submit(self, owner, fn, *args, **kwargs):
+        """
+        Queue fn(*args, **kwargs).  on_done, if given as a keyword, is called on
+        the joining thread with the finished job.
+        """
+        on_done = kwargs.pop('on_done', None)
+        job = Job(owner, fn, args, kwargs, on_done)
+        self._jobs.append(job)
+        self._queue.put(job)
+        return job
+
+    def join(self, progress_cb=None):
+        """
+        Wait for every submitted job, run completion callbacks and return the
+        finished jobs.  progress_cb(done, total) is called as jobs complete.
+        """
+        finished = []
+        while self._jobs:
+            job = self._jobs.pop(0)
+            # wake up now and then so that a KeyboardInterrupt gets through
+            while not job.done.wait(0.1):
+                pass
+            if job.on_done:
+                job.on_done(job)
+            finished.append(job)
+            if progress_cb:
+                progress_cb(len(finished), len(finished) + len(self._jobs))
+        return finished
+
+    def shutdown(self):
+        """
+        Stop the worker threads once the queue has drained
+        """
+        for thread in self._threads:
+            self._queue.put(None)
+        for thread in self._threads:
+            thread.join()
+        self._threads = []
+
+    def _work(self):
+        while True:
+            job = self._queue.get()
+            if job is None:
+                return
+            job.run()
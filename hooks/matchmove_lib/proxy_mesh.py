@@ -0,0 +1,321 @@
+"""
+Copyright (c) 2013 Shotgun Software, Inc
+----------------------------------------------------
+
+Decimated proxy meshes published alongside the full resolution geo.
+
+Proxies are made by vertex clustering: a regular grid is laid over the
+bounding box of all the meshes, the vertices of each cell merge into the
+first one found in it and the triangles left spanning fewer than three cells
+are dropped.  Everything runs on the flat arrays of obj_writer.Mesh with
+slices, comprehensions and dicts built in one call, so it needs neither
+Maya nor numpy.
+
+Each level is given as the fraction of the triangles it should keep.  Grid
+occupancy grows with the square of the resolution on surface meshes, so the
+resolution is estimated from the vertex count, and the estimate is measured
+once and corrected for every level.
+
+A proxy is written next to the full resolution OBJ with the level in its
+name, geo_v001.obj -> geo_v001.proxy1.obj, and the loaders look it up there.
+Geo loaded into Maya is tagged with both paths, so swap_maya_resolution()
+can switch the selected groups over later:
+
+    from matchmove_lib import proxy_mesh
+    proxy_mesh.swap_maya_resolution()
+"""
+import math
+import os
+
+from . import obj_writer
+
+# fraction of the triangles kept by each proxy level, finest first
+LEVELS = (0.25, 0.05)
+
+# a level that keeps more than this fraction isn't worth publishing
+MIN_REDUCTION = 0.75
+
+# geo lighter than this loads quickly enough as it is and gets no proxies
+MIN_TRIANGLES = 2000
+
+# proxies beyond this level are never looked for
+MAX_LEVELS = 4
+
+# string attributes on the group of geo loaded into Maya
+FULL_ATTR = 'mmFullResolution'
+PROXY_ATTR = 'mmProxy'
+LOADED_ATTR = 'mmLoadedFile'
+
+# imports the OBJ as a single group, returning the new nodes
+IMPORT_COMMAND = 'file -import -type "OBJ" -gr -gn "%s" -ra true -rdn -rpr "%s" -options "mo=0" -loadReferenceDepth "all" -returnNewNodes "%s"'
+
+
+def proxy_path(path, level):
+    """
+    Return the path of the level proxy (1 is the finest) of an OBJ
+    """
+    base, ext = os.path.splitext(path)
+    return '%s.proxy%d%s' % (base, level, ext)
+
+
+def write_proxy(path, meshes):
+    """
+    Write a proxy OBJ, renaming it into place once complete so a proxy found
+    next to an OBJ is never a partial one.  Returns the bytes written.
+    """
+    tmp_path = '%s.%d.tmp' % (path, os.getpid())
+    try:
+        size = obj_writer.write_obj(tmp_path, meshes)
+        if os.path.exists(path):
+            os.remove(path)
+        os.rename(tmp_path, path)
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+    return size
+
+
+def find_proxies(path):
+    """
+    Return the (level, path) of every proxy published next to path, finest first
+    """
+    found = []
+    for level in range(1, MAX_LEVELS + 1):
+        candidate = proxy_path(path, level)
+        if os.path.isfile(candidate):
+            found.append((level, candidate))
+    return found
+
+
+def load_path(path, level):
+    """
+    Return the file to load for level of the OBJ at path: the proxy of that
+    level, or the closest coarser one that exists.  Level 0 or no proxies at
+    all loads the full resolution file.
+    """
+    if not level:
+        return path
+    proxies = find_proxies(path)
+    for proxy_level, proxy in proxies:
+        if proxy_level >= level:
+            return proxy
+    return proxies[-1][1] if proxies else path
+
+
+def triangle_count(meshes):
+    return sum(sum(mesh.face_counts) - 2 * len(mesh.face_counts) for mesh in meshes)
+
+
+def _bounds(meshes):
+    lows = [float('inf')] * 3
+    highs = [float('-inf')] * 3
+    for mesh in meshes:
+        for axis in range(3):
+            values = mesh.points[axis::3]
+            if values:
+                lows[axis] = min(lows[axis], min(values))
+                highs[axis] = max(highs[axis], max(values))
+    return lows, highs
+
+
+class _Grid(object):
+    """
+    resolution cells along the longest side of the bounding box
+    """
+    def __init__(self, lows, highs, resolution):
+        size = max(highs[axis] - lows[axis] for axis in range(3)) or 1.0
+        self.origin = lows
+        self.scale = resolution / size
+        self.counts = [int((highs[axis] - lows[axis]) * self.scale) + 1 for axis in range(3)]
+
+    def keys(self, points):
+        """
+        The cell key of every vertex of a flat point array
+        """
+        (ox, oy, oz), scale = self.origin, self.scale
+        nx, nxy = self.counts[0], self.counts[0] * self.counts[1]
+        return [int((x - ox) * scale) + nx * int((y - oy) * scale) + nxy * int((z - oz) * scale)
+                for x, y, z in zip(points[0::3], points[1::3], points[2::3])]
+
+
+def _triangles(mesh):
+    """
+    Fan triangulate every face, returning three flat lists of corners
+    """
+    counts = mesh.face_counts
+    connects = mesh.face_connects
+    if counts.count(3) == len(counts):
+        return connects[0::3], connects[1::3], connects[2::3]
+    if counts.count(4) == len(counts):
+        firsts = connects[0::4]
+        thirds = connects[2::4]
+        return firsts + firsts, connects[1::4] + thirds, thirds + connects[3::4]
+
+    firsts = []
+    seconds = []
+    thirds = []
+    position = 0
+    for count in counts:
+        if count >= 3:
+            corners = connects[position:position + count]
+            firsts.extend([corners[0]] * (count - 2))
+            seconds.extend(corners[1:-1])
+            thirds.extend(corners[2:])
+        position += count
+    return firsts, seconds, thirds
+
+
+def _cluster(mesh, keys):
+    """
+    Return mesh with the vertices of every grid cell merged into the first
+    of them, uvs dropped.  keys holds the cell of every vertex.
+    """
+    # the first vertex of every cell stands in for the whole cell
+    first = dict(zip(reversed(keys), range(len(keys) - 1, -1, -1)))
+    remap = [first[key] for key in keys]
+
+    # keep each triangle spanning three cells once, in its original winding
+    firsts, seconds, thirds = _triangles(mesh)
+    triangles = dict((frozenset(t), t) for t in zip([remap[i] for i in firsts],
+                                                    [remap[i] for i in seconds],
+                                                    [remap[i] for i in thirds])
+                     if t[0] != t[1] and t[1] != t[2] and t[0] != t[2])
+    corners = [i for t in triangles.values() for i in t]
+
+    # renumber the vertices the triangles still use
+    used = sorted(set(corners))
+    renumber = dict(zip(used, range(len(used))))
+    points = mesh.points
+    merged = [value for i in used for value in points[i * 3:i * 3 + 3]]
+    return obj_writer.Mesh(mesh.name, merged, [3] * len(triangles), [renumber[i] for i in corners])
+
+
+def simplify(meshes, ratio):
+    """
+    Return proxies of meshes keeping roughly ratio of their triangles
+    """
+    return _Simplifier(meshes).level(meshes, ratio)
+
+
+class _Simplifier(object):
+    """
+    Sizes the grid of every level of a set of meshes.
+
+    A closed surface has about two triangles per vertex, so a level aims for
+    ratio of the vertices worth of occupied cells.  Occupancy grows with the
+    square of the resolution, so the occupancy of the first level's grid
+    tells how far off the estimate was.  Its cells are only worked out again
+    when it missed by more than TOLERANCE, and the correction applies to the
+    rest of the levels.
+    """
+    TOLERANCE = 0.1
+
+    def __init__(self, meshes):
+        self.meshes = [mesh for mesh in meshes if mesh.face_counts]
+        self.lows, self.highs = _bounds(self.meshes)
+        self.vertices = sum(mesh.num_points for mesh in self.meshes)
+        self.correction = None
+
+    def level(self, meshes, ratio):
+        """
+        Cluster meshes, the originals or a finer level of them, for ratio
+        """
+        if not self.meshes:
+            return []
+        meshes = [mesh for mesh in meshes if mesh.face_counts]
+        target = max(4.0, self.vertices * ratio)
+        keys = self._keys(meshes, math.sqrt(target) * (self.correction or 1.0))
+        if self.correction is None:
+            self.correction = math.sqrt(target / max(1, sum(len(set(k)) for k in keys)))
+            if abs(self.correction - 1.0) > self.TOLERANCE:
+                keys = self._keys(meshes, math.sqrt(target) * self.correction)
+
+        proxies = [_cluster(mesh, mesh_keys) for mesh, mesh_keys in zip(meshes, keys)]
+        return [proxy for proxy in proxies if proxy.face_counts]
+
+    def _keys(self, meshes, resolution):
+        grid = _Grid(self.lows, self.highs, max(1.0, resolution))
+        return [grid.keys(mesh.points) for mesh in meshes]
+
+
+def build_proxies(meshes, levels=None):
+    """
+    Return (level, proxy meshes, triangles) for every level worth publishing.
+    levels is a list of (level, ratio) and defaults to LEVELS numbered from 1.
+    Each level is clustered from the next finer one rather than the full
+    meshes, which gives much the same cells for a fraction of the work.
+    """
+    if levels is None:
+        levels = list(enumerate(LEVELS, 1))
+    full = triangle_count(meshes)
+    proxies = []
+    if full < MIN_TRIANGLES:
+        return proxies
+
+    simplifier = _Simplifier(meshes)
+    source = meshes
+    for level, ratio in sorted(levels, key=lambda each: -each[1]):
+        proxy = simplifier.level(source, ratio)
+        triangles = triangle_count(proxy)
+        if proxy and triangles <= full * MIN_REDUCTION:
+            proxies.append((level, proxy, triangles))
+            source = proxy
+    return sorted(proxies, key=lambda each: each[0])
+
+
+def tag_maya_group(group, full_path, proxy_path, loaded_path, tagged=False):
+    """
+    Record the full resolution and proxy OBJ on an imported group, or update
+    them on a group already tagged
+    """
+    import maya.cmds as cmds
+
+    for attr, value in ((FULL_ATTR, full_path), (PROXY_ATTR, proxy_path), (LOADED_ATTR, loaded_path)):
+        if not tagged:
+            cmds.addAttr(group, longName=attr, dataType='string')
+        cmds.setAttr('%s.%s' % (group, attr), value, type='string')
+
+
+def replace_maya_children(group, path):
+    """
+    Import the OBJ at path as a group of its own and move its meshes into
+    group in place of the ones there
+    """
+    import maya.cmds as cmds
+    import maya.mel as mel
+
+    name = group.rsplit('|', 1)[-1]
+    new_nodes = mel.eval(IMPORT_COMMAND % (name + '_swap', name, path)) or []
+    old_children = cmds.listRelatives(group, children=True, fullPath=True) or []
+    if old_children:
+        cmds.delete(old_children)
+    for imported in cmds.ls(new_nodes, assemblies=True, long=True) or []:
+        children = cmds.listRelatives(imported, children=True, fullPath=True) or []
+        if children:
+            cmds.parent(children, group)
+        cmds.delete(imported)
+
+
+def swap_maya_resolution(groups=None):
+    """
+    Swap loaded geo groups, the selected ones by default, between their
+    proxy and full resolution OBJ.  Returns the groups swapped.
+    """
+    import maya.cmds as cmds
+
+    if groups is None:
+        groups = cmds.ls(selection=True, long=True) or []
+
+    swapped = []
+    for group in groups:
+        if not cmds.attributeQuery(FULL_ATTR, node=group, exists=True):
+            continue
+        full_path = cmds.getAttr('%s.%s' % (group, FULL_ATTR))
+        proxy_path = cmds.getAttr('%s.%s' % (group, PROXY_ATTR))
+        loaded_path = cmds.getAttr('%s.%s' % (group, LOADED_ATTR))
+        target = proxy_path if loaded_path == full_path else full_path
+
+        replace_maya_children(group, target)
+        cmds.setAttr('%s.%s' % (group, LOADED_ATTR), target, type='string')
+        swapped.append(group)
+    return swapped
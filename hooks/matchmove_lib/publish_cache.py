@@ -0,0 +1,168 @@
+"""
+Copyright (c) 2013 Shotgun Software, Inc
+----------------------------------------------------
+
+Session cache of TankPublishedFile records used by the matchmove loaders.
+
+Tank reloads hook files, so the cache lives in this module which is imported
+once per session.  Records expire after a TTL and the least recently used
+records are dropped once the cache is full.  Records that are not cached can
+come from a publish_mirror.PublishMirror before Shotgun is asked.
+
+The loader app lists the publishes made from a scene and runs its hook once
+per selected file, so fetch_scene() fetches all of them with the first file
+and the rest of the selection is then answered from the cache.
+"""
+import time
+
+from collections import OrderedDict
+
+# fields the loader hooks need to name and dispatch a publish
+PUBLISH_FIELDS = ['entity', 'name', 'version_number', 'tank_type']
+
+DEFAULT_TTL = 300.0
+DEFAULT_MAX_SIZE = 2000
+
+# most publishes of a scene fetched along with one of them
+MAX_SCENE_PUBLISHES = 500
+
+
+class PublishCache(object):
+    """
+    A bounded, expiring map of publish id to publish record.
+    """
+    def __init__(self, ttl=DEFAULT_TTL, max_size=DEFAULT_MAX_SIZE, clock=time.time):
+        self.ttl = ttl
+        self.max_size = max_size
+        self.hits = 0
+        self.misses = 0
+        self._clock = clock
+        self._records = OrderedDict()
+
+    def get(self, publish_id):
+        """
+        Return the cached record for publish_id, or None
+        """
+        entry = self._records.pop(publish_id, None)
+        if entry is None or entry[0] < self._clock():
+            self.misses += 1
+            return None
+
+        # re-insert to mark it as most recently used
+        self._records[publish_id] = entry
+        self.hits += 1
+        return entry[1]
+
+    def put(self, record):
+        """
+        Add a record, evicting the least recently used ones if the cache is full
+        """
+        self._records.pop(record['id'], None)
+        self._records[record['id']] = (self._clock() + self.ttl, record)
+        while len(self._records) > self.max_size:
+            self._records.popitem(last=False)
+
+    def fetch(self, sg, publish_ids, fields=PUBLISH_FIELDS, mirror=None):
+        """
+        Return a dict of publish id to record, looking up the ids that are not
+        cached in a publish_mirror.PublishMirror, then querying Shotgun once
+        for the rest.  mirror, if given, is called for the PublishMirror only
+        when some ids are not cached, and may return None.
+        """
+        found = {}
+        missing = []
+        for publish_id in publish_ids:
+            record = self.get(publish_id)
+            if record is None:
+                missing.append(publish_id)
+            else:
+                found[publish_id] = record
+
+        mirror = mirror() if missing and mirror is not None else None
+        if mirror is not None:
+            for publish_id, record in mirror.records(missing, fields).items():
+                self.put(record)
+                found[publish_id] = record
+            missing = [publish_id for publish_id in missing if publish_id not in found]
+
+        if missing:
+            for record in sg.find('TankPublishedFile', [['id', 'in', missing]], fields):
+                self.put(record)
+                found[record['id']] = record
+
+        return found
+
+    def fetch_scene(self, sg, publish_id, fields=PUBLISH_FIELDS, mirror=None):
+        """
+        Fetch the records of publish_id and of every publish made from the
+        same scene, as fetch() does, and return a dict of publish id to
+        record of them.  mirror is called for the PublishMirror, which then
+        also answers which publishes those are.
+        """
+        mirror = mirror() if mirror is not None else None
+        ids = scene_publish_ids(sg, publish_id, mirror)[:MAX_SCENE_PUBLISHES]
+        return self.fetch(sg, ids, fields, mirror=lambda: mirror)
+
+    def invalidate(self, publish_id=None):
+        """
+        Drop one record, or everything if no id is given
+        """
+        if publish_id is None:
+            self._records.clear()
+        else:
+            self._records.pop(publish_id, None)
+
+    def stats(self):
+        """
+        Return the hit/miss counters and current size
+        """
+        return {'hits': self.hits, 'misses': self.misses, 'size': len(self._records)}
+
+
+_session_cache = None
+
+
+def session_cache():
+    """
+    Return the publish cache shared by every loader in this session
+    """
+    global _session_cache
+    if _session_cache is None:
+        _session_cache = PublishCache()
+    return _session_cache
+
+
+def scene_publish_ids(sg, publish_id, mirror=None):
+    """
+    Return the ids of the publishes made from the scenes publish_id depends
+    on, publish_id first, from mirror if it holds publish_id and from the
+    TankDependency links in Shotgun otherwise
+    """
+    publish = {'type': 'TankPublishedFile', 'id': publish_id}
+    if mirror is not None and mirror.records([publish_id], []):
+        ids = [record['id'] for scene in mirror.dependencies(publish) for record in mirror.dependents(scene)]
+    else:
+        links = sg.find('TankDependency', [['tank_published_file', 'is', publish]], ['dependent_tank_published_file'])
+        scenes = [link['dependent_tank_published_file'] for link in links if link.get('dependent_tank_published_file')]
+        links = []
+        if scenes:
+            links = sg.find('TankDependency', [['dependent_tank_published_file', 'in', scenes]],
+                            ['tank_published_file'])
+        ids = [link['tank_published_file']['id'] for link in links if link.get('tank_published_file')]
+
+    seen = set([publish_id])
+    return [publish_id] + [each for each in ids if not (each in seen or seen.add(each))]
+
+
+def complete_record(shotgun_data, fields=PUBLISH_FIELDS):
+    """
+    Return shotgun_data if it already holds every field the loaders need,
+    which saves a lookup when the loader app passes a full record.
+    """
+    if not shotgun_data.get('id'):
+        return None
+    for field in fields:
+        value = shotgun_data.get(field)
+        if value is None or (isinstance(value, dict) and not value.get('name')):
+            return None
+    return shotgun_data
@@ -0,0 +1,415 @@
+"""
+Copyright (c) 2013 Shotgun Software, Inc
+----------------------------------------------------
+
+Local SQLite mirror of a project's TankPublishedFile records.
+
+The loaders look up every publish they load, which costs a Shotgun round
+trip per batch of files, and finding the latest versions of a shot or what
+was published from a scene takes more.  The mirror keeps the fields the
+loaders need, and the TankDependency links between publishes, in a file per
+site and project under ~/.matchmove.  It is indexed for those questions, so
+they and the publishes the session cache misses are mostly answered locally
+in microseconds.
+
+sync() brings it up to date incrementally, fetching only the records whose
+updated_at is past the watermark each table was left with by the last sync.  Shotgun keeps whole
+seconds and a record can be saved in the same second as a sync, so every
+sync reads the last SYNC_OVERLAP seconds again and records are upserted.
+Retired records never show up in an incremental sync, so every FULL_SYNC_AGE
+the whole project is read again and whatever Shotgun no longer returns is
+dropped.  That read is spread over the syncs FULL_SYNC_PAGE records of each
+table at a time, so no single load pays for it.
+
+Anything the mirror can't answer is looked up live by the caller.  A sync
+that Shotgun fails is retried by the next one, while a mirror whose file
+can't be used is switched off for the session, with the reason left in
+error.
+"""
+import calendar
+import datetime
+import os
+import re
+import sqlite3
+import time
+
+from . import tracing
+
+# fields read into the mirror
+PUBLISH_FIELDS = ['entity', 'name', 'version_number', 'tank_type', 'path', 'path_cache', 'updated_at']
+
+# fields of the records the mirror hands back
+RECORD_FIELDS = ['entity', 'name', 'version_number', 'tank_type', 'path', 'path_cache']
+
+# fields of the TankDependency links read into the mirror
+DEPENDENCY_FIELDS = ['tank_published_file', 'dependent_tank_published_file', 'updated_at']
+
+DEFAULT_FOLDER = os.path.join('~', '.matchmove')
+
+# seconds of records read again by every sync
+SYNC_OVERLAP = 60.0
+
+# sync() does nothing this soon after the last sync
+MIN_SYNC_INTERVAL = 30.0
+
+# seconds between full syncs
+FULL_SYNC_AGE = 24 * 60 * 60.0
+
+# records read by each sync while a full sync is under way
+FULL_SYNC_PAGE = 500
+
+# a mirror written with another schema is rebuilt from scratch
+SCHEMA_VERSION = 4
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS publishes (
+    id INTEGER PRIMARY KEY,
+    entity_type TEXT,
+    entity_id INTEGER,
+    entity_name TEXT,
+    name TEXT,
+    version_number INTEGER,
+    tank_type_id INTEGER,
+    tank_type_name TEXT,
+    path TEXT,
+    path_cache TEXT,
+    updated_at REAL,
+    synced_at REAL
+);
+CREATE INDEX IF NOT EXISTS publishes_versions
+    ON publishes (entity_id, tank_type_id, name, version_number);
+CREATE TABLE IF NOT EXISTS dependencies (
+    id INTEGER PRIMARY KEY,
+    publish_id INTEGER,
+    dependency_id INTEGER,
+    updated_at REAL,
+    synced_at REAL
+);
+CREATE INDEX IF NOT EXISTS dependencies_dependency ON dependencies (dependency_id);
+CREATE INDEX IF NOT EXISTS dependencies_publish ON dependencies (publish_id);
+CREATE TABLE IF NOT EXISTS state (
+    name TEXT PRIMARY KEY,
+    value REAL
+);
+"""
+
+_COLUMNS = ('id, entity_type, entity_id, entity_name, name, version_number, '
+            'tank_type_id, tank_type_name, path, path_cache')
+
+# ids per query, well inside SQLite's limit on parameters
+_CHUNK = 500
+
+# errors of the mirror file, as opposed to Shotgun's
+_FILE_ERRORS = (sqlite3.Error, IOError, OSError)
+
+log = tracing.get_logger('publish_mirror')
+
+
+class _UTC(datetime.tzinfo):
+    def utcoffset(self, dt):
+        return datetime.timedelta(0)
+
+    def dst(self, dt):
+        return datetime.timedelta(0)
+
+    def tzname(self, dt):
+        return 'UTC'
+
+
+_utc = _UTC()
+
+
+def _timestamp(value):
+    """
+    Seconds since the epoch of a Shotgun datetime, naive ones taken as UTC
+    """
+    if value is None:
+        return None
+    return calendar.timegm(value.utctimetuple()) + value.microsecond / 1e6
+
+
+def _link(value):
+    if not value:
+        return None, None, None
+    return value.get('type'), value.get('id'), value.get('name')
+
+
+def _publish_row(record, synced_at):
+    entity_type, entity_id, entity_name = _link(record.get('entity'))
+    tank_type_id = tank_type_name = None
+    if record.get('tank_type'):
+        tank_type_id, tank_type_name = record['tank_type']['id'], record['tank_type'].get('name')
+    path = (record.get('path') or {}).get('local_path')
+    return (record['id'], entity_type, entity_id, entity_name, record.get('name'), record.get('version_number'),
+            tank_type_id, tank_type_name, path, record.get('path_cache'), _timestamp(record.get('updated_at')),
+            synced_at)
+
+
+def _dependency_row(record, synced_at):
+    return (record['id'], _link(record.get('tank_published_file'))[1],
+            _link(record.get('dependent_tank_published_file'))[1], _timestamp(record.get('updated_at')), synced_at)
+
+
+# the mirrored tables: (table, entity type, fields read, the field linking
+# a record to its project, the row of a record)
+_TABLES = (
+    ('publishes', 'TankPublishedFile', PUBLISH_FIELDS, 'project', _publish_row),
+    ('dependencies', 'TankDependency', DEPENDENCY_FIELDS, 'tank_published_file.TankPublishedFile.project',
+     _dependency_row),
+)
+
+
+def _record(row):
+    """
+    A publish as find() returns it with RECORD_FIELDS
+    """
+    (publish_id, entity_type, entity_id, entity_name, name, version_number,
+     tank_type_id, tank_type_name, path, path_cache) = row
+    return {'type': 'TankPublishedFile', 'id': publish_id,
+            'entity': {'type': entity_type, 'id': entity_id, 'name': entity_name} if entity_id else None,
+            'name': name,
+            'version_number': version_number,
+            'tank_type': {'type': 'TankType', 'id': tank_type_id, 'name': tank_type_name} if tank_type_id else None,
+            'path': {'local_path': path} if path else None,
+            'path_cache': path_cache}
+
+
+def mirror_path(sg, project, folder=None):
+    """
+    The mirror file of project on the site sg is connected to
+    """
+    site = re.sub(r'^\w+://', '', getattr(sg, 'base_url', '') or 'shotgun').split('/')[0]
+    return os.path.join(os.path.expanduser(folder or DEFAULT_FOLDER),
+                        'publishes_%s_%d.sqlite' % (re.sub(r'[^\w.-]', '_', site), project['id']))
+
+
+class PublishMirror(object):
+    """
+    The mirrored publishes of one project, kept in the SQLite file at path
+    """
+    def __init__(self, path, project, clock=time.time):
+        self.path = path
+        self.project = {'type': project['type'], 'id': project['id']}
+        self.error = None
+        self.sync_error = None
+        self.last_sync = None
+        self.rows_read = 0
+        self.hits = 0
+        self.misses = 0
+        self._clock = clock
+        self._db = None
+
+    def _connection(self):
+        if self._db is None:
+            folder = os.path.dirname(self.path)
+            if folder and not os.path.isdir(folder):
+                os.makedirs(folder)
+            db = sqlite3.connect(self.path, timeout=10.0)
+            if db.execute('PRAGMA user_version').fetchone()[0] != SCHEMA_VERSION:
+                db.executescript('DROP TABLE IF EXISTS publishes; DROP TABLE IF EXISTS dependencies; '
+                                 'DROP TABLE IF EXISTS state;')
+                db.executescript(SCHEMA)
+                db.execute('PRAGMA user_version = %d' % SCHEMA_VERSION)
+                db.commit()
+            self._db = db
+        return self._db
+
+    def _fail(self, error):
+        self.error = '%s: %s' % (self.path, error)
+        if self._db is not None:
+            try:
+                self._db.close()
+            except sqlite3.Error:
+                pass
+        self._db = None
+
+    def _state(self, db, name):
+        row = db.execute('SELECT value FROM state WHERE name = ?', (name,)).fetchone()
+        return row[0] if row else None
+
+    def _set_state(self, db, name, value):
+        if value is None:
+            db.execute('DELETE FROM state WHERE name = ?', (name,))
+        else:
+            db.execute('INSERT OR REPLACE INTO state VALUES (?, ?)', (name, value))
+
+    def sync(self, sg, force=False):
+        """
+        Fetch what changed in Shotgun since the last sync, and the next
+        FULL_SYNC_PAGE records of each table of a full sync if one is under
+        way or due.  Does nothing if the last sync was less than
+        MIN_SYNC_INTERVAL ago, unless forced.  Returns True if it synced; if
+        Shotgun failed the reason is left in sync_error.
+        """
+        now = self._clock()
+        if self.error or (not force and self.last_sync is not None and now - self.last_sync < MIN_SYNC_INTERVAL):
+            return False
+        self.sync_error = None
+        self.rows_read = 0
+
+        try:
+            db = self._connection()
+            with db:
+                watermarks = dict((table[0], self._state(db, '%s watermark' % table[0])) for table in _TABLES)
+                read_changes = [table for table in watermarks if watermarks[table] is not None]
+                full_start = self._state(db, 'full start')
+                if full_start is None and now - (self._state(db, 'full sync') or 0.0) >= FULL_SYNC_AGE:
+                    full_start = now
+                    self._set_state(db, 'full start', full_start)
+                    for table in watermarks:
+                        self._set_state(db, '%s cursor' % table, 0)
+                        if watermarks[table] is None:
+                            # the pages read everything up to now, later
+                            # changes come in as changes from here on
+                            watermarks[table] = now
+                            self._set_state(db, '%s watermark' % table, now)
+                cursors = dict((table, self._state(db, '%s cursor' % table)) for table in watermarks)
+        except _FILE_ERRORS as e:
+            self._fail(e)
+            return False
+
+        reads = {}
+        try:
+            for table, entity_type, fields, project_field, to_row in _TABLES:
+                project = [[project_field, 'is', self.project]]
+                changes = page = []
+                if table in read_changes:
+                    since = datetime.datetime.fromtimestamp(watermarks[table] - SYNC_OVERLAP, _utc)
+                    changes = sg.find(entity_type, project + [['updated_at', 'greater_than', since]],
+                                      fields, order=[{'field_name': 'updated_at', 'direction': 'asc'}])
+                if full_start is not None and cursors[table] is not None:
+                    page = sg.find(entity_type, project + [['id', 'greater_than', int(cursors[table])]],
+                                   fields, order=[{'field_name': 'id', 'direction': 'asc'}], limit=FULL_SYNC_PAGE)
+                reads[table] = (changes, page)
+        except Exception as e:
+            self.sync_error = '%s' % e
+            return False
+
+        try:
+            with db:
+                for table, entity_type, fields, project_field, to_row in _TABLES:
+                    changes, page = reads[table]
+                    self._write(db, table, watermarks[table], [to_row(record, now) for record in changes + page])
+                    if full_start is not None and cursors[table] is not None:
+                        cursors[table] = page[-1]['id'] if len(page) == FULL_SYNC_PAGE else None
+                        self._set_state(db, '%s cursor' % table, cursors[table])
+                if full_start is not None and not [cursor for cursor in cursors.values() if cursor is not None]:
+                    # the full sync is through, drop whatever it didn't see
+                    for table in cursors:
+                        db.execute('DELETE FROM %s WHERE synced_at < ?' % table, (full_start,))
+                    self._set_state(db, 'full sync', full_start)
+                    self._set_state(db, 'full start', None)
+        except _FILE_ERRORS as e:
+            self._fail(e)
+            return False
+
+        self.rows_read = sum(len(changes) + len(page) for changes, page in reads.values())
+        self.last_sync = now
+        return True
+
+    def _write(self, db, table, watermark, rows):
+        """
+        Upsert the rows of table and move its watermark past them
+        """
+        if rows:
+            db.executemany('INSERT OR REPLACE INTO %s VALUES (%s)' % (table, ', '.join('?' * len(rows[0]))), rows)
+        stamps = [row[-2] for row in rows if row[-2] is not None]
+        if stamps and (watermark is None or max(stamps) > watermark):
+            self._set_state(db, '%s watermark' % table, max(stamps))
+
+    def _query(self, sql, args=()):
+        """
+        Rows of a query, or none once the mirror has failed
+        """
+        if self.error:
+            return []
+        try:
+            return self._connection().execute(sql, args).fetchall()
+        except _FILE_ERRORS as e:
+            self._fail(e)
+            return []
+
+    def records(self, publish_ids, fields=RECORD_FIELDS):
+        """
+        Return a dict of publish id to record for the ids in the mirror.
+        Nothing is returned if fields asks for more than RECORD_FIELDS.
+        """
+        if [field for field in fields if field not in RECORD_FIELDS]:
+            return {}
+        publish_ids = list(publish_ids)
+        found = {}
+        for start in range(0, len(publish_ids), _CHUNK):
+            chunk = publish_ids[start:start + _CHUNK]
+            for row in self._query('SELECT %s FROM publishes WHERE id IN (%s)' % (_COLUMNS, ', '.join('?' * len(chunk))),
+                                   chunk):
+                found[row[0]] = _record(row)
+        self.hits += len(found)
+        self.misses += len(publish_ids) - len(found)
+        return found
+
+    def latest(self, entity, tank_type=None):
+        """
+        Return the latest version of every publish of entity, of one
+        TankType if given, sorted by type and name
+        """
+        sql = ('SELECT %s FROM publishes p WHERE entity_id = ? AND entity_type = ?%s AND version_number = '
+               '(SELECT MAX(version_number) FROM publishes q WHERE q.entity_id = p.entity_id AND '
+               'q.tank_type_id IS p.tank_type_id AND q.name IS p.name AND q.entity_type = p.entity_type) '
+               'ORDER BY tank_type_name, name, id' % (_COLUMNS, ' AND tank_type_id = ?' if tank_type else ''))
+        args = [entity['id'], entity['type']] + ([tank_type['id']] if tank_type else [])
+        return [_record(row) for row in self._query(sql, args)]
+
+    def dependents(self, publish):
+        """
+        Return the publishes depending on publish, such as everything
+        published from a scene, sorted by id
+        """
+        sql = ('SELECT %s FROM publishes WHERE id IN '
+               '(SELECT publish_id FROM dependencies WHERE dependency_id = ?) ORDER BY id' % _COLUMNS)
+        return [_record(row) for row in self._query(sql, (publish['id'],))]
+
+    def dependencies(self, publish):
+        """
+        Return the publishes publish depends on, such as the scene it was
+        published from, sorted by id
+        """
+        sql = ('SELECT %s FROM publishes WHERE id IN '
+               '(SELECT dependency_id FROM dependencies WHERE publish_id = ?) ORDER BY id' % _COLUMNS)
+        return [_record(row) for row in self._query(sql, (publish['id'],))]
+
+    def close(self):
+        if self._db is not None:
+            self._db.close()
+            self._db = None
+
+
+_mirrors = {}
+
+
+def session_mirror(sg, project, path=None):
+    """
+    Return the mirror of project shared by every loader in this session,
+    kept at path or the default mirror_path()
+    """
+    path = path or mirror_path(sg, project)
+    if path not in _mirrors:
+        _mirrors[path] = PublishMirror(path, project)
+    return _mirrors[path]
+
+
+def lookup(sg, project, path=None):
+    """
+    Sync the session mirror of project for publishes the session cache
+    missed and return it, or None if they should be looked up in Shotgun:
+    the mirror is off, or the sync failed.
+    """
+    mirror = session_mirror(sg, project, path)
+    if mirror.error is None:
+        with tracing.session_tracer().span('sync publish mirror'):
+            mirror.sync(sg)
+        if mirror.sync_error is not None:
+            log.warning("Looking up publishes in Shotgun, the publish mirror didn't sync: %s", mirror.sync_error)
+            return None
+        if mirror.error is not None:
+            log.warning("The publish mirror is off for this session: %s", mirror.error)
+    return mirror if mirror.error is None else None
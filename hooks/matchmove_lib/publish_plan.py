@@ -0,0 +1,210 @@
+"""
+Copyright (c) 2013 Shotgun Software, Inc
+----------------------------------------------------
+
+Resolves every secondary publish path before anything is exported.
+
+compile_plan() applies the work file fields to each task's publish template
+once, then checks the target folders for collisions by listing their common
+root (normally the version folder) and only descending into the folders that
+listing shows exist.  Missing folders are never stat'ed, which keeps the
+number of round trips to network storage down.  The resulting PublishPlan is
+read by both validation and publish.
+"""
+import os
+import re
+
+from collections import namedtuple
+
+# output name -> publish name used when registering, None to use the item
+PUBLISH_NAMES = {
+    'cone_geo_export': 'Cones',
+    'lens_distort_export': 'lensDistort',
+}
+
+# outputs that don't write a file of their own
+NO_FILE_OUTPUTS = ('shotgun_note_create',)
+
+
+PlanEntry = namedtuple('PlanEntry', 'task output_name path name exists')
+
+
+class PublishPlan(object):
+    """
+    The resolved paths, names and collisions for a list of publish tasks.
+    entries are in the same order as the tasks they were compiled from.
+    """
+    def __init__(self, scene_path, fields, entries, listings):
+        self.scene_path = scene_path
+        self.entries = tuple(entries)
+        self._fields = dict(fields)
+        self._listings = dict(listings)
+
+    @property
+    def fields(self):
+        """
+        A copy of the work file fields
+        """
+        return dict(self._fields)
+
+    @property
+    def version(self):
+        return self._fields.get('version')
+
+    def directories(self):
+        """
+        Every folder a publish will be written to and the folders between them
+        and their common root, parents first
+        """
+        return _sorted_folders(self._listings)
+
+    @property
+    def root(self):
+        """
+        The common root of every publish folder, normally the version folder
+        """
+        folders = self.directories()
+        return folders[0] if folders else None
+
+    @property
+    def version_folder(self):
+        """
+        The {Shot}_matchmove_v{version} folder holding every output, found by
+        walking up from root.  Falls back to root.
+        """
+        root = self.root
+        if root is None or self.version is None:
+            return root
+        pattern = re.compile(r'_v0*%d$' % self.version)
+        folder = root
+        while folder and os.path.dirname(folder) != folder:
+            if pattern.search(os.path.basename(folder)):
+                return folder
+            folder = os.path.dirname(folder)
+        return root
+
+    def missing_directories(self):
+        return [d for d in self.directories() if self._listings[d] is None]
+
+    def collisions(self):
+        return [e for e in self.entries if e.exists]
+
+    def create_directories(self):
+        """
+        Create the missing folders top down.  Returns the folders created.
+        """
+        created = []
+        for folder in self.missing_directories():
+            if self._listings.get(os.path.dirname(folder)) is not None:
+                os.mkdir(folder)
+            else:
+                os.makedirs(folder)
+            self._listings[folder] = frozenset()
+            created.append(folder)
+        return created
+
+    def format(self):
+        """
+        Return a readable description of the plan
+        """
+        lines = ['scene:   %s' % self.scene_path,
+                 'version: %s' % self.version]
+        for folder in self.directories():
+            state = 'create' if self._listings.get(folder) is None else 'exists'
+            lines.append('folder:  %s (%s)' % (folder, state))
+        for entry in self.entries:
+            flag = ' ALREADY EXISTS' if entry.exists else ''
+            lines.append('%-20s %-24s %s%s' % (entry.output_name, entry.name, entry.path, flag))
+        return '\n'.join(lines)
+
+
+def compile_plan(tasks, work_template, scene_path):
+    """
+    Build the PublishPlan for a list of secondary publish tasks
+    """
+    fields = work_template.get_fields(scene_path)
+
+    resolved = []
+    for task in tasks:
+        resolved.append(_resolve(task, fields))
+
+    # list the common root once and only descend into folders it shows exist
+    listings = {}
+    targets = [path for (output_name, path, name) in resolved
+               if path and output_name not in NO_FILE_OUTPUTS]
+    for folder in _sorted_folders(_plan_folders(targets)):
+        listings[folder] = _list(folder, listings)
+
+    entries = []
+    for task, (output_name, path, name) in zip(tasks, resolved):
+        listing = listings.get(os.path.dirname(path)) if path else None
+        exists = bool(listing) and os.path.basename(path) in listing
+        entries.append(PlanEntry(task, output_name, path, name, exists))
+
+    return PublishPlan(scene_path, fields, entries, listings)
+
+
+def _resolve(task, fields):
+    """
+    Return (output name, publish path, publish name) for a task
+    """
+    item = task['item']
+    output = task['output']
+    output_name = output['name']
+    publish_template = output.get('publish_template')
+    if publish_template is None:
+        return output_name, None, None
+
+    task_fields = dict(fields)
+    if output_name == 'camera_export':
+        # more than one camera, so the publish path is unique to the item name
+        task_fields['name'] = item['name']
+        name = item['name'].upper()
+    elif output_name == 'model_geo_export':
+        # only name the exact object, not its parents
+        task_fields['name'] = item['name'].split('|')[-1]
+        name = task_fields['name']
+    else:
+        name = PUBLISH_NAMES.get(output_name)
+
+    path = publish_template.apply_fields(task_fields)
+    return output_name, path, name or os.path.basename(path)
+
+
+def _plan_folders(paths):
+    """
+    Return the folders of paths plus every folder between them and their
+    common root
+    """
+    folders = set(os.path.dirname(path) for path in paths)
+    if not folders:
+        return folders
+
+    parts = os.path.commonprefix([f.split(os.sep) for f in folders])
+    root = os.sep.join(parts) or os.sep
+    for folder in list(folders):
+        while folder != root and len(folder) > len(root):
+            folders.add(folder)
+            folder = os.path.dirname(folder)
+    folders.add(root)
+    return folders
+
+
+def _sorted_folders(folders):
+    return sorted(folders, key=lambda d: (d.count(os.sep), d))
+
+
+def _list(folder, listings):
+    """
+    List folder, or return None if it's missing.  Uses the listing of the
+    parent folder when there is one.
+    """
+    parent = os.path.dirname(folder)
+    if parent in listings:
+        parent_listing = listings[parent]
+        if parent_listing is None or os.path.basename(folder) not in parent_listing:
+            return None
+    try:
+        return frozenset(os.listdir(folder))
+    except OSError:
+        return None
@@ -0,0 +1,310 @@
+"""
+Copyright (c) 2013 Shotgun Software, Inc
+----------------------------------------------------
+
+Batched registration of secondary publishes.
+
+tank.util.register_publish costs several server round trips per publish (tank
+type lookup, create, dependency lookup, dependency create, thumbnail). A geo
+heavy matchmove publishes hundreds of items, so instead the publish hook queues
+a PublishRecord per item and BatchRegistrar.commit() sends them to Shotgun with
+a handful of lookups plus chunked sg.batch() calls.  Other creates that go
+with the publish, like the shot note, can ride along in the same batch.
+"""
+import os
+import threading
+
+from . import thumbnails
+from . import tracing
+
+# maximum number of create requests sent in a single sg.batch() call
+DEFAULT_CHUNK_SIZE = 50
+
+
+class PublishRecord(object):
+    """
+    A publish waiting to be registered.  owner is an opaque token (the publish
+    task) used by the caller to map errors back to the right task.
+    """
+    def __init__(self, owner, path, name, version_number, tank_type, comment,
+                 thumbnail_path=None, dependency_paths=None, checksum=None):
+        self.owner = owner
+        self.path = path
+        self.name = name
+        self.version_number = version_number
+        self.tank_type = tank_type
+        self.comment = comment
+        self.thumbnail_path = thumbnail_path
+        self.dependency_paths = dependency_paths or []
+        self.checksum = checksum
+
+        # filled in by BatchRegistrar.commit()
+        self.entity = None
+        self.errors = []
+
+
+class RequestRecord(object):
+    """
+    Any other create request to send along with the publishes.
+    """
+    def __init__(self, owner, entity_type, data, name):
+        self.owner = owner
+        self.entity_type = entity_type
+        self.data = data
+        self.name = name
+        self.path = None
+
+        # filled in by BatchRegistrar.commit()
+        self.entity = None
+        self.errors = []
+
+
+class BatchRegistrar(object):
+    """
+    Collects publish records and registers them all in one go.
+
+    Records may be queued on one thread while commit() runs on another, but
+    commit() itself should only ever be called from one thread at a time as
+    the Shotgun connection is not thread safe.
+    """
+    def __init__(self, tk, context, sg_task, created_by=None, chunk_size=DEFAULT_CHUNK_SIZE,
+                 checksum_field=None, thumbnail_cache=None):
+        self.tk = tk
+        self.context = context
+        self.sg_task = sg_task
+        self.created_by = created_by
+        self.chunk_size = max(1, chunk_size)
+        self.checksum_field = checksum_field
+        self.thumbnail_cache = thumbnail_cache
+        self.records = []
+        self.requests = []
+        self._lock = threading.Lock()
+
+        # lookups shared by every commit
+        self._tank_types = {}
+        self._storage = None
+        self._dependencies = {}
+
+    def add(self, owner, path, name, version_number, tank_type, comment,
+            thumbnail_path=None, dependency_paths=None, checksum=None):
+        """
+        Queue a publish for registration and return its record
+        """
+        record = PublishRecord(owner, path, name, version_number, tank_type, comment,
+                               thumbnail_path, dependency_paths, checksum)
+        with self._lock:
+            self.records.append(record)
+        return record
+
+    def add_request(self, owner, entity_type, data, name):
+        """
+        Queue another create request for the next batch and return its record
+        """
+        record = RequestRecord(owner, entity_type, data, name)
+        with self._lock:
+            self.requests.append(record)
+        return record
+
+    def pending(self):
+        """
+        Number of records and requests queued but not yet committed
+        """
+        with self._lock:
+            return len(self.records) + len(self.requests)
+
+    def discard(self):
+        """
+        Drop everything queued without sending it.  Returns the records.
+        """
+        with self._lock:
+            records, self.records = self.records, []
+            extra, self.requests = self.requests, []
+        return records + extra
+
+    def commit(self):
+        """
+        Register every queued record and send the queued requests.  Returns
+        the list of records, each with either its created entity or a list of
+        errors.
+        """
+        with self._lock:
+            records, self.records = self.records, []
+            extra, self.requests = self.requests, []
+        if not records and not extra:
+            return records + extra
+
+        with tracing.session_tracer().span('register', publishes=len(records), requests=len(extra)):
+            return self._commit(records, extra)
+
+    def _commit(self, records, extra):
+        sg = self.tk.shotgun
+        failed = []
+
+        try:
+            tank_types = self._resolve_tank_types(sg, set(r.tank_type for r in records))
+            if records and self._storage is None:
+                self._storage = sg.find_one('LocalStorage', [['code', 'is', 'primary']], ['id', 'code']) or {}
+            storage = self._storage
+        except Exception as e:
+            for record in records:
+                record.errors.append('Unable to register publish %s: %s' % (record.name, e))
+            records, failed = [], records
+
+        requests = []
+        for record in records:
+            requests.append({
+                "request_type": "create",
+                "entity_type": "TankPublishedFile",
+                "data": self._publish_data(record, tank_types[record.tank_type], storage),
+            })
+        for record in extra:
+            requests.append({
+                "request_type": "create",
+                "entity_type": record.entity_type,
+                "data": record.data,
+            })
+        self._send(sg, records + extra, requests, 'register', store_entity=True)
+
+        registered = [r for r in records if r.entity]
+        try:
+            self._create_dependencies(sg, registered)
+        except Exception as e:
+            for record in registered:
+                record.errors.append('Unable to link dependencies for %s: %s' % (record.name, e))
+        upload_thumbnails(sg, self.context.project, registered, self.thumbnail_cache)
+
+        return failed + records + extra
+
+    def _resolve_tank_types(self, sg, codes):
+        """
+        Find all of the tank types in a single query, creating any that are missing
+        """
+        missing = [code for code in codes if code not in self._tank_types]
+        if missing:
+            filters = [['code', 'in', missing], ['project', 'is', self.context.project]]
+            for tank_type in sg.find('TankType', filters, ['code']):
+                self._tank_types[tank_type['code']] = tank_type
+            for code in missing:
+                if code not in self._tank_types:
+                    self._tank_types[code] = sg.create('TankType', {'code': code, 'project': self.context.project})
+        return self._tank_types
+
+    def _publish_data(self, record, tank_type, storage):
+        """
+        Build the TankPublishedFile fields for a record, as register_publish would
+        """
+        data = {
+            "code": os.path.basename(record.path),
+            "description": record.comment,
+            "name": record.name,
+            "project": self.context.project,
+            "entity": self.context.entity,
+            "task": self.sg_task,
+            "version_number": record.version_number,
+            "path": {"local_path": record.path},
+            "tank_type": tank_type,
+        }
+        if self.created_by:
+            data["created_by"] = self.created_by
+        if self.checksum_field and record.checksum:
+            data[self.checksum_field] = record.checksum
+
+        path_cache = calc_path_cache(self.tk.project_path, record.path)
+        if path_cache and storage:
+            data["path_cache"] = path_cache
+            data["path_cache_storage"] = storage
+
+        return data
+
+    def _create_dependencies(self, sg, records):
+        """
+        Link every record to its dependency publishes.  All dependency paths
+        are resolved with a single find.
+        """
+        by_cache = self._dependencies
+        missing = set()
+        for record in records:
+            for path in record.dependency_paths:
+                path_cache = calc_path_cache(self.tk.project_path, path)
+                if path_cache and not by_cache.get(path_cache):
+                    missing.add(path_cache)
+
+        if missing:
+            filters = [['path_cache', 'in', list(missing)], ['project', 'is', self.context.project]]
+            for publish in sg.find('TankPublishedFile', filters, ['path_cache']):
+                by_cache[publish['path_cache']] = {'type': 'TankPublishedFile', 'id': publish['id']}
+
+        owners = []
+        requests = []
+        for record in records:
+            for path in record.dependency_paths:
+                dependency = by_cache.get(calc_path_cache(self.tk.project_path, path))
+                if not dependency:
+                    record.errors.append('Unable to find the publish for dependency %s' % path)
+                    continue
+                owners.append(record)
+                requests.append({
+                    "request_type": "create",
+                    "entity_type": "TankDependency",
+                    "data": {"tank_published_file": record.entity,
+                             "dependent_tank_published_file": dependency},
+                })
+        self._send(sg, owners, requests, 'link dependencies for')
+
+    def _send(self, sg, records, requests, action, store_entity=False):
+        """
+        Send requests in chunks.  records[i] owns requests[i]; with
+        store_entity the created entities are stored on their records.
+
+        sg.batch() is transactional, so when a chunk fails its requests are
+        re-sent one by one to find out which record the error belongs to.
+        """
+        for start in range(0, len(requests), self.chunk_size):
+            chunk_records = records[start:start + self.chunk_size]
+            chunk_requests = requests[start:start + self.chunk_size]
+            try:
+                created = sg.batch(chunk_requests)
+            except Exception:
+                created = []
+                for record, request in zip(chunk_records, chunk_requests):
+                    try:
+                        created.append(sg.create(request['entity_type'], request['data']))
+                    except Exception as e:
+                        record.errors.append('Unable to %s %s: %s' % (action, record.name, e))
+                        created.append(None)
+
+            for record, request, entity in zip(chunk_records, chunk_requests, created):
+                if entity and store_entity:
+                    record.entity = {'type': entity['type'], 'id': entity['id']}
+
+
+def calc_path_cache(project_path, path):
+    """
+    Return the path relative to the project storage root, prefixed with the
+    project folder name, or None if the path is outside the project.
+    """
+    norm_root = project_path.replace(os.sep, '/').rstrip('/')
+    norm_path = path.replace(os.sep, '/')
+    if not norm_path.lower().startswith(norm_root.lower() + '/'):
+        return None
+    return '%s%s' % (os.path.basename(norm_root), norm_path[len(norm_root):])
+
+
+def upload_thumbnails(sg, project, records, cache=None):
+    """
+    Upload each distinct thumbnail once and share it with every registered
+    record that uses it.  Errors are added to the records.
+    """
+    by_path = {}
+    for record in records:
+        if record.thumbnail_path:
+            by_path.setdefault(record.thumbnail_path, []).append(record.entity)
+
+    try:
+        errors = thumbnails.apply_thumbnails(sg, project, by_path, cache)
+    except Exception as e:
+        errors = dict((r.entity['id'], 'Unable to set thumbnail for %s: %s' % (r.name, e)) for r in records)
+
+    for record in records:
+        if record.entity['id'] in errors:
+            record.errors.append(errors[record.entity['id']])
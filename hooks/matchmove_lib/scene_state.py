@@ -0,0 +1,97 @@
+"""
+Copyright (c) 2013 Shotgun Software, Inc
+----------------------------------------------------
+
+Tracks whether the Maya scene has changed since it was last looked at.
+
+Maya only reports a single 'modified' flag, which stays set after the first
+edit, so this module installs a few API callbacks that bump a generation
+counter whenever nodes are added, removed, renamed, reparented or
+(dis)connected.  Anything derived from the scene can be cached against
+scene_key() and reused for as long as the key stays the same, with cached()
+and store() keeping it here, as Tank reloads the hook files.
+"""
+import copy
+
+_generation = 0
+_callback_ids = None
+
+# name to (scene key, value) of whatever the hooks derived from the scene
+_cache = {}
+
+
+def _bump(*args):
+    global _generation
+    _generation += 1
+
+
+def install_callbacks():
+    """
+    Register the scene change callbacks, once per session.  Returns False if
+    the Maya API is not available, in which case scene_key() is always unique.
+    """
+    global _callback_ids
+    if _callback_ids is not None:
+        return bool(_callback_ids)
+
+    try:
+        import maya.OpenMaya as om
+    except ImportError:
+        _callback_ids = []
+        return False
+
+    _callback_ids = [
+        om.MDGMessage.addNodeAddedCallback(_bump),
+        om.MDGMessage.addNodeRemovedCallback(_bump),
+        om.MDGMessage.addConnectionCallback(_bump),
+        om.MNodeMessage.addNameChangedCallback(om.MObject(), _bump),
+        om.MDagMessage.addAllDagChangesCallback(_bump),
+        om.MSceneMessage.addCallback(om.MSceneMessage.kAfterOpen, _bump),
+        om.MSceneMessage.addCallback(om.MSceneMessage.kAfterNew, _bump),
+    ]
+    return True
+
+
+def remove_callbacks():
+    """
+    Unregister the scene change callbacks
+    """
+    global _callback_ids
+    if _callback_ids:
+        import maya.OpenMaya as om
+        for callback_id in _callback_ids:
+            om.MMessage.removeCallback(callback_id)
+    _callback_ids = None
+
+
+def scene_key():
+    """
+    Return a value that changes whenever the scene does, or None if changes
+    can't be tracked.
+    """
+    if not install_callbacks():
+        return None
+
+    import maya.cmds as cmds
+    return (cmds.file(query=True, sceneName=True), _generation)
+
+
+def cached(name, key):
+    """
+    Return a copy of the value stored under name for the scene key, or None
+    if the scene has changed since
+    """
+    entry = _cache.get(name)
+    if key is None or entry is None or entry[0] != key:
+        return None
+    return copy.deepcopy(entry[1])
+
+
+def store(name, key, value):
+    """
+    Keep a copy of value under name for as long as the scene key holds
+    """
+    if key is None:
+        _cache.pop(name, None)
+    else:
+        _cache[name] = (key, copy.deepcopy(value))
@@ -0,0 +1,158 @@
+"""
+Copyright (c) 2013 Shotgun Software, Inc
+----------------------------------------------------
+
+Stage publish outputs on local scratch and commit them to publish storage in
+one step.
+
+Exports write into a scratch folder that mirrors the publish folder.  commit()
+copies the finished tree next to the publish folder on the publish storage,
+then makes it visible with a single rename.  If the publish folder already
+exists (the primary publish lives in the same version folder) each staged
+entry is renamed into it instead, which is still one rename per sub folder.
+Those renames are checked for clashes before the first one and put back if
+one fails, so a failed commit leaves the publish folder as it found it.
+Aborting a publish before commit only ever needs a local cleanup.
+"""
+import os
+import shutil
+import tempfile
+
+from . import copy_engine
+from . import pipeline
+
+
+class StagingError(Exception):
+    pass
+
+
+class StagingArea(object):
+    """
+    A local mirror of publish_root.
+    """
+    def __init__(self, publish_root, scratch_root=None, max_workers=4):
+        self.publish_root = os.path.normpath(publish_root)
+        self.max_workers = max_workers
+        scratch_root = scratch_root or os.environ.get('MM_PUBLISH_SCRATCH') or tempfile.gettempdir()
+        if not os.path.isdir(scratch_root):
+            os.makedirs(scratch_root)
+        self.scratch = tempfile.mkdtemp(prefix='mm_publish_', dir=scratch_root)
+        self.committed = False
+
+    def stage_path(self, publish_path):
+        """
+        Return the local path to write in place of publish_path
+        """
+        rel_path = os.path.relpath(os.path.normpath(publish_path), self.publish_root)
+        if rel_path == os.curdir or rel_path.startswith(os.pardir):
+            raise StagingError("%s is not inside %s" % (publish_path, self.publish_root))
+        return os.path.join(self.scratch, rel_path)
+
+    def make_directories(self, publish_folders):
+        """
+        Create the local folders mirroring publish_folders
+        """
+        for folder in publish_folders:
+            if os.path.normpath(folder) == self.publish_root:
+                continue
+            local = self.stage_path(folder)
+            if not os.path.isdir(local):
+                os.makedirs(local)
+
+    def commit(self):
+        """
+        Copy the staged tree to publish storage and make it visible.  Returns
+        the CopyResults of every file.  Raises StagingError on failure, in
+        which case nothing has been made visible.
+        """
+        parent = os.path.dirname(self.publish_root)
+        incoming = os.path.join(parent, '.%s.staging-%d' % (os.path.basename(self.publish_root), os.getpid()))
+
+        try:
+            if not os.path.isdir(parent):
+                os.makedirs(parent)
+            copies = self._copy_tree(incoming)
+        except (OSError, IOError, copy_engine.CopyError) as e:
+            shutil.rmtree(incoming, ignore_errors=True)
+            raise StagingError("Unable to copy the staged publish to %s: %s" % (parent, e))
+
+        try:
+            if not os.path.exists(self.publish_root):
+                os.rename(incoming, self.publish_root)
+            else:
+                _merge(incoming, self.publish_root)
+        except OSError as e:
+            raise StagingError("Unable to move the staged publish into %s: %s" % (self.publish_root, e))
+        finally:
+            shutil.rmtree(incoming, ignore_errors=True)
+
+        self.committed = True
+        self.discard()
+        return copies
+
+    def discard(self):
+        """
+        Remove the local scratch folder
+        """
+        shutil.rmtree(self.scratch, ignore_errors=True)
+
+    def _copy_tree(self, dst_root):
+        """
+        Recreate the staged folders under dst_root and copy the files across
+        with a pool of workers.
+        """
+        pool = pipeline.WorkerPool(self.max_workers, name='staging-commit')
+        try:
+            for folder, dirs, files in os.walk(self.scratch):
+                rel_folder = os.path.relpath(folder, self.scratch)
+                target = os.path.normpath(os.path.join(dst_root, rel_folder))
+                os.mkdir(target)
+                for name in files:
+                    pool.submit(name, copy_engine.copy_file, os.path.join(folder, name), os.path.join(target, name))
+
+            copies = []
+            for job in pool.join():
+                if job.errors:
+                    raise copy_engine.CopyError('; '.join(job.errors))
+                copies.append(job.result)
+            return copies
+        finally:
+            pool.shutdown()
+
+
+def _merge(src, dst):
+    """
+    Rename the entries of src into dst, descending into folders that exist on
+    both sides.  Files never overwrite existing ones.  Raises OSError with dst
+    as it was if any entry can't be moved.
+    """
+    moves = []
+    _plan_merge(src, dst, moves)
+
+    moved = []
+    try:
+        for src_path, dst_path in moves:
+            os.rename(src_path, dst_path)
+            moved.append((src_path, dst_path))
+    except OSError:
+        for src_path, dst_path in reversed(moved):
+            try:
+                os.rename(dst_path, src_path)
+            except OSError:
+                pass
+        raise
+
+
+def _plan_merge(src, dst, moves):
+    """
+    Add the (src, dst) renames merging src into dst to moves
+    """
+    for name in sorted(os.listdir(src)):
+        src_path = os.path.join(src, name)
+        dst_path = os.path.join(dst, name)
+        if not os.path.exists(dst_path):
+            moves.append((src_path, dst_path))
+        elif os.path.isdir(src_path) and os.path.isdir(dst_path):
+            _plan_merge(src_path, dst_path, moves)
+        else:
+            raise OSError("%s already exists" % dst_path)
@@ -0,0 +1,118 @@
+"""
+Copyright (c) 2013 Shotgun Software, Inc
+----------------------------------------------------
+
+Upload each distinct publish thumbnail once and share it from then on.
+
+The matchmove publishes all use a handful of static icons, so the same image
+used to be uploaded for every camera, cones group, geo piece and lens.
+ThumbnailCache is a small persistent map of (project, image hash) to the
+entity that holds the uploaded image.  Later publishes get the image with a
+single sg.share_thumbnail() call per distinct image, and only fall back to
+uploading when the cached entity has gone away.
+"""
+import json
+import os
+
+from . import dedupe
+
+DEFAULT_PATH = os.path.join('~', '.matchmove', 'thumbnail_cache.json')
+
+
+class ThumbnailCache(object):
+    """
+    Persistent map of project and image hash to the entity holding the image.
+    """
+    def __init__(self, path=None):
+        self.path = os.path.expanduser(path or DEFAULT_PATH)
+        self._entries = {}
+        self._dirty = False
+        try:
+            with open(self.path) as fh:
+                self._entries = json.load(fh)
+        except (IOError, OSError, ValueError):
+            pass
+
+    def _key(self, project, digest):
+        return '%s:%s' % (project['id'], digest)
+
+    def source_for(self, project, digest):
+        entry = self._entries.get(self._key(project, digest))
+        if entry:
+            return {'type': entry['type'], 'id': entry['id']}
+        return None
+
+    def remember(self, project, digest, entity):
+        self._entries[self._key(project, digest)] = {'type': entity['type'], 'id': entity['id']}
+        self._dirty = True
+
+    def forget(self, project, digest):
+        if self._entries.pop(self._key(project, digest), None):
+            self._dirty = True
+
+    def save(self):
+        """
+        Write the cache if it changed.  Failing to save only costs an upload
+        next time, so errors are ignored.
+        """
+        if not self._dirty:
+            return
+        try:
+            folder = os.path.dirname(self.path)
+            if not os.path.isdir(folder):
+                os.makedirs(folder)
+            tmp_path = '%s.%d.tmp' % (self.path, os.getpid())
+            with open(tmp_path, 'w') as fh:
+                json.dump(self._entries, fh, indent=1, sort_keys=True)
+            if os.path.exists(self.path) and os.name == 'nt':
+                os.remove(self.path)
+            os.rename(tmp_path, self.path)
+            self._dirty = False
+        except (IOError, OSError):
+            pass
+
+
+def apply_thumbnails(sg, project, entities_by_path, cache=None):
+    """
+    Give every entity the thumbnail at its path.  entities_by_path maps an
+    image path to the list of entities that should show it.  Returns a dict
+    of entity id to error message for the ones that failed.
+    """
+    errors = {}
+    for path, entities in entities_by_path.items():
+        digest = dedupe.file_digest(path)
+
+        source = cache.source_for(project, digest) if cache else None
+        if source:
+            try:
+                sg.share_thumbnail(entities, source_entity=source)
+                continue
+            except Exception:
+                # the cached entity was deleted or lost its image, upload again
+                cache.forget(project, digest)
+
+        first, others = entities[0], entities[1:]
+        try:
+            sg.upload_thumbnail(first['type'], first['id'], path)
+        except Exception as e:
+            for entity in entities:
+                errors[entity['id']] = 'Unable to upload thumbnail %s: %s' % (path, e)
+            continue
+        if cache:
+            cache.remember(project, digest, first)
+
+        if not others:
+            continue
+        try:
+            sg.share_thumbnail(others, source_entity=first)
+        except Exception:
+            # older servers can't share thumbnails, upload them one by one
+            for entity in others:
+                try:
+                    sg.upload_thumbnail(entity['type'], entity['id'], path)
+                except Exception as e:
+                    errors[entity['id']] = 'Unable to upload thumbnail %s: %s' % (path, e)
+
+    if cache:
+        cache.save()
+    return errors
@@ -0,0 +1,55 @@
+"""
+Copyright (c) 2013 Shotgun Software, Inc
+----------------------------------------------------
+
+Wall clock timing of the phases of a hook.
+"""
+import time
+
+from contextlib import contextmanager
+
+
+class PhaseTimer(object):
+    """
+    Records how long each named phase takes, in the order they ran, with any
+    counts the phase reported.  Phases are also recorded as spans of tracer,
+    if one is given.
+    """
+    def __init__(self, tracer=None):
+        self.phases = []
+        self.tracer = tracer
+
+    @contextmanager
+    def phase(self, name):
+        """
+        Time the code it wraps, which is given a dict to fill with counts to
+        report next to the time
+        """
+        counts = {}
+        start = time.time()
+        try:
+            if self.tracer is not None:
+                with self.tracer.span(name) as span:
+                    yield counts
+                    for key, value in counts.items():
+                        span.set(key, value)
+            else:
+                yield counts
+        finally:
+            self.phases.append((name, time.time() - start, counts))
+
+    def total(self):
+        return sum(duration for name, duration, counts in self.phases)
+
+    def report(self, prefix=''):
+        """
+        Return a multi line report of every phase and the total
+        """
+        lines = []
+        for name, duration, counts in self.phases:
+            line = '%s%-20s %8.1f ms' % (prefix, name, duration * 1000.0)
+            if counts:
+                line += '  ' + ' '.join('%s=%s' % (key, counts[key]) for key in sorted(counts))
+            lines.append(line)
+        lines.append('%s%-20s %8.1f ms' % (prefix, 'total', self.total() * 1000.0))
+        return '\n'.join(lines)
@@ -0,0 +1,234 @@
+"""
+Copyright (c) 2013 Shotgun Software, Inc
+----------------------------------------------------
+
+Nested timing spans for the publish and load hooks, written out as Chrome
+trace JSON (open it in chrome://tracing or ui.perfetto.dev).
+
+Tracing is off unless $MM_PUBLISH_TRACE is set or a hook turns it on.  While
+it is off span() hands back one shared span that does nothing, so the
+instrumented code only pays for a method call.
+
+The tracer is shared by the scan, pre-publish and publish hooks of a session,
+so a publish trace also covers the scan and validation that led up to it.
+"""
+import json
+import logging
+import os
+import pprint
+import threading
+import time
+
+ENV_VAR = 'MM_PUBLISH_TRACE'
+
+# where traces that don't belong to a publish (loads) are written
+LOCAL_FOLDER = os.path.join('~', '.matchmove', 'traces')
+
+# Shotgun methods that are counted on the open spans of the calling thread
+SHOTGUN_METHODS = ('find', 'find_one', 'create', 'update', 'delete', 'batch',
+                   'upload', 'upload_thumbnail', 'share_thumbnail')
+
+
+class pretty(object):
+    """
+    Wraps a value so that it is only pretty printed when a log message that
+    uses it is actually emitted:
+
+        log.debug("register args:\\n%s", tracing.pretty(args))
+    """
+    __slots__ = ('value',)
+
+    def __init__(self, value):
+        self.value = value
+
+    def __str__(self):
+        return pprint.pformat(self.value)
+
+
+def get_logger(name):
+    """
+    Return the logger for a hook, under the 'matchmove' logger
+    """
+    return logging.getLogger('matchmove.%s' % name)
+
+
+class Span(object):
+    """
+    A named, timed region.  Values stored with set() and add() end up in the
+    args of the trace event.
+    """
+    __slots__ = ('tracer', 'name', 'args', 'start')
+
+    def __init__(self, tracer, name, args):
+        self.tracer = tracer
+        self.name = name
+        self.args = args
+        self.start = None
+
+    def set(self, key, value):
+        self.args[key] = value
+
+    def add(self, key, amount=1):
+        self.args[key] = self.args.get(key, 0) + amount
+
+    def __enter__(self):
+        self.tracer._push(self)
+        self.start = time.time()
+        return self
+
+    def __exit__(self, exc_type, exc_value, tb):
+        end = time.time()
+        if exc_type is not None:
+            self.args['error'] = '%s: %s' % (exc_type.__name__, exc_value)
+        self.tracer._pop(self, end)
+        return False
+
+
+class _NullSpan(object):
+    __slots__ = ()
+
+    def set(self, key, value):
+        pass
+
+    def add(self, key, amount=1):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, tb):
+        return False
+
+NULL_SPAN = _NullSpan()
+
+
+class Tracer(object):
+    """
+    Collects finished spans from any thread as Chrome 'complete' events.
+    """
+    def __init__(self, enabled=False):
+        self.enabled = enabled
+        self.events = []
+        self._threads = {}
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self._origin = time.time()
+        self._instrumented = []
+
+    def span(self, name, **args):
+        """
+        Return a context manager timing the code it wraps
+        """
+        if not self.enabled:
+            return NULL_SPAN
+        return Span(self, name, args)
+
+    def _stack(self):
+        stack = getattr(self._local, 'stack', None)
+        if stack is None:
+            stack = self._local.stack = []
+        return stack
+
+    def _push(self, span):
+        self._stack().append(span)
+
+    def _pop(self, span, end):
+        stack = self._stack()
+        if span in stack:
+            stack.remove(span)
+
+        thread = threading.current_thread()
+        event = {'name': span.name,
+                 'ph': 'X',
+                 'ts': int((span.start - self._origin) * 1e6),
+                 'dur': int((end - span.start) * 1e6),
+                 'pid': os.getpid(),
+                 'tid': thread.ident,
+                 'args': span.args}
+        with self._lock:
+            self.events.append(event)
+            self._threads[thread.ident] = thread.name
+
+    def instrument(self, sg):
+        """
+        Count the calls made through a Shotgun connection on every open span
+        of the calling thread.  Does nothing while tracing is off.  Returns
+        True if the connection wasn't counted before.
+        """
+        if not self.enabled or sg is None or sg in self._instrumented:
+            return False
+        for method in SHOTGUN_METHODS:
+            fn = getattr(sg, method, None)
+            if fn is not None:
+                setattr(sg, method, self._counted(method, fn))
+        self._instrumented.append(sg)
+        return True
+
+    def _counted(self, method, fn):
+        def counted(*args, **kwargs):
+            for span in self._stack():
+                span.add('sg_calls')
+                span.add('sg.%s' % method)
+            return fn(*args, **kwargs)
+        return counted
+
+    def restore(self, connections=None):
+        """
+        Remove the counting wrappers instrument() added to connections, or to
+        every connection
+        """
+        if connections is None:
+            connections = list(self._instrumented)
+        for sg in connections:
+            if sg in self._instrumented:
+                for method in SHOTGUN_METHODS:
+                    sg.__dict__.pop(method, None)
+                self._instrumented.remove(sg)
+
+    def write(self, path):
+        """
+        Write the collected events as Chrome trace JSON and start over.
+        Returns the path, or None if there was nothing to write.
+        """
+        with self._lock:
+            events, self.events = self.events, []
+            threads = dict(self._threads)
+        if not events:
+            return None
+
+        pid = os.getpid()
+        metadata = [{'name': 'thread_name', 'ph': 'M', 'pid': pid, 'tid': tid, 'args': {'name': name}}
+                    for tid, name in threads.items()]
+
+        folder = os.path.dirname(path)
+        if folder and not os.path.isdir(folder):
+            os.makedirs(folder)
+        tmp_path = '%s.%d.tmp' % (path, pid)
+        with open(tmp_path, 'w') as fh:
+            json.dump({'traceEvents': metadata + sorted(events, key=lambda e: e['ts']),
+                       'displayTimeUnit': 'ms'}, fh)
+        if os.path.exists(path) and os.name == 'nt':
+            os.remove(path)
+        os.rename(tmp_path, path)
+        return path
+
+
+def local_trace_path(prefix):
+    """
+    Return a new timestamped trace path in the local trace folder
+    """
+    return os.path.join(os.path.expanduser(LOCAL_FOLDER),
+                        '%s_%s_%d.json' % (prefix, time.strftime('%Y%m%d_%H%M%S'), os.getpid()))
+
+
+_session_tracer = None
+
+
+def session_tracer():
+    """
+    Return the tracer shared by every hook in this session
+    """
+    global _session_tracer
+    if _session_tracer is None:
+        _session_tracer = Tracer(enabled=bool(os.environ.get(ENV_VAR)))
+    return _session_tracer
@@ -0,0 +1,181 @@
+"""
+Copyright (c) 2013 Shotgun Software, Inc
+----------------------------------------------------
+
+Rule based validation of the publish tasks in a single pass.
+
+Validator.gather() asks Maya everything the rules need for every task at
+once: the loaded plugins (loading each missing one once), the long names of
+the cameras, which cones and geo are visible and the rotation curves of the
+cameras.  The rules then only read those facts, so checking 200 geo pieces
+costs the same handful of queries as checking one, and the artist's
+selection is never touched.
+
+A rule is a function of (item, facts, output name) returning a list of
+errors, registered for the outputs it applies to with the @rule decorator.
+"""
+from collections import namedtuple
+
+# every output the publish hook knows how to publish
+OUTPUTS = ('camera_export', 'cone_geo_export', 'model_geo_export',
+           'lens_distort_export', 'shotgun_note_create')
+
+# output -> (plugin, plugin label, what it exports)
+PLUGINS = {
+    'camera_export': ('fbxmaya', 'FBX', 'cameras'),
+    'cone_geo_export': ('objExport', 'objExport', 'cones'),
+    'model_geo_export': ('objExport', 'objExport', 'geo'),
+}
+
+CAMERA_GROUP = '|Scene|cameras'
+CAMERA_NAMES = ('LEFT', 'RIGHT', 'SHOT')
+ROTATE_ATTRS = ('rotateX', 'rotateY', 'rotateZ')
+
+Rule = namedtuple('Rule', 'name outputs check')
+
+RULES = []
+
+
+def rule(*outputs):
+    """
+    Register the decorated function as a rule for outputs
+    """
+    def register(check):
+        RULES.append(Rule(check.__name__, outputs, check))
+        return check
+    return register
+
+
+class SceneFacts(object):
+    """
+    What the rules know about the scene, gathered by Validator.gather()
+    """
+    def __init__(self):
+        # plugin -> label of the plugins that couldn't be loaded
+        self.plugin_errors = {}
+        # camera item name -> long name, None when it no longer exists
+        self.camera_paths = {}
+        # long names of the visible cones and geo
+        self.visible = set()
+        # camera item name -> its rotation anim curves
+        self.rotate_curves = {}
+        self.camera_names = CAMERA_NAMES
+
+
+class Validator(object):
+    """
+    Gathers the scene facts for a list of tasks and runs the rules on them
+    """
+    def __init__(self, rules=None, camera_names=CAMERA_NAMES):
+        self.rules = list(RULES if rules is None else rules)
+        self.camera_names = tuple(camera_names)
+
+    def gather(self, tasks):
+        import maya.cmds as cmds
+
+        facts = SceneFacts()
+        facts.camera_names = self.camera_names
+        by_output = {}
+        for task in tasks:
+            by_output.setdefault(task['output']['name'], []).append(task['item']['name'])
+
+        # load each plugin the outputs need once, skipping the loaded ones
+        loaded = set(cmds.pluginInfo(query=True, listPlugins=True) or [])
+        for output_name in sorted(by_output):
+            if output_name not in PLUGINS:
+                continue
+            plugin, label, exports = PLUGINS[output_name]
+            if plugin in loaded or plugin in facts.plugin_errors:
+                continue
+            try:
+                cmds.loadPlugin(plugin, quiet=True)
+                loaded.add(plugin)
+            except RuntimeError:
+                facts.plugin_errors[plugin] = label
+
+        cameras = by_output.get('camera_export', [])
+        if cameras:
+            long_names = cmds.ls(cameras, long=True) or []
+            for camera in cameras:
+                matches = [path for path in long_names if path == camera or path.endswith('|' + camera)]
+                facts.camera_paths[camera] = matches[0] if len(matches) == 1 else None
+
+            # the rotation curves of every camera that exists in one query,
+            # by long name since listConnections fails on a missing node.  The
+            # plugs come back with full DAG paths, so cameras sharing a short
+            # name keep their own curves.
+            found = dict((path, camera) for camera, path in facts.camera_paths.items() if path is not None)
+            plugs = ['%s.%s' % (path, attr) for path in sorted(found) for attr in ROTATE_ATTRS]
+            connections = []
+            if plugs:
+                connections = cmds.listConnections(plugs, source=True, destination=False, connections=True,
+                                                   skipConversionNodes=True, fullNodeName=True) or []
+            for plug, curve in zip(connections[0::2], connections[1::2]):
+                camera = found.get(plug.rsplit('.', 1)[0])
+                if camera is not None:
+                    facts.rotate_curves.setdefault(camera, []).append(curve)
+
+        geometry = by_output.get('cone_geo_export', []) + by_output.get('model_geo_export', [])
+        if geometry:
+            facts.visible = set(cmds.ls(geometry, visible=True, long=True) or [])
+
+        return facts
+
+    def check(self, task, facts):
+        """
+        Return the errors of every rule for a task
+        """
+        errors = []
+        output_name = task['output']['name']
+        for each in self.rules:
+            if output_name in each.outputs:
+                errors.extend(each.check(task['item'], facts, output_name))
+        return errors
+
+
+def euler_filter(facts):
+    """
+    Run the Euler filter over the rotation curves of every validated camera
+    in one call.  Returns the number of curves filtered.
+    """
+    import maya.cmds as cmds
+
+    curves = [curve for camera in sorted(facts.rotate_curves) for curve in facts.rotate_curves[camera]]
+    if not curves:
+        return 0
+    return cmds.filterCurve(*curves) or 0
+
+
+@rule('camera_export', 'cone_geo_export', 'model_geo_export')
+def plugin_loaded(item, facts, output_name):
+    """
+    The plugin that exports the output must load
+    """
+    plugin, label, exports = PLUGINS[output_name]
+    if plugin in facts.plugin_errors:
+        return ['Unable to load %s plugin. We will be unable to export %s for publish!' % (label, exports)]
+    return []
+
+
+@rule('camera_export')
+def camera_name(item, facts, output_name):
+    """
+    Cameras must be named |Scene|cameras|(LEFT/RIGHT/SHOT)
+    """
+    path = facts.camera_paths.get(item['name'])
+    if path is None:
+        return ['Camera %s no longer exists or its name is not unique' % item['name']]
+    folder, name = path.rsplit('|', 1)
+    if folder != CAMERA_GROUP or name not in facts.camera_names:
+        return ['Camera %s must be named %s|%s' % (path, CAMERA_GROUP, '/'.join(facts.camera_names))]
+    return []
+
+
+@rule('model_geo_export')
+def geometry_visible(item, facts, output_name):
+    """
+    Hidden geo would export empty
+    """
+    if item['name'] not in facts.visible:
+        return ['Geometry is hidden. Unhide or deselect to continue.']
+    return []
@@ -4,15 +4,39 @@ Copyright (c) 2013 Shotgun Software, Inc
 
 """
 import os
+import sys
 import maya.cmds as cmds
 
 import tank
 from tank import Hook
 
+# shared matchmove helpers live next to the hook folders
+_hooks_path = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+if _hooks_path not in sys.path:
+    sys.path.append(_hooks_path)
+
+from matchmove_lib import journal
+from matchmove_lib import publish_plan
+from matchmove_lib import tracing
+from matchmove_lib import validation
+
+log = tracing.get_logger('pre_publish')
+
 class PrePublishHook(Hook):
     """
     Single hook that implements pre-publish functionality
     """
+
+    # the names a published camera may have under |Scene|cameras
+    camera_names = validation.CAMERA_NAMES
+
+    # run the Euler filter on the rotation curves of the published cameras
+    euler_filter_cameras = True
+
+    # let outputs of an unfinished publish of this scene through, as the
+    # publish hook resumes it.  Should match its resume_publishes option.
+    resume_publishes = True
+
     def execute(self, tasks, work_template, progress_cb, **kwargs):
         """
         Main hook entry point
@@ -66,9 +90,24 @@ class PrePublishHook(Hook):
                         }
         """
 
-        print "<pre-publish> tasks =>", tasks
+        log.debug("tasks =>\n%s", tracing.pretty(tasks))
         print "<pre-publish> work_template =>", work_template
 
+        with tracing.session_tracer().span('validate', tasks=len(tasks)) as span:
+            results = self._validate_tasks(tasks, work_template, progress_cb)
+            span.set('errors', sum(len(r['errors']) for r in results))
+
+        log.debug("results =>\n%s", tracing.pretty(results))
+
+        print "<pre-publish> complete"
+
+        return results
+
+    def _validate_tasks(self, tasks, work_template, progress_cb):
+        """
+        Validate every task, returning the results for the ones with errors
+        """
+        tracer = tracing.session_tracer()
         results = []
 
         # will need the current scene file:
@@ -77,6 +116,28 @@ class PrePublishHook(Hook):
             scene_file = os.path.abspath(scene_file)
             print "<pre-publish> scene_file =>", scene_file
 
+        # resolve the publish paths now so that collisions are reported before
+        # anything gets exported
+        existing = set()
+        if scene_file:
+            plan = publish_plan.compile_plan(tasks, work_template, scene_file)
+            collisions = plan.collisions()
+            if collisions and self.resume_publishes and plan.version_folder and \
+                    journal.PublishJournal.load(plan.version_folder).resumable(scene_file):
+                print "<pre-publish> %d outputs are left from an unfinished publish of this scene, " \
+                      "which will be resumed" % len(collisions)
+                collisions = []
+            existing = set(id(entry.task) for entry in collisions)
+
+        # everything the rules need is queried once for all of the tasks
+        validator = validation.Validator(camera_names=self.camera_names)
+        with tracer.span('gather'):
+            facts = validator.gather(tasks)
+
+        if self.euler_filter_cameras:
+            with tracer.span('euler filter'):
+                print "<pre-publish> euler filtered %d camera rotation curves" % validation.euler_filter(facts)
+
         # validate tasks:
         for task in tasks:
             item = task["item"]
@@ -87,86 +148,22 @@ class PrePublishHook(Hook):
             print "<pre-publish> Validiating %s" % task['item']
             progress_cb(0, "Validating", task)
 
-            print output["name"]
-
-            # depending on output type, do some specific validation:
-            if output["name"] == "camera_export":
-                errors.extend(self._validate_camera(scene_file, work_template, item, output, progress_cb))
-
-            elif output["name"] == "cone_geo_export":
-                errors.extend(self._validate_cones(scene_file, work_template, item, output, progress_cb))
-
-            elif output["name"] == "model_geo_export":
-                errors.extend(self._validate_geometry(scene_file, work_template, item, output, progress_cb))
-
-            elif output["name"] == "shotgun_note_create":
-                pass  # we don't get given the comments...
-
-            elif output["name"] == "lens_distort_export":
-                pass  # pfft. should check if the node has been published before probably.
+            if id(task) in existing:
+                errors.append("The secondary output '%s' has already been published!" % item['name'])
 
+            if output["name"] in validation.OUTPUTS:
+                errors.extend(validator.check(task, facts))
             else:
                 # don't know how to publish other output types!
-                print "<pre-publish> Don't know how to publish this item! %s as %s" % (item['name'], output['name'])
                 errors.append("Don't know how to publish this item! %s as %s" % (item['name'], output['name']))
 
             # if there is anything to report then add to result
             if len(errors) > 0:
+                for error in errors:
+                    print "<pre-publish> %s" % error
                 # add result:
                 results.append({"task":task, "errors":errors})
 
             progress_cb(100)
 
-        import pprint
-        pp = pprint.PrettyPrinter(indent=4)
-        pp.pprint(results)
-
-        print "<pre-publish> complete"
-
         return results
-
-    def _validate_camera(self, path, work_template, item, output, progress_cb):
-        """
-        Validation rules:
-            Camera must be named correctly. |Scene|cameras|(LEFT/RIGHT/SHOT)
-            Run euler filter on camera connections cmds.filterCurve( 'LEFT_rotateX', 'LEFT_rotateY', 'LEFT_rotateZ' )
-        Return:
-            Name error
-            Number of Curves filtered
-        """
-        errors = []
-
-        try:
-            cmds.loadPlugin('fbxmaya')
-        except RuntimeError:
-            print '<pre-publish> Unable to load FBX plugin. We will be unable to export cameras for publish!'
-            errors.append('Unable to load FBX plugin. We will be unable to export cameras for publish!')
-
-        return errors
-
-    def _validate_cones(self, path, work_template, item, output, progress_cb):
-        errors = []
-        try:
-            cmds.loadPlugin('objExport')
-        except RuntimeError:
-            print '<pre-publish> Unable to load objExport plugin. We will be unable to export cones for publish!'
-            errors.append('Unable to load objExport plugin. We will be unable to export cones for publish!')
-
-        return errors
-
-    def _validate_geometry(self, path, work_template, item, output, progress_cb):
-        errors = []
-        try:
-            cmds.loadPlugin('objExport')
-        except RuntimeError:
-            print '<pre-publish> Unable to load objExport plugin. We will be unable to export geo for publish!'
-            errors.append('Unable to load objExport plugin. We will be unable to export geo for publish!')
-
-        # clear the current selection and, if the geo is not hidden add it to the new selection.
-        # list the current selection. if the object was hidden the selection count will be 0
-        cmds.select(item['name'], replace=True, visible=True)
-        if not cmds.ls(selection=True):
-            print '<pre-publish> Geometry is hidden. Unhide or deselect to continue.'
-            errors.append('Geometry is hidden. Unhide or deselect to continue.')
-
-        return errors
@@ -4,7 +4,8 @@ Copyright (c) 2013 Shotgun Software, Inc
 
 """
 import os
-import shutil
+import sys
+import time
 import maya.cmds as cmds
 import maya.mel as mel
 
@@ -12,12 +13,99 @@ import tank
 from tank import Hook
 #from tank import TankError
 
-import pprint
+# shared matchmove helpers live next to the hook folders
+_hooks_path = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+if _hooks_path not in sys.path:
+    sys.path.append(_hooks_path)
+
+from matchmove_lib import camera_cache
+from matchmove_lib import cone_cloud
+from matchmove_lib import context_cache
+from matchmove_lib import copy_engine
+from matchmove_lib import dedupe
+from matchmove_lib import fingerprints
+from matchmove_lib import journal
+from matchmove_lib import obj_writer
+from matchmove_lib import pipeline
+from matchmove_lib import proxy_mesh
+from matchmove_lib import publish_plan
+from matchmove_lib import registration
+from matchmove_lib import staging
+from matchmove_lib import thumbnails
+from matchmove_lib import tracing
+
+log = tracing.get_logger('publish')
 
 class PublishHook(Hook):
     """
     Single hook that implements publish functionality for secondary tasks
     """
+
+    # queue all registrations and send them to Shotgun in a few batch calls once
+    # the exports are done, rather than calling register_publish per item.
+    batch_registration = True
+
+    # number of threads used for file copies.  Shotgun requests are always sent
+    # from a single worker thread as the connection is not thread safe.
+    max_io_workers = 4
+
+    # optional TankPublishedFile field that receives the checksum of copied
+    # files, a dedupe.HASH_ALGORITHM hex digest
+    checksum_field = None
+
+    # export cones and geo with the streaming writer in matchmove_lib rather than
+    # Maya's objExport plugin
+    use_builtin_obj_writer = True
+
+    # write a binary channel cache next to every published camera FBX
+    write_camera_cache = True
+
+    # decimated proxies written next to every geo OBJ, as the fraction of the
+    # triangles each level keeps, up to proxy_mesh.MAX_LEVELS of them.  Empty
+    # to only publish full resolution geo.
+    proxy_levels = proxy_mesh.LEVELS
+
+    # publish cones as a binary record per cone next to the OBJ, which then
+    # only holds a vertex per cone, see matchmove_lib.cone_cloud.  Groups whose
+    # cones aren't all the same mesh, such as frozen or edited cones, are
+    # exported as meshes anyway.  False exports every cone's mesh.
+    publish_cones_as_points = True
+
+    # write every output to local scratch first and move the finished version
+    # folder onto publish storage in one step.  scratch_root defaults to
+    # $MM_PUBLISH_SCRATCH or the system temp folder.
+    stage_locally = False
+    scratch_root = None
+
+    # hard link outputs that are identical to ones already published for the
+    # shot to a shared content addressed copy, see matchmove_lib.dedupe
+    dedupe_outputs = True
+
+    # link cones and geo that haven't changed since the previous version
+    # instead of exporting them again, see matchmove_lib.fingerprints
+    skip_unchanged_geometry = True
+
+    # local file remembering which entity holds each uploaded thumbnail, so
+    # the static publish icons are only uploaded once per project.  None uses
+    # ~/.matchmove/thumbnail_cache.json
+    thumbnail_cache_path = None
+
+    # clear the cached tasks, user and project before publishing, for when
+    # they have been changed in Shotgun during the session
+    refresh_context = False
+
+    # write a Chrome trace of the publish into the version folder.  Setting
+    # $MM_PUBLISH_TRACE instead also traces the scan and validation.
+    write_trace = False
+
+    # journal finished exports and registrations in the version folder, so
+    # publishing the same version again after a failure only redoes what is
+    # missing, see matchmove_lib.journal
+    resume_publishes = True
+
+    # print the publish plan and return without exporting or registering anything
+    dry_run = False
+
     def execute(self, tasks, work_template, comment, thumbnail_path, sg_task, primary_publish_path, progress_cb, **kwargs):
         """
         Main hook entry point
@@ -83,13 +171,146 @@ class PublishHook(Hook):
                                     A list of error messages (strings) to report
                         }
         """
+        # write_trace only traces this publish, so the tracer and the Shotgun
+        # connections are put back as they were afterwards
+        tracer = tracing.session_tracer()
+        was_enabled = tracer.enabled
+        if self.write_trace:
+            tracer.enabled = True
+        instrumented = [sg for sg in (self.parent.tank.shotgun, self.parent.engine.shotgun)
+                        if tracer.instrument(sg)]
+
+        self._plan = None
+        try:
+            with tracer.span('publish', tasks=len(tasks)):
+                results = self._publish_tasks(tracer, tasks, work_template, comment, sg_task, primary_publish_path, progress_cb)
+        finally:
+            if tracer.enabled and self._plan:
+                self._write_trace(tracer)
+            tracer.restore(instrumented)
+            tracer.enabled = was_enabled
+
+        return results
+
+    def _publish_tasks(self, tracer, tasks, work_template, comment, sg_task, primary_publish_path, progress_cb):
+        """
+        Export and register every task, returning the list of task errors
+        """
         results = []
 
-        # publish all tasks:
-        for task in tasks:
+        # resolve every path, folder and collision once, before exporting anything
+        with tracer.span('plan'):
+            working_path = cmds.file(query=True, sceneName=True)
+            plan = publish_plan.compile_plan(tasks, work_template, working_path)
+
+        if self.dry_run:
+            print "<publish> dry run, nothing will be published:"
+            print plan.format()
+            return results
+
+        self._journal = journal.NULL_JOURNAL
+        if self.resume_publishes and plan.version_folder:
+            self._journal = journal.PublishJournal.load(plan.version_folder)
+        resuming = self._journal.resumable(working_path)
+
+        collisions = plan.collisions()
+        if collisions and resuming:
+            print "<publish> resuming the unfinished publish in %s" % plan.version_folder
+            collisions = self._remove_leftovers(collisions)
+        if collisions:
+            for entry in collisions:
+                print "<publish> The secondary output '%s' file named '%s' already exists!" % (entry.task['item']['type'], entry.path)
+                results.append({"task": entry.task,
+                                "errors": ["The secondary output '%s' file named '%s' already exists!" % (entry.task['item']['type'], entry.path)]})
+            return results
+
+        self._plan = plan
+        self._scene_path = working_path
+        self._outputs = []
+        self._staged_exports = []
+        self._digests = {}
+
+        # a staged publish starts its journal once it is committed, so
+        # aborting it before then leaves nothing on publish storage
+        self._staging = None
+        if self.stage_locally:
+            self._staging = staging.StagingArea(plan.root, self.scratch_root, self.max_io_workers)
+            self._staging.make_directories(plan.directories())
+            print "<publish> staging publish in %s" % self._staging.scratch
+        else:
+            self._start_journal()
+            for folder in plan.create_directories():
+                print "<publish> Created folder %s" % folder
+
+        # fingerprint all of the cones and geo up front
+        self._fingerprints = {}
+        self._previous_manifest = None
+        self._manifest = fingerprints.Manifest(plan.version_folder)
+        if resuming:
+            self._manifest = fingerprints.Manifest.load(plan.version_folder) or self._manifest
+        if self.skip_unchanged_geometry:
+            roots = [e.task['item']['name'] for e in plan.entries
+                     if e.output_name in ('cone_geo_export', 'model_geo_export')]
+            if roots:
+                with tracer.span('fingerprint', items=len(roots)):
+                    self._fingerprints = fingerprints.fingerprint_all(roots)
+                    self._previous_manifest = fingerprints.previous_manifest(plan.version_folder)
+
+        # tasks, user and project are looked up once per session
+        self._context_cache = context_cache.session_cache()
+        if self.refresh_context:
+            self._context_cache.invalidate()
+        if any(e.output_name == 'shotgun_note_create' for e in plan.entries):
+            self._context_cache.tasks(self.parent.tank.shotgun, self.parent.context.entity)
+
+        # staged files only become visible on commit, so they are always
+        # registered in a batch once the commit has succeeded
+        self._registrar = None
+        self._thumbnail_cache = thumbnails.ThumbnailCache(self.thumbnail_cache_path)
+        if self.batch_registration or self._staging:
+            self._registrar = registration.BatchRegistrar(self.parent.tank,
+                                                          self.parent.context,
+                                                          sg_task,
+                                                          self._context_cache.user(self.parent.tank.shotgun),
+                                                          checksum_field=self.checksum_field,
+                                                          thumbnail_cache=self._thumbnail_cache)
+
+        # publishes registered on their own, waiting for their thumbnails
+        self._unbatched = []
+
+        # scene exports run here on the main thread, everything else is handed
+        # to the worker pools and joined before returning.
+        self._io_pool = pipeline.WorkerPool(self.max_io_workers, name='publish-io')
+        self._sg_pool = pipeline.WorkerPool(1, name='publish-shotgun')
+
+        # publish all tasks.  If an export blows up, the copies and
+        # registrations already queued still finish, so the journal knows
+        # about them when the publish is retried.
+        try:
+            self._publish_entries(tracer, plan, results, comment, sg_task, primary_publish_path, progress_cb)
+        except BaseException:
+            self._io_pool.shutdown()
+            self._sg_pool.shutdown()
+            raise
+
+        self._join_workers(results, progress_cb)
+
+        if not results:
+            self._journal.record_finish()
+
+        return results
+
+    def _publish_entries(self, tracer, plan, results, comment, sg_task, primary_publish_path, progress_cb):
+        """
+        Export each entry of the plan on the main thread, queueing copies and
+        registrations on the worker pools
+        """
+        for entry in plan.entries:
+            task = entry.task
             item = task["item"]
             output = task["output"]
             errors = []
+            self._current_task = task
 
             print "<publish> ", item
             print "<publish> ", output
@@ -98,45 +319,49 @@ class PublishHook(Hook):
             print "<publish> starting"
             progress_cb(0, "Starting...", task)
 
-            # calculate publish path for this task
-            # interim kludge...
-            working_path = cmds.file(query=True, sceneName=True)
-
-            fields = work_template.get_fields(working_path)
+            fields = plan.fields
             publish_template = output["publish_template"]
-            secondary_publish_path = publish_template.apply_fields(fields)
+            secondary_publish_path = entry.path
 
-            if os.path.exists(secondary_publish_path):
-                print ("<publish> The secondary output '%s' file named '%s' already exists!" % (item['type'], secondary_publish_path))
+            # outputs registered by an earlier attempt are left alone
+            if output["name"] == "shotgun_note_create":
+                journal_key = 'Note %s' % self._note_subject()
+            else:
+                journal_key = secondary_publish_path
+            if journal_key and self._journal.registration(journal_key):
+                print "<publish> %s was published by an earlier attempt" % journal_key
+                progress_cb(100)
+                continue
 
-                errors.append("The secondary output '%s' file named '%s' already exists!" % (item['type'], secondary_publish_path))
-                results.append({"task": task, "errors": errors})
-                return results
+            with tracer.span(output["name"], item=item['name']) as span:
+                # depending on output type, do some specific validation:
+                if output["name"] == "camera_export":
+                    errors.extend(self._publish_camera(item, secondary_publish_path, entry.name, fields, comment, sg_task, primary_publish_path, progress_cb))
 
-            # create the parent directories for the publish if they don't already exist.
-            if not os.path.exists(os.path.dirname(secondary_publish_path)):
-                print "<publish> Creating folder %s" % os.path.dirname(secondary_publish_path)
-                os.makedirs(os.path.dirname(secondary_publish_path))
+                elif output["name"] == "cone_geo_export":
+                    errors.extend(self._publish_cones(item, secondary_publish_path, fields, comment, sg_task, primary_publish_path, progress_cb))
 
-            # depending on output type, do some specific validation:
-            if output["name"] == "camera_export":
-                errors.extend(self._publish_camera(item, publish_template, fields, comment, sg_task, primary_publish_path, progress_cb))
+                elif output["name"] == "model_geo_export":
+                    errors.extend(self._publish_geometry(item, secondary_publish_path, entry.name, fields, comment, sg_task, primary_publish_path, progress_cb))
 
-            elif output["name"] == "cone_geo_export":
-                errors.extend(self._publish_cones(item, secondary_publish_path, fields, comment, sg_task, primary_publish_path, progress_cb))
+                elif output["name"] == "lens_distort_export":
+                    errors.extend(self._publish_lens_node(item, secondary_publish_path, fields, comment, sg_task, primary_publish_path, progress_cb))
 
-            elif output["name"] == "model_geo_export":
-                errors.extend(self._publish_geometry(item, publish_template, fields, comment, sg_task, primary_publish_path, progress_cb))
+                elif output["name"] == "shotgun_note_create" and self._registrar:
+                    # the context is cached by now, so this only queues the note
+                    errors.extend(self._publish_note(task, item, publish_template, fields, comment, sg_task, primary_publish_path, progress_cb))
 
-            elif output["name"] == "lens_distort_export":
-                errors.extend(self._publish_lens_node(item, secondary_publish_path, fields, comment, sg_task, primary_publish_path, progress_cb))
+                elif output["name"] == "shotgun_note_create":
+                    # Shotgun requests are only ever sent from the Shotgun worker
+                    self._sg_pool.submit(task, self._publish_note, task, item, publish_template, fields, comment, sg_task, primary_publish_path, progress_cb)
 
-            elif output["name"] == "shotgun_note_create":
-                 errors.extend(self._publish_note(item, publish_template, fields, comment, sg_task, primary_publish_path, progress_cb))
+                else:
+                    # don't know how to publish other output types!
+                    errors.append("Don't know how to publish this item! %s as %s" % (item['name'], output['name']))
 
-            else:
-                # don't know how to publish other output types!
-                errors.append("Don't know how to publish this item! %s as %s" % (item['name'], output['name']))
+                # bytes written by the export, copies are counted when they finish
+                if tracer.enabled and secondary_publish_path and os.path.isfile(self._write_path(secondary_publish_path)):
+                    span.set('bytes', os.path.getsize(self._write_path(secondary_publish_path)))
 
             # if there is anything to report then add to result
             if len(errors) > 0:
@@ -145,63 +370,285 @@ class PublishHook(Hook):
 
             progress_cb(100)
 
-        return results
+    def _remove_leftovers(self, collisions):
+        """
+        Remove the files an unfinished publish left behind without journaling
+        them, so they are exported again.  Returns the collisions that remain.
+        """
+        remaining = []
+        for entry in collisions:
+            if self._journal.exported(entry.path):
+                continue
+            paths = [entry.path]
+            if entry.output_name == 'camera_export':
+                paths.append(camera_cache.cache_path(entry.path))
+            elif entry.output_name == 'cone_geo_export':
+                paths.append(cone_cloud.cloud_path(entry.path))
+            elif entry.output_name == 'model_geo_export':
+                paths.extend(proxy for level, proxy in proxy_mesh.find_proxies(entry.path))
+            try:
+                for path in paths:
+                    if os.path.exists(path):
+                        os.remove(path)
+                print "<publish> removed %s left by an earlier attempt" % entry.path
+            except OSError as e:
+                print "<publish> Unable to remove %s: %s" % (entry.path, e)
+                remaining.append(entry)
+        return remaining
+
+    def _earlier_export(self, path):
+        """
+        Return the journal record of path if an earlier attempt exported it
+        """
+        record = self._journal.exported(path)
+        if record:
+            print "<publish> %s was exported by an earlier attempt" % path
+        return record
 
-    def _publish_camera(self, item, publish_template, fields, comment, sg_task, primary_publish_path, progress_cb):
+    def _start_journal(self):
         """
-        Publishes the selected camera as an FBX archive in ASCII format
+        Journal the start of the publish, which creates the version folder.
+        Without a journal the publish can't be resumed but still goes ahead.
         """
-        errors = []
+        try:
+            self._journal.record_start(self._scene_path)
+        except (IOError, OSError) as e:
+            print "<publish> Unable to start the publish journal: %s" % e
+            self._journal = journal.NULL_JOURNAL
 
-        print "<publish> publish camera called"
+    def _journal_export(self, path, checksum=None):
+        """
+        Journal a finished output.  Staged outputs are journaled once they
+        have been committed.  The checksum is taken once, here, and kept for
+        dedupe so the output is only read once.  The journal only helps a
+        retry, so failing to write it doesn't fail the publish.
+        """
+        if checksum is None and (self.dedupe_outputs or self._journal is not journal.NULL_JOURNAL):
+            try:
+                checksum = dedupe.file_digest(self._write_path(path))
+            except (IOError, OSError) as e:
+                print "<publish> Unable to checksum %s: %s" % (path, e)
+        if checksum is not None:
+            self._digests[path] = checksum
+
+        if self._staging and not self._staging.committed:
+            self._staged_exports.append((path, checksum))
+            return
+        try:
+            self._journal.record_export(path, checksum)
+        except (IOError, OSError) as e:
+            print "<publish> Unable to journal %s: %s" % (path, e)
 
-        # more than one camera, so we need to make publish path unique to the item name
-        fields['name'] = item['name']
-        secondary_publish_path = publish_template.apply_fields(fields)
-        secondary_publish_name = fields.get("name").upper()  # we want an uppercase name
-        if not secondary_publish_name:
-            secondary_publish_name = os.path.basename(secondary_publish_path)
+    def _journal_registration(self, key, entity):
+        try:
+            self._journal.record_registration(key, entity)
+        except (IOError, OSError) as e:
+            print "<publish> Unable to journal %s: %s" % (key, e)
 
-        print "<publish> using name for publish: %s" % secondary_publish_name
+    def _join_workers(self, results, progress_cb):
+        """
+        Wait for the background copies and Shotgun requests to finish, then
+        add any errors to the result of the task that queued the work.
+        """
+        def _report(done, total):
+            progress_cb(100.0 * done / total, "Waiting for %d background jobs" % (total - done))
 
-        if os.path.exists(secondary_publish_path):
-            print "<publish> The published camera named '%s' already exists!" % secondary_publish_path
-            errors.append("The published camera named '%s' already exists!" % secondary_publish_path)
-            results.append({"task": item, "errors": errors})
-            return results
+        tracer = tracing.session_tracer()
+        try:
+            with tracer.span('wait io'):
+                for job in self._io_pool.join(_report):
+                    self._add_task_errors(results, job.owner, job.errors + (job.result or []))
+
+            committed = True
+            if self._staging:
+                with tracer.span('staging commit'):
+                    committed = self._commit_staging(results)
+
+            if self.dedupe_outputs and committed:
+                with tracer.span('dedupe'):
+                    self._dedupe_outputs()
+
+            if self._manifest.entries and committed:
+                print "<publish> wrote fingerprints %s" % self._manifest.save()
+
+            # the last registrations are queued by the copy callbacks above
+            self._flush_registrations()
+
+            with tracer.span('wait shotgun'):
+                for job in self._sg_pool.join(_report):
+                    if self._registrar and job.owner is self._registrar:
+                        self._collect_registrations(results, job.result or [])
+                        if job.errors:
+                            print "<publish> registration failed: %s" % job.errors
+                    else:
+                        self._add_task_errors(results, job.owner, job.errors + (job.result or []))
+
+            if self._unbatched:
+                with tracer.span('thumbnails', publishes=len(self._unbatched)):
+                    self._upload_thumbnails(results)
+        finally:
+            self._io_pool.shutdown()
+            self._sg_pool.shutdown()
+            if self._staging and not self._staging.committed:
+                self._staging.discard()
+
+    def _upload_thumbnails(self, results):
+        """
+        Give the publishes registered on their own their thumbnails, uploading
+        each distinct image once as the batch registrar does.
+        """
+        registration.upload_thumbnails(self.parent.tank.shotgun, self.parent.context.project,
+                                       self._unbatched, self._thumbnail_cache)
+        for record in self._unbatched:
+            if record.errors:
+                print "<publish> thumbnail failed for %s: %s" % (record.path, record.errors)
+                self._add_task_errors(results, record.owner, record.errors)
+
+    def _write_trace(self, tracer):
+        """
+        Write the trace of this publish into the version folder.  Tracing is
+        only a diagnostic, so failing to write it doesn't fail the publish.
+        """
+        path = os.path.join(self._plan.version_folder, '.publish_trace_%s.json' % time.strftime('%Y%m%d_%H%M%S'))
+        try:
+            if tracer.write(path):
+                print "<publish> wrote trace %s" % path
+        except (IOError, OSError) as e:
+            print "<publish> Unable to write trace %s: %s" % (path, e)
 
-        # select the camera
+    def _commit_staging(self, results):
+        """
+        Move the staged outputs onto publish storage.  If that fails nothing
+        is registered and every task that wrote a file gets the error.
+        """
         try:
-            cmds.select(item['name'], visible=True, hierarchy=True, replace=True)
-            print "<publish> selected %s" % item['name']
-        except ValueError as e:
-            errors.append('Unable to select camera [%s]' % item['name'])
-            return errors
+            copies = self._staging.commit()
+        except staging.StagingError as e:
+            print "<publish> %s" % e
+            for record in self._registrar.discard():
+                self._add_task_errors(results, record.owner, [str(e)])
+            return False
+
+        size = sum(copy.bytes for copy in copies)
+        print "<publish> committed %d files (%d bytes) to %s" % (len(copies), size, self._staging.publish_root)
+        self._start_journal()
+        for path, checksum in self._staged_exports:
+            self._journal_export(path, checksum)
+        return True
+
+    def _dedupe_outputs(self):
+        """
+        Replace outputs that match earlier publishes of the shot with hard
+        links.  Failures only cost disk space, so they are logged and ignored.
+        """
+        store = dedupe.BlobStore.for_version_folder(self._plan.version_folder)
+        for task, path in self._outputs:
+            if os.path.isfile(path):
+                self._io_pool.submit(task, store.dedupe, path, self._digests.get(path))
+
+        saved = 0
+        linked = 0
+        for job in self._io_pool.join():
+            if job.errors:
+                print "<publish> dedupe failed: %s" % job.errors
+            elif job.result:
+                saved += job.result
+                linked += 1
+        print "<publish> dedupe linked %d unchanged files, saving %d bytes" % (linked, saved)
+
+    def _write_path(self, publish_path):
+        """
+        Return the path an output should be written to, which is on local
+        scratch when staging.
+        """
+        if self._staging:
+            return self._staging.stage_path(publish_path)
+        return publish_path
 
-        # set export settings
-        mel.eval('FBXExportInAscii -v 1')
-        mel.eval('FBXExportConvertUnitString "cm"')
-        mel.eval('FBXExportInputConnections -v 0')
-        mel.eval('FBXExportCameras -v 1')
+    def _flush_registrations(self):
+        """
+        Hand all queued publish records to the Shotgun worker
+        """
+        if self._registrar and self._registrar.pending():
+            print "<publish> registering %d publishes" % self._registrar.pending()
+            self._sg_pool.submit(self._registrar, self._registrar.commit)
 
-        #FBX 2006 -
-        mel.eval('FBXExportFileVersion "FBX200611"')
+    def _collect_registrations(self, results, records):
+        """
+        Add errors from committed publish records to the result of their task
+        """
+        for record in records:
+            # anything that was created is journaled, even if linking its
+            # dependencies failed, so a retry never registers it twice
+            if record.entity:
+                self._journal_registration(record.path or record.name, record.entity)
+            if record.errors:
+                print "<publish> register failed for %s: %s" % (record.path or record.name, record.errors)
+                self._add_task_errors(results, record.owner, record.errors)
+            else:
+                print "<publish> registered %s => %s" % (record.path or record.name, record.entity)
 
-        print "<publish>"
-        print "\tFBXExportInAscii -v 1"
-        print '\tFBXExportConvertUnitString "cm"'
-        print '\tFBXExportInputConnections -v 0'
-        print '\tFBXExportCameras -v 1'
-        print '\tFBXExportFileVersion "FBX200611"'
+    def _add_task_errors(self, results, task, errors):
+        """
+        Add errors to the existing result for a task, or start a new one
+        """
+        if not errors:
+            return
+        for result in results:
+            if result["task"] is task:
+                result["errors"].extend(errors)
+                return
+        results.append({"task": task, "errors": list(errors)})
+
+    def _publish_camera(self, item, secondary_publish_path, secondary_publish_name, fields, comment, sg_task, primary_publish_path, progress_cb):
+        """
+        Publishes the selected camera as an FBX archive in ASCII format
+        """
+        errors = []
 
-        # export selection
-        progress_cb(20.0)
-        try:
-            mel.eval('FBXExport -f "%s" -s' % secondary_publish_path)
-            print '\tFBXExport -f "%s" -s' % secondary_publish_path
-        except RuntimeError as e:
-            print "<publish> 'Unable to publish camera [%s]" % item['name']
-            errors.append('Unable to publish camera [%s]' % item['name'])
+        print "<publish> publish camera called"
+        print "<publish> using name for publish: %s" % secondary_publish_name
+
+        if not self._earlier_export(secondary_publish_path):
+            # select the camera
+            try:
+                cmds.select(item['name'], visible=True, hierarchy=True, replace=True)
+                print "<publish> selected %s" % item['name']
+            except ValueError as e:
+                errors.append('Unable to select camera [%s]' % item['name'])
+                return errors
+
+            # set export settings
+            mel.eval('FBXExportInAscii -v 1')
+            mel.eval('FBXExportConvertUnitString "cm"')
+            mel.eval('FBXExportInputConnections -v 0')
+            mel.eval('FBXExportCameras -v 1')
+
+            #FBX 2006 -
+            mel.eval('FBXExportFileVersion "FBX200611"')
+
+            print "<publish>"
+            print "\tFBXExportInAscii -v 1"
+            print '\tFBXExportConvertUnitString "cm"'
+            print '\tFBXExportInputConnections -v 0'
+            print '\tFBXExportCameras -v 1'
+            print '\tFBXExportFileVersion "FBX200611"'
+
+            # export selection
+            progress_cb(20.0)
+            try:
+                mel.eval('FBXExport -f "%s" -s' % self._write_path(secondary_publish_path))
+                print '\tFBXExport -f "%s" -s' % self._write_path(secondary_publish_path)
+            except RuntimeError as e:
+                print "<publish> 'Unable to publish camera [%s]" % item['name']
+                errors.append('Unable to publish camera [%s]' % item['name'])
+
+            if self.write_camera_cache and not errors:
+                progress_cb(60.0)
+                errors.extend(self._write_camera_cache(item['name'], camera_cache.cache_path(secondary_publish_path)))
+
+            if not errors:
+                self._journal_export(secondary_publish_path)
 
         progress_cb(80.0)
         env_disk_location = self.parent.engine.environment['disk_location']
@@ -219,38 +666,54 @@ class PublishHook(Hook):
 
         return errors
 
+    def _write_camera_cache(self, camera, path):
+        """
+        Bake the camera channels over the playback range into a binary cache
+        that the Nuke loader can read instead of the FBX.  Cameras the cache
+        can't hold are left to the FBX.
+        """
+        start = cmds.playbackOptions(query=True, minTime=True)
+        end = cmds.playbackOptions(query=True, maxTime=True)
+        try:
+            channels, rotate_order = camera_cache.bake_camera(camera, start, end)
+            camera_cache.write_cache(self._write_path(path), int(start), channels, rotate_order)
+            print "<publish> wrote camera cache %s" % path
+            self._outputs.append((self._current_task, path))
+        except camera_cache.UncachableCamera as e:
+            print "<publish> No camera cache for %s, Nuke will read the FBX: %s" % (camera, e)
+        except (RuntimeError, IOError, camera_cache.CameraCacheError) as e:
+            print "<publish> Unable to write camera cache %s: %s" % (path, e)
+            return ['Unable to write camera cache for [%s]' % camera]
+        return []
+
     def _publish_cones(self, item, secondary_publish_path, fields, comment, sg_task, primary_publish_path, progress_cb):
         """
-        Publishes the cones group and children as a single OBJ archive.
+        Publishes the cones group and children as a single OBJ archive, or as
+        cone records and a point OBJ with publish_cones_as_points.
         """
         errors = []
         print "<publish> publish cones called"
 
-        # select the cones
-        try:
-            cones_ = cmds.select(item['name'], visible=True, hierarchy=True, replace=True)
-            print "<publish> ", item['name'], " selected"
-        except Exception as e:
-            print e
-            errors.append('Unable to select cones [%s]' % item['name'])
-            return errors
-
-        # export selection
-        progress_cb(40.0)
-        try:
-            cmds.file(secondary_publish_path,
-                      pr=0,
-                      typ="OBJexport",
-                      es=1,
-                      op="groups=1; ptgroups=0; materials=0; smoothing=0; normals=0")
-            print """cmds.file(secondary_publish_path,
-                       pr=0,
-                       typ="OBJexport",
-                       es=1,
-                       op="groups=1; ptgroups=0; materials=0; smoothing=0; normals=0")"""
-        except Exception as e:
-            print e
-            errors.append('Unable to publish cones [%s]' % item['name'])
+        if not self._earlier_export(secondary_publish_path):
+            # select the cones
+            try:
+                cones_ = cmds.select(item['name'], visible=True, hierarchy=True, replace=True)
+                print "<publish> ", item['name'], " selected"
+            except Exception as e:
+                print e
+                errors.append('Unable to select cones [%s]' % item['name'])
+                return errors
+
+            # export selection
+            progress_cb(40.0)
+            try:
+                export = self._export_cones if self.publish_cones_as_points else None
+                self._export_or_reuse(item['name'], secondary_publish_path, export,
+                                      {'cones_as_points': self.publish_cones_as_points})
+                self._journal_export(secondary_publish_path)
+            except Exception as e:
+                print e
+                errors.append('Unable to publish cones [%s]' % item['name'])
 
         progress_cb(80.0)
         env_disk_location = self.parent.engine.environment['disk_location']
@@ -268,53 +731,36 @@ class PublishHook(Hook):
 
         return errors
 
-    def _publish_geometry(self, item, publish_template, fields, comment, sg_task, primary_publish_path, progress_cb):
+    def _publish_geometry(self, item, secondary_publish_path, secondary_publish_name, fields, comment, sg_task, primary_publish_path, progress_cb):
         """
         Publishes the geometry each object as OBJ archives.
         """
         errors = []
         print "<publish> publish model called"
 
-        # there may more than one geo publish, so we need to make publish path unique to the item name
-        # could go so badly. we only want to name the exact object.
-        fields['name'] = item['name'].split('|')[-1]
-        secondary_publish_path = publish_template.apply_fields(fields)
-
-        secondary_publish_name = fields.get("name")
-        if not secondary_publish_name:
-            secondary_publish_name = os.path.basename(secondary_publish_path)
-
-        if os.path.exists(secondary_publish_path):
-            print "<publish> The geoPublish named '%s' already exists!" % secondary_publish_path
-
-            errors.append("The geoPublish named '%s' already exists!" % secondary_publish_path)
-            results.append({"task": task, "errors": errors})
-            return results
-
-        # select the cones
-        try:
-            cmds.select(item['name'], visible=True, hierarchy=True, replace=True)
-        except Exception as e:
-            print e
-            errors.append('Unable to select transform [%s]' % item['name'])
-            return errors
-
-        # export selection
-        progress_cb(60.0)
-        try:
-            cmds.file(secondary_publish_path,
-                      pr=0,
-                      typ="OBJexport",
-                      es=1,
-                      op="groups=1; ptgroups=0; materials=0; smoothing=0; normals=0")
-            print """cmds.file(secondary_publish_path,
-                       pr=0,
-                       typ="OBJexport",
-                       es=1,
-                       op="groups=1; ptgroups=0; materials=0; smoothing=0; normals=0")"""
-        except Exception as e:
-            print e
-            errors.append('Unable to publish model [%s]' % item['name'])
+        if not self._earlier_export(secondary_publish_path):
+            # select the cones
+            try:
+                cmds.select(item['name'], visible=True, hierarchy=True, replace=True)
+            except Exception as e:
+                print e
+                errors.append('Unable to select transform [%s]' % item['name'])
+                return errors
+
+            # export selection
+            progress_cb(60.0)
+            try:
+                previous, meshes = self._export_or_reuse(item['name'], secondary_publish_path,
+                                                         settings={'proxy_levels': list(self.proxy_levels or ())})
+            except Exception as e:
+                print e
+                errors.append('Unable to publish model [%s]' % item['name'])
+            else:
+                if not previous:
+                    progress_cb(70.0)
+                    errors.extend(self._write_proxies(item['name'], secondary_publish_path, meshes))
+                if not errors:
+                    self._journal_export(secondary_publish_path)
 
         progress_cb(80.0)
         env_disk_location = self.parent.engine.environment['disk_location']
@@ -331,80 +777,256 @@ class PublishHook(Hook):
                                [primary_publish_path])
         return errors
 
+    def _export_or_reuse(self, root, path, export=None, settings=None):
+        """
+        Export root to path with export, _export_obj by default, unless the
+        previous version holds an output with the same fingerprint and export
+        settings, in which case that file and its proxies or cone records are
+        linked in instead.  Returns the previous output that was linked and
+        the meshes written by the builtin writer, either of which may be None.
+        """
+        fingerprint = self._fingerprints.get(root)
+        if fingerprint:
+            settings = dict(settings or {}, builtin_obj_writer=self.use_builtin_obj_writer)
+            fingerprint = fingerprints.with_settings(fingerprint, settings)
+        previous = None
+        if fingerprint and self._previous_manifest:
+            previous = self._previous_manifest.output_for(root, fingerprint)
+
+        meshes = None
+        if previous and self._link_previous(previous, path):
+            print "<publish> %s is unchanged, reusing %s" % (root, previous)
+            for level, proxy in proxy_mesh.find_proxies(previous):
+                self._link_previous(proxy, proxy_mesh.proxy_path(path, level))
+            if os.path.isfile(cone_cloud.cloud_path(previous)):
+                self._link_previous(cone_cloud.cloud_path(previous), cone_cloud.cloud_path(path))
+        else:
+            previous = None
+            meshes = (export or self._export_obj)(root, path)
+
+        if fingerprint:
+            self._manifest.add(root, fingerprint, path)
+        return previous, meshes
+
+    def _export_cones(self, root, path):
+        """
+        Write the cone records of root next to path, and path as an OBJ with
+        a vertex per cone for anything that can't read the records.  Groups
+        with cones that don't match the first one are exported as meshes.
+        """
+        names, channels, prototype, mismatched = cone_cloud.collect_cones(root)
+        if mismatched:
+            print "<publish> %d cones of %s differ from the first, exporting every cone's mesh: %s" % (
+                len(mismatched), root, ', '.join(mismatched[:5]))
+            return self._export_obj(root, path)
+
+        cloud = cone_cloud.cloud_path(path)
+        size = cone_cloud.write_cloud(self._write_path(cloud), names, channels, prototype)
+        self._outputs.append((self._current_task, cloud))
+        print "<publish> wrote %d cones (%d bytes) to %s" % (len(names), size, cloud)
+
+        points = cone_cloud.points_mesh(root.rsplit('|', 1)[-1], channels)
+        size = obj_writer.write_obj(self._write_path(path), [points])
+        print "<publish> wrote %d bytes to %s" % (size, self._write_path(path))
+
+    def _write_proxies(self, root, path, meshes=None):
+        """
+        Write the proxy levels of root next to its OBJ, replacing any left by
+        an earlier attempt.  The meshes are pulled from the scene unless the
+        export just did so.
+        """
+        levels = [(level, ratio) for level, ratio in enumerate(self.proxy_levels or (), 1)
+                  if level <= proxy_mesh.MAX_LEVELS]
+        if not levels:
+            return []
+
+        try:
+            if meshes is None:
+                meshes = obj_writer.collect_meshes(root)
+            full = proxy_mesh.triangle_count(meshes)
+            for level, proxy, triangles in proxy_mesh.build_proxies(meshes, levels):
+                proxy_path = proxy_mesh.proxy_path(path, level)
+                size = proxy_mesh.write_proxy(self._write_path(proxy_path), proxy)
+                self._outputs.append((self._current_task, proxy_path))
+                print "<publish> wrote proxy %s: %d of %d triangles, %d bytes" % (proxy_path, triangles, full, size)
+        except (RuntimeError, IOError, OSError) as e:
+            print "<publish> Unable to write proxies for %s: %s" % (root, e)
+            return ['Unable to write proxy geometry for [%s]' % root]
+        return []
+
+    def _link_previous(self, previous, path):
+        """
+        Hard link a previous output to path, copying it if links aren't
+        possible.  Returns False if neither worked.
+        """
+        path = self._write_path(path)
+        try:
+            os.link(previous, path)
+            return True
+        except (OSError, AttributeError):
+            pass
+
+        try:
+            copy_engine.copy_file(previous, path)
+            return True
+        except copy_engine.CopyError as e:
+            print "<publish> %s" % e
+            return False
+
+    def _export_obj(self, root, path):
+        """
+        Export root and its children as a single OBJ file.  objExport works on
+        the current selection, so root must be selected when it is used.
+        Returns the meshes written by the builtin writer.
+        """
+        path = self._write_path(path)
+        if self.use_builtin_obj_writer:
+            meshes = obj_writer.collect_meshes(root)
+            size = obj_writer.write_obj(path, meshes)
+            print "<publish> wrote %d bytes to %s" % (size, path)
+            return meshes
+
+        cmds.file(path,
+                  pr=0,
+                  typ="OBJexport",
+                  es=1,
+                  op="groups=1; ptgroups=0; materials=0; smoothing=0; normals=0")
+        print """cmds.file(path,
+                   pr=0,
+                   typ="OBJexport",
+                   es=1,
+                   op="groups=1; ptgroups=0; materials=0; smoothing=0; normals=0")"""
+
     def _publish_lens_node(self,  item, secondary_publish_path, fields, comment, sg_task, primary_publish_path, progress_cb):
         """
         Copy and rename the lens distortion script from work path to publish path and register publish.
+
+        The copy runs on the io worker pool and the publish is registered once it
+        has completed successfully.
         """
-        errors = []
         print "<publish> publish lens called"
 
-        try:
-            # parent directory of dst is created by caller
-            print "<publish> copying %s => %s" % (item['name'], secondary_publish_path)
-            shutil.copyfile(item['name'], secondary_publish_path)
-        except shutil.Error:
-            print "<publish> Unable to copy to %s, is this path writable?" % secondary_publish_path
-            errors.append("Unable to copy to %s, is this path writable?" % secondary_publish_path)
-
         env_disk_location = self.parent.engine.environment['disk_location']
         icons_disk_location = os.path.abspath(os.path.join(os.path.dirname(env_disk_location), '..', 'icons'))
         thumbnail_path = os.path.join(icons_disk_location, 'lens_distortion_thumb.png')
 
-        self._register_publish(secondary_publish_path,
-                               'lensDistort',
-                               sg_task,
-                               fields["version"],
-                               'Matchmove Lens Distortion Node',
-                               comment,
-                               thumbnail_path,
-                               [primary_publish_path])
+        task = self._current_task
+        copies = {}
+
+        def _register(checksum):
+            self._current_task = task
+            self._register_publish(secondary_publish_path,
+                                   'lensDistort',
+                                   sg_task,
+                                   fields["version"],
+                                   'Matchmove Lens Distortion Node',
+                                   comment,
+                                   thumbnail_path,
+                                   [primary_publish_path],
+                                   checksum=checksum)
+
+        def _copied(job):
+            if job.errors or job.result:
+                return
+            copy = copies[secondary_publish_path]
+            print "<publish> copied %d bytes in %.2fs (%.1f MB/s, %s) checksum %s" % (
+                copy.bytes, copy.seconds, copy.throughput / 1e6, copy.method, copy.checksum)
+            _register(copy.checksum)
+
+        exported = self._earlier_export(secondary_publish_path)
+        if exported:
+            _register(exported['checksum'])
+        else:
+            self._io_pool.submit(task, self._copy_file, item['name'], secondary_publish_path, copies, on_done=_copied)
+
+        return []
+
+    def _copy_file(self, src, dst, copies):
+        """
+        Copy a work file into the publish area, storing the CopyResult in
+        copies[dst].  Runs on a worker thread.
+        """
+        errors = []
+        with tracing.session_tracer().span('copy', path=dst) as span:
+            try:
+                # parent directory of dst is created by caller
+                print "<publish> copying %s => %s" % (src, dst)
+                copies[dst] = copy_engine.copy_file(src, self._write_path(dst), algorithm=dedupe.HASH_ALGORITHM)
+                span.set('bytes', copies[dst].bytes)
+                self._journal_export(dst, copies[dst].checksum)
+            except copy_engine.CopyError as e:
+                print "<publish> %s" % e
+                errors.append("Unable to copy to %s, is this path writable?" % dst)
 
         return errors
 
 
-    def _publish_note(self, item, publish_template, fields, comment, sg_task, primary_publish_path, progress_cb):
+    def _publish_note(self, task, item, publish_template, fields, comment, sg_task, primary_publish_path, progress_cb):
         """
-        Use the SG api to generate a note in Shotgun.
+        Use the SG api to generate a note in Shotgun.  In batch mode the note
+        is sent in the same batch as the publishes.
         """
         errors = []
         print "<publish> publish note called"
 
         sg = self.parent.engine.shotgun
 
-        fields = ['id', 'content']
-        filters = [
-            ['entity', 'is', self.parent.context.entity],
-        ]
-        sg_tasks = sg.find('Task', filters, fields)
+        sg_tasks = self._context_cache.tasks(sg, self.parent.context.entity)
         print "<publish> found tasks: %s" % sg_tasks
 
         args = {
-            "project": self.parent.context.project,
+            "project": self._context_cache.project(self.parent.context),
             "note_links": [self.parent.context.entity],
-            "user": tank.util.get_shotgun_user(sg),
-            "subject": 'Matchmove Publish on %s' % self.parent.context.entity.get('name', 'UNSET'),
+            "user": self._context_cache.user(sg),
+            "subject": self._note_subject(),
             "content": comment,
             "sg_note_type": 'Matchmove',
             "tasks": sg_tasks,
         }
 
-        print "<publish> create note args:"
-        pp = pprint.PrettyPrinter()
-        pp.pprint(args)
+        log.debug("create note args:\n%s", tracing.pretty(args))
+
+        if self._registrar:
+            self._registrar.add_request(task, 'Note', args, 'Note %s' % args['subject'])
+            return errors
 
-        sg_data = sg.create('Note', args, return_fields=['id'])
+        with tracing.session_tracer().span('note'):
+            sg_data = sg.create('Note', args, return_fields=['id'])
         if not sg_data.get('id'):
             print '<publish> Unable to create Note! %s' % sg_data
             errors.append('Unable to create Note! %s' % sg_data)
+        else:
+            self._journal_registration('Note %s' % args['subject'], sg_data)
 
         return errors
 
+    def _note_subject(self):
+        return 'Matchmove Publish on %s' % self.parent.context.entity.get('name', 'UNSET')
 
-    def _register_publish(self, path, name, sg_task, publish_version, tank_type, comment, thumbnail_path=None, dependency_paths=None):
+
+    def _register_publish(self, path, name, sg_task, publish_version, tank_type, comment, thumbnail_path=None, dependency_paths=None, checksum=None):
         """
         Helper method to register publish using the
         specified publish info.
+
+        In batch registration mode the publish is queued against the current
+        task and registered in chunks, otherwise it is registered on its own.
+        Either way the Shotgun requests are sent from the Shotgun worker and
+        joined at the end of execute.
         """
+        self._outputs.append((self._current_task, path))
+
+        if self._registrar:
+            self._registrar.add(self._current_task, path, name, publish_version, tank_type,
+                                comment, thumbnail_path, dependency_paths, checksum)
+            print "<publish> queued %s for registration" % path
+
+            # send full chunks while the remaining items are still exporting,
+            # unless the files aren't visible until the staging commit
+            if not self._staging and self._registrar.pending() >= self._registrar.chunk_size:
+                self._flush_registrations()
+            return None
+
         # construct args:
         args = {
             "tk": self.parent.tank,
@@ -415,23 +1037,26 @@ class PublishHook(Hook):
             "version_number": publish_version,
             "task": sg_task,
             "tank_type":tank_type,
-            "thumbnail_path": thumbnail_path,
             "dependency_paths": dependency_paths,
             }
 
-        pp = pprint.PrettyPrinter()
-        print "<publish> calling register with args:"
-        pp.pprint(args)
-
-        # register publish;
-        sg_data = tank.util.register_publish(**args)
-
-        print "<publish> register complete, return data:"
-        pp.pprint(sg_data)
-
-        return sg_data
-
-
-
-
-
+        log.debug("calling register with args:\n%s", tracing.pretty(args))
+
+        # register publish on the Shotgun worker
+        task = self._current_task
+        def _register():
+            with tracing.session_tracer().span('register', path=path):
+                sg_data = tank.util.register_publish(**args)
+
+            log.debug("register complete, return data:\n%s", tracing.pretty(sg_data))
+            if sg_data:
+                self._journal_registration(path, sg_data)
+                if thumbnail_path:
+                    # thumbnails are shared between publishes once they are all registered
+                    record = registration.PublishRecord(task, path, name, publish_version, tank_type,
+                                                        comment, thumbnail_path, dependency_paths, checksum)
+                    record.entity = {'type': sg_data['type'], 'id': sg_data['id']}
+                    self._unbatched.append(record)
+            return []
+
+        self._sg_pool.submit(task, _register)
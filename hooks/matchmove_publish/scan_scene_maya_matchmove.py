@@ -5,26 +5,51 @@ Copyright (c) 2013 Shotgun Software, Inc
 """
 
 import os
+import sys
 import maya.cmds as cmds
 
 import tank
 from tank import Hook
 
-class AttributeNotConnected(Exception):
-    pass
+# shared matchmove helpers live next to the hook folders
+_hooks_path = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+if _hooks_path not in sys.path:
+    sys.path.append(_hooks_path)
+
+from matchmove_lib import lens_index
+from matchmove_lib import scene_state
+from matchmove_lib import timing
+from matchmove_lib import tracing
+
+# baked cameras have every one of these channels driven by an animCurve
+CAMERA_CHANNELS = {'translateX': 'tx', 'translateY': 'ty', 'translateZ': 'tz',
+                   'rotateX': 'rx', 'rotateY': 'ry', 'rotateZ': 'rz',
+                   'scaleX': 'sx', 'scaleY': 'sy', 'scaleZ': 'sz'}
 
 class ScanSceneHook(Hook):
     """
     Hook to scan scene for items to publish
     """
 
+    # lens work file versions to offer for publish: None for the latest
+    # version of each lens, 'all' for every version, or a set of versions.
+    lens_versions = None
+
     def execute(self, **kwargs):
         """
         Main hook entry point
         """
+        with tracing.session_tracer().span('scan') as span:
+            items = self._scan_scene()
+            span.set('items', len(items))
+        return items
 
+    def _scan_scene(self):
+        """
+        Find every item in the scene that can be published
+        """
+        timer = timing.PhaseTimer(tracing.session_tracer())
         items = []
-        current_selection = cmds.ls(selection=True)
 
         # get the main scene:
         scene_path = os.path.abspath(cmds.file(query=True, sn=True))
@@ -37,62 +62,33 @@ class ScanSceneHook(Hook):
             "name": name,
             "description": ""})
 
-        # get a list of any cameras in the scene, then filter by those with
-        # connections to animCurves. These are the cameras which have been baked
-        all_persp_cameras = cmds.listCameras(perspective=True)
-        for camera in all_persp_cameras:
-            try:
-                for attr_name in ['tx','ty','tz','rx','ry','rz','sx','sy','sz']:
-                    plug = "%s.%s" % (camera, attr_name)
-                    if not cmds.connectionInfo(plug, isDestination=True):
-                        raise AttributeNotConnected
-            except AttributeNotConnected:
-                break
-            else:
-                print '<scan-scene> found camera %s' % camera
-                items.append({
-                    "type": "camera",
-                    "name": camera,
-                    "description": "scene renderable camera",
-                    "selected": True,
-                })
-
-        # find all of the cones in the scene. Cones are any object with part of
-        # their name containing 'cone' or 'Cone'.
-        cone_parents = set()
-        cones_groups = cmds.ls('|Scene|cones*', transforms=True, long=True)
-
-        #for cone in all_cones:
-            #try:
-                #cone_parents.add(cmds.listRelatives(cone, parent=True, fullPath=True)[0])
-            #except:
-                #pass # the object is parented to the global root
-
-        for parent in cones_groups:
-            print '<scan-scene> found cones group %s' % parent
-            items.append({
-                "type": "cones_geo",
-                "name": parent,
-                "description": "cones",
-                "selected": True,
-            })
-
-        # find geo in the scene and add each peice to the items list, assumes the
-        # scene has been created per MM specs.
-        all_geo = cmds.ls('|Scene|geo|*', transforms=True, long=True)
-        for geo_obj in all_geo:
-            print '<scan-scene> found geo %s' % geo_obj
-            items.append({
-                "type": "model_geo",
-                "name": geo_obj,
-                "description": "model",
-                "selected": True,
-            })
+        # cameras, cones and geo only change when the scene does, so reuse the
+        # last scan if nothing has been edited since.
+        key = scene_state.scene_key()
+        scene_items = scene_state.cached('scan', key)
+        if scene_items is not None:
+            print '<scan-scene> scene unchanged, reusing previous scan'
+        else:
+            scene_items = []
+            with timer.phase('cameras'):
+                scene_items.extend(self._scan_cameras())
+            with timer.phase('cones + geo'):
+                scene_items.extend(self._scan_geometry())
+            scene_state.store('scan', key, scene_items)
+        items.extend(scene_items)
 
         # locate lens distortion nodes exported from 3DE
-        lens_work_path_template = self.parent.get_template_by_name('3de_shot_lens_work')
-        lens_fields = self.parent.context.as_template_fields(lens_work_path_template)
-        found_lenses = self.parent.tank.paths_from_template(lens_work_path_template, lens_fields, skip_keys=['version'])
+        with timer.phase('lenses') as counts:
+            index = lens_index.session_index()
+            before = dict(index.stats)
+            lens_work_path_template = self.parent.get_template_by_name('3de_shot_lens_work')
+            lens_fields = self.parent.context.as_template_fields(lens_work_path_template)
+            found_lenses = lens_index.find_versions(index,
+                                                    lens_work_path_template,
+                                                    lens_fields,
+                                                    self.lens_versions)
+            # file system calls of this scan, a rescan of an unchanged folder only stats it
+            counts.update((name, index.stats[name] - before[name]) for name in index.stats)
         for lens_name in found_lenses:
             print '<scan-scene> found lens %s' % lens_name
             items.append({
@@ -109,10 +105,89 @@ class ScanSceneHook(Hook):
             "selected": True,
         })
 
-        import pprint
-        pp = pprint.PrettyPrinter(indent=4)
-        pp.pprint(items)
+        print "<scan-scene> found %d items" % len(items)
+        print "<scan-scene> timings:"
+        print timer.report('\t')
 
         print "<scan-scene> complete"
 
         return items
+
+    def _scan_cameras(self):
+        """
+        Find the perspective cameras with animCurve connections on all of their
+        transform channels. These are the cameras which have been baked.
+        """
+        items = []
+
+        all_persp_cameras = cmds.listCameras(perspective=True) or []
+        if not all_persp_cameras:
+            return items
+
+        # key everything by full DAG path so cameras sharing a short name
+        # under different parents can't overwrite each other, and list each
+        # camera under the shortest unique name Maya gave it
+        camera_paths = cmds.ls(all_persp_cameras, long=True) or []
+        display_names = {}
+        for path in camera_paths:
+            for camera in all_persp_cameras:
+                if path == camera or path.endswith('|' + camera):
+                    display_names[path] = camera
+
+        # a single query for the incoming connections of every camera channel.
+        # fullNodeName is how listConnections spells long=True.
+        plugs = ["%s.%s" % (path, attr) for path in camera_paths for attr in CAMERA_CHANNELS.values()]
+        connections = cmds.listConnections(plugs, source=True, destination=False, connections=True,
+                                           skipConversionNodes=True, fullNodeName=True) or []
+        connected = {}
+        for plug in connections[0::2]:
+            path, attr = plug.rsplit('.', 1)
+            connected.setdefault(path, set()).add(CAMERA_CHANNELS.get(attr, attr))
+
+        for path in camera_paths:
+            if len(connected.get(path, ())) < len(CAMERA_CHANNELS):
+                continue
+            camera = display_names.get(path, path)
+            print '<scan-scene> found camera %s' % camera
+            items.append({
+                "type": "camera",
+                "name": camera,
+                "description": "scene renderable camera",
+                "selected": True,
+            })
+
+        return items
+
+    def _scan_geometry(self):
+        """
+        Find the cones groups and geo pieces in a single query, assumes the
+        scene has been created per MM specs.
+        """
+        items = []
+
+        transforms = cmds.ls('|Scene|cones*', '|Scene|geo|*', transforms=True, long=True) or []
+
+        # find all of the cones in the scene. Cones are any group under
+        # |Scene with a name starting with 'cones'.
+        for parent in transforms:
+            if parent.startswith('|Scene|cones'):
+                print '<scan-scene> found cones group %s' % parent
+                items.append({
+                    "type": "cones_geo",
+                    "name": parent,
+                    "description": "cones",
+                    "selected": True,
+                })
+
+        # add each piece of geo to the items list
+        for geo_obj in transforms:
+            if geo_obj.startswith('|Scene|geo|'):
+                print '<scan-scene> found geo %s' % geo_obj
+                items.append({
+                    "type": "model_geo",
+                    "name": geo_obj,
+                    "description": "model",
+                    "selected": True,
+                })
+
+        return items
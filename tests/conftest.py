@@ -0,0 +1,19 @@
+"""
+Copyright (c) 2013 Shotgun Software, Inc
+----------------------------------------------------
+
+Tests of the matchmove_lib modules, run against the fake maya, tank and nuke
+modules and the mock Shotgun of the benchmark harness:
+
+    python -m pytest tests
+"""
+import os
+import sys
+
+BENCH_PATH = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'benchmarks'))
+if BENCH_PATH not in sys.path:
+    sys.path.insert(0, BENCH_PATH)
+
+from harness import install_fakes
+
+install_fakes()
@@ -0,0 +1,95 @@
+"""
+Copyright (c) 2013 Shotgun Software, Inc
+----------------------------------------------------
+
+Tests of matchmove_lib.fbx_header on files from harness.fbx_files
+"""
+import pytest
+
+from harness import fbx_files
+from matchmove_lib import fbx_header
+
+
+def test_ascii(tmpdir):
+    path = str(tmpdir.join('camera.fbx'))
+    fbx_files.write_ascii(path, ['SHOT'], 50, take='Take 002')
+
+    header = fbx_header.read_header(path)
+    assert header.cameras == fbx_files.PRODUCER_CAMERAS + ['SHOT']
+    assert header.camera == 'SHOT'
+    assert header.take == 'Take 002'
+    assert header.version == 6100
+    assert not header.binary
+
+
+def test_ascii_lines_split_across_chunks(tmpdir, monkeypatch):
+    path = str(tmpdir.join('camera.fbx'))
+    fbx_files.write_ascii(path, ['SHOT', 'WITNESS'], 200)
+    whole = fbx_header.read_header(path)
+
+    monkeypatch.setattr(fbx_header, 'CHUNK_SIZE', 37)
+    assert fbx_header.read_header(path) == whole
+    assert whole.camera == 'WITNESS'
+
+
+@pytest.mark.parametrize('version', [7400, 7500])
+def test_binary(tmpdir, version):
+    path = str(tmpdir.join('camera.fbx'))
+    fbx_files.write_binary(path, ['SHOT', 'WITNESS'], 50, take='Take 003', version=version)
+
+    header = fbx_header.read_header(path)
+    assert header.cameras == ['SHOT', 'WITNESS']
+    assert header.camera == 'WITNESS'
+    assert header.takes[-1] == 'Take 003'
+    assert header.version == version
+    assert header.binary
+
+
+def test_producer_cameras_are_not_the_camera(tmpdir):
+    path = str(tmpdir.join('empty.fbx'))
+    fbx_files.write_ascii(path, [], 10)
+    assert fbx_header.read_header(path).camera is None
+
+
+def test_unreadable_files_raise(tmpdir):
+    path = str(tmpdir.join('camera.fbx'))
+    fbx_files.write_binary(path, ['SHOT'], 50)
+    with open(path, 'rb') as fh:
+        data = fh.read()
+    with open(path, 'wb') as fh:
+        fh.write(data[:len(data) // 3])
+
+    with pytest.raises(fbx_header.FbxError):
+        fbx_header.read_header(path)
+    with pytest.raises(fbx_header.FbxError):
+        fbx_header.read_header(str(tmpdir.join('missing.fbx')))
+
+
+def test_reader_prefetches_on_threads(tmpdir):
+    paths = []
+    for index in range(3):
+        paths.append(str(tmpdir.join('camera%d.fbx' % index)))
+        fbx_files.write_binary(paths[-1], ['CAM%d' % index], 20)
+    broken = str(tmpdir.join('broken.fbx'))
+    with open(broken, 'wb') as fh:
+        fh.write(fbx_header.BINARY_MAGIC + b'\x00' * 8)
+
+    reader = fbx_header.HeaderReader()
+    reader.prefetch(paths + [broken], max_workers=2)
+    assert reader.submitted(paths[0]) and not reader.submitted(str(tmpdir.join('other.fbx')))
+
+    for index, path in enumerate(paths):
+        assert reader.header(path) == fbx_header.read_header(path)
+        assert reader.header(path).camera == 'CAM%d' % index
+    with pytest.raises(fbx_header.FbxError):
+        reader.header(broken)
+    # every read is done, so the worker threads are gone
+    assert reader._pool is None
+
+
+def test_reader_reads_what_was_not_prefetched(tmpdir):
+    path = str(tmpdir.join('camera.fbx'))
+    fbx_files.write_ascii(path, ['SHOT'], 10)
+    reader = fbx_header.HeaderReader()
+    assert reader.header(path).camera == 'SHOT'
+    assert not reader.submitted(path)
@@ -0,0 +1,83 @@
+"""
+Copyright (c) 2013 Shotgun Software, Inc
+----------------------------------------------------
+
+Tests of matchmove_lib.obj_writer
+"""
+import os
+
+import maya
+
+from harness import scene
+from matchmove_lib import obj_writer
+
+EXPECTED = """# This file uses centimeters as units for non-parametric coordinates.
+
+g default
+v 0.000000 0.000000 0.000000
+v 1.000000 0.000000 0.000000
+v 1.000000 1.000000 0.000000
+v 0.000000 1.000000 0.000000
+v 2.000000 0.000000 0.000000
+v 3.000000 0.000000 0.000000
+v 2.500000 1.000000 0.000000
+vt 0.000000 0.000000
+vt 1.000000 0.000000
+vt 1.000000 1.000000
+vt 0.000000 1.000000
+g quad
+f 1/1 2/2 3/3 4/4
+g tri
+f 5 6 7
+"""
+
+
+def _meshes():
+    quad = obj_writer.Mesh('quad', [0, 0, 0, 1, 0, 0, 1, 1, 0, 0, 1, 0], [4], [0, 1, 2, 3],
+                           [0, 0, 1, 0, 1, 1, 0, 1], [0, 1, 2, 3])
+    tri = obj_writer.Mesh('tri', [2, 0, 0, 3, 0, 0, 2.5, 1, 0], [3], [0, 1, 2])
+    return [quad, tri]
+
+
+def _read(path):
+    with open(path) as fh:
+        return fh.read()
+
+
+def test_groups_and_global_indices(tmpdir):
+    path = str(tmpdir.join('out.obj'))
+    written = obj_writer.write_obj(path, _meshes())
+    assert _read(path) == EXPECTED
+    assert written == os.path.getsize(path)
+
+
+def test_chunks_do_not_change_the_output(tmpdir):
+    mesh = scene.grid_mesh(20)
+    meshes = [obj_writer.Mesh('grid', [v for point in mesh.points for v in point],
+                              mesh.face_counts, mesh.face_connects)]
+    whole = str(tmpdir.join('whole.obj'))
+    chunked = str(tmpdir.join('chunked.obj'))
+    obj_writer.write_obj(whole, meshes)
+    obj_writer.write_obj(chunked, meshes, chunk_size=7)
+    assert _read(whole) == _read(chunked)
+
+
+def test_uvs_need_uv_ids():
+    mesh = obj_writer.Mesh('quad', [0, 0, 0] * 4, [4], [0, 1, 2, 3], uvs=[0, 0] * 4)
+    assert mesh.uvs is None
+    assert mesh.num_uvs == 0
+
+
+def test_export_meshes_from_maya(tmpdir):
+    maya.use_scene(scene.build_scene(str(tmpdir.join('scene.ma')), geo=3, mesh_size=4, cones_per_group=0))
+    path = str(tmpdir.join('geo.obj'))
+    obj_writer.export_meshes('|Scene|geo', path)
+
+    lines = _read(path).splitlines()
+    assert len([line for line in lines if line.startswith('v ')]) == 3 * 16
+    assert len([line for line in lines if line.startswith('f ')]) == 3 * 9
+    assert [line for line in lines if line.startswith('g ')] == ['g default', 'g piece0000', 'g piece0001',
+                                                                 'g piece0002']
+    # the last piece's faces index into the vertices written after the others
+    assert max(int(token.split('/')[0]) for line in lines if line.startswith('f ')
+               for token in line.split()[1:]) == 3 * 16
@@ -0,0 +1,172 @@
+"""
+Copyright (c) 2013 Shotgun Software, Inc
+----------------------------------------------------
+
+Tests of matchmove_lib.publish_cache
+"""
+from harness import mock_shotgun
+from matchmove_lib import publish_cache
+
+
+class Clock(object):
+    def __init__(self, now=1000.0):
+        self.now = now
+
+    def __call__(self):
+        return self.now
+
+
+class Mirror(object):
+    """
+    Holds some of the records, as a publish mirror does
+    """
+    def __init__(self, records):
+        self._records = dict((record['id'], record) for record in records)
+        self.asked = []
+
+    def records(self, publish_ids, fields):
+        self.asked.append(list(publish_ids))
+        return dict((i, self._records[i]) for i in publish_ids if i in self._records)
+
+
+def _record(publish_id, name='geo'):
+    return {'type': 'TankPublishedFile', 'id': publish_id, 'name': name}
+
+
+def test_records_expire_after_the_ttl():
+    clock = Clock()
+    cache = publish_cache.PublishCache(ttl=10.0, clock=clock)
+    cache.put(_record(1))
+
+    clock.now += 10.0
+    assert cache.get(1)['id'] == 1
+    clock.now += 0.5
+    assert cache.get(1) is None
+    assert cache.stats() == {'hits': 1, 'misses': 1, 'size': 0}
+
+
+def test_put_starts_the_ttl_again():
+    clock = Clock()
+    cache = publish_cache.PublishCache(ttl=10.0, clock=clock)
+    cache.put(_record(1, 'old'))
+    clock.now += 8.0
+    cache.put(_record(1, 'new'))
+    clock.now += 8.0
+    assert cache.get(1)['name'] == 'new'
+
+
+def test_least_recently_used_records_are_dropped():
+    cache = publish_cache.PublishCache(max_size=3, clock=Clock())
+    for publish_id in (1, 2, 3):
+        cache.put(_record(publish_id))
+
+    # reading 1 makes 2 the least recently used
+    cache.get(1)
+    cache.put(_record(4))
+    assert cache.get(2) is None
+    assert [publish_id for publish_id in (1, 3, 4) if cache.get(publish_id)] == [1, 3, 4]
+    assert cache.stats()['size'] == 3
+
+
+def test_fetch_queries_shotgun_once_for_the_misses():
+    sg = mock_shotgun.MockShotgun()
+    ids = [sg.add('TankPublishedFile', {'name': 'geo%d' % i})['id'] for i in range(4)]
+    cache = publish_cache.PublishCache(clock=Clock())
+    cache.put(_record(ids[0], 'cached'))
+
+    sg.reset_counts()
+    found = cache.fetch(sg, ids, ['name'])
+    assert sg.calls == {'find': 1}
+    assert [found[i]['name'] for i in ids] == ['cached', 'geo1', 'geo2', 'geo3']
+
+    sg.reset_counts()
+    assert cache.fetch(sg, ids, ['name']) == found
+    assert not sg.calls
+
+
+def test_fetch_asks_the_mirror_before_shotgun():
+    sg = mock_shotgun.MockShotgun()
+    ids = [sg.add('TankPublishedFile', {'name': 'geo%d' % i})['id'] for i in range(3)]
+    mirror = Mirror([_record(ids[1], 'mirrored')])
+    cache = publish_cache.PublishCache(clock=Clock())
+    cache.put(_record(ids[0], 'cached'))
+
+    sg.reset_counts()
+    found = cache.fetch(sg, ids, ['name'], mirror=lambda: mirror)
+    assert mirror.asked == [ids[1:]]
+    assert [found[i]['name'] for i in ids] == ['cached', 'mirrored', 'geo2']
+    assert sg.calls == {'find': 1}
+
+
+def test_missing_publishes_are_left_out():
+    sg = mock_shotgun.MockShotgun()
+    cache = publish_cache.PublishCache(clock=Clock())
+    assert cache.fetch(sg, [12345]) == {}
+
+
+def test_invalidate():
+    cache = publish_cache.PublishCache(clock=Clock())
+    for publish_id in (1, 2, 3):
+        cache.put(_record(publish_id))
+    cache.invalidate(2)
+    assert cache.get(2) is None
+    assert cache.get(1) is not None
+    cache.invalidate()
+    assert cache.stats()['size'] == 0
+
+
+def test_complete_record():
+    record = {'type': 'TankPublishedFile', 'id': 1, 'name': 'geo', 'version_number': 1,
+              'entity': {'type': 'Shot', 'id': 2, 'name': 'sh010'},
+              'tank_type': {'type': 'TankType', 'id': 3, 'name': 'Matchmove Model'}}
+    assert publish_cache.complete_record(record) is record
+    assert publish_cache.complete_record(dict(record, tank_type={'type': 'TankType', 'id': 3})) is None
+    assert publish_cache.complete_record({'type': 'TankPublishedFile', 'id': 1}) is None
+
+
+def _scene_site():
+    """
+    A mock site with two scenes and the publishes made from each
+    """
+    sg = mock_shotgun.MockShotgun()
+    project = sg.add('Project', {'name': 'bench'})
+    scenes = [sg.add('TankPublishedFile', {'project': project, 'name': 'scene%d' % i}) for i in range(2)]
+    made = []
+    for scene in scenes:
+        publishes = [sg.add('TankPublishedFile', {'project': project, 'name': 'geo%d' % i}) for i in range(3)]
+        for publish in publishes:
+            sg.add('TankDependency', {'tank_published_file': publish, 'dependent_tank_published_file': scene})
+        made.append([publish['id'] for publish in publishes])
+    return sg, project, made
+
+
+def test_scene_publish_ids_from_shotgun():
+    sg, project, made = _scene_site()
+    assert publish_cache.scene_publish_ids(sg, made[0][1]) == [made[0][1], made[0][0], made[0][2]]
+    assert publish_cache.scene_publish_ids(sg, 999) == [999]
+
+
+def test_scene_publish_ids_from_the_mirror(tmpdir):
+    from matchmove_lib import publish_mirror
+
+    sg, project, made = _scene_site()
+    mirror = publish_mirror.PublishMirror(str(tmpdir.join('publishes.sqlite')), project)
+    mirror.sync(sg)
+    sg.reset_counts()
+    assert publish_cache.scene_publish_ids(sg, made[1][2], mirror) == [made[1][2], made[1][0], made[1][1]]
+    assert not sg.calls
+    mirror.close()
+
+
+def test_fetch_scene_caches_the_rest_of_the_selection():
+    sg, project, made = _scene_site()
+    cache = publish_cache.PublishCache(clock=Clock())
+
+    sg.reset_counts()
+    found = cache.fetch_scene(sg, made[0][0], ['name'])
+    assert sorted(found) == sorted(made[0])
+    assert sg.calls == {'find': 3}
+
+    sg.reset_counts()
+    assert cache.fetch(sg, made[0][1:], ['name']) == dict((i, found[i]) for i in made[0][1:])
+    assert not sg.calls
@@ -0,0 +1,322 @@
+"""
+Copyright (c) 2013 Shotgun Software, Inc
+----------------------------------------------------
+
+Tests of matchmove_lib.publish_mirror against harness.mock_shotgun
+"""
+import pytest
+
+from harness import mock_shotgun
+from matchmove_lib import publish_cache
+from matchmove_lib import publish_mirror
+
+
+class Clock(object):
+    def __init__(self, now=1.5e9):
+        self.now = now
+
+    def __call__(self):
+        return self.now
+
+    def advance(self, seconds):
+        self.now += seconds
+
+
+class Site(object):
+    """
+    A mock Shotgun site with a project, and a publish in another project
+    """
+    def __init__(self):
+        self.clock = Clock()
+        self.sg = mock_shotgun.MockShotgun(clock=self.clock)
+        self.project = self.sg.add('Project', {'name': 'bench'})
+        self.other = self.sg.add('Project', {'name': 'other'})
+        self.shot = dict(self.sg.add('Shot', {'code': 'sh010', 'name': 'sh010', 'project': self.project}),
+                         name='sh010')
+        self.tank_type = dict(self.sg.add('TankType', {'code': 'Geo'}), name='Geo')
+        self.publish('elsewhere', project=self.other)
+
+    def publish(self, name, version=1, project=None, tank_type=None):
+        self.clock.advance(1)
+        return self.sg.add('TankPublishedFile', {'project': project or self.project, 'entity': self.shot,
+                                                 'tank_type': tank_type or self.tank_type, 'name': name,
+                                                 'version_number': version,
+                                                 'path': {'local_path': '/geo/%s_v%03d.obj' % (name, version)},
+                                                 'path_cache': 'geo/%s_v%03d.obj' % (name, version)})
+
+    def depend(self, publish, dependency):
+        self.clock.advance(1)
+        return self.sg.add('TankDependency', {'tank_published_file': publish,
+                                              'dependent_tank_published_file': dependency})
+
+    def live(self, ids):
+        return dict((r['id'], r) for r in self.sg.find('TankPublishedFile', [['id', 'in', ids]],
+                                                       publish_mirror.RECORD_FIELDS))
+
+    def project_ids(self):
+        return [p['id'] for p in self.sg.all('TankPublishedFile') if p['project']['id'] == self.project['id']]
+
+
+@pytest.fixture
+def site():
+    return Site()
+
+
+@pytest.fixture
+def mirror(site, tmpdir):
+    mirror = publish_mirror.PublishMirror(str(tmpdir.join('publishes.sqlite')), site.project, site.clock)
+    yield mirror
+    mirror.close()
+
+
+def _sync(site, mirror):
+    site.clock.advance(publish_mirror.MIN_SYNC_INTERVAL)
+    return mirror.sync(site.sg)
+
+
+def _full_sync(site, mirror):
+    """
+    Sync until the full sync under way is through, returning the syncs taken
+    """
+    syncs = 0
+    while True:
+        assert _sync(site, mirror)
+        syncs += 1
+        if mirror._state(mirror._connection(), 'full start') is None:
+            return syncs
+
+
+def test_records_match_shotgun(site, mirror):
+    for index in range(5):
+        site.publish('geo%02d' % index)
+    assert mirror.sync(site.sg)
+
+    ids = site.project_ids()
+    assert mirror.records(ids) == site.live(ids)
+
+
+def test_other_projects_are_left_out(site, mirror):
+    mirror.sync(site.sg)
+    elsewhere = [p['id'] for p in site.sg.all('TankPublishedFile') if p['project']['id'] == site.other['id']]
+    assert mirror.records(elsewhere) == {}
+
+
+def test_fields_beyond_the_mirror_are_not_answered(site, mirror):
+    publish = site.publish('geo')
+    mirror.sync(site.sg)
+    assert mirror.records([publish['id']], ['name', 'created_by']) == {}
+
+
+def test_full_sync_is_read_a_page_at_a_time(site, mirror, monkeypatch):
+    monkeypatch.setattr(publish_mirror, 'FULL_SYNC_PAGE', 4)
+    for index in range(10):
+        site.publish('geo%02d' % index)
+
+    site.sg.reset_counts()
+    assert mirror.sync(site.sg)
+    assert mirror.rows_read == 4
+    # a page of publishes and one of dependency links
+    assert sum(site.sg.calls.values()) == 2
+
+    # the first page is used while the rest are still to come
+    ids = site.project_ids()
+    assert len(mirror.records(ids)) == 4
+
+    assert _full_sync(site, mirror) == 2
+    assert mirror.records(ids) == site.live(ids)
+
+
+def test_syncs_are_throttled(site, mirror):
+    assert mirror.sync(site.sg)
+    site.clock.advance(publish_mirror.MIN_SYNC_INTERVAL / 2)
+    site.sg.reset_counts()
+    assert not mirror.sync(site.sg)
+    assert not site.sg.calls
+    assert mirror.sync(site.sg, force=True)
+
+
+def test_incremental_sync_upserts_changes(site, mirror):
+    publish = site.publish('geo')
+    _full_sync(site, mirror)
+
+    site.clock.advance(publish_mirror.SYNC_OVERLAP * 2)
+    site.sg.update('TankPublishedFile', publish['id'], {'path_cache': 'moved/geo_v001.obj'})
+    added = site.publish('geo', 2)
+    assert _sync(site, mirror)
+
+    # only what changed since the watermark, less the overlap, is read again
+    assert mirror.rows_read == 2
+    assert mirror.records([publish['id']])[publish['id']]['path_cache'] == 'moved/geo_v001.obj'
+    assert mirror.records([added['id']]) == site.live([added['id']])
+
+
+def test_changes_saved_during_the_sync_second_are_read_again(site, mirror):
+    _full_sync(site, mirror)
+    # stamped in the same whole second the watermark was taken in
+    late = site.publish('late')
+    site.clock.advance(-1)
+    site.sg.entities['TankPublishedFile'][late['id']]['updated_at'] = site.sg._now()
+    assert _sync(site, mirror)
+    assert late['id'] in mirror.records([late['id']])
+
+
+def test_retired_publishes_go_at_the_next_full_sync(site, mirror):
+    kept = site.publish('kept')
+    retired = site.publish('retired')
+    _full_sync(site, mirror)
+
+    site.sg.delete('TankPublishedFile', retired['id'])
+    assert _sync(site, mirror)
+    assert retired['id'] in mirror.records([retired['id']])
+
+    site.clock.advance(publish_mirror.FULL_SYNC_AGE)
+    _full_sync(site, mirror)
+    assert mirror.records([kept['id'], retired['id']]) == site.live([kept['id']])
+
+
+def test_shotgun_faults_leave_the_mirror_on(site, mirror, monkeypatch):
+    publish = site.publish('geo')
+    _full_sync(site, mirror)
+
+    def broken(*args, **kwargs):
+        raise RuntimeError('Shotgun is down')
+
+    monkeypatch.setattr(site.sg, 'find', broken)
+    assert not _sync(site, mirror)
+    assert mirror.sync_error == 'Shotgun is down'
+    assert mirror.error is None
+
+    monkeypatch.undo()
+    assert mirror.sync(site.sg)
+    assert mirror.sync_error is None
+    assert publish['id'] in mirror.records([publish['id']])
+
+
+def test_unusable_file_switches_the_mirror_off(site, tmpdir):
+    path = str(tmpdir.join('not_a_folder'))
+    with open(path, 'w') as fh:
+        fh.write('in the way')
+    mirror = publish_mirror.PublishMirror(str(tmpdir.join('not_a_folder', 'publishes.sqlite')), site.project,
+                                          site.clock)
+    assert not mirror.sync(site.sg)
+    assert mirror.error
+    assert mirror.records([1]) == {}
+
+
+def test_other_schema_is_rebuilt(site, tmpdir):
+    import sqlite3
+
+    path = str(tmpdir.join('publishes.sqlite'))
+    db = sqlite3.connect(path)
+    db.execute('CREATE TABLE publishes (id INTEGER PRIMARY KEY, name TEXT)')
+    db.execute("INSERT INTO publishes VALUES (1, 'stale')")
+    db.commit()
+    db.close()
+
+    publish = site.publish('geo')
+    mirror = publish_mirror.PublishMirror(path, site.project, site.clock)
+    assert mirror.sync(site.sg)
+    assert mirror.records([1, publish['id']]) == site.live([publish['id']])
+    mirror.close()
+
+
+def test_lookup_falls_back_to_shotgun(site, tmpdir, monkeypatch):
+    monkeypatch.setattr(publish_mirror, '_mirrors', {})
+    path = str(tmpdir.join('publishes.sqlite'))
+    publish = site.publish('geo')
+
+    monkeypatch.setattr(site.sg, 'find', lambda *args, **kwargs: [][0])
+    assert publish_mirror.lookup(site.sg, site.project, path) is None
+
+    monkeypatch.undo()
+    mirror = publish_mirror.lookup(site.sg, site.project, path)
+    assert mirror is publish_mirror.session_mirror(site.sg, site.project, path)
+    assert publish['id'] in mirror.records([publish['id']])
+
+
+def test_publish_cache_asks_for_the_mirror_only_on_a_miss(site):
+    publish = site.publish('geo')
+    cache = publish_cache.PublishCache(clock=site.clock)
+    asked = []
+
+    def mirror():
+        asked.append(True)
+        return None
+
+    assert cache.fetch(site.sg, [publish['id']], mirror=mirror)[publish['id']]['name'] == 'geo'
+    assert len(asked) == 1
+    site.sg.reset_counts()
+    assert cache.fetch(site.sg, [publish['id']], mirror=mirror)[publish['id']]['name'] == 'geo'
+    assert len(asked) == 1
+    assert not site.sg.calls
+
+
+def test_dependency_links_are_read_a_page_at_a_time(site, mirror, monkeypatch):
+    monkeypatch.setattr(publish_mirror, 'FULL_SYNC_PAGE', 4)
+    scene = site.publish('scene')
+    geo = [site.publish('geo%02d' % index) for index in range(10)]
+    for each in geo:
+        site.depend(each, scene)
+
+    assert _full_sync(site, mirror) == 3
+    assert [record['id'] for record in mirror.dependents(scene)] == [each['id'] for each in geo]
+
+
+def test_dependents(site, mirror):
+    scene = site.publish('scene')
+    other = site.publish('other scene')
+    geo = site.publish('geo')
+    site.depend(geo, scene)
+    site.depend(site.publish('cones'), other)
+    _full_sync(site, mirror)
+    assert mirror.dependents(scene) == list(site.live([geo['id']]).values())
+    assert mirror.dependencies(geo) == list(site.live([scene['id']]).values())
+
+    # new links come in with the incremental sync
+    site.clock.advance(publish_mirror.SYNC_OVERLAP * 2)
+    lens = site.publish('lens')
+    site.depend(lens, scene)
+    assert _sync(site, mirror)
+    assert [record['id'] for record in mirror.dependents(scene)] == [geo['id'], lens['id']]
+    assert mirror.dependents(lens) == []
+
+
+def test_retired_dependency_links_go_at_the_next_full_sync(site, mirror):
+    scene = site.publish('scene')
+    geo = site.publish('geo')
+    link = site.depend(geo, scene)
+    _full_sync(site, mirror)
+
+    site.sg.delete('TankDependency', link['id'])
+    site.clock.advance(publish_mirror.FULL_SYNC_AGE)
+    _full_sync(site, mirror)
+    assert mirror.dependents(scene) == []
+
+
+def test_latest_versions(site, mirror):
+    camera_type = dict(site.sg.add('TankType', {'code': 'Camera'}), name='Camera')
+    for version in range(1, 4):
+        site.publish('geo', version)
+    for version in range(1, 3):
+        site.publish('cones', version)
+        site.publish('camera', version, tank_type=camera_type)
+    other_shot = site.sg.add('Shot', {'code': 'sh020', 'name': 'sh020', 'project': site.project})
+    site.sg.add('TankPublishedFile', {'project': site.project, 'entity': other_shot, 'tank_type': site.tank_type,
+                                      'name': 'geo', 'version_number': 9})
+    _full_sync(site, mirror)
+
+    def live(**filters):
+        found = site.sg.find('TankPublishedFile', [['project', 'is', site.project], ['entity', 'is', site.shot]] +
+                             [[field, 'is', value] for field, value in filters.items()],
+                             publish_mirror.RECORD_FIELDS)
+        latest = {}
+        for record in found:
+            key = (record['tank_type']['name'], record['name'])
+            if key not in latest or record['version_number'] > latest[key]['version_number']:
+                latest[key] = record
+        return [latest[key] for key in sorted(latest)]
+
+    assert [(r['name'], r['version_number']) for r in mirror.latest(site.shot)] == [
+        ('camera', 2), ('cones', 2), ('geo', 3)]
+    assert mirror.latest(site.shot) == live()
+    assert mirror.latest(site.shot, camera_type) == live(tank_type=camera_type)
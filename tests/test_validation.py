@@ -0,0 +1,139 @@
+"""
+Copyright (c) 2013 Shotgun Software, Inc
+----------------------------------------------------
+
+Tests of matchmove_lib.validation
+"""
+import maya
+import maya.cmds
+import pytest
+
+from harness import scene
+from matchmove_lib import validation
+
+
+def _task(output_name, item_name):
+    return {'item': {'name': item_name}, 'output': {'name': output_name}}
+
+
+def _errors(validator, tasks):
+    facts = validator.gather(tasks)
+    return [validator.check(task, facts) for task in tasks]
+
+
+@pytest.fixture
+def scene_path(tmpdir):
+    path = str(tmpdir.join('scene.ma'))
+    maya.use_scene(scene.build_scene(path, cameras=2, cones_per_group=2, geo=4, hidden_geo=1, mesh_size=2))
+    maya.reset_counts()
+    return path
+
+
+def test_valid_tasks_pass(scene_path):
+    tasks = [_task('camera_export', 'SHOT'), _task('camera_export', '|Scene|cameras|LEFT'),
+             _task('model_geo_export', '|Scene|geo|piece0001'), _task('lens_distort_export', 'lens')]
+    assert _errors(validation.Validator(), tasks) == [[], [], [], []]
+
+
+def test_missing_and_misnamed_cameras(scene_path):
+    maya.scene.add('|elsewhere', 'transform')
+    maya.scene.add('|elsewhere|LEFT', 'transform')
+    maya.scene.add('|Scene|cameras|witness', 'transform')
+    tasks = [_task('camera_export', 'RIGHT'), _task('camera_export', 'LEFT'),
+             _task('camera_export', '|elsewhere|LEFT'), _task('camera_export', 'witness')]
+    missing, ambiguous, outside, misnamed = _errors(validation.Validator(), tasks)
+    assert missing == ['Camera RIGHT no longer exists or its name is not unique']
+    assert ambiguous == ['Camera LEFT no longer exists or its name is not unique']
+    assert outside == ['Camera |elsewhere|LEFT must be named |Scene|cameras|LEFT/RIGHT/SHOT']
+    assert misnamed == ['Camera |Scene|cameras|witness must be named |Scene|cameras|LEFT/RIGHT/SHOT']
+
+
+def test_camera_names_can_be_configured(scene_path):
+    validator = validation.Validator(camera_names=['LEFT'])
+    shot, left = _errors(validator, [_task('camera_export', 'SHOT'), _task('camera_export', 'LEFT')])
+    assert shot == ['Camera |Scene|cameras|SHOT must be named |Scene|cameras|LEFT']
+    assert left == []
+
+
+def test_hidden_geometry(scene_path):
+    hidden, visible = _errors(validation.Validator(), [_task('model_geo_export', '|Scene|geo|piece0000'),
+                                                       _task('model_geo_export', '|Scene|geo|piece0001')])
+    assert hidden == ['Geometry is hidden. Unhide or deselect to continue.']
+    assert visible == []
+
+
+def test_plugins_are_loaded_once(scene_path):
+    tasks = [_task('cone_geo_export', '|Scene|cones|cone0000'), _task('model_geo_export', '|Scene|geo|piece0001')]
+    assert _errors(validation.Validator(), tasks) == [[], []]
+    assert maya.call_counts['cmds.loadPlugin'] == 1
+    assert 'objExport' in maya.scene.plugins
+
+    maya.reset_counts()
+    validation.Validator().gather(tasks)
+    assert 'cmds.loadPlugin' not in maya.call_counts
+
+
+def test_plugins_that_fail_to_load(scene_path, monkeypatch):
+    def fail(name, quiet=False):
+        raise RuntimeError('Plugin %s not found' % name)
+    monkeypatch.setattr(maya.cmds, 'loadPlugin', fail)
+    camera, geo = _errors(validation.Validator(), [_task('camera_export', 'SHOT'),
+                                                   _task('model_geo_export', '|Scene|geo|piece0001')])
+    assert camera == ['Unable to load FBX plugin. We will be unable to export cameras for publish!']
+    assert geo == ['Unable to load objExport plugin. We will be unable to export geo for publish!']
+
+
+def test_custom_rules_only_see_their_outputs(scene_path):
+    seen = []
+
+    def named_lens(item, facts, output_name):
+        seen.append((item['name'], output_name))
+        return [] if item['name'] == 'lens' else ['Lens %s must be named lens' % item['name']]
+
+    validator = validation.Validator(rules=[validation.Rule('named_lens', ('lens_distort_export',), named_lens)])
+    tasks = [_task('lens_distort_export', 'lens'), _task('lens_distort_export', 'other'),
+             _task('camera_export', 'RIGHT')]
+    assert _errors(validator, tasks) == [[], ['Lens other must be named lens'], []]
+    assert seen == [('lens', 'lens_distort_export'), ('other', 'lens_distort_export')]
+
+
+def test_queries_do_not_grow_with_the_tasks(scene_path):
+    def queries(geo):
+        maya.use_scene(scene.build_scene(scene_path, cameras=2, cones_per_group=geo, geo=geo, mesh_size=2))
+        maya.scene.plugins.update(['fbxmaya', 'objExport'])
+        tasks = [_task('camera_export', 'SHOT'), _task('camera_export', 'LEFT')]
+        tasks += [_task('cone_geo_export', '|Scene|cones|cone%04d' % i) for i in range(geo)]
+        tasks += [_task('model_geo_export', '|Scene|geo|piece%04d' % i) for i in range(geo)]
+        maya.reset_counts()
+        assert all(errors == [] for errors in _errors(validation.Validator(), tasks))
+        return dict(maya.call_counts)
+
+    assert queries(1) == queries(50)
+
+
+def test_euler_filter_runs_once_on_every_rotation_curve(scene_path):
+    validator = validation.Validator()
+    facts = validator.gather([_task('camera_export', 'SHOT'), _task('camera_export', 'LEFT')])
+    assert facts.rotate_curves == {
+        'LEFT': ['LEFT_rotateX', 'LEFT_rotateY', 'LEFT_rotateZ'],
+        'SHOT': ['SHOT_rotateX', 'SHOT_rotateY', 'SHOT_rotateZ'],
+    }
+    maya.reset_counts()
+    assert validation.euler_filter(facts) == 6
+    assert maya.call_counts == {'cmds.filterCurve': 1}
+    assert validation.euler_filter(validation.SceneFacts()) == 0
+
+
+def test_cameras_sharing_a_short_name_keep_their_own_curves(scene_path):
+    maya.scene.add('|elsewhere', 'transform')
+    witness = maya.scene.add('|elsewhere|LEFT', 'transform')
+    for attr in validation.ROTATE_ATTRS:
+        witness.connections[attr] = 'witness_%s' % attr
+    tasks = [_task('camera_export', '|Scene|cameras|LEFT'), _task('camera_export', '|elsewhere|LEFT')]
+    facts = validation.Validator().gather(tasks)
+    assert facts.rotate_curves == {
+        '|Scene|cameras|LEFT': ['LEFT_rotateX', 'LEFT_rotateY', 'LEFT_rotateZ'],
+        '|elsewhere|LEFT': ['witness_rotateX', 'witness_rotateY', 'witness_rotateZ'],
+    }
+    assert [validation.Validator().check(task, facts) for task in tasks] == [
+        [], ['Camera |elsewhere|LEFT must be named |Scene|cameras|LEFT/RIGHT/SHOT']]